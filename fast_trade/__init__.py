@@ -2,6 +2,7 @@
 from .build_data_frame import build_data_frame, prepare_df
 from .finta import TA
 from .run_backtest import run_backtest
+from .run_backtest_batch import run_backtest_batch
 from .transformers_map import transformers_map
 from .validate_backtest import validate_backtest
 from .fxmacrodata import FXMacroDataClient, build_macro_context
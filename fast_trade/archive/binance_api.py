@@ -1,16 +1,26 @@
 import datetime
-import math
 import os
-import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain
 
 import pandas as pd
 import requests
+import requests.adapters
 from rich.console import Console
 
-API_DELAY = float(os.getenv("API_DELAY", 0.3))
+from .rate_limit import BINANCE_WEIGHT_LIMITS, KLINE_REQUEST_WEIGHT, get_rate_limiter
+
+BINANCE_API_URL = os.getenv("BINANCE_API_URL", "https://api.binance.{tld}/api/v3")
+# windows of 1 minute klines requested at once, each one is at most 1000 candles
+BINANCE_MAX_IN_FLIGHT = int(os.getenv("BINANCE_MAX_IN_FLIGHT", 4))
+HOURS_TO_INCREMENT = 15
 console = Console()
 
+_session = None
+_session_lock = threading.Lock()
+
 BINANCE_KLINE_REST_HEADER_MATCH = [
     "date",  # Open time
     "open",  # Open
@@ -28,7 +38,7 @@ BINANCE_KLINE_REST_HEADER_MATCH = [
 
 
 def get_exchange_info(tld="us"):
-    url = f"https://api.binance.{tld}/api/v3"
+    url = BINANCE_API_URL.format(tld=tld)
     req = requests.get(f"{url}/exchangeInfo")
     # attempt to sort any keys that are lists
     data = req.json()
@@ -72,8 +82,9 @@ def get_available_symbols(tld="us"):
 def get_oldest_date_available(symbol, tld="us"):
     endTime = int(datetime.datetime.utcnow().timestamp() * 1000)
     # TODO: make this accept a tld
-    url = f"https://api.binance.{tld}/api/v3/klines?symbol={symbol}&interval=1m&startTime=0&endTime={endTime}&limit=1"
+    url = f"{BINANCE_API_URL.format(tld=tld)}/klines?symbol={symbol}&interval=1m&startTime=0&endTime={endTime}&limit=1"
 
+    get_rate_limiter(f"binance{tld}").acquire(KLINE_REQUEST_WEIGHT.get(f"binance{tld}", 1))
     data = requests.get(url).json()
     try:
         oldest_date = datetime.datetime.fromtimestamp(data[0][0] / 1000)
@@ -83,87 +94,117 @@ def get_oldest_date_available(symbol, tld="us"):
         return datetime.datetime.utcnow() - datetime.timedelta(days=1)
 
 
+def get_session() -> requests.Session:
+    """The keep-alive session every kline request goes through, its pool fits the windows in flight."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(10, BINANCE_MAX_IN_FLIGHT * 4))
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def _respect_used_weight(res, exchange: str, rate_limiter) -> None:
+    """Holds the bucket until the next minute once the server says most of its weight budget is used."""
+    used = res.headers.get("X-MBX-USED-WEIGHT-1M") or res.headers.get("X-MBX-USED-WEIGHT")
+    limit = BINANCE_WEIGHT_LIMITS.get(exchange)
+    if used and limit and int(used) >= limit * 0.9:
+        # binance resets the counter at the start of every minute
+        rate_limiter.pause(60 - time.time() % 60)
+
+
+def _get_kline_window(symbol: str, start_time: int, end_time: int, tld: str, rate_limiter) -> list:
+    exchange = f"binance{tld}"
+    params = {"symbol": symbol, "interval": "1m", "startTime": start_time, "endTime": end_time, "limit": 1000}
+    error_count = 0
+    while True:
+        rate_limiter.acquire(KLINE_REQUEST_WEIGHT.get(exchange, 1))
+        req = get_session().get(f"{BINANCE_API_URL.format(tld=tld)}/klines", params=params, timeout=30)
+        if req.status_code == 200:
+            _respect_used_weight(req, exchange, rate_limiter)
+            return req.json()
+
+        console.print(f"[red]Binance error {symbol}: {req.text}[/red]")
+        error_count += 1
+        if error_count > 3:
+            raise Exception(f"Download failed for {symbol} after {error_count} errors. Error: {req.text}")
+        if req.status_code in (418, 429):
+            # every window waits out the Retry-After, not just this one
+            rate_limiter.pause(float(req.headers.get("Retry-After") or 10))
+        else:
+            time.sleep(error_count)
+
+
 def get_binance_klines(
     symbol,
     start_date: datetime.datetime,
     end_date: datetime.datetime,
     tld="us",
     status_update=lambda x: None,
-    store_func=lambda x, y: None,
+    store_func=lambda df, symbol, exchange: None,
 ):
+    """Downloads the 1 minute klines between start_date and end_date.
+
+    The range is split in HOURS_TO_INCREMENT windows and up to BINANCE_MAX_IN_FLIGHT of them
+    are requested at once, within the exchange's rate limit. The windows are put back in order,
+    and store_func gets every 30 windows that are complete and in order.
+    """
     start_date = start_date.replace(tzinfo=datetime.timezone.utc)
     end_date = end_date.replace(tzinfo=datetime.timezone.utc)
 
-    curr_date = start_date
-
-    HOURS_TO_INCREMENT = 15
-
     end_date = end_date.replace(tzinfo=datetime.timezone.utc)
     now = datetime.datetime.now().replace(tzinfo=datetime.timezone.utc)
     if end_date > now:
         end_date = now.replace(second=0, microsecond=0)
 
-    # calculate the estimated number of calls
-    total_duration_hours = (end_date - curr_date).total_seconds() / 3600
-    num_calls = math.ceil(total_duration_hours / HOURS_TO_INCREMENT)
-    total_api_calls = 0
-    error_count = 0
-    klines = []
-    start_time = time.time()
+    windows = []
+    curr_date = start_date
     while curr_date < end_date:
         next_end_date = curr_date + datetime.timedelta(hours=HOURS_TO_INCREMENT)
-        startTime = int(curr_date.timestamp()) * 1000
-        endTime = int(next_end_date.timestamp()) * 1000
-
-        url = (
-            f"https://api.binance.{tld}/api/v3/klines"
-            f"?symbol={symbol}&interval=1m"
-            f"&startTime={startTime}&endTime={endTime}&limit=1000"
-        )
+        windows.append((int(curr_date.timestamp()) * 1000, int(next_end_date.timestamp()) * 1000))
+        curr_date = next_end_date
 
-        req = requests.get(url)
-        total_api_calls += 1
-        if req.status_code == 200:
-            curr_date = next_end_date
-            klines.extend(req.json())
-            error_count = 0
-        else:
-            console.print(f"[red]Binance error {symbol}: {req.text}[/red]")
-            error_count += 1
-            if error_count > 3:
-                raise Exception(
-                    f"Download failed for {symbol} after 3 errors. Error: {req.text}"
-                )
-            if req.status_code == 429:
-                # sleeep for some time
-                time.sleep(10)
-                continue
-        sleeper = random.random() * API_DELAY
-        if sleeper < 0.1:
-            sleeper += 0.1
-
-        if total_api_calls % 30 == 0:
-            sleeper += random.randint(1, 3)
-            kline_df = binance_kline_to_df(klines)
-            store_func(kline_df, symbol, "binanceus")
-
-        status_obj = {
-            "symbol": symbol,
-            "perc_complete": round(total_api_calls / num_calls * 100, 2),
-            "call_count": total_api_calls,
-            "total_calls": num_calls,
-            "total_time": round(time.time() - start_time, 2),
-            # "sleep_time": sleeper,
-            "est_time_remaining": round(
-                (time.time() - start_time)
-                / total_api_calls
-                * (num_calls - total_api_calls),
-                2,
-            ),
+    num_calls = len(windows)
+    results = [None] * num_calls
+    total_api_calls = 0
+    contiguous = 0
+    stored = 0
+    rate_limiter = get_rate_limiter(f"binance{tld}")
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, min(BINANCE_MAX_IN_FLIGHT, num_calls))) as pool:
+        futures = {
+            pool.submit(_get_kline_window, symbol, window_start, window_end, tld, rate_limiter): idx
+            for idx, (window_start, window_end) in enumerate(windows)
         }
-        status_update(status_obj)
-        time.sleep(sleeper)
-        curr_date = next_end_date
+        try:
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                total_api_calls += 1
+                while contiguous < num_calls and results[contiguous] is not None:
+                    contiguous += 1
+
+                if contiguous - stored >= 30:
+                    kline_df = binance_kline_to_df(list(chain.from_iterable(results[stored:contiguous])))
+                    store_func(kline_df, symbol, f"binance{tld}")
+                    stored = contiguous
+
+                elapsed = time.time() - start_time
+                status_update(
+                    {
+                        "symbol": symbol,
+                        "perc_complete": round(total_api_calls / num_calls * 100, 2),
+                        "call_count": total_api_calls,
+                        "total_calls": num_calls,
+                        "total_time": round(elapsed, 2),
+                        "est_time_remaining": round(elapsed / total_api_calls * (num_calls - total_api_calls), 2),
+                    }
+                )
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
 
     status_obj = {
         "symbol": symbol,
@@ -174,7 +215,7 @@ def get_binance_klines(
         "est_time_remaining": 0,
     }
     status_update(status_obj)
-    klines_df = binance_kline_to_df(klines)
+    klines_df = binance_kline_to_df(list(chain.from_iterable(results)))
     return klines_df, status_obj
 
 
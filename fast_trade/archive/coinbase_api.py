@@ -1,17 +1,26 @@
 import datetime
-import math
 import os
-import random
+import threading
 import time
 import typing
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import pandas as pd
 import requests
+import requests.adapters
 from rich.console import Console
 
-API_DELAY = os.getenv("API_DELAY", 0.3)
-BASE_URL = "https://api.exchange.coinbase.com"
+from .rate_limit import get_rate_limiter
+
+BASE_URL = os.getenv("COINBASE_API_URL", "https://api.exchange.coinbase.com")
+# the most candles coinbase returns for one request, at 1 minute granularity that's 300 minutes
+CANDLES_PER_PAGE = 300
+COINBASE_MAX_IN_FLIGHT = int(os.getenv("COINBASE_MAX_IN_FLIGHT", 4))
+STORE_EVERY_PAGES = 10
 console = Console()
+
+_session = None
+_session_lock = threading.Lock()
 CB_REST_HEADER_MATCH = [
     "date",
     "low",
@@ -42,16 +51,56 @@ def get_asset_ids() -> typing.List[str]:
     return ids
 
 
+def get_session() -> requests.Session:
+    """The keep-alive session every candle request goes through, its pool fits the pages in flight."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=max(10, COINBASE_MAX_IN_FLIGHT * 4)))
+        return _session
+
+
+def _request_candles(product_id: str, params: dict) -> list:
+    """Returns the raw candles of one request.
+
+    A 429 slows the shared coinbase limiter down and is retried, other errors are retried
+    with a growing sleep. Raises after 5 failed attempts.
+    """
+    rate_limiter = get_rate_limiter("coinbase")
+    url = f"{BASE_URL}/products/{product_id}/candles"
+    headers = {"Content-Type": "application/json"}
+    bad_errors = 0
+    while True:
+        rate_limiter.acquire()
+        res = get_session().get(url, params=params, headers=headers, timeout=30)
+        if res.status_code == 200:
+            rate_limiter.recover()
+            return res.json()
+
+        bad_errors += 1
+        console.print(f"[red]Coinbase error {res.status_code}: {res.text}[/red]")
+        if bad_errors > 4:
+            raise Exception(f"Api Error: {res.status_code} {res.text}")
+        if res.status_code == 429:
+            rate_limiter.backoff(float(res.headers.get("Retry-After") or 1))
+        else:
+            time.sleep(bad_errors)
+
+
 def get_product_candles(
     product_id: str,
     start: datetime = None,
     end: datetime = None,
     update_status: callable = lambda x: None,
-    store_func: callable = lambda x: None,
+    store_func: callable = lambda df, symbol, exchange: None,
 ):
-    """Returns the candle data for a given product"""
+    """Returns the candle data for a given product
 
-    # print("Fetching data for: ", product_id, start, end)
+    The range is split in pages of CANDLES_PER_PAGE minutes and up to COINBASE_MAX_IN_FLIGHT
+    of them are requested at once. Pages are put back in order as they complete, and every
+    STORE_EVERY_PAGES complete, contiguous pages are handed to store_func right away.
+    """
     if not start:
         # fetch the oldest date for this symbol
         start = get_oldest_day(product_id)
@@ -60,96 +109,74 @@ def get_product_candles(
     end = end or datetime.datetime.utcnow()
     start = start or (end - datetime.timedelta(hours=3))
 
-    # end = end + datetime.timedelta(days=1)
-
     start = start.replace(tzinfo=datetime.timezone.utc)
     end = end.replace(tzinfo=datetime.timezone.utc)
 
-    # print("start", start, "end", end)
-    # return
-    # while datetime.datetime.fromisoformat(
-    currentDate = start
-    df = pd.DataFrame()
+    now = datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc)
+    end = min(end, now)
+
+    windows = []
+    current_date = start
+    while current_date < end:
+        next_end = min(current_date + datetime.timedelta(minutes=CANDLES_PER_PAGE), end)
+        windows.append((current_date, next_end))
+        current_date = next_end
 
-    # calculate the estimated number of calls
-    total_duration_hours = (end - start).total_seconds() / 3600
-    num_calls = math.ceil(total_duration_hours / 3)
-    # print("estimated number of calls: ", num_calls)
+    num_calls = len(windows)
+    pages = [None] * num_calls
     call_count = 0
-    # print("start", start, "end", end)
+    contiguous = 0
+    stored = 0
     status_obj = {}
-    bad_errors = 0
     start_time = time.time()
-    while currentDate < end:
-        # print("currentDate", currentDate, "end", end)
-        currentDate = currentDate.replace(tzinfo=datetime.timezone.utc)
-        next_end = currentDate + datetime.timedelta(hours=3)
-        now = datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc)
-        next_end = next_end.replace(tzinfo=datetime.timezone.utc)
-        if next_end > now:
-            next_end = now
-
-        params = {
-            "granularity": 60,
-            "start": str(int(currentDate.timestamp())),
-            "end": str(int(next_end.timestamp())),
+    with ThreadPoolExecutor(max_workers=max(1, min(COINBASE_MAX_IN_FLIGHT, num_calls))) as pool:
+        futures = {
+            pool.submit(
+                _request_candles,
+                product_id,
+                {"granularity": 60, "start": str(int(page_start.timestamp())), "end": str(int(page_end.timestamp()))},
+            ): idx
+            for idx, (page_start, page_end) in enumerate(windows)
         }
-
-        df = get_single_candle(product_id, params, df)
-        if df.empty:
-            console.print(f"[red]Error downloading {product_id}[/red]")
-            bad_errors += 1
-            if bad_errors > 4:
-                raise Exception(
-                    f"Error Downloading: for {product_id} from {start} to {end}"
-                )
-            time.sleep(2 * bad_errors)
-            continue
-        call_count += 1
-        if call_count % 10 == 0:
-
-            store_func(df, product_id, "coinbase")
-
-        status_obj = {
-            "symbol": product_id,
-            "perc_complete": round(call_count / num_calls * 100, 2),
-            "call_count": call_count,
-            "total_calls": num_calls,
-            "total_time": round(time.time() - start_time, 2),
-            # "sleep_time": sleeper,
-            "est_time_remaining": round(
-                (time.time() - start_time) / call_count * (num_calls - call_count), 2
-            ),
-        }
-        update_status(status_obj)
-        currentDate = next_end
-    if not df.empty:
-        df.sort_index(inplace=True, ascending=False)
+        try:
+            for future in as_completed(futures):
+                pages[futures[future]] = df_from_candles(future.result())
+                call_count += 1
+                while contiguous < num_calls and pages[contiguous] is not None:
+                    contiguous += 1
+
+                if contiguous - stored >= STORE_EVERY_PAGES:
+                    store_func(pd.concat(pages[stored:contiguous]).sort_index(), product_id, "coinbase")
+                    stored = contiguous
+
+                elapsed = time.time() - start_time
+                status_obj = {
+                    "symbol": product_id,
+                    "perc_complete": round(call_count / num_calls * 100, 2),
+                    "call_count": call_count,
+                    "total_calls": num_calls,
+                    "total_time": round(elapsed, 2),
+                    "est_time_remaining": round(elapsed / call_count * (num_calls - call_count), 2),
+                }
+                update_status(status_obj)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    df = pd.concat(pages) if pages else df_from_candles([])
+    df = df[~df.index.duplicated(keep="last")]
+    df.sort_index(inplace=True, ascending=False)
 
     return df, status_obj
 
 
 def get_single_candle(product_id: str, params: dict = {}, df=pd.DataFrame()):
-    url = f"{BASE_URL}/products/{product_id}/candles"
-    headers = {"Content-Type": "application/json"}
+    """Fetches one page of candles and appends it to df, an empty frame means the request failed."""
     try:
-        res = requests.get(url, params=params, headers=headers)
-        bad_errors = 0
-        if res.status_code > 399:
-            bad_errors += 1
-            console.print(f"[red]Coinbase error {res.status_code}: {res.text}[/red]")
-            time.sleep(bad_errors * bad_errors * bad_errors)
-            if bad_errors > 5:
-                raise Exception(f"Api Error: {res.status_code} {res.text}")
-        res = res.json()
-        new_df = df_from_candles(res)
+        new_df = df_from_candles(_request_candles(product_id, params))
         if new_df.empty:
-            bad_errors += 1
-            if bad_errors > 0:
-                raise Exception(f"Error Downloading: for {product_id}")
-            return pd.DataFrame()
-        sleep_time = random.random() * 0.5 + 0.1
-        time.sleep(sleep_time)
+            raise Exception(f"Error Downloading: for {product_id}")
         df = pd.concat([df, new_df])
         df.drop_duplicates(inplace=True)
         return df
@@ -172,35 +199,29 @@ def df_from_candles(klines):
 def get_oldest_day(
     product_id, start_date=datetime.datetime(2015, 7, 21)
 ) -> datetime.datetime:
-    """Find the oldest day with data for a given product_id."""
-
-    url = f"{BASE_URL}/products/{product_id}/candles"
-    end_date = datetime.datetime.now()
-    call_count = 0
-    while start_date <= end_date:
-        middle_date = start_date + (end_date - start_date) // 2
+    """Find the oldest day with data for a given product_id.
+
+    Binary search over the days between start_date and today, each probe asks for the daily
+    candle of one day, so a quiet minute can't be mistaken for the product not trading yet.
+    """
+    low = 0
+    high = (datetime.datetime.now() - start_date).days
+    while low < high:
+        middle = (low + high) // 2
+        middle_date = start_date + datetime.timedelta(days=middle)
         params = {
-            "granularity": 60,
+            "granularity": 86400,
             "start": int(middle_date.timestamp()),
-            "end": int((middle_date + datetime.timedelta(minutes=1)).timestamp()),
+            "end": int((middle_date + datetime.timedelta(days=1)).timestamp()),
         }
-
-        response = requests.get(url, params=params)
-        call_count += 1
-        time.sleep(random.random() * 0.2 + 0.1)
-        if response.status_code != 200:
-            time.sleep(2)
-            raise Exception(f"API request failed: {response.text}")
-
-        data = response.json()
-        if data:
+        if _request_candles(product_id, params):
             # Data found, search in earlier half
-            end_date = middle_date - datetime.timedelta(days=1)
+            high = middle
         else:
             # No data, search in later half
-            start_date = middle_date + datetime.timedelta(days=1)
+            low = middle + 1
 
-    return end_date
+    return start_date + datetime.timedelta(days=low)
 
 
 if __name__ == "__main__":
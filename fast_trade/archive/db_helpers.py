@@ -1,22 +1,38 @@
 import datetime
+import numbers
 import os
 import sqlite3
+import time
 import typing
+import uuid
 
 import pandas as pd
+import pyarrow.parquet as pq
+from pandas.tseries.frequencies import to_offset
+from pandas.tseries.offsets import Day, Tick
 
 ARCHIVE_PATH = os.getenv("ARCHIVE_PATH", os.path.join(os.getcwd(), "ft_archive"))
 if os.path.isfile(ARCHIVE_PATH):
     ARCHIVE_PATH = os.path.dirname(ARCHIVE_PATH)
 
+KLINE_COLUMNS = ["open", "high", "low", "close", "volume"]
+# about 45 days of 1 minute candles, small enough that date filters can skip most of an archive
+KLINE_ROW_GROUP_SIZE = 65536
+# every symbol is a directory of month partitions, {exchange}/{symbol}/year=YYYY/month=MM/part-*.parquet
+KLINE_PART_PREFIX = "part-"
 
-def _atomic_write_parquet(df: pd.DataFrame, path: str, index: bool = True) -> None:
+
+def atomic_write_parquet(
+    df: pd.DataFrame, path: str, index: bool = True, row_group_size: typing.Optional[int] = None
+) -> None:
+    """Writes df next to path and moves it in place, so a reader never sees a half written file."""
     tmp_path = path + ".tmp"
-    df.to_parquet(tmp_path, index=index)
+    df.to_parquet(tmp_path, index=index, row_group_size=row_group_size)
     os.replace(tmp_path, path)
 
 
-def _safe_read_parquet(path: str) -> typing.Optional[pd.DataFrame]:
+def safe_read_parquet(path: str) -> typing.Optional[pd.DataFrame]:
+    """The parquet file at path, None if it can't be read."""
     try:
         return pd.read_parquet(path)
     except Exception:
@@ -29,6 +45,202 @@ def _safe_read_parquet(path: str) -> typing.Optional[pd.DataFrame]:
         return None
 
 
+def _kline_timestamp(value) -> pd.Timestamp:
+    """A date bound as a Timestamp, epoch seconds and milliseconds are read the way apply_charting_to_df reads them."""
+    if isinstance(value, numbers.Real) and not isinstance(value, bool):
+        # build_data_frame imports the indicator cache, which imports this module
+        from fast_trade.build_data_frame import detect_time_unit
+
+        return pd.to_datetime(value, unit=detect_time_unit(int(value)))
+    return pd.Timestamp(value)
+
+
+def _kline_date_bounds(start_date=None, end_date=None, tz=None):
+    """Widens the requested range to whole days, so the first and last candles are never cut
+    short before they're resampled (and partial date strings still cover the whole day)."""
+    lower = upper = None
+    if start_date is not None:
+        lower = _kline_timestamp(start_date).floor("D")
+    if end_date is not None:
+        upper = _kline_timestamp(end_date).floor("D") + pd.Timedelta(days=1)
+    if tz is not None:
+        lower = lower.tz_localize(tz) if lower is not None and lower.tz is None else lower
+        upper = upper.tz_localize(tz) if upper is not None and upper.tz is None else upper
+    else:
+        # naive archives are stored in UTC
+        lower = lower.tz_convert("UTC").tz_localize(None) if lower is not None and lower.tz else lower
+        upper = upper.tz_convert("UTC").tz_localize(None) if upper is not None and upper.tz else upper
+    return lower, upper
+
+
+def _read_kline_parquet(path: str, start_date=None, end_date=None) -> typing.Optional[pd.DataFrame]:
+    """Reads the OHLCV columns of a kline parquet between start_date and end_date.
+
+    The date range is pushed down to pyarrow, so only the row groups that overlap it are read.
+    Falls back to safe_read_parquet (a full read) if the file can't be filtered.
+    """
+    try:
+        schema = pq.read_schema(path)
+        index_columns = (schema.pandas_metadata or {}).get("index_columns", [])
+        lower, upper = _kline_date_bounds(start_date, end_date, tz=getattr(schema.field("date").type, "tz", None))
+        columns = [column for column in KLINE_COLUMNS if column in schema.names]
+        if "date" not in index_columns:
+            columns.append("date")
+        filters = []
+        if lower is not None:
+            filters.append(("date", ">=", lower))
+        if upper is not None:
+            filters.append(("date", "<", upper))
+        df = pd.read_parquet(path, columns=columns, filters=filters or None)
+    except Exception:
+        df = safe_read_parquet(path)
+        if df is None:
+            return None
+
+    if "date" in df.columns:
+        df = df.set_index("date")
+    df.index = pd.to_datetime(df.index)
+
+    lower, upper = _kline_date_bounds(start_date, end_date, tz=df.index.tz)
+    if lower is not None:
+        df = df[df.index >= lower]
+    if upper is not None:
+        df = df[df.index < upper]
+    return df
+
+
+def _tiles_days(freq) -> bool:
+    """True if the bins of freq tile every day, so the candles of whole days resample the same as the archive.
+
+    The bins of the other freqs start at the archive's first midnight (7Min, 2D) or follow the
+    calendar (weeks, months), so they depend on candles outside of the days asked for.
+    """
+    try:
+        offset = to_offset(freq)
+    except ValueError:
+        return False
+    if isinstance(offset, Day):
+        return offset.n == 1
+    return isinstance(offset, Tick) and pd.Timedelta(days=1) % pd.Timedelta(offset) == pd.Timedelta(0)
+
+
+def kline_archive_dir(symbol: str, exchange: str, archive_path: typing.Optional[str] = None) -> str:
+    return os.path.join(archive_path or ARCHIVE_PATH, exchange, symbol)
+
+
+def _is_kline_archive_dir(path: str) -> bool:
+    """A partitioned archive has at least one part file, an aborted first download leaves none."""
+    return os.path.isdir(path) and bool(_kline_parts(path))
+
+
+def kline_archive_exists(symbol: str, exchange: str, archive_path: typing.Optional[str] = None) -> bool:
+    """True if the symbol has a partitioned archive or a legacy single file one."""
+    symbol_dir = kline_archive_dir(symbol, exchange, archive_path)
+    return _is_kline_archive_dir(symbol_dir) or os.path.exists(f"{symbol_dir}.parquet")
+
+
+def _kline_parts(symbol_dir: str, lower=None, upper=None) -> typing.List[str]:
+    """Lists the part files of a partitioned archive, in the order they were written.
+
+    Months that can't overlap [lower, upper) are skipped without being opened. The bounds
+    get a day of slack on both sides, since the partitions follow the stored timezone.
+    """
+    lower = None if lower is None else pd.Timestamp(lower).tz_localize(None) - pd.Timedelta(days=1)
+    upper = None if upper is None else pd.Timestamp(upper).tz_localize(None) + pd.Timedelta(days=1)
+    parts = []
+    for year_name in sorted(os.listdir(symbol_dir)):
+        year_path = os.path.join(symbol_dir, year_name)
+        if not year_name.startswith("year=") or not os.path.isdir(year_path):
+            continue
+        for month_name in sorted(os.listdir(year_path)):
+            month_path = os.path.join(year_path, month_name)
+            if not month_name.startswith("month=") or not os.path.isdir(month_path):
+                continue
+            month_start = pd.Timestamp(year=int(year_name[5:]), month=int(month_name[6:]), day=1)
+            month_end = month_start + pd.offsets.MonthBegin(1)
+            if (lower is not None and month_end <= lower) or (upper is not None and month_start >= upper):
+                continue
+            parts.extend(
+                os.path.join(month_path, name)
+                for name in sorted(os.listdir(month_path))
+                if name.startswith(KLINE_PART_PREFIX) and name.endswith(".parquet")
+            )
+    return parts
+
+
+def _read_kline_parts(symbol_dir: str, start_date=None, end_date=None) -> pd.DataFrame:
+    """Reads a partitioned archive between start_date and end_date.
+
+    A date stored in more than one part keeps the value that was written last.
+    """
+    lower, upper = _kline_date_bounds(start_date, end_date)
+    frames = [
+        df
+        for df in (_read_kline_parquet(path, start_date, end_date) for path in _kline_parts(symbol_dir, lower, upper))
+        if df is not None
+    ]
+    if not frames:
+        return pd.DataFrame(columns=KLINE_COLUMNS, index=pd.DatetimeIndex([], name="date"), dtype=float)
+    if len(frames) == 1:
+        # every part is written sorted and without duplicates
+        return frames[0]
+    df = pd.concat(frames)
+    return df[~df.index.duplicated(keep="last")].sort_index()
+
+
+def read_kline_archive(
+    symbol: str,
+    exchange: str,
+    start_date=None,
+    end_date=None,
+    archive_path: typing.Optional[str] = None,
+) -> typing.Optional[pd.DataFrame]:
+    """Reads the archived klines of a symbol from either archive layout.
+
+    Returns None if there is no archive, or the legacy file couldn't be read.
+    """
+    symbol_dir = kline_archive_dir(symbol, exchange, archive_path)
+    if os.path.isdir(symbol_dir):
+        return _read_kline_parts(symbol_dir, start_date, end_date)
+    if os.path.exists(f"{symbol_dir}.parquet"):
+        return _read_kline_parquet(f"{symbol_dir}.parquet", start_date, end_date)
+    return None
+
+
+def latest_kline_date(
+    symbol: str, exchange: str, archive_path: typing.Optional[str] = None
+) -> typing.Optional[pd.Timestamp]:
+    """The date of the newest archived candle, only the latest month partition is read."""
+    symbol_dir = kline_archive_dir(symbol, exchange, archive_path)
+    if os.path.isdir(symbol_dir):
+        parts = _kline_parts(symbol_dir)
+        if not parts:
+            return None
+        last_month = os.path.dirname(parts[-1])
+        frames = [_read_kline_parquet(path) for path in parts if os.path.dirname(path) == last_month]
+        dates = [df.index.max() for df in frames if df is not None and not df.empty]
+    else:
+        df = None
+        if os.path.exists(f"{symbol_dir}.parquet"):
+            df = _read_kline_parquet(f"{symbol_dir}.parquet")
+        dates = [df.index.max()] if df is not None and not df.empty else []
+    return max(dates) if dates else None
+
+
+def archive_symbols(exchange_path: str, extensions=(".parquet", ".sqlite")) -> typing.List[str]:
+    """The symbols archived in an exchange directory, as single files or partitioned directories."""
+    symbols = set()
+    for name in os.listdir(exchange_path):
+        if name.startswith("_"):
+            continue
+        extension = os.path.splitext(name)[1]
+        if extension in extensions:
+            symbols.add(name[: -len(extension)])
+        elif _is_kline_archive_dir(os.path.join(exchange_path, name)):
+            symbols.add(name)
+    return sorted(symbols)
+
+
 # update the kline archive by the given symbol and exchange
 # get the archive path from the environment variable
 def get_local_assets() -> typing.List[typing.Tuple[str, str]]:
@@ -44,28 +256,47 @@ def get_local_assets() -> typing.List[typing.Tuple[str, str]]:
         exchange_path = os.path.join(ARCHIVE_PATH, exchange)
         if not os.path.isdir(exchange_path):
             continue
-        for symbol in os.listdir(exchange_path):
-            if symbol.startswith("_"):
-                continue
-            if symbol.endswith(".parquet"):
-                all_assets.append((exchange, symbol.replace(".parquet", "")))
-            elif symbol.endswith(".sqlite"):
-                all_assets.append((exchange, symbol.replace(".sqlite", "")))
+        all_assets.extend((exchange, symbol) for symbol in archive_symbols(exchange_path))
 
     return all_assets
 
 
+def _append_kline_parts(df: pd.DataFrame, symbol_dir: str) -> typing.List[str]:
+    """Writes the klines as new part files, one per month, without touching the existing parts.
+
+    Candles that are already archived with the same values are left out.
+    """
+    if os.path.isdir(symbol_dir) and not df.empty:
+        stored = _read_kline_parts(symbol_dir, df.index[0], df.index[-1])
+        if not stored.empty:
+            known = stored.reindex(df.index)[KLINE_COLUMNS].to_numpy()
+            df = df[~(known == df[KLINE_COLUMNS].to_numpy()).all(axis=1)]
+
+    token = f"{KLINE_PART_PREFIX}{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.parquet"
+    paths = []
+    for (year, month), part in df.groupby([df.index.year, df.index.month]):
+        month_path = os.path.join(symbol_dir, f"year={year:04d}", f"month={month:02d}")
+        os.makedirs(month_path, exist_ok=True)
+        path = os.path.join(month_path, token)
+        atomic_write_parquet(part, path, index=True, row_group_size=KLINE_ROW_GROUP_SIZE)
+        paths.append(path)
+    return paths
+
+
 def update_klines_to_db(df, symbol, exchange) -> str:
     """
     Store the kline dataframe to the db
 
+    New candles are appended as part files to the month partitions they fall in, the
+    existing files are never rewritten. compact_klines merges the parts back together.
+
     Args:
         df (pd.DataFrame): The kline dataframe to store
         symbol (str): The symbol of the klines
         exchange (str): The exchange of the klines
 
     Returns:
-        str: The path to the db
+        str: The path to the symbol's archive directory
     """
     # create the archive path if it doesn't exist
     if not os.path.exists(ARCHIVE_PATH):
@@ -74,27 +305,59 @@ def update_klines_to_db(df, symbol, exchange) -> str:
     exchange_path = f"{ARCHIVE_PATH}/{exchange}"
     if not os.path.exists(exchange_path):
         os.makedirs(exchange_path)
-    # create the symbol path if it doesn't exist
-    symbol_path = f"{exchange_path}/{symbol}.parquet"
+    symbol_dir = f"{exchange_path}/{symbol}"
     df = standardize_df(df)
+    df.index = pd.to_datetime(df.index)
     df.index.name = "date"
 
-    if os.path.exists(symbol_path):
-        existing = _safe_read_parquet(symbol_path)
-        if existing is None:
-            _atomic_write_parquet(df, symbol_path, index=True)
-        else:
-            if "date" in existing.columns:
-                existing = existing.set_index("date")
-            existing.index = pd.to_datetime(existing.index)
-            combined = pd.concat([existing, df])
-            combined = combined[~combined.index.duplicated(keep="last")]
-            combined = combined.sort_index()
-            _atomic_write_parquet(combined, symbol_path, index=True)
-    else:
-        _atomic_write_parquet(df, symbol_path, index=True)
+    legacy_path = f"{symbol_dir}.parquet"
+    if os.path.exists(legacy_path):
+        # the first update of a single file archive moves it into partitions
+        existing = _read_kline_parquet(legacy_path)
+        if existing is not None and not existing.empty:
+            _append_kline_parts(standardize_df(existing), symbol_dir)
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+    os.makedirs(symbol_dir, exist_ok=True)
+    _append_kline_parts(df, symbol_dir)
+
+    return symbol_dir
 
-    return symbol_path
+
+def compact_klines(symbol: str, exchange: str, archive_path: typing.Optional[str] = None) -> int:
+    """
+    Merges the part files of every month partition into a single sorted file
+
+    The merged file takes the name of the newest part it replaces, so parts appended
+    while compacting still sort after it and win on duplicate dates.
+
+    Returns:
+        int: The number of partitions that were compacted
+    """
+    symbol_dir = kline_archive_dir(symbol, exchange, archive_path)
+    if not os.path.isdir(symbol_dir):
+        return 0
+
+    months: typing.Dict[str, typing.List[str]] = {}
+    for path in _kline_parts(symbol_dir):
+        months.setdefault(os.path.dirname(path), []).append(path)
+
+    compacted = 0
+    for parts in months.values():
+        if len(parts) < 2:
+            continue
+        frames = [df for df in (_read_kline_parquet(path) for path in parts) if df is not None]
+        if not frames:
+            continue
+        merged = pd.concat(frames)
+        merged = merged[~merged.index.duplicated(keep="last")].sort_index()
+        atomic_write_parquet(merged, parts[-1], index=True, row_group_size=KLINE_ROW_GROUP_SIZE)
+        for path in parts[:-1]:
+            if os.path.exists(path):
+                os.remove(path)
+        compacted += 1
+    return compacted
 
 
 def connect_to_db(db_path: str, create: bool = False) -> sqlite3.Connection:
@@ -123,8 +386,8 @@ def migrate_sqlite_to_parquet(sqlite_path: str, parquet_path: str) -> None:
     df = pd.read_sql_query("SELECT * FROM klines", conn)
     if "date" in df.columns:
         df["date"] = pd.to_datetime(df["date"])
-        df = df.set_index("date")
-    _atomic_write_parquet(df, parquet_path, index=True)
+        df = df.set_index("date").sort_index()
+    atomic_write_parquet(df, parquet_path, index=True, row_group_size=KLINE_ROW_GROUP_SIZE)
 
 
 def standardize_df(df):
@@ -161,11 +424,15 @@ def get_kline(
 ) -> pd.DataFrame:
     """
     Get the klines from the db
+
+    Only the OHLCV columns of the days between start_date and end_date are read from the parquet archive,
+    and only the month partitions that overlap them are opened. Freqs whose bins don't tile a day
+    (7Min, 2D, weeks, months) read the whole archive, their bins depend on where it starts.
     """
     parquet_path = f"{ARCHIVE_PATH}/{exchange}/{symbol}.parquet"
     sqlite_path = f"{ARCHIVE_PATH}/{exchange}/{symbol}.sqlite"
     # if the db exists, if not try and downlaod it
-    if not os.path.exists(parquet_path) and not os.path.exists(sqlite_path):
+    if not kline_archive_exists(symbol, exchange) and not os.path.exists(sqlite_path):
         import fast_trade.archive.update_kline as update_kline
 
         update_kline.update_kline(
@@ -180,13 +447,9 @@ def get_kline(
         if isinstance(end_date, str):
             end_date = datetime.datetime.fromisoformat(end_date)
 
-    df = None
-    if os.path.exists(parquet_path):
-        df = _safe_read_parquet(parquet_path)
-        if df is not None:
-            if "date" in df.columns:
-                df = df.set_index("date")
-            df.index = pd.to_datetime(df.index)
+    # only the days asked for are read when that gives the same candles as resampling the whole archive
+    read_start, read_end = (start_date, end_date) if _tiles_days(freq) else (None, None)
+    df = read_kline_archive(symbol, exchange, read_start, read_end)
 
     if df is None:
         if os.path.exists(sqlite_path):
@@ -200,20 +463,15 @@ def get_kline(
 
             df = pd.read_sql_query(query, conn)
             df.date = pd.to_datetime(df.date)
-            df = df.set_index("date")
-            _atomic_write_parquet(df, parquet_path, index=True)
+            df = df.set_index("date").sort_index()
+            atomic_write_parquet(df, parquet_path, index=True, row_group_size=KLINE_ROW_GROUP_SIZE)
         else:
             import fast_trade.archive.update_kline as update_kline
 
             update_kline.update_kline(
                 symbol=symbol, exchange=exchange, start_date=start_date, end_date=end_date
             )
-            if os.path.exists(parquet_path):
-                df = _safe_read_parquet(parquet_path)
-                if df is not None:
-                    if "date" in df.columns:
-                        df = df.set_index("date")
-                    df.index = pd.to_datetime(df.index)
+            df = read_kline_archive(symbol, exchange, read_start, read_end)
 
     if df is None:
         raise RuntimeError(f"Failed to load parquet for {exchange}:{symbol}; file was corrupted or missing")
@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+# request weight per second and burst size, kept under the published limits
+# binance.us: 1200 weight/min, binance.com: 6000 weight/min, coinbase public: 10 requests/sec
+EXCHANGE_RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "binanceus": (float(os.getenv("BINANCEUS_WEIGHT_PER_SEC", 16)), 40),
+    "binancecom": (float(os.getenv("BINANCECOM_WEIGHT_PER_SEC", 80)), 200),
+    "coinbase": (float(os.getenv("COINBASE_REQUESTS_PER_SEC", 8)), 8),
+}
+# a klines request with limit=1000 costs 2 weight on binance, coinbase counts requests
+KLINE_REQUEST_WEIGHT = {"binanceus": 2, "binancecom": 2, "coinbase": 1}
+# the server side weight budget per minute, reported back in the X-MBX-USED-WEIGHT-1M header
+BINANCE_WEIGHT_LIMITS = {"binanceus": 1200, "binancecom": 6000}
+
+
+class TokenBucket:
+    """Thread safe token bucket, refilled with `rate` tokens a second up to `capacity`.
+
+    acquire reserves the tokens right away and lets the balance go negative, so callers
+    are served in the order they asked and each one sleeps off its own share of the debt.
+    backoff and recover make the rate adaptive, halved on a 429 and won back as requests succeed.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.max_rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, weight: float = 1) -> float:
+        """Blocks until `weight` tokens are available, returns the seconds waited."""
+        with self._lock:
+            self._refill()
+            self._tokens -= weight
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """Holds every caller back for at least `seconds`, e.g. when the server asks to back off."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+    def backoff(self, seconds: float) -> None:
+        """Halves the rate, down to a tenth of the configured one, and pauses. For real 429s only."""
+        with self._lock:
+            self._refill()
+            self.rate = max(self.max_rate / 10, self.rate / 2)
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+    def recover(self) -> None:
+        """Every successful request wins back a fiftieth of the configured rate."""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self._refill()
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 50)
+
+
+_limiters: Dict[str, TokenBucket] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(exchange: str) -> TokenBucket:
+    """The bucket shared by every request to an exchange, in every thread."""
+    with _limiters_lock:
+        if exchange not in _limiters:
+            rate, capacity = EXCHANGE_RATE_LIMITS.get(exchange, (1.0, 1.0))
+            _limiters[exchange] = TokenBucket(rate, capacity)
+        return _limiters[exchange]
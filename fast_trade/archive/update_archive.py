@@ -1,17 +1,17 @@
 import datetime
 import os
 import time
-from typing import Callable, List, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
 
 from rich.console import Console
 from rich.progress import BarColumn, Progress, SpinnerColumn, TaskProgressColumn, TextColumn, TimeElapsedColumn
 
-import pandas as pd
-
 from .update_kline import update_kline
-from .db_helpers import _safe_read_parquet
+from .db_helpers import archive_symbols, latest_kline_date
 
 ARCHIVE_PATH = os.getenv("ARCHIVE_PATH", os.path.join(os.getcwd(), "ft_archive"))
+ARCHIVE_UPDATE_WORKERS = int(os.getenv("ARCHIVE_UPDATE_WORKERS", 4))
 console = Console()
 
 
@@ -20,32 +20,19 @@ def update_single_archive(
     exchange: str,
     progress_callback: Callable[[dict], None] = None,
 ):
-    # check the oldest date in the existing archive
-    if not symbol.endswith(".parquet"):
-        symbol = symbol + ".parquet"
-    path = os.path.join(ARCHIVE_PATH, exchange, symbol)
-
     now = datetime.datetime.now(datetime.timezone.utc)
     now = now.replace(second=0, microsecond=0)
 
-    if os.path.exists(path):
-        try:
-            df = _safe_read_parquet(path)
-            if df is None:
-                raise RuntimeError("archive parquet corrupted")
-            if "date" in df.columns:
-                df = df.set_index("date")
-            df.index = pd.to_datetime(df.index)
-            start_date = df.index.max()
-        except Exception:
-            start_date = None
-    else:
+    actual_symbol = symbol.replace(".parquet", "")
+    # check the newest date in the existing archive
+    try:
+        start_date = latest_kline_date(actual_symbol, exchange, archive_path=ARCHIVE_PATH)
+    except Exception:
         start_date = None
 
     if start_date is None:
         start_date = now - datetime.timedelta(days=7)
 
-    actual_symbol = symbol.replace(".parquet", "")
     update_kline(
         symbol=actual_symbol,
         exchange=exchange,
@@ -55,18 +42,24 @@ def update_single_archive(
     )
 
 
-def update_archive():
-    """Read the archive and update the klines"""
-    count = 0
+def update_archive(max_workers: Optional[int] = None) -> Dict[str, object]:
+    """Read the archive and update the klines
+
+    Symbols are updated by a bounded pool of threads. Their requests share the per exchange
+    budgets in rate_limit.py, so the workers overlap the waiting without going over the limits.
+    A symbol that fails is reported and skipped, the others still update.
+
+    Returns:
+        dict: "updated", the (exchange, symbol) pairs that were updated and "failed",
+        the error of every "exchange:symbol" that failed
+    """
     start_time = time.time()
 
     work_items: List[Tuple[str, str]] = []
     for exchange in os.listdir(ARCHIVE_PATH):
         if not os.path.isdir(os.path.join(ARCHIVE_PATH, exchange)):
             continue
-        for symbol in os.listdir(os.path.join(ARCHIVE_PATH, exchange)):
-            if symbol.startswith("_") or not symbol.endswith(".parquet"):
-                continue
+        for symbol in archive_symbols(os.path.join(ARCHIVE_PATH, exchange), extensions=(".parquet",)):
             work_items.append((exchange, symbol))
 
     progress = Progress(
@@ -79,12 +72,14 @@ def update_archive():
         transient=True,
     )
 
+    updated: List[Tuple[str, str]] = []
+    failed: Dict[str, str] = {}
+
     with progress:
         overall_task = progress.add_task("Updating symbols", total=len(work_items))
 
-        for exchange, symbol in work_items:
-            actual_symbol = symbol.replace(".parquet", "")
-            symbol_task = progress.add_task(f"{exchange}:{actual_symbol}", total=100)
+        def update_symbol(exchange: str, symbol: str) -> None:
+            symbol_task = progress.add_task(f"{exchange}:{symbol}", total=100)
 
             def progress_callback(status_obj):
                 perc = status_obj.get("perc_complete", 0)
@@ -96,16 +91,29 @@ def update_archive():
 
             try:
                 update_single_archive(symbol, exchange, progress_callback=progress_callback)
+            finally:
                 progress.update(symbol_task, completed=100)
                 progress.update(overall_task, advance=1)
-                count += 1
-            except Exception as e:
-                progress.update(symbol_task, completed=100)
-                progress.update(overall_task, advance=1)
-                raise e
+
+        workers = max(1, min(max_workers or ARCHIVE_UPDATE_WORKERS, len(work_items) or 1))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(update_symbol, exchange, symbol): (exchange, symbol) for exchange, symbol in work_items
+            }
+            for future in as_completed(futures):
+                exchange, symbol = futures[future]
+                try:
+                    future.result()
+                    updated.append((exchange, symbol))
+                except Exception as e:
+                    failed[f"{exchange}:{symbol}"] = str(e)
+                    console.print(f"[red]Failed to update {exchange}:{symbol}: {e}[/red]")
 
     updated_time = round(time.time() - start_time, 2)
-    console.print(f"[green]Updated {count} symbols in {updated_time} seconds[/green]")
+    console.print(f"[green]Updated {len(updated)} symbols in {updated_time} seconds[/green]")
+    if failed:
+        console.print(f"[red]{len(failed)} symbols failed: {', '.join(sorted(failed))}[/red]")
+    return {"updated": updated, "failed": failed}
 
 
 if __name__ == "__main__":
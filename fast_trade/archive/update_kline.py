@@ -6,7 +6,7 @@ import pandas as pd
 
 from .binance_api import get_binance_klines
 from .coinbase_api import get_product_candles
-from .db_helpers import update_klines_to_db
+from .db_helpers import compact_klines, update_klines_to_db
 
 supported_exchanges = ["binanceus", "binancecom", "coinbase"]
 
@@ -81,6 +81,8 @@ def update_kline(
                     raise ValueError(f"Exchange {exchange} not supported")
 
                 db_path = update_klines_to_db(klines, symbol, exchange)
+                # the download appended a part per store, merge them into one file per month
+                compact_klines(symbol, exchange)
                 return db_path
             except Exception as exc:
                 last_exc = exc
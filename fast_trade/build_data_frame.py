@@ -1,12 +1,27 @@
+import json
 import os
 import re
 from datetime import datetime
+from typing import Optional
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from pandas.tseries.frequencies import to_offset
+from pandas.tseries.offsets import Day
 
+from .indicator_cache import OHLCV_COLUMNS, IndicatorCache, data_fingerprint, indicator_cache
 from .transformers_map import transformers_map
 
 
+OHLCV_AGG = {"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"}
+# the candle columns are always read as floats, arrow parses ISO dates itself and leaves the rest
+# (epoch seconds or milliseconds) to standardize_df
+CSV_CONVERT_OPTIONS = pa_csv.ConvertOptions(column_types={column: pa.float64() for column in OHLCV_COLUMNS})
+# the size and modified time of the csv a sidecar was parsed from, in its schema metadata
+SIDECAR_SOURCE_KEY = b"fast_trade.csv_source"
+
+
 class TransformerError(Exception):
     def __init__(self, message):
         self.message = message
@@ -16,19 +31,20 @@ class TransformerError(Exception):
         return self.message
 
 
-def build_data_frame(backtest: dict, csv_path: str):
+def build_data_frame(backtest: dict, csv_path: str, sidecar: bool = False):
     """Creates a Pandas DataFame with the provided backtest. Used when providing a CSV as the datafile
 
     Parameters
     ----------
     backtest: dict, provides instructions on how to build the dataframe
     csv_path: string, absolute path of where to find the data file
+    sidecar: bool, passed on to load_basic_df_from_csv
 
     Returns
     -------
     object, A Pandas DataFrame indexed buy date
     """
-    df = load_basic_df_from_csv(csv_path)
+    df = load_basic_df_from_csv(csv_path, sidecar=sidecar)
 
     if df.empty:
         raise Exception("Dataframe is empty. Check the start and end dates")
@@ -38,11 +54,13 @@ def build_data_frame(backtest: dict, csv_path: str):
     return df
 
 
-def load_basic_df_from_csv(csv_path: str):
+def load_basic_df_from_csv(csv_path: str, sidecar: bool = False):
     """Loads a dataframe from a csv
     Parameters
     ----------
         csv_path: string, path to the csv so it can be read
+        sidecar: bool, keep the loaded dataframe in an arrow file next to the csv (csv_path + ".arrow")
+            and memory map that instead of parsing the csv again, until the csv changes
 
     Returns
         df, A basic dataframe with the data from the csv
@@ -51,13 +69,67 @@ def load_basic_df_from_csv(csv_path: str):
     if not os.path.isfile(csv_path):
         raise Exception(f"File not found: {csv_path}")
 
-    df = pd.read_csv(csv_path, header=0)
-    df = standardize_df(df)
+    if sidecar:
+        df = read_csv_sidecar(csv_path)
+        if df is not None:
+            return df
+
+    # the pyarrow reader parses the candle columns straight to floats, the frame is new so it isn't copied
+    table = pa_csv.read_csv(csv_path, convert_options=CSV_CONVERT_OPTIONS)
+    if "date" in table.column_names and pa.types.is_timestamp(table.schema.field("date").type):
+        date_type = table.schema.field("date").type
+        if date_type.unit in ("s", "ms"):
+            # pandas parses date strings to (at least) microseconds
+            date = table["date"].cast(pa.timestamp("us", date_type.tz))
+            table = table.set_column(table.column_names.index("date"), "date", date)
+    df = standardize_df(table.to_pandas(), copy=False)
+
+    if sidecar:
+        write_csv_sidecar(csv_path, df)
 
     return df
 
 
-def prepare_df(df: pd.DataFrame, backtest: dict):
+def _csv_source(csv_path: str) -> bytes:
+    stat = os.stat(csv_path)
+    return json.dumps({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}).encode()
+
+
+def read_csv_sidecar(csv_path: str) -> Optional[pd.DataFrame]:
+    """The dataframe saved by write_csv_sidecar, None if there isn't one or the csv changed since."""
+    path = csv_path + ".arrow"
+    if not os.path.exists(path):
+        return None
+    try:
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+    except Exception:
+        # a broken sidecar is parsed again and replaced
+        return None
+    if (table.schema.metadata or {}).get(SIDECAR_SOURCE_KEY) != _csv_source(csv_path):
+        return None
+    return table.to_pandas()
+
+
+def write_csv_sidecar(csv_path: str, df: pd.DataFrame) -> None:
+    """Saves the dataframe loaded from csv_path next to it, stamped with the size and modified time of the csv.
+
+    It is an uncompressed arrow (feather v2) file, unlike parquet it keeps every dtype as it is (seconds
+    timestamps too) and can be memory mapped.
+    """
+    path = csv_path + ".arrow"
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), SIDECAR_SOURCE_KEY: _csv_source(csv_path)})
+    try:
+        with pa.OSFile(path + ".tmp", "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        # the csv can be somewhere read only, it is parsed every time then
+        pass
+
+
+def prepare_df(df: pd.DataFrame, backtest: dict, cache: IndicatorCache = indicator_cache, warm_up: bool = False):
     """Prepares the provided dataframe for a backtest by applying the datapoints and splicing based on the given backtest.
         Useful when loading an existing dataframe (ex. from a cache).
 
@@ -65,6 +137,9 @@ def prepare_df(df: pd.DataFrame, backtest: dict):
     ----------
         df: DataFrame, should have all the open, high, low, close, volume data set as headers and indexed by date
         backtest: dict, provides instructions on how to build the dataframe
+        cache: IndicatorCache, passed on to apply_transformers_to_dataframe
+        warm_up: bool, calculate the datapoints on the rows before start too and only trim to start after,
+            so they are warmed up on the first row of the backtest
 
     Returns
     ------
@@ -83,8 +158,13 @@ def prepare_df(df: pd.DataFrame, backtest: dict):
 
     start_time = backtest.get("start")
     stop_time = backtest.get("stop")
-    df = apply_charting_to_df(df, freq, start_time, stop_time)
-    df = apply_transformers_to_dataframe(df, datapoints)
+    if warm_up and start_time:
+        df = apply_charting_to_df(df, freq, None, stop_time)
+        df = apply_transformers_to_dataframe(df, datapoints, cache=cache)
+        df = apply_charting_to_df(df, freq, start_time, None)
+    else:
+        df = apply_charting_to_df(df, freq, start_time, stop_time)
+        df = apply_transformers_to_dataframe(df, datapoints, cache=cache)
     trailing_stop_loss = backtest.get("trailing_stop_loss", 0)
     if trailing_stop_loss:
         df["trailing_stop_loss"] = df["close"].cummax() * (
@@ -150,6 +230,7 @@ def apply_charting_to_df(df: pd.DataFrame, freq: str, start_time: str, stop_time
 def apply_transformers_to_dataframe(
     df: pd.DataFrame,
     transformers: list,
+    cache: IndicatorCache = indicator_cache,
 ):
     """Applies indications from the backtest to the dataframe
     Parameters
@@ -164,6 +245,7 @@ def apply_transformers_to_dataframe(
             "args": [], list arguments to pass the the function,
             "freq": "", string, frequency of the transformer, default is the freq in the backtest
         }
+        cache: IndicatorCache, where to look up and store transformer results, None to always recompute
 
     Returns
     -------
@@ -173,58 +255,158 @@ def apply_transformers_to_dataframe(
     base_freq = infer_frequency(df)
     # set the freq of the dataframe
     df = df.asfreq(base_freq)
-    # return df
-    for ind in transformers:
+    if not transformers:
+        return df
+
+    # the outputs are collected as aligned columns and the frame is only put together once at the end.
+    # the first transformer sees the candles as they are, the rest see them forward filled
+    candles = df
+    columns = {}
+    # the candles only change once, when they are forward filled after the first transformer,
+    # so the data fingerprints (None for the candles themselves) are only computed once per freq on
+    # each side of that, same for the candles resampled to each datapoint freq
+    fingerprints = {}
+    views = None
+    for idx, ind in enumerate(transformers):
         transformer = ind.get("transformer")
         field_name = ind.get("name")
         freq = ind.get("freq", None)
+        args = ind.get("args", [])
+
+        # the transformer sees the earlier outputs it takes as args (and any that replaced a candle column)
+        overrides = {
+            name: values
+            for name, values in columns.items()
+            if name in candles.columns or any(isinstance(arg, str) and arg == name for arg in args)
+        }
+        # a frame of its own, transformers can add columns to it
+        frame = candles.assign(**overrides) if overrides else candles.copy(deep=False)
+        # a datapoint named after a candle column replaced it, the frame has its own fingerprint
+        replaces_candles = any(name in OHLCV_COLUMNS for name in overrides)
 
         # Create a temporary dataframe with the desired frequency
-        if freq:
-            tmp_df = (
-                df.resample(freq)
-                .agg(
-                    {
-                        "open": "first",
-                        "high": "max",
-                        "low": "min",
-                        "close": "last",
-                        "volume": "sum",
-                    }
-                )
-                .ffill()
-            )
+        if freq and replaces_candles:
+            tmp_df = frame.resample(freq).agg(OHLCV_AGG).ffill()
+        elif freq:
+            if views is None:
+                # the candles resampled before, in this call or an earlier one on the same candles
+                views = {}
+                if cache is not None:
+                    if None not in fingerprints:
+                        fingerprints[None] = data_fingerprint(candles)
+                    views = cache.resampled(fingerprints[None])
+            tmp_df = resample_candles(candles, freq, views, cache, fingerprints.get(None))
         else:
-            tmp_df = df
+            tmp_df = frame
 
         # make sure the transformer is in the transformers_map
         if transformer not in transformers_map:
             raise ValueError(f"Transformer '{transformer}' not a valid transformer.")
-        try:
-            if len(ind.get("args", [])):
-                args = ind.get("args")
-                trans_res = transformers_map[transformer](tmp_df, *args)
+
+        cache_key = None
+        trans_res = None
+        if cache is not None and IndicatorCache.is_cacheable(tmp_df, args):
+            if replaces_candles:
+                fingerprint = data_fingerprint(tmp_df)
             else:
-                trans_res = transformers_map[transformer](tmp_df)
-        except Exception as e:
-            raise TransformerError(f"Error applying transformer '{transformer}': {e}")
+                if freq not in fingerprints:
+                    fingerprints[freq] = data_fingerprint(tmp_df)
+                fingerprint = fingerprints[freq]
+            cache_key = cache.make_key(fingerprint, transformer, transformers_map[transformer], args, freq)
+            trans_res = cache.get(cache_key)
+
+        if trans_res is None:
+            try:
+                if len(args):
+                    trans_res = transformers_map[transformer](tmp_df, *args)
+                else:
+                    trans_res = transformers_map[transformer](tmp_df)
+            except Exception as e:
+                raise TransformerError(f"Error applying transformer '{transformer}': {e}")
+            if cache_key is not None and isinstance(trans_res, (pd.Series, pd.DataFrame)):
+                cache.put(cache_key, trans_res)
 
         if isinstance(trans_res, pd.DataFrame):
-            df = process_res_df(df, ind, trans_res)
-            # resample the dataframe to the base freq
-
+            for key in trans_res.keys().values:
+                columns[datapoint_column(ind, key)] = _aligned(trans_res[key], df.index)
         elif isinstance(trans_res, pd.Series):
-            df[field_name] = trans_res
-
-        df = df.asfreq(base_freq).ffill()
-
-    return df
+            columns[field_name] = _aligned(trans_res, df.index)
+
+        if idx == 0:
+            candles = df.ffill()
+            # without gaps in the candles the fingerprints and the resampled candles stay the same
+            if df[[column for column in OHLCV_COLUMNS if column in df.columns]].isna().any(axis=None):
+                fingerprints = {}
+                views = None
+
+    return pd.DataFrame({**{column: candles[column] for column in candles.columns}, **columns}, index=df.index)
+
+
+def _freq_span(freq: str, index: pd.DatetimeIndex) -> Optional[pd.Timedelta]:
+    """How long the bins of freq are, None when they aren't all the same length (months, weeks, days with a tz)."""
+    try:
+        offset = to_offset(freq)
+    except ValueError:
+        return None
+    if isinstance(offset, Day) and index.tz is None:
+        return pd.Timedelta(days=offset.n)
+    try:
+        return pd.Timedelta(offset)
+    except (TypeError, ValueError):
+        return None
+
+
+def resample_candles(
+    candles: pd.DataFrame,
+    freq: str,
+    views: dict,
+    cache: Optional[IndicatorCache] = None,
+    fingerprint: Optional[str] = None,
+) -> pd.DataFrame:
+    """The OHLCV candles resampled to freq and forward filled.
+
+    views holds the candles already resampled (and not filled) by freq and gets the new one. A freq that
+    isn't in views or the cache is built from the coarsest view that evenly divides it, 1h from 15Min,
+    and from the candles when there is none. The bins of both start at midnight on the first day, so
+    the open, high, low and close are the same either way. A fractional volume is a sum of sums and can
+    be off in the last digit.
+    """
+    view = views.get(freq)
+    if view is None and cache is not None:
+        view = cache.get_resampled(fingerprint, freq)
+    if view is None:
+        source = candles
+        span = _freq_span(freq, candles.index)
+        if span is not None:
+            finer = [
+                (finer_span, finer_freq)
+                for finer_freq, finer_span in ((f, _freq_span(f, candles.index)) for f in views)
+                if finer_span is not None and finer_span < span and span % finer_span == pd.Timedelta(0)
+            ]
+            if finer:
+                source = views[max(finer)[1]]
+        view = source.resample(freq).agg(OHLCV_AGG)
+        if cache is not None:
+            cache.put_resampled(fingerprint, freq, view)
+    views[freq] = view
+    return view.ffill()
+
+
+def _aligned(values: pd.Series, index: pd.Index) -> pd.Series:
+    """values on the rows of index, forward filled like the rest of the frame.
+
+    Only the outputs of another freq (or index) are reindexed, and only the ones with gaps are filled.
+    """
+    if not values.index.equals(index):
+        values = values.reindex(index)
+    return values.ffill() if values.hasnans else values
 
 
 def process_res_df(df, ind, trans_res):
     """handle if a transformer returns multiple columns
     To manage this, we just add the name of column in a clean
-    way, removing periods and lowercasing it.
+    way, removing periods and lowercasing it, see datapoint_column.
+    apply_transformers_to_dataframe builds its columns with datapoint_column directly.
 
     Parameters
     ----------
@@ -237,17 +419,20 @@ def process_res_df(df, ind, trans_res):
     df, dataframe, updated dataframe with the new columns
     """
     for key in trans_res.keys().values:
-        i_name = ind.get("name")
-        clean_key = key.lower()
-        clean_key = clean_key.replace(".", "")
-        clean_key = clean_key.replace(" ", "_")
-        # include the name of the transformer in the key
-        df_key = f"{i_name}_{ind.get('transformer')}_{clean_key}"
-        df[df_key] = trans_res[key]
+        df[datapoint_column(ind, key)] = trans_res[key]
 
     return df
 
 
+def datapoint_column(ind, key):
+    """The dataframe column of one of the columns a transformer returns, e.g. macd_macd_signal"""
+    clean_key = key.lower()
+    clean_key = clean_key.replace(".", "")
+    clean_key = clean_key.replace(" ", "_")
+    # include the name of the transformer in the key
+    return f"{ind.get('name')}_{ind.get('transformer')}_{clean_key}"
+
+
 def detect_time_unit(str_or_int: str or int):
     """Determines a if a timestamp is really a timestamp and if it
     matches is in seconds or milliseconds
@@ -269,41 +454,43 @@ def detect_time_unit(str_or_int: str or int):
         return "ms"
 
 
-def standardize_df(df: pd.DataFrame):
+def standardize_df(df: pd.DataFrame, copy: bool = True):
     """Standardizes a dataframe with the basic features used
     throughout the project.
     Parameters
     ----------
         df: A pandas dataframe (probably one just created) with
     at least the required columns of: date, open, close, high, low, volume.
+        copy: bool, False when df was just created and is only used through the result
 
     Returns
     -------
         A new pandas dataframe of with all the data in the expected types.
     """
-    new_df = df.copy()
+    new_df = df.copy() if copy else df
 
     if "date" in new_df.columns:
         new_df = new_df.set_index("date")
 
-    ts = str(new_df.index[0])
-    time_unit = detect_time_unit(ts)
-    if time_unit:
-        new_df.index = pd.to_datetime(new_df.index, unit=time_unit)
-    else:
-        new_df.index = pd.to_datetime(new_df.index)
-    new_df = new_df[~new_df.index.duplicated(keep="first")]
-    new_df = new_df.sort_index()
+    if not pd.api.types.is_datetime64_any_dtype(new_df.index):
+        time_unit = detect_time_unit(new_df.index[0]) if len(new_df.index) else None
+        if time_unit:
+            new_df.index = pd.to_datetime(new_df.index, unit=time_unit)
+        else:
+            new_df.index = pd.to_datetime(new_df.index)
+    # a clean csv is already unique and sorted, the checks are much cheaper than the dedup and sort
+    if not new_df.index.is_unique:
+        new_df = new_df[~new_df.index.duplicated(keep="first")]
+    if not new_df.index.is_monotonic_increasing:
+        new_df = new_df.sort_index()
 
     columns_to_drop = ["ignore", "date"]
 
     new_df = new_df.drop(columns=columns_to_drop, errors="ignore")
 
-    new_df.open = pd.to_numeric(new_df.open)
-    new_df.close = pd.to_numeric(new_df.close)
-    new_df.high = pd.to_numeric(new_df.high)
-    new_df.low = pd.to_numeric(new_df.low)
-    new_df.volume = pd.to_numeric(new_df.volume)
+    for column in OHLCV_COLUMNS:
+        if not pd.api.types.is_numeric_dtype(new_df[column]):
+            new_df[column] = pd.to_numeric(new_df[column])
 
     return new_df
 
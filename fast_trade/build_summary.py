@@ -1,6 +1,8 @@
 import datetime
 import warnings
+from functools import cached_property
 
+import numpy as np
 import pandas as pd
 
 from fast_trade.calculate_perc_missing import calculate_perc_missing
@@ -17,11 +19,13 @@ from fast_trade.summary import (
     calculate_time_analysis,
     calculate_trade_quality,
     calculate_trade_streaks,
+    create_round_trips,
     create_trade_log,
     summarize_time_held,
     summarize_trade_perc,
     summarize_trades,
 )
+from fast_trade.summary import kernel
 
 __all__ = [
     "calculate_buy_and_hold_perc",
@@ -36,134 +40,204 @@ __all__ = [
     "calculate_time_analysis",
     "calculate_trade_quality",
     "calculate_trade_streaks",
+    "create_round_trips",
     "create_trade_log",
     "summarize_time_held",
     "summarize_trade_perc",
     "summarize_trades",
     "build_summary",
+    "SUMMARY_METRICS",
+    "SummaryContext",
 ]
 
 
-def build_summary(df, performance_start_time):
-    equity_peak = round(df["account_value"].max(), 3)
-    equity_final = round(df.iloc[-1]["adj_account_value"], 3)
-    max_drawdown = round(df["adj_account_value"].min(), 3)
-
-    performance_stop_time = datetime.datetime.utcnow()
-    start_date = df.index[0]
-    end_date = df.index[-1]
-
-    total_enter = len(df[df.action == "e"]) + len(df[df.action == "ae"])
-    total_exit = len(df[df.action == "x"]) + len(df[df.action == "ax"])
-    total_hold = len(df[df.action == "h"])
-
-    trade_log_df = create_trade_log(df)
-    total_trades = len(trade_log_df.index)
-
-    (
-        mean_trade_time_held,
-        max_trade_time_held,
-        min_trade_time_held,
-        median_time_held,
-    ) = summarize_time_held(trade_log_df)
-
-    (
-        max_trade_perc,
-        min_trade_perc,
-        mean_trade_perc,
-        median_trade_perc,
-    ) = summarize_trade_perc(trade_log_df)
-
-    total_fees = round(df.fee.sum(), 3)
-    win_trades = trade_log_df[trade_log_df.adj_account_value_change_perc > 0]
-    loss_trades = trade_log_df[trade_log_df.adj_account_value_change_perc < 0]
-
-    (total_num_winning_trades, avg_win_perc, win_perc) = summarize_trades(
-        win_trades, total_trades
-    )
-    (total_num_losing_trades, avg_loss_perc, loss_perc) = summarize_trades(
-        loss_trades, total_trades
-    )
-
+def _clean(value, cast=float):
+    return cast(0 if pd.isna(value) else value)
+
+
+def _seconds(value):
+    return round(value.total_seconds(), 3) if isinstance(value, datetime.timedelta) else 0
+
+
+class SummaryContext:
+    """
+    The intermediates of one backtest summary, each computed the first time a metric needs it.
+
+    The trade log, the drawdown series, the in trade runs and the action counts are shared by
+    every metric that uses them, and metrics that depend on other metrics (ex. market_adjusted_return)
+    get them through get, so nothing is computed twice and nothing that isn't asked for is computed.
+    The account metrics are computed by the summary kernel on the numpy arrays of the columns,
+    taken once from the dataframe.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.values = {}
+        self.arrays = {}
+
+    def get(self, key: str):
+        if key not in self.values:
+            self.values[key] = SUMMARY_METRICS[key](self)
+        return self.values[key]
+
+    def array(self, column: str) -> np.ndarray:
+        """The column as a float array, a view of the dataframe's when it's already float64."""
+        if column not in self.arrays:
+            self.arrays[column] = self.df[column].to_numpy(dtype=np.float64)
+        return self.arrays[column]
+
+    @cached_property
+    def in_trade(self) -> np.ndarray:
+        return self.df["in_trade"].to_numpy(dtype=bool)
+
+    @cached_property
+    def trade_log(self) -> pd.DataFrame:
+        return create_trade_log(self.df)
+
+    @cached_property
+    def drawdowns(self) -> np.ndarray:
+        return kernel.drawdowns(self.array("adj_account_value"))
+
+    @cached_property
+    def in_trade_durations(self) -> np.ndarray:
+        """The length of every in trade run, in rows."""
+        return kernel.run_lengths(self.in_trade)
+
+    @cached_property
+    def action_counts(self) -> pd.Series:
+        return self.df.action.value_counts()
+
+    @cached_property
+    def time_held(self) -> tuple:
+        return summarize_time_held(self.trade_log)
+
+    @cached_property
+    def trade_perc(self) -> tuple:
+        return summarize_trade_perc(self.trade_log)
+
+    @cached_property
+    def winning_trades(self) -> tuple:
+        trade_log = self.trade_log
+        return summarize_trades(trade_log[trade_log.adj_account_value_change_perc > 0], len(trade_log.index))
+
+    @cached_property
+    def losing_trades(self) -> tuple:
+        trade_log = self.trade_log
+        return summarize_trades(trade_log[trade_log.adj_account_value_change_perc < 0], len(trade_log.index))
+
+    @cached_property
+    def perc_missing(self) -> list:
+        return calculate_perc_missing(self.df)
+
+    def count_actions(self, *actions) -> int:
+        return int(sum(self.action_counts.get(action, 0) for action in actions))
+
+
+# every key of the summary, in the order build_summary returns them. test_duration is set by
+# build_summary once everything else is computed
+SUMMARY_METRICS = {
+    "return_perc": lambda ctx: kernel.calculate_return_perc(ctx.array("adj_account_value")),
+    "sharpe_ratio": lambda ctx: kernel.calculate_shape_ratio(ctx.array("adj_account_value_change_perc")),
+    "buy_and_hold_perc": lambda ctx: kernel.calculate_buy_and_hold_perc(ctx.array("close")),
+    "median_trade_len": lambda ctx: _seconds(ctx.time_held[3]),
+    "mean_trade_len": lambda ctx: _seconds(ctx.time_held[0]),
+    "max_trade_held": lambda ctx: _seconds(ctx.time_held[1]),
+    "min_trade_len": lambda ctx: _seconds(ctx.time_held[2]),
+    "total_num_winning_trades": lambda ctx: _clean(ctx.winning_trades[0]),
+    "total_num_losing_trades": lambda ctx: _clean(ctx.losing_trades[0]),
+    "avg_win_perc": lambda ctx: _clean(ctx.winning_trades[1]),
+    "avg_loss_perc": lambda ctx: _clean(ctx.losing_trades[1]),
+    "best_trade_perc": lambda ctx: _clean(ctx.trade_perc[0]),
+    "min_trade_perc": lambda ctx: _clean(ctx.trade_perc[1]),
+    "median_trade_perc": lambda ctx: _clean(ctx.trade_perc[3]),
+    "mean_trade_perc": lambda ctx: _clean(ctx.trade_perc[2]),
+    "num_trades": lambda ctx: len(ctx.trade_log.index),
+    "win_perc": lambda ctx: _clean(ctx.winning_trades[2]),
+    "loss_perc": lambda ctx: _clean(ctx.losing_trades[2]),
+    "equity_peak": lambda ctx: _clean(round(kernel.nan_max(ctx.array("account_value")), 3)),
+    "equity_final": lambda ctx: _clean(round(ctx.array("adj_account_value")[-1], 3)),
+    "max_drawdown": lambda ctx: _clean(round(kernel.nan_min(ctx.array("adj_account_value")), 3)),
+    "total_fees": lambda ctx: _clean(round(kernel.nan_sum(ctx.array("fee")), 3)),
+    "first_tic": lambda ctx: ctx.df.index[0].strftime("%Y-%m-%d %H:%M:%S"),
+    "last_tic": lambda ctx: ctx.df.index[-1].strftime("%Y-%m-%d %H:%M:%S"),
+    "total_tics": lambda ctx: len(ctx.df.index),
+    "perc_missing": lambda ctx: _clean(ctx.perc_missing[0]),
+    "total_missing": lambda ctx: _clean(ctx.perc_missing[1], int),
+    "test_duration": lambda ctx: 0.0,
+    "num_of_enter_signals": lambda ctx: ctx.count_actions("e", "ae"),
+    "num_of_exit_signals": lambda ctx: ctx.count_actions("x", "ax"),
+    "num_of_hold_signals": lambda ctx: ctx.count_actions("h"),
+    "market_adjusted_return": lambda ctx: calculate_market_adjusted_returns(
+        ctx.df, ctx.get("return_perc"), ctx.get("buy_and_hold_perc")
+    ),
+    "position_metrics": lambda ctx: kernel.calculate_position_metrics(
+        ctx.array("aux"), ctx.in_trade, ctx.array("fee"), ctx.array("adj_account_value"), ctx.in_trade_durations
+    ),
+    "trade_quality": lambda ctx: calculate_trade_quality(ctx.trade_log),
+    "market_exposure": lambda ctx: kernel.calculate_market_exposure(ctx.in_trade, ctx.in_trade_durations),
+    "effective_trades": lambda ctx: calculate_effective_trades(ctx.df, ctx.trade_log),
+    "drawdown_metrics": lambda ctx: kernel.calculate_drawdown_metrics(ctx.drawdowns),
+    "risk_metrics": lambda ctx: kernel.calculate_risk_metrics(ctx.array("adj_account_value_change_perc"), ctx.drawdowns),
+    "trade_streaks": lambda ctx: calculate_trade_streaks(ctx.trade_log),
+    "time_analysis": lambda ctx: calculate_time_analysis(ctx.df),
+}
+
+
+def _select(metrics):
+    """
+    Which top level summary keys the requested metrics need, and for the grouped ones (ex.
+    "drawdown_metrics.max_drawdown_pct") which of their keys to keep, None keeps them all.
+    Names that aren't summary metrics are skipped.
+    """
+    selected = {}
+    for metric in metrics:
+        key, _, sub_key = str(metric).partition(".")
+        if key not in SUMMARY_METRICS:
+            continue
+        if not sub_key:
+            selected[key] = None
+        elif selected.get(key, []) is not None:
+            selected.setdefault(key, []).append(sub_key)
+    return selected
+
+
+def build_summary(df, performance_start_time, metrics=None):
+    """
+    Summarizes a backtest.
+
+    Every metric is computed only when it is asked for and the intermediates they share (the trade
+    log, the drawdowns, ...) are computed once, see SummaryContext.
+
+    Parameters
+    ----------
+    df: pandas dataframe, the processed backtest
+    performance_start_time: datetime, when the backtest started, for test_duration
+    metrics: list of str, optional, the summary keys to compute (ex. ["return_perc",
+        "drawdown_metrics.max_drawdown_pct"]), all of them by default
+
+    Returns
+    -------
+    (summary, trade_log), the trade log is empty when none of the requested metrics needed it
+    """
+    context = SummaryContext(df)
+    selected = dict.fromkeys(SUMMARY_METRICS) if metrics is None else _select(metrics)
+
+    summary = {}
     with warnings.catch_warnings():
         warnings.simplefilter("ignore", category=RuntimeWarning)
-        return_perc = calculate_return_perc(df)
-        sharpe_ratio = calculate_shape_ratio(df)
-        buy_and_hold_perc = calculate_buy_and_hold_perc(df)
-
-        market_adjusted_return = calculate_market_adjusted_returns(
-            df, return_perc, buy_and_hold_perc
-        )
-        position_metrics = calculate_position_metrics(df)
-        trade_quality = calculate_trade_quality(trade_log_df)
-        market_exposure = calculate_market_exposure(df)
-        effective_trades = calculate_effective_trades(df, trade_log_df)
-
-        drawdown_metrics = calculate_drawdown_metrics(df)
-        risk_metrics = calculate_risk_metrics(df)
-        trade_streaks = calculate_trade_streaks(trade_log_df)
-        time_analysis = calculate_time_analysis(df)
-
+        for key in SUMMARY_METRICS:
+            if key not in selected:
+                continue
+            value = context.get(key)
+            sub_keys = selected[key]
+            if sub_keys is not None and isinstance(value, dict):
+                value = {sub_key: value[sub_key] for sub_key in value if sub_key in sub_keys}
+            summary[key] = value
+
+    if "test_duration" in summary:
         performance_stop_time = datetime.datetime.utcnow()
+        summary["test_duration"] = round((performance_stop_time - performance_start_time).total_seconds(), 3)
 
-        [perc_missing, total_missing_dates] = calculate_perc_missing(df)
-
-    if isinstance(median_time_held, datetime.timedelta):
-        median_time_held = round(median_time_held.total_seconds(), 3)
-        mean_trade_time_held = round(mean_trade_time_held.total_seconds(), 3)
-        max_trade_time_held = round(max_trade_time_held.total_seconds(), 3)
-        min_trade_time_held = round(min_trade_time_held.total_seconds(), 3)
-    else:
-        median_time_held = 0
-        mean_trade_time_held = 0
-        max_trade_time_held = 0
-        min_trade_time_held = 0
-
-    summary = {
-        "return_perc": float(return_perc if not pd.isna(return_perc) else 0),
-        "sharpe_ratio": float(sharpe_ratio if not pd.isna(sharpe_ratio) else 0),
-        "buy_and_hold_perc": float(buy_and_hold_perc if not pd.isna(buy_and_hold_perc) else 0),
-        "median_trade_len": median_time_held if not pd.isna(median_time_held) else 0,
-        "mean_trade_len": mean_trade_time_held if not pd.isna(mean_trade_time_held) else 0,
-        "max_trade_held": max_trade_time_held if not pd.isna(max_trade_time_held) else 0,
-        "min_trade_len": min_trade_time_held if not pd.isna(min_trade_time_held) else 0,
-        "total_num_winning_trades": float(
-            total_num_winning_trades if not pd.isna(total_num_winning_trades) else 0
-        ),
-        "total_num_losing_trades": float(
-            total_num_losing_trades if not pd.isna(total_num_losing_trades) else 0
-        ),
-        "avg_win_perc": float(avg_win_perc if not pd.isna(avg_win_perc) else 0),
-        "avg_loss_perc": float(avg_loss_perc if not pd.isna(avg_loss_perc) else 0),
-        "best_trade_perc": float(max_trade_perc if not pd.isna(max_trade_perc) else 0),
-        "min_trade_perc": float(min_trade_perc if not pd.isna(min_trade_perc) else 0),
-        "median_trade_perc": float(median_trade_perc if not pd.isna(median_trade_perc) else 0),
-        "mean_trade_perc": float(mean_trade_perc if not pd.isna(mean_trade_perc) else 0),
-        "num_trades": int(total_trades if not pd.isna(total_trades) else 0),
-        "win_perc": float(win_perc if not pd.isna(win_perc) else 0),
-        "loss_perc": float(loss_perc if not pd.isna(loss_perc) else 0),
-        "equity_peak": float(equity_peak if not pd.isna(equity_peak) else 0),
-        "equity_final": float(equity_final if not pd.isna(equity_final) else 0),
-        "max_drawdown": float(max_drawdown if not pd.isna(max_drawdown) else 0),
-        "total_fees": float(total_fees if not pd.isna(total_fees) else 0),
-        "first_tic": start_date.strftime("%Y-%m-%d %H:%M:%S"),
-        "last_tic": end_date.strftime("%Y-%m-%d %H:%M:%S"),
-        "total_tics": len(df.index),
-        "perc_missing": float(perc_missing if not pd.isna(perc_missing) else 0),
-        "total_missing": int(total_missing_dates if not pd.isna(total_missing_dates) else 0),
-        "test_duration": round((performance_stop_time - performance_start_time).total_seconds(), 3),
-        "num_of_enter_signals": total_enter,
-        "num_of_exit_signals": total_exit,
-        "num_of_hold_signals": total_hold,
-        "market_adjusted_return": market_adjusted_return,
-        "position_metrics": position_metrics,
-        "trade_quality": trade_quality,
-        "market_exposure": market_exposure,
-        "effective_trades": effective_trades,
-        "drawdown_metrics": drawdown_metrics,
-        "risk_metrics": risk_metrics,
-        "trade_streaks": trade_streaks,
-        "time_analysis": time_analysis,
-    }
-
+    # the cached trade log, when a metric needed it
+    trade_log_df = vars(context).get("trade_log", pd.DataFrame())
     return summary, trade_log_df
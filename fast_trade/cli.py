@@ -27,14 +27,25 @@ from rich.live import Live
 from rich.table import Table
 
 from fast_trade.archive.cli import download_asset, get_assets
-from fast_trade.archive.db_helpers import connect_to_db, migrate_sqlite_to_parquet
+from fast_trade.archive.db_helpers import (
+    connect_to_db,
+    kline_archive_exists,
+    latest_kline_date,
+    migrate_sqlite_to_parquet,
+    read_kline_archive,
+)
 from fast_trade.archive.update_archive import update_archive
 from fast_trade.archive.update_kline import update_kline
 from fast_trade.ml.evolver import optimize_strategy
+from fast_trade.ml.fitness_cache import FitnessCache, default_cache_path
+from fast_trade.ml.sweep import SAMPLERS as SWEEP_SAMPLERS
+from fast_trade.ml.sweep import default_results_path, run_sweep
+from fast_trade.ml.walk_forward import run_walk_forward
 from fast_trade.ml.regime import apply_regime_model, load_regime_model, train_regime_model, save_regime_model
 from fast_trade.validate_backtest import validate_backtest
 from fast_trade.build_data_frame import prepare_df
 from fast_trade.run_backtest import compile_action_logic, determine_action_compiled
+from fast_trade.streaming import DatapointStream, can_stream
 from fast_trade.cli_render import format_value as _format_value
 from fast_trade.cli_render import render_kv_table as _render_kv_table
 from fast_trade.cli_render import render_summary as _render_summary
@@ -54,6 +65,7 @@ from .cli_helpers import (
     render_plot_preview_from_data,
     save,
 )
+from .run_backtest import max_datapoint_periods as _max_datapoint_periods
 from .run_backtest import run_backtest
 
 app = typer.Typer(help="Fast Trade CLI", add_completion=False)
@@ -267,18 +279,12 @@ def backtest(
             now = datetime.datetime.now(datetime.timezone.utc)
             start_val = None
             archive_path = os.getenv("ARCHIVE_PATH", "ft_archive")
-            db_path = os.path.join(archive_path, exchange, f"{symbol}.parquet")
-            if os.path.exists(db_path):
-                try:
-                    df = pd.read_parquet(db_path)
-                    if "date" in df.columns:
-                        df = df.set_index("date")
-                    df.index = pd.to_datetime(df.index)
-                    latest = df.index.max()
-                    if latest:
-                        start_val = latest
-                except Exception:
-                    start_val = None
+            try:
+                latest = latest_kline_date(symbol, exchange, archive_path=archive_path)
+                if latest:
+                    start_val = latest
+            except Exception:
+                start_val = None
             if not start_val:
                 start_val = strat_obj.get("start")
                 if isinstance(start_val, str):
@@ -749,29 +755,16 @@ def _load_backtest_summary(run_path: str) -> dict:
     raise FileNotFoundError("summary.yml or summary.json not found")
 
 
-def _max_datapoint_periods(backtest: dict) -> int:
-    max_period = 0
-    for dp in backtest.get("datapoints", []):
-        args = dp.get("args", [])
-        periods = [int(a) for a in args if isinstance(a, int)]
-        if periods:
-            max_period = max(max_period, max(periods))
-    return max_period
-
-
 def _load_latest_ohlcv(exchange: str, symbol: str, lookback_rows: int) -> pd.DataFrame:
     archive_path = os.getenv("ARCHIVE_PATH", "ft_archive")
-    path = os.path.join(archive_path, exchange, f"{symbol}.parquet")
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"Archive not found: {path}")
-    from fast_trade.archive.db_helpers import _safe_read_parquet, get_kline
+    if not kline_archive_exists(symbol, exchange, archive_path=archive_path):
+        raise FileNotFoundError(f"Archive not found: {os.path.join(archive_path, exchange, symbol)}")
+    from fast_trade.archive.db_helpers import get_kline
 
-    df = _safe_read_parquet(path)
+    df = read_kline_archive(symbol, exchange, archive_path=archive_path)
     if df is None:
         # parquet was corrupted; it has been removed. Rebuild from source.
         df = get_kline(symbol, exchange, freq="1Min")
-    if "date" in df.columns:
-        df = df.set_index("date")
     df.index = pd.to_datetime(df.index)
     if lookback_rows and len(df) > lookback_rows:
         df = df.tail(lookback_rows)
@@ -861,9 +854,14 @@ def logs_cmd(
 
 
 @app.command("update_archive")
-def update_archive_cmd():
+def update_archive_cmd(
+    workers: Optional[int] = typer.Option(None, "--workers", help="Symbols to update at once"),
+):
     console.print(Panel.fit("Updating archive", style="yellow"))
-    update_archive()
+    result = update_archive(max_workers=workers)
+    if result["failed"]:
+        console.print(f"[red]Archive update finished with {len(result['failed'])} failed symbols[/red]")
+        raise typer.Exit(code=1)
     console.print("[green]Archive update complete[/green]")
 
 
@@ -960,6 +958,8 @@ def portfolio_start_cmd(
     console.print(Panel.fit(f"Portfolio {name} — {symbol} ({exchange})", style="blue"))
     console.print(f"[cyan]State[/cyan] cash={state.get('cash')} position={state.get('position_qty')}")
     compiled_action_logic = compile_action_logic(strategy_obj)
+    # the datapoints are updated one candle at a time when they all can be, the state keeps them across restarts
+    stream = DatapointStream.from_dict(state.get("stream"), strategy_obj) if can_stream(strategy_obj) else None
 
     def _run_cycle():
         nonlocal state
@@ -977,7 +977,11 @@ def portfolio_start_cmd(
             console.print(f"[yellow]{msg}[/yellow]")
             return
 
-        df = prepare_df(df, strategy_obj)
+        if stream is not None:
+            df = stream.update(df)
+            state["stream"] = stream.to_dict()
+        else:
+            df = prepare_df(df, strategy_obj)
         if df.empty:
             msg = f"{datetime.datetime.utcnow().isoformat()} | WARN | empty_df_after_prepare"
             _append_portfolio_log(paths["log"], msg)
@@ -1101,10 +1105,8 @@ def portfolio_stop_cmd(
         pass
 
 
-@app.command("evolve")
-def evolve_cmd(
-    config: str = typer.Argument(..., help="Path to evolver config JSON"),
-):
+def _load_search_config(config: str):
+    """(config, base strategy, genes) of an evolve or sweep config file."""
     if config.endswith((".yml", ".yaml")):
         console.print("[yellow]YAML is supported but JSON is the default format[/yellow]")
     try:
@@ -1140,6 +1142,22 @@ def evolve_cmd(
                 raise typer.BadParameter("Genes must be list of {name, space} or [name, space]")
     else:
         raise typer.BadParameter("Genes must be a list")
+    return config_payload, base_strategy, genes_list
+
+
+def _settings_fitness_cache(settings: dict) -> Optional[FitnessCache]:
+    """The fitness of every strategy evaluated is kept in the archive, so reruns skip them."""
+    cache_setting = settings.get("fitness_cache", True)
+    if not cache_setting:
+        return None
+    return FitnessCache(cache_setting if isinstance(cache_setting, str) else default_cache_path())
+
+
+@app.command("evolve")
+def evolve_cmd(
+    config: str = typer.Argument(..., help="Path to evolver config JSON"),
+):
+    config_payload, base_strategy, genes_list = _load_search_config(config)
 
     settings = config_payload.get("settings", {})
     fitness_config = config_payload.get("fitness")
@@ -1153,8 +1171,13 @@ def evolve_cmd(
     tournament = settings.get("K_tournament", 4)
     parallel_processing = settings.get("parallel_processing")
     if not parallel_processing:
-        threads = settings.get("threads", 4)
-        parallel_processing = ["thread", threads]
+        if settings.get("threads"):
+            parallel_processing = ["thread", settings.get("threads")]
+        else:
+            # backtests are CPU bound, threads mostly wait on the GIL
+            parallel_processing = ["process", settings.get("processes") or os.cpu_count()]
+
+    fitness_cache = _settings_fitness_cache(settings)
 
     console.print(Panel.fit("Evolving strategy", style="magenta"))
     progress = Progress(
@@ -1168,7 +1191,7 @@ def evolve_cmd(
         transient=True,
     )
 
-    status = {"best": None, "current": None, "gen": 0, "total": generations, "best_genes": None}
+    status = {"best": None, "current": None, "gen": 0, "total": generations, "best_genes": None, "cache": None}
 
     def build_status_table():
         table = Table(title="Evolution Status", box=box.SIMPLE_HEAVY)
@@ -1180,6 +1203,9 @@ def evolve_cmd(
         if status["best_genes"]:
             best_preview = ", ".join(f"{k}={v}" for k, v in status["best_genes"][:5])
             table.add_row("Best Genes", best_preview)
+        if status["cache"]:
+            cache = status["cache"]
+            table.add_row("Cache Hits", f"{cache['hits'] + cache['disk_hits']} ({cache['hit_rate']:.0%})")
         return table
 
     def progress_callback(payload):
@@ -1191,6 +1217,8 @@ def evolve_cmd(
             status["best"] = payload.get("best_fitness")
         if payload.get("best_genes") is not None:
             status["best_genes"] = payload.get("best_genes")
+        if payload.get("cache") is not None:
+            status["cache"] = payload.get("cache")
 
     with Live(build_status_table(), console=console, refresh_per_second=4) as live:
         with progress:
@@ -1220,7 +1248,10 @@ def evolve_cmd(
                 parallel_processing=parallel_processing,
                 progress_callback=wrapped_progress_callback,
                 fitness_config=fitness_config,
+                fitness_cache=fitness_cache,
             )
+    if fitness_cache is not None:
+        fitness_cache.close()
 
     table = Table(title="Best Solution", box=box.SIMPLE_HEAVY)
     table.add_column("Gene", style="cyan", no_wrap=True)
@@ -1231,6 +1262,167 @@ def evolve_cmd(
     console.print(f"[green]Best fitness[/green] {best_fitness}")
 
 
+@app.command("sweep")
+def sweep_cmd(
+    config: str = typer.Argument(..., help="Path to sweep config JSON, same strategy and genes as evolve"),
+    out: Optional[str] = typer.Option(None, "--out", help="Folder of the results parquet files"),
+    resume: bool = typer.Option(True, "--resume/--no-resume", help="Skip the candidates already in --out"),
+    top: int = typer.Option(10, "--top", help="How many of the best candidates to show"),
+):
+    config_payload, base_strategy, genes_list = _load_search_config(config)
+    settings = config_payload.get("settings", {})
+    sampler = settings.get("sampler", "grid")
+    if sampler not in SWEEP_SAMPLERS:
+        raise typer.BadParameter(f"sampler must be one of {SWEEP_SAMPLERS}")
+    results_path = out or default_results_path(os.path.splitext(os.path.basename(config))[0])
+    fitness_cache = _settings_fitness_cache(settings)
+
+    console.print(Panel.fit(f"Sweeping strategy ({sampler})", style="magenta"))
+    progress = Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        TaskProgressColumn(),
+        TimeElapsedColumn(),
+        TimeRemainingColumn(),
+        console=console,
+        transient=True,
+    )
+    with progress:
+        task = progress.add_task("Evaluating candidates", total=None)
+
+        def progress_callback(payload):
+            progress.update(
+                task,
+                total=payload["total"],
+                completed=payload["done"],
+                description=(
+                    f"Evaluating candidates (pruned {payload['pruned']}, errors {payload['errors']}, "
+                    f"resumed {payload['resumed']})"
+                ),
+            )
+
+        try:
+            results = run_sweep(
+                base_strategy,
+                genes_list,
+                sampler=sampler,
+                samples=settings.get("samples"),
+                seed=settings.get("seed", 0),
+                fitness_config=config_payload.get("fitness"),
+                constraints=config_payload.get("constraints"),
+                prune_fraction=settings.get("prune_fraction", 0.25),
+                processes=settings.get("processes") or os.cpu_count(),
+                batch_size=settings.get("batch_size"),
+                results_path=results_path,
+                resume=resume,
+                fitness_cache=fitness_cache,
+                progress_callback=progress_callback,
+            )
+        finally:
+            if fitness_cache is not None:
+                fitness_cache.close()
+
+    if results.empty:
+        console.print("[yellow]No candidates to evaluate[/yellow]")
+        return
+    counts = results["status"].value_counts()
+    console.print(
+        f"[green]{len(results)}[/green] candidates, {int(results['passed'].sum())} passed, "
+        f"{counts.get('pruned', 0)} pruned, {counts.get('error', 0)} errors. Results in {results_path}"
+    )
+    best = results[results["passed"]].sort_values("fitness", ascending=False).head(top)
+    gene_columns = [column for column in results.columns if column.startswith("gene.")]
+    table = Table(title="Best Candidates", box=box.SIMPLE_HEAVY)
+    for column in gene_columns + ["fitness", "return_perc", "sharpe_ratio", "num_trades"]:
+        table.add_column(column.replace("gene.", ""), style="cyan" if column in gene_columns else "white")
+    for _, row in best.iterrows():
+        table.add_row(
+            *[str(row[column]) for column in gene_columns],
+            *[_format_value(row[column]) for column in ["fitness", "return_perc", "sharpe_ratio", "num_trades"]],
+        )
+    console.print(table)
+
+
+# the evolve settings every walk-forward fold passes on to optimize_strategy
+WALK_FORWARD_GA_SETTINGS = [
+    "num_generations",
+    "num_parents_mating",
+    "sol_per_pop",
+    "mutation_percent_genes",
+    "mutation_type",
+    "crossover_type",
+    "parent_selection_type",
+    "K_tournament",
+]
+
+
+@app.command("walk_forward")
+def walk_forward_cmd(
+    config: str = typer.Argument(..., help="Path to walk-forward config JSON, same strategy and genes as evolve"),
+    train: Optional[str] = typer.Option(None, "--train", help="Length of the train windows, e.g. 30D"),
+    test: Optional[str] = typer.Option(None, "--test", help="Length of the test windows, e.g. 7D"),
+    step: Optional[str] = typer.Option(None, "--step", help="How far apart the folds start, defaults to --test"),
+    anchored: Optional[bool] = typer.Option(None, "--anchored/--rolling", help="Train every fold from the start"),
+    out: Optional[str] = typer.Option(None, "--out", help="Folder to write folds.csv and equity.csv to"),
+):
+    config_payload, base_strategy, genes_list = _load_search_config(config)
+    settings = config_payload.get("settings", {})
+    windows = config_payload.get("walk_forward", {})
+    train = train or windows.get("train")
+    test = test or windows.get("test")
+    if not train or not test:
+        raise typer.BadParameter("Set the train and test windows, with --train/--test or walk_forward.train/test")
+    optimizer_settings = {key: settings[key] for key in WALK_FORWARD_GA_SETTINGS if key in settings}
+
+    console.print(Panel.fit(f"Walk-forward: train {train}, test {test}", style="magenta"))
+    progress = Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        TaskProgressColumn(),
+        TimeElapsedColumn(),
+        console=console,
+        transient=True,
+    )
+    with progress:
+        task = progress.add_task("Optimizing folds", total=None)
+        result = run_walk_forward(
+            base_strategy,
+            genes_list,
+            train,
+            test,
+            step=step or windows.get("step"),
+            anchored=windows.get("anchored", False) if anchored is None else anchored,
+            fitness_config=config_payload.get("fitness"),
+            optimizer_settings=optimizer_settings,
+            processes=settings.get("processes") or os.cpu_count(),
+            seed=settings.get("seed", 0),
+            progress_callback=lambda payload: progress.update(task, total=payload["total"], completed=payload["done"]),
+        )
+
+    folds = result["folds"]
+    gene_columns = [column for column in folds.columns if column.startswith("gene.")]
+    metric_columns = ["train_fitness", "test_fitness", "return_perc", "num_trades"]
+    table = Table(title="Folds", box=box.SIMPLE_HEAVY)
+    table.add_column("test window", style="cyan", no_wrap=True)
+    for column in gene_columns + metric_columns:
+        table.add_column(column.replace("gene.", ""), style="cyan" if column in gene_columns else "white")
+    for _, row in folds.iterrows():
+        table.add_row(
+            f"{row['test_start']:%Y-%m-%d %H:%M} → {row['test_stop']:%Y-%m-%d %H:%M}",
+            *[_format_value(row[column]) for column in gene_columns + metric_columns],
+        )
+    console.print(table)
+    _render_kv_table("Out of Sample", [[key, _format_value(value)] for key, value in result["summary"].items()])
+
+    if out:
+        os.makedirs(out, exist_ok=True)
+        folds.to_csv(os.path.join(out, "folds.csv"))
+        result["equity"].to_csv(os.path.join(out, "equity.csv"))
+        console.print(f"[green]Saved[/green] {out}")
+
+
 @app.callback()
 def cli_callback(
     ctx: typer.Context,
@@ -2,8 +2,34 @@ from functools import wraps
 
 import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
 from pandas import DataFrame, Series
 
+# how many values the rolling window helpers work on at once, bounds the window views they materialize
+_WINDOW_BLOCK = 1 << 20
+
+
+def _rolling_windows(values: np.ndarray, period: int, func) -> np.ndarray:
+    """
+    func of every full window of values, aligned on the window's last row (NaN before).
+
+    func gets a 2d block of windows, one per row, and reduces each row the same way it
+    would reduce the window alone, so the results match a rolling apply to the last digit.
+    """
+    out = np.full(len(values), np.nan)
+    if period < 1 or len(values) < period:
+        return out
+    windows = sliding_window_view(values, period)
+    step = max(1, _WINDOW_BLOCK // period)
+    for start in range(0, len(windows), step):
+        block = windows[start:start + step]
+        out[period - 1 + start:period - 1 + start + len(block)] = func(block)
+    return out
+
+
+def _mean_abs_deviation(windows: np.ndarray) -> np.ndarray:
+    return np.abs(windows - windows.mean(axis=1)[:, None]).mean(axis=1)
+
 
 def inputvalidator(input_="ohlc"):
     def dfcheck(func):
@@ -289,23 +315,23 @@ class TA:
         sma = pd.Series(
             ohlc[column].rolling(period).mean(), name="SMA"
         )  # first KAMA is SMA
-        kama = []
+        name = "{0} period KAMA.".format(period)
+        prior = sma.shift().to_numpy()
+        started = np.flatnonzero(pd.notna(prior))
+        if not len(started):
+            return pd.Series([None] * len(sma), index=sma.index, name=name)
+
+        # the first KAMA starts from the prior SMA, then
         # Current KAMA = Prior KAMA + smoothing_constant * (Price - Prior KAMA)
-        for s, ma, price in zip(
-            sc.items(), sma.shift().items(), ohlc[column].items()
+        first = started[0]
+        k = float(prior[first])
+        values = [np.nan] * len(sma)
+        for i, s, price in zip(
+            range(first, len(sma)), sc.to_numpy()[first:].tolist(), ohlc[column].to_numpy(dtype=float)[first:].tolist()
         ):
-            try:
-                kama.append(kama[-1] + s[1] * (price[1] - kama[-1]))
-            except (IndexError, TypeError):
-                if pd.notnull(ma[1]):
-                    kama.append(ma[1] + s[1] * (price[1] - ma[1]))
-                else:
-                    kama.append(None)
-
-        sma["KAMA"] = pd.Series(
-            kama, index=sma.index, name="{0} period KAMA.".format(period)
-        )  # apply the kama list to existing index
-        return sma["KAMA"]
+            k = k + s * (price - k)
+            values[i] = k
+        return pd.Series(values, index=sma.index, name=name)
 
     @classmethod
     def ZLEMA(
@@ -346,16 +372,11 @@ class TA:
         d = (period * (period + 1)) / 2  # denominator
         weights = np.arange(1, period + 1)
 
-        def linear(w):
-            def _compute(x):
-                return (w * x).sum() / d
-
-            return _compute
-
-        _close = ohlc[column].rolling(period, min_periods=period)
-        wma = _close.apply(linear(weights), raw=True)
+        wma = _rolling_windows(
+            ohlc[column].to_numpy(dtype=float), period, lambda windows: (windows * weights).sum(axis=1) / d
+        )
 
-        return pd.Series(wma, name="{0} period WMA.".format(period))
+        return pd.Series(wma, index=ohlc.index, name="{0} period WMA.".format(period))
 
     @classmethod
     def HMA(cls, ohlc: DataFrame, period: int = 16) -> Series:
@@ -400,11 +421,11 @@ class TA:
         evwma = [0]
 
         #  evwma = (evma[-1] * (vol_sum - volume)/vol_sum) + (volume * price / vol_sum)
-        for x, y in zip(x.fillna(0).items(), y.items()):
-            if x[1] == 0 or y[1] == 0:
+        for x, y in zip(x.fillna(0).tolist(), y.tolist()):
+            if x == 0 or y == 0:
                 evwma.append(0)
             else:
-                evwma.append(evwma[-1] * x[1] + y[1])
+                evwma.append(evwma[-1] * x + y)
 
         return pd.Series(
             evwma[1:],
@@ -832,7 +853,8 @@ class TA:
         SAR trails price as the trend extends over time. The indicator is below prices when prices are rising and above prices when prices are falling.
         In this regard, the indicator stops and reverses when the price trend reverses and breaks above or below the indicator.
         """
-        high, low = ohlc.high.values, ohlc.low.values
+        # plain floats, the loop is much faster on them than on numpy scalars
+        high, low = ohlc.high.to_numpy().tolist(), ohlc.low.to_numpy().tolist()
 
         # Starting values
         sig0, xpt0, af0 = True, high[0], af
@@ -1079,36 +1101,24 @@ class TA:
         :period: Specifies the number of Periods used for DMI calculation
         """
 
-        ohlc["up_move"] = ohlc["high"].diff()
-        ohlc["down_move"] = -ohlc["low"].diff()
-
-        # positive Dmi
-        def _dmp(row):
-            if row["up_move"] > row["down_move"] and row["up_move"] > 0:
-                return row["up_move"]
-            else:
-                return 0
-
-        # negative Dmi
-        def _dmn(row):
-            if row["down_move"] > row["up_move"] and row["down_move"] > 0:
-                return row["down_move"]
-            else:
-                return 0
+        up_move = ohlc["high"].diff()
+        down_move = -ohlc["low"].diff()
 
-        ohlc["plus"] = ohlc.apply(_dmp, axis=1)
-        ohlc["minus"] = ohlc.apply(_dmn, axis=1)
+        # positive Dmi, the up move when it's positive and bigger than the down move, negative Dmi the other way around
+        plus = pd.Series(np.where((up_move > down_move) & (up_move > 0), up_move, 0.0), index=ohlc.index)
+        minus = pd.Series(np.where((down_move > up_move) & (down_move > 0), down_move, 0.0), index=ohlc.index)
 
+        atr = cls.ATR(ohlc, period)
         diplus = pd.Series(
             100
-            * (ohlc["plus"] / cls.ATR(ohlc, period))
+            * (plus / atr)
             .ewm(alpha=1 / period, adjust=adjust)
             .mean(),
             name="DI_PLUS",
         )
         diminus = pd.Series(
             100
-            * (ohlc["minus"] / cls.ATR(ohlc, period))
+            * (minus / atr)
             .ewm(alpha=1 / period, adjust=adjust)
             .mean(),
             name="DI_MINUS",
@@ -1283,14 +1293,15 @@ class TA:
         This is because they are stuck with one time frame. The Ultimate Oscillator attempts to correct this fault by incorporating longer
         time frames into the basic formula."""
 
-        k = []  # current low or past close
-        for row, _row in zip(ohlc.itertuples(), ohlc.shift(1).itertuples()):
-            k.append(min(row.low, _row.close))
+        # current low or past close, whichever is lower (the low when there's no past close)
+        low, past_close = ohlc["low"].to_numpy(), ohlc["close"].shift(1).to_numpy()
+        k = np.where(past_close < low, past_close, low)
         bp = pd.Series(ohlc[column] - k, name="bp")  # Buying pressure
 
-        Average7 = bp.rolling(window=7).sum() / cls.TR(ohlc).rolling(window=7).sum()
-        Average14 = bp.rolling(window=14).sum() / cls.TR(ohlc).rolling(window=14).sum()
-        Average28 = bp.rolling(window=28).sum() / cls.TR(ohlc).rolling(window=28).sum()
+        tr = cls.TR(ohlc)
+        Average7 = bp.rolling(window=7).sum() / tr.rolling(window=7).sum()
+        Average14 = bp.rolling(window=14).sum() / tr.rolling(window=14).sum()
+        Average28 = bp.rolling(window=28).sum() / tr.rolling(window=28).sum()
 
         return pd.Series(
             (100 * ((4 * Average7) + (2 * Average14) + Average28)) / (4 + 2 + 1)
@@ -1467,27 +1478,15 @@ class TA:
 
         tp = cls.TP(ohlc)
         rmf = pd.Series(tp * ohlc["volume"], name="rmf")  # Real Money Flow
-        _mf = pd.concat([tp, rmf], axis=1)
-        _mf["delta"] = _mf["TP"].diff()
-
-        def pos(row):
-            if row["delta"] > 0:
-                return row["rmf"]
-            else:
-                return 0
-
-        def neg(row):
-            if row["delta"] < 0:
-                return row["rmf"]
-            else:
-                return 0
+        delta = tp.diff()
 
-        _mf["neg"] = _mf.apply(neg, axis=1)
-        _mf["pos"] = _mf.apply(pos, axis=1)
+        # the money flow goes to the positive side when the typical price went up, the negative one when it went down
+        pos = pd.Series(np.where(delta > 0, rmf, 0.0), index=ohlc.index)
+        neg = pd.Series(np.where(delta < 0, rmf, 0.0), index=ohlc.index)
 
         mfratio = pd.Series(
-            _mf["pos"].rolling(window=period).sum()
-            / _mf["neg"].rolling(window=period).sum()
+            pos.rolling(window=period).sum()
+            / neg.rolling(window=period).sum()
         )
 
         return pd.Series(
@@ -1678,7 +1677,12 @@ class TA:
         tp_rolling = tp.rolling(window=period, min_periods=0)
         # calculate MAD (Mean Deviation)
         # https://www.khanacademy.org/math/statistics-probability/summarizing-quantitative-data/other-measures-of-spread/a/mean-absolute-deviation-mad-review
-        mad = tp_rolling.apply(lambda s: abs(s - s.mean()).mean(), raw=True)
+        values = tp.to_numpy(dtype=float)
+        mad = _rolling_windows(values, period, _mean_abs_deviation)
+        # the first rows only have a partial window
+        for end in range(1, min(period, len(values) + 1)):
+            mad[end - 1] = _mean_abs_deviation(values[None, :end])[0]
+        mad = pd.Series(mad, index=tp.index)
         return pd.Series(
             (tp - tp_rolling.mean()) / (constant * mad),
             name="{0} period CCI".format(period),
@@ -1813,10 +1817,9 @@ class TA:
         """Indicator by Colin Twiggs which improves upon CMF.
         source: https://user42.tuxfamily.org/chart/manual/Twiggs-Money-Flow.html"""
 
-        ohlcv["ll"] = [min(l, c) for l, c in zip(ohlcv["low"], ohlcv["close"].shift(1))]
-        ohlcv["hh"] = [
-            max(h, c) for h, c in zip(ohlcv["high"], ohlcv["close"].shift(1))
-        ]
+        past_close = ohlcv["close"].shift(1)
+        ohlcv["ll"] = np.where(past_close < ohlcv["low"], past_close, ohlcv["low"])
+        ohlcv["hh"] = np.where(past_close > ohlcv["high"], past_close, ohlcv["high"])
 
         ohlcv["range"] = (
             2 * ((ohlcv["close"] - ohlcv["ll"]) / (ohlcv["hh"] - ohlcv["ll"])) - 1
@@ -1993,17 +1996,10 @@ class TA:
 
         bb = cls.BBANDS(ohlc, period=period, MA=ma)
         kc = cls.KC(ohlc, period=period, kc_mult=1.5)
-        comb = pd.concat([bb, kc], axis=1)
+        # the squeeze is on while the bollinger bands are inside the keltner channel
+        sqz = (bb["BB_LOWER"] > kc["KC_LOWER"]) & (bb["BB_UPPER"] < kc["KC_UPPER"])
 
-        def sqz_on(row):
-            if row["BB_LOWER"] > row["KC_LOWER"] and row["BB_UPPER"] < row["KC_UPPER"]:
-                return True
-            else:
-                return False
-
-        comb["SQZ"] = comb.apply(sqz_on, axis=1)
-
-        return pd.Series(comb["SQZ"], name="{0} period SQZMI".format(period))
+        return pd.Series(sqz, name="{0} period SQZMI".format(period))
 
     @classmethod
     @inputvalidator(input_="ohlcv")
@@ -2037,19 +2033,14 @@ class TA:
         smav = ohlc["volume"].rolling(window=period).mean()
         mf = pd.Series((ohlc["close"] - hl2 + tp.diff()), name="mf")
 
-        _mf = pd.concat([ohlc["close"], ohlc["volume"], mf], axis=1)
-
-        def vol_shift(row):
-
-            if row["mf"] > factor * row["close"] / 100:
-                return row["volume"]
-            elif row["mf"] < -factor * row["close"] / 100:
-                return -row["volume"]
-            else:
-                return 0
-
-        _mf["vol_shift"] = _mf.apply(vol_shift, axis=1)
-        _sum = _mf["vol_shift"].rolling(window=period).sum()
+        # the volume counts up when the money flow is above the threshold, down when it's below minus the threshold
+        volume = ohlc["volume"].to_numpy(dtype=float)
+        threshold = factor * ohlc["close"] / 100
+        vol_shift = pd.Series(
+            np.select([mf > threshold, mf < -threshold], [volume, -volume], 0.0),
+            index=ohlc.index,
+        )
+        _sum = vol_shift.rolling(window=period).sum()
 
         return pd.Series((_sum / smav) / period * 100)
 
@@ -2078,7 +2069,7 @@ class TA:
 
         typical = TA.TP(ohlc)
         # historical interday volatility and cutoff
-        inter = typical.apply(np.log).diff()
+        inter = np.log(typical).diff()
         # stdev of linear1
         vinter = inter.rolling(window=30).std()
         cutoff = pd.Series(factor * vinter * ohlc["close"], name="cutoff")
@@ -2088,34 +2079,16 @@ class TA:
             name="mav",
         )
 
-        _va = pd.concat([ohlc["volume"], mav.shift()], axis=1)
-        _mp = pd.concat([price_change, cutoff], axis=1)
-        _mp.fillna(value=0, inplace=True)
-
-        def _vol_added(row):
-            """Determine the maximum volume to be added"""
-
-            if row["volume"] > vfactor * row["mav"]:
-                return vfactor * row["mav"]
-            else:
-                return row["volume"]
-
-        added_vol = _va.apply(_vol_added, axis=1)
-
-        def _multiplier(row):
-            """
-            Determine whether the volume is up volume (multiplier +1) or
-            down volume (multiplier -1). If price change is smaller than cutoff
-            do not count volume (multipler 0).
-            """
-            if row["pc"] > row["cutoff"]:
-                return 1
-            elif row["pc"] < 0 - row["cutoff"]:
-                return -1
-            else:
-                return 0
+        # the volume added is capped at vfactor times the average volume
+        max_volume = vfactor * mav.shift()
+        added_vol = pd.Series(
+            np.where(ohlc["volume"] > max_volume, max_volume, ohlc["volume"].to_numpy(dtype=float)), index=ohlc.index
+        )
 
-        multiplier = _mp.apply(_multiplier, axis=1)
+        # up volume (multiplier +1) or down volume (multiplier -1), if the price change is smaller
+        # than the cutoff the volume doesn't count (multiplier 0)
+        price_change, cutoff = price_change.fillna(0), cutoff.fillna(0)
+        multiplier = pd.Series(np.select([price_change > cutoff, price_change < 0 - cutoff], [1, -1], 0), index=ohlc.index)
         raw_sum = (multiplier * added_vol).rolling(window=period).sum()
         raw_value = raw_sum / mav.shift()
 
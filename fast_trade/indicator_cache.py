@@ -0,0 +1,179 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from fast_trade.archive.db_helpers import atomic_write_parquet, safe_read_parquet
+
+OHLCV_COLUMNS = ["open", "high", "low", "close", "volume"]
+INDICATOR_CACHE_MB = float(os.getenv("INDICATOR_CACHE_MB", 256))
+INDICATOR_CACHE_PATH = os.getenv("INDICATOR_CACHE_PATH")
+# part of every key, bump it when a change to finta, the transformers or the resampling changes their
+# results, so the parquet files written before it are missed instead of read
+CACHE_VERSION = 1
+
+# parquet needs named columns, so a cached Series is stored as a one column frame
+_SERIES_COLUMN = "__series__"
+
+TransformerResult = Union[pd.Series, pd.DataFrame]
+
+
+def data_fingerprint(df: pd.DataFrame) -> str:
+    """Hashes the index and the OHLCV columns of a dataframe.
+
+    Indicator columns are left out on purpose, the transformers only ever read the candles.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(df.index.asi8).tobytes())
+    for column in OHLCV_COLUMNS:
+        if column not in df.columns:
+            continue
+        values = df[column].to_numpy()
+        digest.update(f"{column}:{values.dtype}".encode())
+        if values.dtype == object:
+            values = pd.util.hash_pandas_object(df[column], index=False).to_numpy()
+        digest.update(np.ascontiguousarray(values).tobytes())
+    return digest.hexdigest()
+
+
+def _nbytes(value: TransformerResult) -> int:
+    usage = value.memory_usage(index=True)
+    return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+
+
+class IndicatorCache:
+    """LRU cache of transformer outputs, bounded by memory and optionally backed by parquet files."""
+
+    def __init__(self, max_bytes: Optional[int] = None, path: Optional[str] = None) -> None:
+        self.max_bytes = int(INDICATOR_CACHE_MB * 1024 * 1024) if max_bytes is None else max_bytes
+        self.path = path if path is not None else INDICATOR_CACHE_PATH
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.current_bytes = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # the (fingerprint, freq) of every resampled candles entry in _entries, see put_resampled
+        self._resampled: "dict[str, tuple]" = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_cacheable(df: pd.DataFrame, args: list) -> bool:
+        """Results are only cacheable if the args don't point at a computed (non OHLCV) column."""
+        return not any(
+            isinstance(arg, str) and arg in df.columns and arg not in OHLCV_COLUMNS
+            for arg in args
+        )
+
+    @staticmethod
+    def make_key(fingerprint: str, transformer: str, func, args: list, freq: Optional[str]) -> str:
+        func_name = f"{getattr(func, '__module__', '')}.{getattr(func, '__qualname__', repr(func))}"
+        raw = repr((CACHE_VERSION, fingerprint, transformer, func_name, list(args), str(freq) if freq else None))
+        return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+    @staticmethod
+    def resample_key(fingerprint: str, freq: str) -> str:
+        raw = repr((CACHE_VERSION, fingerprint, "resample", str(freq)))
+        return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[TransformerResult]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                # put stores a copy, hand out copies too so a caller editing a result can't change later hits
+                return entry[0].copy()
+
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._store(key, value)
+        return value.copy()
+
+    def put(self, key: str, value: TransformerResult) -> None:
+        value = value.copy()
+        self._store(key, value)
+        self._write_disk(key, value)
+
+    def _store(self, key: str, value: TransformerResult) -> None:
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                evicted_key, (_, evicted_size) = self._entries.popitem(last=False)
+                self._resampled.pop(evicted_key, None)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.parquet")
+
+    def _read_disk(self, key: str) -> Optional[TransformerResult]:
+        if not self.path or not os.path.exists(self._disk_path(key)):
+            return None
+        value = safe_read_parquet(self._disk_path(key))
+        if value is not None and list(value.columns) == [_SERIES_COLUMN]:
+            value = value[_SERIES_COLUMN].rename(None)
+        return value
+
+    def _write_disk(self, key: str, value: TransformerResult) -> None:
+        if not self.path:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        frame = value.to_frame(_SERIES_COLUMN) if isinstance(value, pd.Series) else value
+        try:
+            atomic_write_parquet(frame, self._disk_path(key))
+        except Exception:
+            # not every transformer output can be stored as parquet, the memory cache still has it
+            pass
+
+    def get_resampled(self, fingerprint: str, freq: str) -> Optional[pd.DataFrame]:
+        """The candles with the data fingerprint resampled to freq, if they are cached."""
+        return self.get(self.resample_key(fingerprint, freq))
+
+    def put_resampled(self, fingerprint: str, freq: str, candles: pd.DataFrame) -> None:
+        key = self.resample_key(fingerprint, freq)
+        self.put(key, candles)
+        with self._lock:
+            if key in self._entries:
+                self._resampled[key] = (fingerprint, str(freq))
+
+    def resampled(self, fingerprint: str) -> dict:
+        """Every freq the candles with the data fingerprint are resampled to in memory, to build coarser ones from."""
+        with self._lock:
+            return {freq: self._entries[key][0] for key, (owner, freq) in self._resampled.items() if owner == fingerprint}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._resampled.clear()
+            self.current_bytes = 0
+            self.hits = self.disk_hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+indicator_cache = IndicatorCache()
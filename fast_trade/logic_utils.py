@@ -1,8 +1,11 @@
 import itertools
-from typing import List
+from typing import List, Optional
 
+import numpy as np
 import pandas as pd
 
+from fast_trade.run_analysis import ACTION_ENTER, ACTION_EXIT
+
 
 def max_last_frames(backtest: dict) -> int:
     logics = [
@@ -39,48 +42,99 @@ def can_vectorize_logic(df: pd.DataFrame, backtest: dict) -> bool:
     return True
 
 
+def confirm_frames(condition: pd.Series, frames: int) -> pd.Series:
+    """Requires a condition to hold on the current row and the previous ``frames - 1`` rows.
+
+    This is the vectorized form of the ``last_frames`` lookback used by the row loop: a rolling
+    AND over the boolean condition, false until ``frames`` rows have been seen.
+    """
+    if frames <= 1:
+        return condition
+
+    values = condition.to_numpy(dtype=bool, na_value=False)
+    misses = np.concatenate(([0], np.cumsum(~values)))
+    confirmed = np.zeros(len(values), dtype=bool)
+    confirmed[frames - 1:] = misses[frames:] == misses[:-frames]
+    return pd.Series(confirmed, index=condition.index)
+
+
+def logic_condition(df: pd.DataFrame, logic: List) -> pd.Series:
+    """The boolean Series of a single logic, ex. ["rsi", "<", 30] or ["close", ">", "sma", 3]."""
+    if isinstance(logic[2], (int, float)):
+        if logic[1] == ">":
+            condition = df[logic[0]] > logic[2]
+        elif logic[1] == "<":
+            condition = df[logic[0]] < logic[2]
+        elif logic[1] == "=":
+            condition = df[logic[0]] == logic[2]
+        elif logic[1] == "!=":
+            condition = df[logic[0]] != logic[2]
+        elif logic[1] == ">=":
+            condition = df[logic[0]] >= logic[2]
+        elif logic[1] == "<=":
+            condition = df[logic[0]] <= logic[2]
+        else:
+            condition = pd.Series(False, index=df.index)
+    elif logic[2] in df.columns:
+        if logic[1] == ">":
+            condition = df[logic[0]] > df[logic[2]]
+        elif logic[1] == "<":
+            condition = df[logic[0]] < df[logic[2]]
+        elif logic[1] == "=":
+            condition = df[logic[0]] == df[logic[2]]
+        elif logic[1] == "!=":
+            condition = df[logic[0]] != df[logic[2]]
+        elif logic[1] == ">=":
+            condition = df[logic[0]] >= df[logic[2]]
+        elif logic[1] == "<=":
+            condition = df[logic[0]] <= df[logic[2]]
+        else:
+            condition = pd.Series(False, index=df.index)
+    else:
+        condition = pd.Series(False, index=df.index)
+
+    if len(logic) > 3 and logic[3]:
+        condition = confirm_frames(condition, int(logic[3]))
+    return condition
+
+
 def build_mask(df: pd.DataFrame, logic_list: List, combine_any: bool) -> pd.Series:
     if not logic_list:
         return pd.Series(False, index=df.index)
     mask = pd.Series(True, index=df.index) if not combine_any else pd.Series(False, index=df.index)
     for logic in logic_list:
-        if isinstance(logic[2], (int, float)):
-            if logic[1] == ">":
-                condition = df[logic[0]] > logic[2]
-            elif logic[1] == "<":
-                condition = df[logic[0]] < logic[2]
-            elif logic[1] == "=":
-                condition = df[logic[0]] == logic[2]
-            elif logic[1] == "!=":
-                condition = df[logic[0]] != logic[2]
-            elif logic[1] == ">=":
-                condition = df[logic[0]] >= logic[2]
-            elif logic[1] == "<=":
-                condition = df[logic[0]] <= logic[2]
-            else:
-                condition = pd.Series(False, index=df.index)
-        elif logic[2] in df.columns:
-            if logic[1] == ">":
-                condition = df[logic[0]] > df[logic[2]]
-            elif logic[1] == "<":
-                condition = df[logic[0]] < df[logic[2]]
-            elif logic[1] == "=":
-                condition = df[logic[0]] == df[logic[2]]
-            elif logic[1] == "!=":
-                condition = df[logic[0]] != df[logic[2]]
-            elif logic[1] == ">=":
-                condition = df[logic[0]] >= df[logic[2]]
-            elif logic[1] == "<=":
-                condition = df[logic[0]] <= df[logic[2]]
-            else:
-                condition = pd.Series(False, index=df.index)
-        else:
-            condition = pd.Series(False, index=df.index)
-
+        condition = logic_condition(df, logic)
         mask = mask | condition if combine_any else mask & condition
     return mask
 
 
+def build_mask_matrix(
+    df: pd.DataFrame, logic_lists: List, combine_any: bool, conditions: Optional[dict] = None
+) -> np.ndarray:
+    """build_mask for many logic lists at once, a bars x len(logic_lists) boolean matrix.
+
+    A logic shared by several lists (same column, operator, value and confirmation frames)
+    is only evaluated once, pass the same ``conditions`` dict to share them across calls.
+    """
+    if conditions is None:
+        conditions = {}
+    matrix = np.zeros((len(df.index), len(logic_lists)), dtype=bool)
+    for col, logic_list in enumerate(logic_lists):
+        if not logic_list:
+            continue
+        mask = matrix[:, col]
+        mask[:] = not combine_any
+        for logic in logic_list:
+            key = tuple(logic)
+            if key not in conditions:
+                conditions[key] = logic_condition(df, logic).to_numpy(dtype=bool, na_value=False)
+            if combine_any:
+                mask |= conditions[key]
+            else:
+                mask &= conditions[key]
+    return matrix
+
+
 def vectorized_actions(df: pd.DataFrame, backtest: dict) -> pd.Series:
     df_actions = pd.Series("h", index=df.index)
     exit_mask = build_mask(df, backtest.get("exit", []), combine_any=False)
@@ -101,3 +155,27 @@ def vectorized_actions(df: pd.DataFrame, backtest: dict) -> pd.Series:
     ] = "ae"
 
     return df_actions
+
+
+def action_code_matrix(df: pd.DataFrame, backtests: List, conditions: Optional[dict] = None) -> np.ndarray:
+    """vectorized_actions for many backtests over the same frame, as a bars x len(backtests) int8 matrix
+    of the simulation codes (hold, enter or exit, see run_analysis).
+
+    Every backtest has to pass can_vectorize_logic. The trailing stop loss is worked out from the
+    close, the same way prepare_df does, since each backtest can have its own.
+    """
+    exit_mask = build_mask_matrix(df, [b.get("exit", []) for b in backtests], False, conditions)
+    exit_mask |= build_mask_matrix(df, [b.get("any_exit", []) for b in backtests], True, conditions)
+    for col, backtest in enumerate(backtests):
+        trailing_stop_loss = backtest.get("trailing_stop_loss")
+        if trailing_stop_loss:
+            stop = df["close"].cummax() * (1 - float(trailing_stop_loss))
+            exit_mask[:, col] |= (df["close"] <= stop).to_numpy()
+
+    enter_mask = build_mask_matrix(df, [b.get("enter", []) for b in backtests], False, conditions)
+    enter_mask |= build_mask_matrix(df, [b.get("any_enter", []) for b in backtests], True, conditions)
+
+    codes = np.zeros(exit_mask.shape, dtype=np.int8)
+    codes[enter_mask] = ACTION_ENTER
+    codes[exit_mask] = ACTION_EXIT
+    return codes
@@ -229,6 +229,28 @@ def evolve(config: str) -> dict:
     return _run_ft_cli("evolve", config)
 
 
+def sweep(config: str, out: Optional[str] = None, resume: bool = True) -> dict:
+    """Run a grid/random/LHS parameter sweep via `ft sweep`."""
+    args = ["sweep", config]
+    if out:
+        args += ["--out", out]
+    if not resume:
+        args.append("--no-resume")
+    return _run_ft_cli(*args)
+
+
+def walk_forward(config: str, train: Optional[str] = None, test: Optional[str] = None, out: Optional[str] = None) -> dict:
+    """Optimize on rolling train windows and score the winners out of sample via `ft walk_forward`."""
+    args = ["walk_forward", config]
+    if train:
+        args += ["--train", train]
+    if test:
+        args += ["--test", test]
+    if out:
+        args += ["--out", out]
+    return _run_ft_cli(*args)
+
+
 def portfolio_start(
     strategy_path: str,
     symbol: str = "BTC-USD",
@@ -408,6 +430,8 @@ CLI_PARITY_TOOLS = [
     "logs",
     "update_archive",
     "evolve",
+    "sweep",
+    "walk_forward",
     "portfolio_start",
     "portfolio_stop",
     "portfolio_status",
@@ -2,13 +2,21 @@ import datetime
 import warnings
 import copy
 import json
+import multiprocessing as mp
 import os
 import random
 import string
+import threading
+from typing import Optional
 
 import pygad
 
 from fast_trade import run_backtest
+from fast_trade.archive.db_helpers import get_kline
+from fast_trade.indicator_cache import IndicatorCache, data_fingerprint
+from fast_trade.ml.fitness_cache import FitnessCache, strategy_hash
+from fast_trade.run_backtest import MissingData
+from fast_trade.shared_frame import attach_frame, can_share_frame, release_frame, share_frame
 from fast_trade.transformers_map import transformers_map
 
 frequency_map = ["1Min", "5Min", "15Min", "30Min", "1h", "4h", "8h", "12h"]
@@ -179,84 +187,164 @@ def _get_metric(summary: dict, key: str, default=0.0):
     return current
 
 
-def fitness_func(solution, solution_idx, strategy, genes: list, fitness_config=None, error_callback=None):
+class FitnessData:
     """
-    Evaluates the fitness of a solution by running a backtest with the given strategy and genes.
+    Candles and indicators shared by every fitness evaluation of one optimization run.
 
-    Args:
-        solution: The current solution being evaluated. Can be None if using callable gene functions.
-        solution_idx: The index of the solution.
-        strategy: The base strategy to be optimized.
-        genes: The list of genes representing strategy parameters.
+    The OHLCV is loaded once per (symbol, exchange, freq, start, stop) instead of once per
+    individual. Datapoints are memoized in a cache owned by the run, keyed by the candles,
+    transformer and args, so the ones that don't depend on the genes are only computed for
+    the first individual and every later one only computes its gene dependent datapoints.
 
-    Returns:
-        A float representing the fitness score of the solution.
+    A frame can be given instead (e.g. one fold of a walk-forward run), every strategy is then
+    backtested on it and its rows before the strategy's start only warm up the datapoints. It is
+    kept under the None key of candles, so a FitnessPool shares it with its workers like the rest.
     """
+
+    def __init__(self, cache: IndicatorCache = None, df=None):
+        self.cache = cache if cache is not None else IndicatorCache()
+        self.candles = {}
+        if df is not None:
+            self.candles[None] = df
+        self.loads = 0
+        # data_fingerprint of the candles, by the same key
+        self.fingerprints = {}
+        self._lock = threading.Lock()
+
+    def _candles_key(self, strategy: dict):
+        if None in self.candles:
+            return None
+        freq = strategy.get("freq") or strategy.get("chart_period")
+        return (strategy.get("symbol"), strategy.get("exchange"), freq, strategy.get("start"), strategy.get("stop"))
+
+    def get_candles(self, strategy: dict):
+        """The candles run_backtest would load for the strategy, read from the archive only once."""
+        key = self._candles_key(strategy)
+        if key is None:
+            return self.candles[None]
+        with self._lock:
+            if key not in self.candles:
+                # prepare_df trims the frame to start/stop before any datapoint is calculated,
+                # so there's no need to load the warm up run_backtest adds for the longest period
+                self.candles[key] = get_kline(key[0], key[1], key[3], key[4], freq=key[2])
+                self.loads += 1
+            df = self.candles[key]
+        if df.empty:
+            raise MissingData(f"No data found for {key[0]} on {key[1]}")
+        return df
+
+    def fingerprint(self, strategy: dict) -> Optional[str]:
+        """data_fingerprint of the candles the strategy is backtested on, None if they can't be loaded."""
+        key = self._candles_key(strategy)
+        if key is not None and (not strategy.get("symbol") or not strategy.get("exchange")):
+            return None
+        if key not in self.fingerprints:
+            try:
+                df = self.get_candles(strategy)
+            except Exception:
+                # the backtest will report it
+                return None
+            fingerprint = data_fingerprint(df)
+            with self._lock:
+                self.fingerprints[key] = fingerprint
+        return self.fingerprints[key]
+
+    def run_backtest(self, strategy: dict, metrics: list = None) -> dict:
+        """Backtests the strategy on the shared candles, metrics is passed on to run_backtest."""
+        if None in self.candles:
+            return run_backtest(strategy, df=self.candles[None], cache=self.cache, warm_up=True, metrics=metrics)
+        if not strategy.get("symbol") or not strategy.get("exchange"):
+            # nothing to share, let run_backtest report what's missing
+            return run_backtest(strategy)
+        return run_backtest(strategy, df=self.get_candles(strategy), cache=self.cache, metrics=metrics)
+
+    def stats(self) -> dict:
+        return {"candle_loads": self.loads, **self.cache.stats()}
+
+
+def _solution_strategy(solution, strategy, genes: list) -> dict:
+    """The base strategy with the genes of one solution filled in."""
     # Map the numeric gene values to actual values
     mapped_genes = []
 
     if solution is None:
         # If solution is None, we're using callable functions directly
         # Use modify_strategy with with_columns=True to handle column mappings
-        strategy_copy = modify_strategy(strategy.copy(), genes, with_columns=True)
-    else:
-        # Standard GA approach with numeric solution
-        for i, gene in enumerate(genes):
-            gene_name = gene[0]
-            if "column" in gene_name:
-                # Map numeric value to a column name
-                column_idx = int(solution[i]) % len(columns)
-                mapped_genes.append((gene_name, columns[column_idx]))
-            else:
-                # Use the numeric value directly
-                mapped_genes.append((gene_name, solution[i]))
+        return modify_strategy(strategy.copy(), genes, with_columns=True)
 
-        # Modify the strategy based on the mapped genes
-        strategy_copy = modify_strategy(strategy.copy(), mapped_genes)
+    # Standard GA approach with numeric solution
+    for i, gene in enumerate(genes):
+        gene_name = gene[0]
+        if "column" in gene_name:
+            # Map numeric value to a column name
+            column_idx = int(solution[i]) % len(columns)
+            mapped_genes.append((gene_name, columns[column_idx]))
+        else:
+            # Use the numeric value directly
+            mapped_genes.append((gene_name, solution[i]))
 
-    try:
-        result = run_backtest(strategy_copy)
-    except Exception as exc:
-        if error_callback:
-            error_callback(exc)
-        return -1e9
+    # Modify the strategy based on the mapped genes
+    return modify_strategy(strategy.copy(), mapped_genes)
 
-    # Use the result to calculate fitness (e.g., total return)
-    summary = result.get("summary", {})
 
-    fitness_presets = {
-        "aggressive": {
-            "weights": {
-                "return_perc": 0.5,
-                "market_adjusted_return": 0.3,
-                "sharpe_ratio": 0.1,
-                "drawdown_metrics.max_drawdown_pct": -0.2,
-                "num_trades": 0.1,
-            },
-            "min_trades": 5,
-            "low_trades_penalty": -5.0,
+def map_genes(solution, genes: list) -> list:
+    """(gene name, value) pairs of a solution, with the freq and column genes mapped to what they stand for."""
+    mapped = []
+    for i, gene in enumerate(genes):
+        gene_name = gene[0]
+        if gene_name == "freq" and not isinstance(solution[i], str):
+            freq_idx = int(solution[i])
+            freq_idx = max(0, min(freq_idx, len(frequency_map) - 1))
+            mapped.append((gene_name, frequency_map[freq_idx]))
+        elif "column" in gene_name:
+            mapped.append((gene_name, columns[int(solution[i]) % len(columns)]))
+        else:
+            mapped.append((gene_name, _normalize_types(solution[i])))
+    return mapped
+
+
+fitness_presets = {
+    "aggressive": {
+        "weights": {
+            "return_perc": 0.5,
+            "market_adjusted_return": 0.3,
+            "sharpe_ratio": 0.1,
+            "drawdown_metrics.max_drawdown_pct": -0.2,
+            "num_trades": 0.1,
         },
-        "conservative": {
-            "weights": {
-                "return_perc": 0.2,
-                "market_adjusted_return": 0.2,
-                "sharpe_ratio": 0.3,
-                "drawdown_metrics.max_drawdown_pct": -0.4,
-                "num_trades": 0.1,
-                "risk_metrics.sortino_ratio": 0.2,
-            },
-            "min_trades": 5,
-            "low_trades_penalty": -5.0,
+        "min_trades": 5,
+        "low_trades_penalty": -5.0,
+    },
+    "conservative": {
+        "weights": {
+            "return_perc": 0.2,
+            "market_adjusted_return": 0.2,
+            "sharpe_ratio": 0.3,
+            "drawdown_metrics.max_drawdown_pct": -0.4,
+            "num_trades": 0.1,
+            "risk_metrics.sortino_ratio": 0.2,
         },
-    }
+        "min_trades": 5,
+        "low_trades_penalty": -5.0,
+    },
+}
 
+# always part of the compact summary, on top of the metrics the fitness is weighted on
+summary_metrics = ["return_perc", "market_adjusted_return", "sharpe_ratio", "num_trades", "win_perc"]
+
+
+def _fitness_config(fitness_config=None) -> dict:
     default_fitness = fitness_presets["aggressive"]
     if isinstance(fitness_config, dict) and fitness_config.get("preset"):
         preset_name = fitness_config.get("preset")
-        config = fitness_presets.get(preset_name, default_fitness)
-    else:
-        config = fitness_config or default_fitness
-    weights = config.get("weights", default_fitness["weights"])
+        return fitness_presets.get(preset_name, default_fitness)
+    return fitness_config or default_fitness
+
+
+def score_summary(summary: dict, fitness_config=None) -> float:
+    """The weighted fitness of a backtest summary."""
+    config = _fitness_config(fitness_config)
+    weights = config.get("weights", fitness_presets["aggressive"]["weights"])
     min_trades = config.get("min_trades", 0)
     low_trades_penalty = config.get("low_trades_penalty", -5.0)
 
@@ -275,7 +363,118 @@ def fitness_func(solution, solution_idx, strategy, genes: list, fitness_config=N
     return fitness
 
 
-def fitness_wrapper(ga_instance, solution, solution_idx, base_strategy, genes, fitness_config, error_callback):
+def compact_metrics(fitness_config=None) -> list:
+    """The dotted paths compact_summary keeps: summary_metrics, the weighted ones and the config's "metrics"."""
+    config = _fitness_config(fitness_config)
+    metrics = list(summary_metrics)
+    for metric in list(config.get("weights", fitness_presets["aggressive"]["weights"])) + config.get("metrics", []):
+        if metric not in metrics:
+            metrics.append(metric)
+    return metrics
+
+
+def compact_summary(summary: dict, fitness_config=None) -> dict:
+    """The handful of metrics worth sending back from a fitness evaluation, keyed by their dotted path."""
+    return {metric: _normalize_types(_get_metric(summary, metric, 0.0)) for metric in compact_metrics(fitness_config)}
+
+
+def fitness_key(strategy: dict, fitness_config=None, fitness_data: FitnessData = None) -> Optional[str]:
+    """The FitnessCache key of a strategy, None if the candles it is backtested on aren't known."""
+    fingerprint = fitness_data.fingerprint(strategy) if fitness_data is not None else None
+    return strategy_hash(strategy, fitness_config, fingerprint) if fingerprint is not None else None
+
+
+def evaluate_solution(
+    solution,
+    strategy,
+    genes: list,
+    fitness_config=None,
+    error_callback=None,
+    fitness_data: FitnessData = None,
+    fitness_cache: FitnessCache = None,
+):
+    """
+    Same as fitness_func, but returns the compact summary of the backtest along with the fitness.
+
+    Returns:
+        (fitness, summary), the summary is {"error": message} if the backtest failed.
+    """
+    strategy_copy = _solution_strategy(solution, strategy, genes)
+    cache_key = None
+    if fitness_cache is not None:
+        cache_key = fitness_key(strategy_copy, fitness_config, fitness_data)
+    if cache_key is not None:
+        cached = fitness_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    try:
+        if fitness_data is not None:
+            # only the metrics the fitness and the compact summary read are computed
+            result = fitness_data.run_backtest(strategy_copy, metrics=compact_metrics(fitness_config))
+        else:
+            result = run_backtest(strategy_copy)
+    except Exception as exc:
+        if error_callback:
+            error_callback(exc)
+        return -1e9, {"error": str(exc)}
+
+    # Use the result to calculate fitness (e.g., total return)
+    summary = result.get("summary", {})
+    fitness, summary = score_summary(summary, fitness_config), compact_summary(summary, fitness_config)
+    if cache_key is not None:
+        fitness_cache.put(cache_key, fitness, summary)
+    return fitness, summary
+
+
+def fitness_func(
+    solution,
+    solution_idx,
+    strategy,
+    genes: list,
+    fitness_config=None,
+    error_callback=None,
+    fitness_data: FitnessData = None,
+    fitness_cache: FitnessCache = None,
+):
+    """
+    Evaluates the fitness of a solution by running a backtest with the given strategy and genes.
+
+    Args:
+        solution: The current solution being evaluated. Can be None if using callable gene functions.
+        solution_idx: The index of the solution.
+        strategy: The base strategy to be optimized.
+        genes: The list of genes representing strategy parameters.
+        fitness_data: FitnessData shared by the run, None to let every backtest load its own data.
+        fitness_cache: FitnessCache looked up by the hash of the modified strategy and its candles (see fitness_key)
+            before backtesting, only used with fitness_data.
+
+    Returns:
+        A float representing the fitness score of the solution.
+    """
+    fitness, _ = evaluate_solution(
+        solution,
+        strategy,
+        genes,
+        fitness_config=fitness_config,
+        error_callback=error_callback,
+        fitness_data=fitness_data,
+        fitness_cache=fitness_cache,
+    )
+    return fitness
+
+
+def fitness_wrapper(
+    ga_instance,
+    solution,
+    solution_idx,
+    base_strategy,
+    genes,
+    fitness_config,
+    error_callback,
+    fitness_data=None,
+    fitness_cache=None,
+):
     return fitness_func(
         solution,
         solution_idx,
@@ -283,9 +482,106 @@ def fitness_wrapper(ga_instance, solution, solution_idx, base_strategy, genes, f
         genes=genes,
         fitness_config=fitness_config,
         error_callback=error_callback,
+        fitness_data=fitness_data,
+        fitness_cache=fitness_cache,
     )
 
 
+# set once per worker process by _init_fitness_worker
+_WORKER_FITNESS = None
+
+
+def _init_fitness_worker(base_strategy, genes, fitness_config, frames):
+    """Pool initializer, keeps everything but the gene vectors in the worker for the whole run.
+
+    frames are (key, meta, df) tuples of the candles the parent preloaded, attached from
+    shared memory when there's a meta, sent once per worker otherwise.
+    """
+    global _WORKER_FITNESS
+    fitness_data = FitnessData()
+    segments = []
+    for key, meta, df in frames:
+        if meta is not None:
+            df, segment = attach_frame(meta)
+            segments.append(segment)
+        fitness_data.candles[key] = df
+    _WORKER_FITNESS = (base_strategy, genes, fitness_config, fitness_data, segments)
+
+
+def _fitness_task(solution):
+    base_strategy, genes, fitness_config, fitness_data, _ = _WORKER_FITNESS
+    return evaluate_solution(solution, base_strategy, genes, fitness_config, fitness_data=fitness_data)
+
+
+class FitnessPool:
+    """
+    Long lived worker processes evaluating whole generations, so backtests don't serialize on the GIL.
+
+    The candles of the initial population are loaded once in the parent and put in shared memory
+    for every worker, anything else (e.g. another freq gene) is loaded once per worker.
+    Tasks only carry the gene vector and come back as (fitness, compact summary). Another
+    module level task can be given, it finds the run in _WORKER_FITNESS like _fitness_task.
+    """
+
+    def __init__(
+        self,
+        base_strategy: dict,
+        genes: list,
+        fitness_config=None,
+        processes: int = None,
+        population: list = None,
+        fitness_data: FitnessData = None,
+        task=None,
+    ):
+        self.processes = max(1, processes or mp.cpu_count())
+        self.task = task or _fitness_task
+        fitness_data = fitness_data if fitness_data is not None else FitnessData()
+        # only the names are needed to map a solution, callable gene spaces can't be pickled anyway
+        gene_names = [(gene[0], None) for gene in genes]
+        for solution in population or []:
+            try:
+                strategy = _solution_strategy(solution, base_strategy, gene_names)
+                if strategy.get("symbol") and strategy.get("exchange"):
+                    fitness_data.get_candles(strategy)
+            except Exception:
+                # the workers will report it when they evaluate the solution
+                pass
+
+        self._segments = []
+        frames = []
+        for key, df in fitness_data.candles.items():
+            if can_share_frame(df):
+                meta, segment = share_frame(df)
+                self._segments.append(segment)
+                frames.append((key, meta, None))
+            else:
+                frames.append((key, None, df))
+
+        self._pool = mp.Pool(
+            processes=self.processes,
+            initializer=_init_fitness_worker,
+            initargs=(base_strategy, gene_names, fitness_config, frames),
+        )
+
+    def evaluate(self, solutions) -> list:
+        """(fitness, summary) of every solution, in order."""
+        chunksize = max(1, len(solutions) // (self.processes * 4))
+        return self._pool.map(self.task, list(solutions), chunksize=chunksize)
+
+    def close(self) -> None:
+        self._pool.terminate()
+        self._pool.join()
+        for segment in self._segments:
+            release_frame(segment, unlink=True)
+        self._segments = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
 def save_yaml(strategy, filename):
     if not filename:
         rnd_str = "".join(random.choices(string.ascii_letters + string.digits, k=10))
@@ -341,6 +637,9 @@ def optimize_strategy(
     K_tournament=4,
     progress_callback=None,
     fitness_config=None,
+    fitness_data: FitnessData = None,
+    fitness_cache: FitnessCache = None,
+    random_seed: int = None,
 ):
     """
     Optimizes a trading strategy using a genetic algorithm.
@@ -351,6 +650,14 @@ def optimize_strategy(
                gene_value can be a static value, a lambda function, or a callable function.
         gene_space_provider: A function that takes a gene_type and returns its space configuration.
             If None, default ranges will be used based on gene name.
+        parallel_processing: N or ["thread", N] evaluates the individuals on pygad's threads,
+            ["process", N] on a FitnessPool of N worker processes that lives for the whole run.
+        fitness_data: FitnessData holding the candles and datapoints shared by every individual.
+            A new one is made for the run if None.
+        fitness_cache: FitnessCache of the strategies already evaluated, pass one with a path to
+            reuse them across runs. An in memory one is made for the run if None. Its hit stats
+            are sent to progress_callback as "cache".
+        random_seed: seeds pygad's generators, the initial population is drawn from the random module.
 
     Returns:
         The best solution and its fitness value
@@ -358,6 +665,10 @@ def optimize_strategy(
     date_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     # Check if the genes contain callable functions (lambdas or regular functions)
     started_at = datetime.datetime.now()
+    if fitness_data is None:
+        fitness_data = FitnessData()
+    if fitness_cache is None:
+        fitness_cache = FitnessCache()
     has_callable_genes = any(callable(gene[1]) for gene in genes)
     # If we have callable genes, we'll use them directly and skip the GA optimization
     if has_callable_genes:
@@ -369,7 +680,15 @@ def optimize_strategy(
 
         for i in range(num_generations):
             # Each iteration calls the function to get new values
-            fitness = fitness_func(None, i, base_strategy, genes, fitness_config=fitness_config)
+            fitness = fitness_func(
+                None,
+                i,
+                base_strategy,
+                genes,
+                fitness_config=fitness_config,
+                fitness_data=fitness_data,
+                fitness_cache=fitness_cache,
+            )
             if progress_callback:
                 progress_callback(
                     {
@@ -377,6 +696,7 @@ def optimize_strategy(
                         "total_generations": num_generations,
                         "best_fitness": best_fitness,
                         "fitness": fitness,
+                        "cache": fitness_cache.stats(),
                     }
                 )
 
@@ -457,28 +777,37 @@ def optimize_strategy(
     if isinstance(parallel_processing, int):
         parallel_processing = ["thread", parallel_processing]
 
+    # pygad's own process mode pickles the fitness function and starts a new pool every generation,
+    # so whole generations are sent to a pool of our own instead, as one batch
+    fitness_pool = None
+    if parallel_processing and parallel_processing[0] == "process":
+        fitness_pool = FitnessPool(
+            base_strategy,
+            genes,
+            fitness_config,
+            processes=parallel_processing[1],
+            population=initial_population,
+            fitness_data=fitness_data,
+        )
+    # compact summaries of the evaluated solutions, only collected in process mode
+    summaries = {}
+    # copies of the same strategy in one batch, backtested once
+    duplicates = {"count": 0}
+
     def on_generation(ga):
         if progress_callback:
-            solution, solution_fitness, _ = ga.best_solution()
-            mapped = []
-            for i, gene in enumerate(genes):
-                gene_name = gene[0]
-                if gene_name == "freq":
-                    freq_idx = int(solution[i])
-                    freq_idx = max(0, min(freq_idx, len(frequency_map) - 1))
-                    mapped.append((gene_name, frequency_map[freq_idx]))
-                elif "column" in gene_name:
-                    mapped.append((gene_name, columns[int(solution[i]) % len(columns)]))
-                else:
-                    mapped.append((gene_name, _normalize_types(solution[i])))
-            progress_callback(
-                {
-                    "generation": ga.generations_completed,
-                    "total_generations": num_generations,
-                    "best_fitness": solution_fitness,
-                    "best_genes": mapped,
-                }
-            )
+            # the generation was just evaluated, without its fitness pygad would evaluate it all over again
+            solution, solution_fitness, _ = ga.best_solution(pop_fitness=ga.last_generation_fitness)
+            payload = {
+                "generation": ga.generations_completed,
+                "total_generations": num_generations,
+                "best_fitness": solution_fitness,
+                "best_genes": map_genes(solution, genes),
+            }
+            if tuple(solution) in summaries:
+                payload["best_summary"] = summaries[tuple(solution)]
+            payload["cache"] = {**fitness_cache.stats(), "duplicates": duplicates["count"]}
+            progress_callback(payload)
 
     warnings.filterwarnings("ignore", category=UserWarning, module="pygad.pygad")
 
@@ -489,34 +818,75 @@ def optimize_strategy(
             error_state["count"] += 1
             print(f"Fitness error: {exc}")
 
-    ga_instance = pygad.GA(
-        num_generations=num_generations,
-        num_parents_mating=num_parents_mating,
-        fitness_func=lambda ga, sol, idx: fitness_wrapper(
-            ga, sol, idx, base_strategy, genes, fitness_config, error_callback
-        ),
-        sol_per_pop=sol_per_pop,
-        num_genes=len(genes),  # Set number of genes based on the actual gene list length
-        gene_space=gene_space,
-        initial_population=initial_population,
-        parent_selection_type=parent_selection_type,
-        crossover_type=crossover_type,
-        mutation_type=mutation_type,
-        mutation_percent_genes=mutation_percent_genes,
-        parallel_processing=parallel_processing,
-        random_mutation_min_val=-1.0,
-        random_mutation_max_val=1.0,
-        save_best_solutions=True,
-        K_tournament=K_tournament,
-        on_generation=on_generation,
-    )
-    # Run the GA
-    with warnings.catch_warnings():
-        warnings.filterwarnings("ignore", category=UserWarning, module="pygad.pygad")
-        ga_instance.run()
+    def batch_fitness(ga, solutions, solution_indices):
+        # the strategies are hashed here, so cached and repeated ones never reach the workers
+        keys = []
+        for solution in solutions:
+            strategy = _solution_strategy(solution, base_strategy, genes)
+            # without candles the backtest fails, so nothing is ever cached under the plain hash
+            keys.append(fitness_key(strategy, fitness_config, fitness_data) or strategy_hash(strategy, fitness_config))
+        results = {}
+        pending = {}
+        for solution, key in zip(solutions, keys):
+            if key in results or key in pending:
+                duplicates["count"] += 1
+                continue
+            cached = fitness_cache.get(key)
+            if cached is not None:
+                results[key] = cached
+            else:
+                pending[key] = solution
+
+        if pending:
+            for key, (fitness, summary) in zip(pending, fitness_pool.evaluate(list(pending.values()))):
+                if "error" in summary:
+                    error_callback(summary["error"])
+                else:
+                    fitness_cache.put(key, fitness, summary)
+                results[key] = (fitness, summary)
+
+        fitnesses = []
+        for solution, key in zip(solutions, keys):
+            fitness, summaries[tuple(solution)] = results[key]
+            fitnesses.append(fitness)
+        return fitnesses
+
+    try:
+        ga_instance = pygad.GA(
+            num_generations=num_generations,
+            num_parents_mating=num_parents_mating,
+            fitness_func=batch_fitness if fitness_pool else lambda ga, sol, idx: fitness_wrapper(
+                ga, sol, idx, base_strategy, genes, fitness_config, error_callback, fitness_data, fitness_cache
+            ),
+            fitness_batch_size=sol_per_pop if fitness_pool else None,
+            sol_per_pop=sol_per_pop,
+            num_genes=len(genes),  # Set number of genes based on the actual gene list length
+            gene_space=gene_space,
+            initial_population=initial_population,
+            parent_selection_type=parent_selection_type,
+            crossover_type=crossover_type,
+            mutation_type=mutation_type,
+            mutation_percent_genes=mutation_percent_genes,
+            parallel_processing=None if fitness_pool else parallel_processing,
+            random_mutation_min_val=-1.0,
+            random_mutation_max_val=1.0,
+            save_best_solutions=True,
+            K_tournament=K_tournament,
+            on_generation=on_generation,
+            random_seed=random_seed,
+        )
+        # Run the GA
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", category=UserWarning, module="pygad.pygad")
+            ga_instance.run()
+    finally:
+        if fitness_pool:
+            fitness_pool.close()
 
     # Get the best solution
-    solution, solution_fitness, solution_idx = ga_instance.best_solution()
+    solution, solution_fitness, solution_idx = ga_instance.best_solution(
+        pop_fitness=ga_instance.last_generation_fitness
+    )
 
     # save the best solution
     # best_solution_file = f"./ft_archive/{date_str}_best_solution.yml"
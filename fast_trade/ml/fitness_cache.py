@@ -0,0 +1,123 @@
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+from typing import Optional, Tuple
+
+# keys that are written on the strategy but don't change the backtest
+IGNORED_STRATEGY_KEYS = ["completed_at", "started_at"]
+# part of every hash, bump it when a change to the backtest or the summary changes the fitness of a strategy,
+# so the sqlite files written before it are missed instead of read
+CACHE_VERSION = 1
+
+
+def default_cache_path() -> str:
+    """fitness_cache.sqlite in the ml folder of the archive, next to the evolver results."""
+    archive_path = os.getenv("ARCHIVE_PATH") or "./ft_archive"
+    if not archive_path.endswith("ml"):
+        archive_path = os.path.join(archive_path, "ml")
+    return os.path.join(archive_path, "fitness_cache.sqlite")
+
+
+def _canonical(value):
+    """JSON friendly copy of value where 14.0 and 14 (or np.int64(14)) hash the same."""
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        # numpy scalars
+        value = value.item()
+    if isinstance(value, float) and math.isfinite(value) and value.is_integer():
+        return int(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def strategy_hash(strategy: dict, fitness_config=None, data: Optional[str] = None) -> str:
+    """Hashes a strategy, after modify_strategy filled in the genes, together with the fitness config.
+
+    Genomes that only differ before the rounding and column/freq mapping of modify_strategy
+    end up with the same hash. data is the fingerprint of the candles the strategy is backtested
+    on (see FitnessData.fingerprint), so a strategy with no stop is evaluated again once the
+    archive gets new candles.
+    """
+    payload = {k: v for k, v in strategy.items() if k not in IGNORED_STRATEGY_KEYS}
+    raw = json.dumps(_canonical([CACHE_VERSION, payload, fitness_config, data]), sort_keys=True, default=str)
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+class FitnessCache:
+    """Fitness and compact summary of every strategy evaluated, in memory and optionally in a sqlite file.
+
+    The sqlite file survives the run, so a resumed or repeated run doesn't backtest a strategy twice.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """The sqlite connection, opened on first use so an unused cache leaves no file behind."""
+        if self.path and self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # every thread of the GA shares the connection, behind the lock
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS fitness (key TEXT PRIMARY KEY, fitness REAL, summary TEXT)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str) -> Optional[Tuple[float, dict]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry
+            conn = self._connection()
+            if conn is not None:
+                row = conn.execute("SELECT fitness, summary FROM fitness WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = (row[0], json.loads(row[1]))
+                    self._entries[key] = entry
+                    self.disk_hits += 1
+                    return entry
+            self.misses += 1
+            return None
+
+    def put(self, key: str, fitness: float, summary: dict) -> None:
+        with self._lock:
+            self._entries[key] = (fitness, summary)
+            conn = self._connection()
+            if conn is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO fitness (key, fitness, summary) VALUES (?, ?, ?)",
+                    (key, float(fitness), json.dumps(_canonical(summary), default=str)),
+                )
+                conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            }
@@ -11,7 +11,7 @@ from typing import Any, Dict, List, Mapping, Optional
 import pandas as pd
 import requests
 
-from fast_trade.archive.db_helpers import ARCHIVE_PATH, _safe_read_parquet
+from fast_trade.archive.db_helpers import ARCHIVE_PATH, archive_symbols, kline_archive_exists, read_kline_archive
 from fast_trade.ml.hmm_screen import normalize_config
 
 
@@ -46,18 +46,18 @@ def load_archive_candles(
     freq: str = "1D",
 ) -> pd.DataFrame:
     """Load local archive candles without auto-downloading."""
-    parquet_path = os.path.join(ARCHIVE_PATH, exchange, f"{symbol}.parquet")
-    if not os.path.exists(parquet_path):
+    archive_dir = os.path.join(ARCHIVE_PATH, exchange, symbol)
+    if not kline_archive_exists(symbol, exchange, archive_path=ARCHIVE_PATH):
         raise FileNotFoundError(
-            f"No archive data for {exchange}/{symbol} at {parquet_path}. "
+            f"No archive data for {exchange}/{symbol} at {archive_dir}. "
             "Run `ft download` first or pass live=True."
         )
-    df = _safe_read_parquet(parquet_path)
+    start = utc_now() - dt.timedelta(days=int(lookback_days)) if lookback_days else None
+    df = read_kline_archive(symbol, exchange, start_date=start, archive_path=ARCHIVE_PATH)
     if df is None or df.empty:
-        raise RuntimeError(f"Archive parquet unreadable or empty: {parquet_path}")
+        raise RuntimeError(f"Archive parquet unreadable or empty: {archive_dir}")
     df = _ensure_ohlcv(df)
-    if lookback_days:
-        start = utc_now() - dt.timedelta(days=int(lookback_days))
+    if start is not None:
         df = df[df.index >= start]
     if freq:
         df = (
@@ -237,15 +237,7 @@ def _local_archive_symbols(exchange: str) -> List[str]:
     exchange_path = os.path.join(ARCHIVE_PATH, exchange)
     if not os.path.isdir(exchange_path):
         return []
-    symbols = []
-    for name in os.listdir(exchange_path):
-        if name.startswith("_"):
-            continue
-        if name.endswith(".parquet"):
-            symbols.append(name[: -len(".parquet")])
-        elif name.endswith(".sqlite"):
-            symbols.append(name[: -len(".sqlite")])
-    return sorted(symbols)
+    return archive_symbols(exchange_path)
 
 
 def load_universe(config: Mapping[str, Any]) -> List[Dict[str, Any]]:
@@ -0,0 +1,393 @@
+import glob
+import itertools
+import math
+import multiprocessing as mp
+import os
+from functools import partial
+from typing import Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from fast_trade.archive.db_helpers import atomic_write_parquet, safe_read_parquet
+from fast_trade.evaluate import handle_rule
+from fast_trade.ml import evolver
+from fast_trade.ml.evolver import (
+    FitnessData,
+    FitnessPool,
+    _fitness_config,
+    _get_metric,
+    _solution_strategy,
+    compact_metrics,
+    evaluate_solution,
+    fitness_key,
+    map_genes,
+)
+from fast_trade.ml.fitness_cache import FitnessCache, strategy_hash
+from fast_trade.run_backtest_batch import run_backtest_batch
+
+SAMPLERS = ["grid", "random", "lhs"]
+
+# metrics that only ever move one way as a backtest gets longer, with the operators a rule on them
+# can't pass anymore once it failed on the first part of the candles
+PRUNABLE_RULES = {
+    "num_trades": ["<", "<="],
+    "total_fees": ["<", "<="],
+    "equity_peak": ["<", "<="],
+    "max_drawdown": [">", ">="],
+    "drawdown_metrics.max_drawdown_pct": [">", ">="],
+}
+
+
+def default_results_path(name: str) -> str:
+    """sweeps/<name> in the ml folder of the archive, next to the evolver results."""
+    archive_path = os.getenv("ARCHIVE_PATH") or "./ft_archive"
+    if not archive_path.endswith("ml"):
+        archive_path = os.path.join(archive_path, "ml")
+    return os.path.join(archive_path, "sweeps", name)
+
+
+def gene_values(space) -> Optional[list]:
+    """The values a gene can take, None for a continuous range.
+
+    A space is a list of values or a {"low", "high"} range, inclusive. Integer ranges step by 1
+    unless they have a "step", float ranges are continuous unless they have one.
+    """
+    if isinstance(space, (list, tuple)):
+        return list(space)
+    if not isinstance(space, dict) or "low" not in space or "high" not in space:
+        raise ValueError(f"Invalid gene space: {space}, expected a list or a dict with low and high")
+    low, high = space["low"], space["high"]
+    step = space.get("step")
+    if step is None:
+        if isinstance(low, float) or isinstance(high, float):
+            return None
+        step = 1
+    count = int(math.floor((high - low) / step + 1e-9)) + 1
+    if all(isinstance(v, int) for v in (low, high, step)):
+        return [low + i * step for i in range(count)]
+    return [round(low + i * step, 10) for i in range(count)]
+
+
+def grid_candidates(spaces: list) -> Iterator[list]:
+    """Every combination of the gene values, in order. Needs a step on float ranges."""
+    values = []
+    for space in spaces:
+        options = gene_values(space)
+        if options is None:
+            raise ValueError(f"A grid needs discrete gene values, add a step to {space}")
+        values.append(options)
+    for combination in itertools.product(*values):
+        yield list(combination)
+
+
+def _pick(space, options, u: float):
+    """The value at u in [0, 1) of a gene space."""
+    if options is not None:
+        return options[min(int(u * len(options)), len(options) - 1)]
+    return space["low"] + u * (space["high"] - space["low"])
+
+
+def random_candidates(spaces: list, samples: int, seed: Optional[int] = None) -> Iterator[list]:
+    """samples candidates drawn uniformly and independently from every gene."""
+    rng = np.random.default_rng(seed)
+    options = [gene_values(space) for space in spaces]
+    for _ in range(samples):
+        yield [_pick(space, opts, float(rng.random())) for space, opts in zip(spaces, options)]
+
+
+def lhs_candidates(spaces: list, samples: int, seed: Optional[int] = None) -> Iterator[list]:
+    """samples candidates on a Latin hypercube.
+
+    Every gene's range is cut in samples equal strata and each stratum is used exactly once,
+    so the candidates cover every gene evenly even when there are few of them.
+    """
+    rng = np.random.default_rng(seed)
+    options = [gene_values(space) for space in spaces]
+    strata = [rng.permutation(samples) for _ in spaces]
+    for i in range(samples):
+        yield [
+            _pick(space, opts, (float(order[i]) + float(rng.random())) / samples)
+            for space, opts, order in zip(spaces, options, strata)
+        ]
+
+
+def sweep_candidates(spaces: list, sampler: str = "grid", samples: Optional[int] = None, seed=None):
+    """(lazy candidates, how many there will be) for a sampler."""
+    if sampler == "grid":
+        total = math.prod(len(gene_values(space) or [None]) for space in spaces)
+        candidates = grid_candidates(spaces)
+        if samples is not None and samples < total:
+            return itertools.islice(candidates, samples), samples
+        return candidates, total
+    if sampler not in SAMPLERS:
+        raise ValueError(f"Unknown sampler: {sampler}, expected one of {SAMPLERS}")
+    if not samples:
+        raise ValueError(f"The {sampler} sampler needs a number of samples")
+    sample = random_candidates if sampler == "random" else lhs_candidates
+    return sample(spaces, samples, seed), samples
+
+
+def _nested(summary: dict) -> dict:
+    """A compact summary keyed by dotted paths, nested again so handle_rule can walk it."""
+    nested = {}
+    for key, value in summary.items():
+        current = nested
+        parts = key.split(".")
+        for part in parts[:-1]:
+            current = current.setdefault(part, {})
+        current[parts[-1]] = value
+    return nested
+
+
+def check_constraints(summary: dict, constraints: list) -> bool:
+    """True if the compact summary passes every evaluate_rules style constraint."""
+    nested = _nested(summary)
+    try:
+        return all(handle_rule(nested, rule) for rule in constraints)
+    except (KeyError, TypeError, ValueError):
+        return False
+
+
+def prune_candidate(strategy: dict, constraints: list, fraction: float, fitness_data: FitnessData) -> str:
+    """Backtests the first fraction of the candles, returns why the candidate can't pass, "" if it still can.
+
+    Only the PRUNABLE_RULES are checked: they can only get worse as the backtest goes on, so
+    failing on the first part of the candles means failing on all of them.
+    """
+    rules = [
+        rule
+        for rule in constraints or []
+        if rule[1] in PRUNABLE_RULES.get(rule[0], []) and isinstance(rule[2], (int, float))
+    ]
+    if not rules or not 0 < fraction < 1 or not strategy.get("symbol") or not strategy.get("exchange"):
+        return ""
+    try:
+        df = fitness_data.get_candles(strategy)
+        prefix = df.iloc[: max(1, int(len(df) * fraction))]
+        # an open position closed on the last row would count a trade the full backtest doesn't have
+        table = run_backtest_batch(prefix, [{**strategy, "exit_on_end": False}], cache=fitness_data.cache)
+    except Exception:
+        # the full backtest reports it
+        return ""
+    metrics = table.iloc[0].to_dict()
+    metrics["drawdown_metrics"] = {"max_drawdown_pct": metrics["max_drawdown_pct"]}
+    for rule in rules:
+        if not handle_rule(metrics, rule):
+            value = _get_metric(metrics, rule[0])
+            return f"{' '.join(str(r) for r in rule)} failed on the first {fraction:.0%} of the candles ({value})"
+    return ""
+
+
+def evaluate_candidate(
+    solution,
+    base_strategy: dict,
+    genes: list,
+    fitness_config=None,
+    fitness_data: FitnessData = None,
+    constraints: list = None,
+    prune_fraction: float = 0.25,
+):
+    """(status, fitness, compact summary, message) of one candidate, status is "ok", "pruned" or "error"."""
+    fitness_data = fitness_data if fitness_data is not None else FitnessData()
+    if constraints:
+        reason = prune_candidate(
+            _solution_strategy(solution, base_strategy, genes), constraints, prune_fraction, fitness_data
+        )
+        if reason:
+            return "pruned", math.nan, {}, reason
+    fitness, summary = evaluate_solution(solution, base_strategy, genes, fitness_config, fitness_data=fitness_data)
+    if "error" in summary:
+        return "error", math.nan, {}, summary["error"]
+    return "ok", fitness, summary, ""
+
+
+def _sweep_task(solution, constraints=None, prune_fraction=0.25):
+    """FitnessPool task, evaluate_candidate with the run kept in the worker by _init_fitness_worker."""
+    base_strategy, genes, fitness_config, fitness_data, _ = evolver._WORKER_FITNESS
+    return evaluate_candidate(solution, base_strategy, genes, fitness_config, fitness_data, constraints, prune_fraction)
+
+
+def _part_files(results_path: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(results_path, "part-*.parquet")))
+
+
+def load_sweep_results(results_path: str) -> pd.DataFrame:
+    """Every result written so far by run_sweep to results_path, in the order they were written."""
+    frames = [frame for frame in (safe_read_parquet(path) for path in _part_files(results_path)) if frame is not None]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+def run_sweep(
+    base_strategy: dict,
+    genes: list,
+    sampler: str = "grid",
+    samples: Optional[int] = None,
+    seed: Optional[int] = 0,
+    fitness_config=None,
+    constraints: list = None,
+    prune_fraction: float = 0.25,
+    processes: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    results_path: Optional[str] = None,
+    resume: bool = True,
+    fitness_cache: FitnessCache = None,
+    progress_callback=None,
+) -> pd.DataFrame:
+    """
+    Searches the genes of a strategy exhaustively (grid) or quasi randomly (random, lhs), instead of the GA.
+
+    Candidates are generated lazily and evaluated in batches on a FitnessPool, the candles are
+    loaded once and shared with the workers. Before a full backtest, a candidate is backtested on
+    the first prune_fraction of the candles and dropped if it already fails one of the constraints
+    that can only get worse (PRUNABLE_RULES). Every batch is written to results_path as its own
+    parquet part file, so an interrupted sweep resumes where it stopped.
+
+    Args:
+        base_strategy: the strategy with "#gene" placeholders, filled in with modify_strategy
+        genes: (name, space) tuples, a space is a list of values or a {"low", "high", "step"} range.
+            freq and column genes are indices, as in the evolver.
+        sampler: "grid", "random" or "lhs" (Latin hypercube)
+        samples: how many candidates random and lhs draw, the grid stops after that many if given
+        seed: seed of the random and lhs samplers, keep it to resume the same sweep
+        fitness_config: weights of the fitness, as for optimize_strategy
+        constraints: evaluate_rules style rules the compact summary has to pass, ex. ["num_trades", ">=", 10]
+        prune_fraction: part of the candles the constraints are checked on first, 0 to never prune
+        processes: worker processes, the candidates are evaluated in this process if 1
+        batch_size: candidates per batch (and per part file), 8 per process by default
+        results_path: folder of the parquet part files, nothing is written if None
+        resume: skip the candidates already in results_path, False to start over
+        fitness_cache: FitnessCache shared with the evolver, looked up before evaluating
+        progress_callback: called with the progress after every batch
+
+    Returns:
+        The results table, one row per distinct candidate: candidate, key, gene.<name>, status,
+        fitness, passed, message and the metrics of the compact summary.
+    """
+    processes = max(1, processes or mp.cpu_count())
+    batch_size = batch_size or processes * 8
+    constraints = constraints or []
+    # the constraints can only be checked if the compact summary has their metrics
+    fitness_config = {**_fitness_config(fitness_config)}
+    fitness_config["metrics"] = list(fitness_config.get("metrics", [])) + [
+        rule[0] for rule in constraints if rule[0] not in fitness_config.get("metrics", [])
+    ]
+    metrics = compact_metrics(fitness_config)
+    spaces = [gene[1] for gene in genes]
+    gene_names = [(gene[0], None) for gene in genes]
+
+    previous_keys = set()
+    part = 0
+    if results_path:
+        os.makedirs(results_path, exist_ok=True)
+        if resume:
+            previous = load_sweep_results(results_path)
+            previous_keys = set(previous["key"]) if not previous.empty else set()
+        else:
+            for path in _part_files(results_path):
+                os.remove(path)
+        part = len(_part_files(results_path))
+
+    candidates, total = sweep_candidates(spaces, sampler, samples, seed)
+    fitness_data = FitnessData()
+    fitness_pool = None
+    stats = {"evaluated": 0, "resumed": 0, "duplicates": 0, "pruned": 0, "errors": 0, "cached": 0}
+    best = {"fitness": None, "genes": None}
+    rows = []
+    seen = set()
+    position = 0
+    try:
+        while True:
+            batch = list(itertools.islice(candidates, batch_size))
+            if not batch:
+                break
+            pending = {}
+            results = {}
+            for solution in batch:
+                position += 1
+                strategy = _solution_strategy(solution, base_strategy, gene_names)
+                # without candles the backtest fails, so nothing is ever cached under the plain hash
+                key = fitness_key(strategy, fitness_config, fitness_data) or strategy_hash(strategy, fitness_config)
+                if key in previous_keys:
+                    stats["resumed"] += 1
+                    continue
+                if key in seen:
+                    # random and lhs draw the same integers again, modify_strategy rounds floats
+                    stats["duplicates"] += 1
+                    continue
+                seen.add(key)
+                cached = fitness_cache.get(key) if fitness_cache is not None else None
+                if cached is not None:
+                    stats["cached"] += 1
+                    results[key] = (position - 1, solution, ("ok", cached[0], cached[1], ""))
+                else:
+                    pending[key] = (position - 1, solution)
+
+            if pending:
+                solutions = [solution for _, solution in pending.values()]
+                if processes > 1 and fitness_pool is None:
+                    fitness_pool = FitnessPool(
+                        base_strategy,
+                        genes,
+                        fitness_config,
+                        processes=processes,
+                        population=solutions,
+                        fitness_data=fitness_data,
+                        task=partial(_sweep_task, constraints=constraints, prune_fraction=prune_fraction),
+                    )
+                if fitness_pool is not None:
+                    outcomes = fitness_pool.evaluate(solutions)
+                else:
+                    outcomes = [
+                        evaluate_candidate(
+                            solution, base_strategy, gene_names, fitness_config, fitness_data, constraints, prune_fraction
+                        )
+                        for solution in solutions
+                    ]
+                for (key, (index, solution)), outcome in zip(pending.items(), outcomes):
+                    results[key] = (index, solution, outcome)
+                    if outcome[0] == "ok" and fitness_cache is not None:
+                        fitness_cache.put(key, outcome[1], outcome[2])
+
+            batch_rows = []
+            for key, (index, solution, (status, fitness, summary, message)) in sorted(
+                results.items(), key=lambda item: item[1][0]
+            ):
+                stats["evaluated"] += 1
+                stats["pruned"] += status == "pruned"
+                stats["errors"] += status == "error"
+                passed = status == "ok" and check_constraints(summary, constraints)
+                row = {"candidate": index, "key": key}
+                row.update({f"gene.{name}": value for name, value in map_genes(solution, gene_names)})
+                row.update({"status": status, "fitness": float(fitness), "passed": passed, "message": message})
+                row.update({metric: float(summary.get(metric, math.nan)) for metric in metrics})
+                batch_rows.append(row)
+                if passed and (best["fitness"] is None or fitness > best["fitness"]):
+                    best = {"fitness": fitness, "genes": map_genes(solution, gene_names)}
+
+            if batch_rows:
+                rows.extend(batch_rows)
+                if results_path:
+                    atomic_write_parquet(
+                        pd.DataFrame(batch_rows), os.path.join(results_path, f"part-{part:05d}.parquet"), index=False
+                    )
+                    part += 1
+            if progress_callback:
+                progress_callback(
+                    {
+                        **stats,
+                        "done": position,
+                        "total": total,
+                        "best_fitness": best["fitness"],
+                        "best_genes": best["genes"],
+                    }
+                )
+    finally:
+        if fitness_pool is not None:
+            fitness_pool.close()
+
+    if results_path:
+        return load_sweep_results(results_path)
+    return pd.DataFrame(rows)
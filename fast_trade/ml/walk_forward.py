@@ -0,0 +1,307 @@
+import multiprocessing as mp
+import random
+
+import numpy as np
+import pandas as pd
+
+from fast_trade import run_backtest
+from fast_trade.archive.db_helpers import get_kline
+from fast_trade.ml.evolver import (
+    FitnessData,
+    _normalize_types,
+    compact_summary,
+    frequency_map,
+    modify_strategy,
+    optimize_strategy,
+    score_summary,
+)
+from fast_trade.run_backtest import MissingData, max_datapoint_periods
+from fast_trade.shared_frame import attach_frame, can_share_frame, release_frame, share_frame
+from fast_trade.summary.metrics import calculate_drawdown_metrics
+
+
+def walk_forward_folds(index: pd.DatetimeIndex, train, test, step=None, anchored=False) -> list:
+    """
+    Rolling train/test windows over the candles.
+
+    Each fold trains on `train` worth of candles and tests on the `test` right after them, the next
+    fold starts `step` later (default `test`, so the test windows tile the candles). Anchored folds
+    all train from the first candle. Only the folds whose whole test window has candles are made.
+
+    Returns:
+        list of dicts, the fold number and its bounds as timestamps: train_start, test_start and
+        test_stop, which is excluded
+    """
+    train, test = pd.Timedelta(train), pd.Timedelta(test)
+    step = pd.Timedelta(step) if step else test
+    if min(train, test, step) <= pd.Timedelta(0):
+        raise ValueError("train, test and step must be positive")
+    if len(index) < 2:
+        return []
+
+    first = index[0]
+    # the last candle covers up to where the next one would start
+    end = index[-1] + (index[-1] - index[-2])
+    folds = []
+    while True:
+        train_start = first if anchored else first + step * len(folds)
+        test_start = first + train + step * len(folds)
+        test_stop = test_start + test
+        if test_stop > end:
+            return folds
+        folds.append({"fold": len(folds), "train_start": train_start, "test_start": test_start, "test_stop": test_stop})
+
+
+def _top_of_space(space):
+    """The largest value of a gene space, None when it can't be told."""
+    if isinstance(space, dict):
+        return space.get("high")
+    if isinstance(space, (list, tuple)) and space:
+        try:
+            return max(space)
+        except TypeError:
+            return None
+    return None
+
+
+def _widest_freq(space) -> str:
+    """The longest freq a freq gene can pick, its values are frequency_map indices or freq strings."""
+    values = space if isinstance(space, (list, tuple)) else [_top_of_space(space)]
+    freqs = []
+    for value in values:
+        if isinstance(value, str):
+            freqs.append(value)
+        elif value is None:
+            freqs.append(frequency_map[-1])
+        else:
+            freqs.append(frequency_map[max(0, min(int(value), len(frequency_map) - 1))])
+    return max(freqs, key=pd.Timedelta)
+
+
+def warm_up_period(strategy: dict, genes: list = ()) -> pd.Timedelta:
+    """
+    How long before a window its candles have to start so every datapoint is warmed up on its first row.
+
+    That's max_datapoint_periods bars of the strategy's freq. With genes, a "#name" arg counts as the
+    top of the gene's space and a freq gene as the longest freq it can pick, so the warm up covers
+    every strategy the genes can make.
+    """
+    tops = {gene[0]: _top_of_space(gene[1]) for gene in genes}
+    datapoints = []
+    for dp in strategy.get("datapoints", []):
+        args = []
+        for arg in dp.get("args", []):
+            if isinstance(arg, str) and arg.startswith("#"):
+                arg = tops.get(arg[1:])
+            args.append(int(round(arg)) if isinstance(arg, float) else arg)
+        datapoints.append({"args": args})
+
+    freq_genes = [gene[1] for gene in genes if gene[0] == "freq"]
+    freq = _widest_freq(freq_genes[0]) if freq_genes else strategy.get("freq") or strategy.get("chart_period")
+    return pd.Timedelta(freq) * max_datapoint_periods({"datapoints": datapoints})
+
+
+def run_fold(
+    df: pd.DataFrame,
+    fold: dict,
+    base_strategy: dict,
+    genes: list,
+    fitness_config=None,
+    optimizer_settings: dict = None,
+    seed: int = 0,
+):
+    """
+    Optimizes the strategy on the train window of one fold and backtests the winner on its test window.
+
+    Both windows are views of df (positional slices, nothing is copied) that start as far before
+    the window as warm_up_period says, those rows only warm up the datapoints.
+
+    Returns:
+        (row, equity, winner), row is the fold's bounds, winning genes, train and test fitness and the
+        compact summary of the test backtest, equity the adj_account_value of the test backtest and
+        winner the strategy that was tested
+    """
+    # the initial population is drawn from the random module, the rest of the GA from its own generators
+    random.seed(seed + fold["fold"])
+    index = df.index
+    test_pos, stop_pos = index.searchsorted(fold["test_start"]), index.searchsorted(fold["test_stop"])
+
+    train_from = index.searchsorted(fold["train_start"] - warm_up_period(base_strategy, genes))
+    fitness_data = FitnessData(df=df.iloc[train_from:test_pos])
+    train_strategy = {
+        **base_strategy,
+        "start": fold["train_start"].isoformat(),
+        "stop": index[test_pos - 1].isoformat(),
+    }
+    winning_genes, train_fitness = optimize_strategy(
+        train_strategy,
+        genes,
+        fitness_config=fitness_config,
+        fitness_data=fitness_data,
+        random_seed=seed + fold["fold"],
+        **(optimizer_settings or {}),
+    )
+
+    winner = modify_strategy(base_strategy, winning_genes)
+    winner["start"] = fold["test_start"].isoformat()
+    winner["stop"] = index[stop_pos - 1].isoformat()
+    test_from = index.searchsorted(fold["test_start"] - warm_up_period(winner))
+    result = run_backtest(winner, df=df.iloc[test_from:stop_pos], cache=fitness_data.cache, warm_up=True)
+    summary = result["summary"]
+
+    row = {
+        "fold": fold["fold"],
+        "train_start": fold["train_start"],
+        "test_start": fold["test_start"],
+        "test_stop": fold["test_stop"],
+        **{f"gene.{name}": _normalize_types(value) for name, value in winning_genes},
+        "train_fitness": float(train_fitness),
+        "test_fitness": float(score_summary(summary, fitness_config)),
+        **compact_summary(summary, fitness_config),
+    }
+    equity = result["df"]["adj_account_value"].rename("equity")
+    return row, equity, winner
+
+
+# set once per worker process by _init_fold_worker
+_WORKER_FOLDS = None
+
+
+def _init_fold_worker(meta, df, base_strategy, genes, fitness_config, optimizer_settings, seed):
+    """Pool initializer, attaches the shared candles (or keeps the ones sent once per worker)."""
+    global _WORKER_FOLDS
+    segment = None
+    if meta is not None:
+        df, segment = attach_frame(meta)
+    _WORKER_FOLDS = (df, segment, base_strategy, genes, fitness_config, optimizer_settings, seed)
+
+
+def _fold_task(fold):
+    df, _, base_strategy, genes, fitness_config, optimizer_settings, seed = _WORKER_FOLDS
+    return fold["fold"], run_fold(df, fold, base_strategy, genes, fitness_config, optimizer_settings, seed)
+
+
+def stitch_equity(curves: list, base_balance: float) -> pd.Series:
+    """One equity curve out of the test windows, each one compounding on where the previous one ended."""
+    stitched = []
+    balance = base_balance
+    for curve in curves:
+        scaled = curve * (balance / base_balance)
+        stitched.append(scaled)
+        balance = float(scaled.iloc[-1])
+    return pd.concat(stitched) if stitched else pd.Series(dtype=float, name="equity")
+
+
+def run_walk_forward(
+    base_strategy: dict,
+    genes: list,
+    train,
+    test,
+    step=None,
+    anchored: bool = False,
+    df: pd.DataFrame = None,
+    fitness_config=None,
+    optimizer_settings: dict = None,
+    processes: int = None,
+    seed: int = 0,
+    progress_callback=None,
+) -> dict:
+    """
+    Walk-forward evaluation: optimize on every train window, score the winner on the test window after it.
+
+    The folds cover the strategy's start to stop (all of df when they aren't set). The candles are
+    loaded once, from the archive with the warm up of the first fold unless df is given, and every
+    fold works on views of them. The folds are independent, so
+    with processes > 1 they run on a pool, with the candles in shared memory. Each fold then runs
+    optimize_strategy in its worker, without a pool of its own.
+
+    Parameters
+    ----------
+    base_strategy: dict, the strategy with "#gene" placeholders, as for optimize_strategy
+    genes: list of (name, space), the genes to optimize
+    train, test, step: pandas timedeltas or strings (e.g. "30D"), see walk_forward_folds
+    anchored: bool, every train window starts at the first candle
+    df: pandas dataframe, optional, the OHLCV candles to walk over
+    fitness_config: dict, how the train windows are scored, the test windows are scored the same way
+    optimizer_settings: dict, passed on to optimize_strategy (num_generations, sol_per_pop, ...)
+    processes: int, how many folds run at once, defaults to the CPU count
+    seed: int, the GA of fold n is seeded with seed + n
+    progress_callback: callable, called with {"phase": "folds", "done", "total"} as folds finish
+
+    Returns
+    -------
+    dict
+        folds, dataframe with one row per fold (see run_fold)
+        equity, the stitched equity curve of the test windows
+        strategies, the winning strategy of every fold
+        summary, return_perc, max_drawdown_pct and num_trades of the stitched curve
+    """
+    start = pd.Timestamp(base_strategy["start"]) if base_strategy.get("start") else None
+    stop = pd.Timestamp(base_strategy["stop"]) if base_strategy.get("stop") else None
+    if df is None:
+        freq = "1Min" if any(gene[0] == "freq" for gene in genes) else base_strategy.get("freq", "1Min")
+        df = get_kline(
+            base_strategy.get("symbol"),
+            base_strategy.get("exchange"),
+            start - warm_up_period(base_strategy, genes) if start is not None else None,
+            stop,
+            freq=freq,
+        )
+    if df.empty:
+        raise MissingData(f"No data found for {base_strategy.get('symbol')} on {base_strategy.get('exchange')}")
+
+    span = df.loc[start:stop].index
+    folds = walk_forward_folds(span, train, test, step=step, anchored=anchored)
+    if not folds:
+        raise ValueError(f"The candles from {span[0]} to {span[-1]} are too short for one fold")
+
+    if processes is None:
+        processes = mp.cpu_count()
+    processes = max(1, min(processes, len(folds)))
+    results = [None] * len(folds)
+
+    def fold_done(done):
+        if progress_callback:
+            progress_callback({"phase": "folds", "done": done, "total": len(folds)})
+
+    if processes == 1:
+        for done, fold in enumerate(folds, start=1):
+            results[fold["fold"]] = run_fold(df, fold, base_strategy, genes, fitness_config, optimizer_settings, seed)
+            fold_done(done)
+    else:
+        # daemonic pool workers can't start the optimizer's own pool
+        settings = {**(optimizer_settings or {}), "parallel_processing": None}
+        meta, segment, worker_df = None, None, None
+        if can_share_frame(df):
+            meta, segment = share_frame(df)
+        else:
+            worker_df = df
+        try:
+            with mp.Pool(
+                processes=processes,
+                initializer=_init_fold_worker,
+                initargs=(meta, worker_df, base_strategy, genes, fitness_config, settings, seed),
+            ) as pool:
+                for done, (position, result) in enumerate(pool.imap_unordered(_fold_task, folds), start=1):
+                    results[position] = result
+                    fold_done(done)
+        finally:
+            release_frame(segment, unlink=True)
+
+    rows = [row for row, _, _ in results]
+    base_balance = float(base_strategy.get("base_balance", 1000))
+    equity = stitch_equity([curve for _, curve, _ in results], base_balance)
+    drawdown = calculate_drawdown_metrics(pd.DataFrame({"adj_account_value": equity}))
+    final = float(equity.iloc[-1])
+    return {
+        "folds": pd.DataFrame(rows).set_index("fold"),
+        "equity": equity,
+        "strategies": [winner for _, _, winner in results],
+        "summary": {
+            "num_folds": len(folds),
+            "return_perc": round(100 - base_balance / final * 100, 3) if final else 0.0,
+            "max_drawdown_pct": drawdown["max_drawdown_pct"],
+            "num_trades": int(sum(row.get("num_trades", 0) for row in rows)),
+            "mean_test_fitness": round(float(np.mean([row["test_fitness"] for row in rows])), 3),
+        },
+    }
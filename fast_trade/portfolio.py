@@ -5,7 +5,7 @@ from typing import Dict, List, Optional, Tuple, Union
 
 import pandas as pd
 
-from fast_trade.archive.db_helpers import _atomic_write_parquet, _safe_read_parquet
+from fast_trade.archive.db_helpers import atomic_write_parquet, safe_read_parquet
 
 
 def portfolio_paths(name: str, archive_path: Optional[str] = None) -> Dict[str, str]:
@@ -60,14 +60,14 @@ def append_trades(trades_path: str, rows: List[dict]) -> None:
         return
     df = pd.DataFrame(rows)
     if os.path.exists(trades_path):
-        existing = _safe_read_parquet(trades_path)
+        existing = safe_read_parquet(trades_path)
         if existing is None:
             merged = df
         else:
             merged = pd.concat([existing, df]).reset_index(drop=True)
-        _atomic_write_parquet(merged, trades_path, index=False)
+        atomic_write_parquet(merged, trades_path, index=False)
     else:
-        _atomic_write_parquet(df, trades_path, index=False)
+        atomic_write_parquet(df, trades_path, index=False)
 
 
 def apply_action(
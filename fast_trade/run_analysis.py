@@ -7,8 +7,22 @@ ACTION_HOLD = 0
 ACTION_ENTER = 1
 ACTION_EXIT = 2
 
+# the categories of a compact action column, the codes of "h", "e" and "x" are the ACTION_* codes
+ACTION_LABELS = ["h", "e", "x", "ae", "ax", "tsl"]
+# the ACTION_* code of every category code, the last one is for -1 (a label that isn't one of them)
+_CATEGORY_ACTIONS = np.array(
+    [ACTION_HOLD, ACTION_ENTER, ACTION_EXIT, ACTION_ENTER, ACTION_EXIT, ACTION_EXIT, ACTION_HOLD], dtype=np.int8
+)
+
+
+def compact_actions(actions) -> pd.Categorical:
+    """The actions as a Categorical of ACTION_LABELS, one byte per row instead of a python string."""
+    return pd.Categorical(actions, categories=ACTION_LABELS)
+
 
 def _encode_actions(actions: np.ndarray) -> np.ndarray:
+    if isinstance(actions, pd.Categorical) and list(actions.categories) == ACTION_LABELS:
+        return _CATEGORY_ACTIONS[actions.codes]
     codes = np.zeros(len(actions), dtype=np.int8)
     enter_mask = (actions == "e") | (actions == "ae")
     exit_mask = (actions == "x") | (actions == "ax") | (actions == "tsl")
@@ -17,6 +31,22 @@ def _encode_actions(actions: np.ndarray) -> np.ndarray:
     return codes
 
 
+def _transition_indices(action_codes: np.ndarray) -> np.ndarray:
+    """Finds the rows where the position actually changes.
+
+    An enter only counts when we're out of a trade and an exit only when we're in one, so the
+    state after any non-hold row is just its own action. A row is a transition when its action
+    differs from the previous non-hold action (starting from "out of a trade"). The result
+    alternates enter, exit, enter, ...
+    """
+    events = np.flatnonzero(action_codes != ACTION_HOLD)
+    event_codes = action_codes[events]
+    previous_codes = np.empty_like(event_codes)
+    previous_codes[:1] = ACTION_EXIT
+    previous_codes[1:] = event_codes[:-1]
+    return events[event_codes != previous_codes]
+
+
 def _simulate_account_path(
     action_codes: np.ndarray,
     close_prices: np.ndarray,
@@ -26,24 +56,30 @@ def _simulate_account_path(
     max_lot_size: float,
     progress_callback=None,
 ):
+    """Event driven account simulation.
+
+    Only the enter/exit transitions are visited in Python, the rows in between carry the
+    state forward so they're filled in with numpy.
+    """
     n = len(action_codes)
     in_trade_array = np.zeros(n, dtype=bool)
-    account_value_array = np.zeros(n, dtype=float)
+    account_value_array = np.full(n, base_balance, dtype=float)
     aux_array = np.zeros(n, dtype=float)
     fee_array = np.zeros(n, dtype=float)
 
+    transitions = _transition_indices(action_codes)
+    cash_values = np.empty(len(transitions), dtype=float)
+    aux_values = np.empty(len(transitions), dtype=float)
+
     fee_rate = comission / 100 if comission else 0.0
-    in_trade = False
     cash_value = base_balance
     aux_value = 0.0
-    update_every = max(1, n // 200) if n else 1
 
-    for i in range(n):
+    for t, i in enumerate(transitions):
         close = close_prices[i]
         fee = 0.0
-        action_code = action_codes[i]
 
-        if action_code == ACTION_ENTER and not in_trade:
+        if t % 2 == 0:
             base_transaction_amount = cash_value * lot_size
             if max_lot_size and base_transaction_amount > max_lot_size:
                 base_transaction_amount = max_lot_size
@@ -52,21 +88,27 @@ def _simulate_account_path(
             fee = round(aux_value * fee_rate, 8) if fee_rate and aux_value else 0.0
             aux_value = aux_value - fee
             cash_value = round(cash_value - base_transaction_amount, 8)
-            in_trade = True
 
-        elif action_code == ACTION_EXIT and in_trade:
+        else:
             base_value = round(aux_value * close, 8) if aux_value else 0.0
             fee = round(base_value * fee_rate, 8) if fee_rate and base_value else 0.0
             cash_value = round(cash_value + base_value - fee, 8)
             aux_value = 0.0
-            in_trade = False
 
-        account_value_array[i] = cash_value
-        aux_array[i] = aux_value
-        in_trade_array[i] = in_trade
+        cash_values[t] = cash_value
+        aux_values[t] = aux_value
         fee_array[i] = fee
-        if progress_callback and (i % update_every == 0 or i == n - 1):
-            progress_callback({"percent": int((i + 1) / n * 100)})
+
+    if len(transitions):
+        # every transition holds its state until the next one (or the end of the frame)
+        first = transitions[0]
+        run_lengths = np.diff(np.append(transitions, n))
+        account_value_array[first:] = np.repeat(cash_values, run_lengths)
+        aux_array[first:] = np.repeat(aux_values, run_lengths)
+        in_trade_array[first:] = np.repeat(np.arange(len(transitions)) % 2 == 0, run_lengths)
+
+    if progress_callback:
+        progress_callback({"percent": 100})
 
     adj_account_value_array = account_value_array + np.round(aux_array * close_prices, 8)
     return {
@@ -78,6 +120,24 @@ def _simulate_account_path(
     }
 
 
+def _exit_on_end(sim: dict, close: float, comission: float) -> dict:
+    """Closes the position still open on the last row, as one extra row priced at the last close."""
+    fee_rate = comission / 100 if comission else 0.0
+    aux = sim["aux"][-1]
+    new_base = round(aux * close, 8) if aux else 0.0
+    fee = round(new_base * fee_rate, 8) if fee_rate and new_base else 0.0
+    new_account_value = sim["account_value"][-1] + new_base - fee
+    return {
+        "in_trade": np.append(sim["in_trade"], False),
+        "account_value": np.append(sim["account_value"], new_account_value),
+        "aux": np.append(sim["aux"], 0.0),
+        "fee": np.append(sim["fee"], fee),
+        "adj_account_value": np.append(
+            sim["adj_account_value"], new_account_value + convert_aux_to_base(0.0, close)
+        ),
+    }
+
+
 def apply_logic_to_df(df: pd.DataFrame, backtest: dict, progress_callback=None):
     """Analyzes the dataframe and runs sort of a market simulation, entering and exiting positions
 
@@ -127,37 +187,21 @@ def apply_logic_to_df(df: pd.DataFrame, backtest: dict, progress_callback=None):
             max_lot_size=max_lot_size,
             progress_callback=progress_callback,
         )
-        fee_rate = comission / 100 if comission else 0.0
-        in_trade_array = sim["in_trade"]
-        account_value_array = sim["account_value"]
-        aux_array = sim["aux"]
-        fee_array = sim["fee"]
-        adj_account_value_array = sim["adj_account_value"]
-
         # Handle exit_on_end if needed
-        if backtest.get("exit_on_end") and in_trade_array[-1]:
+        if backtest.get("exit_on_end") and sim["in_trade"][-1]:
             # Create a new row for the exit
             new_date = df.index[-1] + timedelta(seconds=1)
             new_row = pd.DataFrame(data=[df.iloc[-1]], index=[new_date])
 
-            # Process the exit
-            close = close_prices[-1]
-            new_base = round(aux_array[-1] * close, 8) if aux_array[-1] else 0.0
-            fee = round(new_base * fee_rate, 8) if fee_rate and new_base else 0.0
-            new_account_value = account_value_array[-1] + new_base - fee
-
             # Add the new row to the dataframe
             df = pd.concat([df, pd.DataFrame(data=new_row)])
+            sim = _exit_on_end(sim, close_prices[-1], comission)
 
-            # Append values to arrays
-            in_trade_array = np.append(in_trade_array, False)
-            aux_array = np.append(aux_array, 0.0)
-            account_value_array = np.append(account_value_array, new_account_value)
-            fee_array = np.append(fee_array, fee)
-            adj_account_value = new_account_value + convert_aux_to_base(0.0, close)
-            adj_account_value_array = np.append(
-                adj_account_value_array, adj_account_value
-            )
+        in_trade_array = sim["in_trade"]
+        account_value_array = sim["account_value"]
+        aux_array = sim["aux"]
+        fee_array = sim["fee"]
+        adj_account_value_array = sim["adj_account_value"]
 
         # Add columns to dataframe
         df["aux"] = aux_array
@@ -5,6 +5,7 @@ import multiprocessing as mp
 from collections import deque
 from functools import partial
 
+import numpy as np
 import pandas as pd
 
 from fast_trade.archive.db_helpers import get_kline
@@ -12,8 +13,10 @@ from fast_trade.archive.db_helpers import get_kline
 from .build_data_frame import prepare_df
 from .build_summary import build_summary
 from .evaluate import evaluate_rules
-from .run_analysis import apply_logic_to_df
+from .indicator_cache import IndicatorCache, indicator_cache
+from .run_analysis import apply_logic_to_df, compact_actions
 from .logic_utils import can_vectorize_logic, max_last_frames, vectorized_actions
+from .shared_frame import attach_frame, can_share_frame, release_frame, share_frame
 from .validate_backtest import validate_backtest, validate_backtest_with_df
 
 
@@ -63,6 +66,18 @@ def extract_error_messages(error_dict: dict) -> str:
     return "\n".join(messages)
 
 
+# the columns build_summary reads, a compact frame keeps them as they are
+SUMMARY_COLUMNS = [
+    "close",
+    "aux",
+    "account_value",
+    "adj_account_value",
+    "fee",
+    "adj_account_value_change_perc",
+    "adj_account_value_change",
+]
+
+
 class MissingData(Exception):
     pass
 
@@ -76,11 +91,37 @@ class BacktestKeyError(Exception):
         super().__init__(f"Backtest Error(s):\n{self.error_msgs}")
 
 
+def max_datapoint_periods(backtest: dict) -> int:
+    """The longest period any datapoint looks back, i.e. how many rows it needs to warm up."""
+    max_period = 0
+    for dp in backtest.get("datapoints", []):
+        args = dp.get("args", [])
+        periods = [int(a) for a in args if isinstance(a, (int, np.integer))]
+        if periods:
+            max_period = max(max_period, max(periods))
+    return max_period
+
+
+def rule_metrics(rules: list) -> list:
+    """The summary metrics the rules compare, so they are computed when only some metrics are asked for."""
+    names = []
+    for rule in rules:
+        names.append(rule[0])
+        if isinstance(rule[2], str):
+            names.append(rule[2])
+    return names
+
+
 def run_backtest(
     backtest: dict,
     df: pd.DataFrame = pd.DataFrame(),
     summary=True,
     progress_callback=None,
+    cache: IndicatorCache = indicator_cache,
+    warm_up: bool = False,
+    metrics: list = None,
+    compact: bool = False,
+    keep_columns: list = None,
 ):
     """
     Run a backtest on a given dataframe
@@ -88,6 +129,12 @@ def run_backtest(
         backtest: dict, required, object containing the logic to test and other details
         data_path: string or list, required, where to find the csv file of the ohlcv data
         df: pandas dataframe indexed by date
+        cache: IndicatorCache, where the datapoints are looked up and stored, None to always recompute
+        warm_up: bool, the rows of df before start only warm up the datapoints, see prepare_df
+        metrics: list of str, only these summary metrics are computed (ex. "drawdown_metrics.max_drawdown_pct"),
+            plus the ones the rules use. All of them by default
+        compact: bool, keep the actions as a Categorical and return a smaller df, see compact_df
+        keep_columns: list of str, the datapoint columns a compact df keeps
     Returns
         dict
             summary dict, summary of the performace of backtest
@@ -154,18 +201,23 @@ def run_backtest(
             f"No data found for {backtest.get('symbol')} on {backtest.get('exchange')} or in the given dataframe"
         )
 
-    df = prepare_df(df, new_backtest)
+    candle_columns = set(df.columns)
+    df = prepare_df(df, new_backtest, cache=cache, warm_up=warm_up)
+    datapoint_columns = [column for column in df.columns if column not in candle_columns]
 
     df = apply_backtest_to_df(
         df,
         new_backtest,
         progress_callback=progress_callback,
+        compact=compact,
     )
     # throw an error if the backtest is not valid
     validate_backtest_with_df(new_backtest, df)
 
     if summary:
-        summary, trade_log = build_summary(df, performance_start_time)
+        if metrics is not None:
+            metrics = list(metrics) + rule_metrics(new_backtest.get("rules", []))
+        summary, trade_log = build_summary(df, performance_start_time, metrics=metrics)
     else:
         performance_stop_time = datetime.datetime.utcnow()
         summary = {
@@ -183,6 +235,9 @@ def run_backtest(
     }
     # add the strategy to the summary
     summary["strategy"] = new_backtest
+    if compact:
+        # the summary and the trade log are built from the full frame, only what is returned is compacted
+        df = compact_df(df, datapoint_columns, keep_columns)
     return {
         "summary": summary,
         "df": df,
@@ -227,12 +282,13 @@ def prepare_new_backtest(backtest):
     return new_backtest
 
 
-def apply_backtest_to_df(df: pd.DataFrame, backtest: dict, progress_callback=None):
+def apply_backtest_to_df(df: pd.DataFrame, backtest: dict, progress_callback=None, compact: bool = False):
     """Processes the frame and adds the resultent rows
     Parameters
     ----------
         df, dataframe with all the calculated datapoints
         backtest, backtest object
+        compact, bool, store the actions as a Categorical (see compact_actions) instead of strings
 
     Returns
     -------
@@ -250,7 +306,48 @@ def apply_backtest_to_df(df: pd.DataFrame, backtest: dict, progress_callback=Non
             else None
         ),
     )
+    if compact:
+        df["action"] = compact_actions(df["action"])
+
+    return simulate_actions(df, backtest, progress_callback=progress_callback)
+
+
+def compact_df(df: pd.DataFrame, datapoint_columns: list, keep_columns: list = None) -> pd.DataFrame:
+    """The backtest frame in less memory.
+
+    The datapoint columns are dropped, except the ones in keep_columns. The columns build_summary
+    reads stay float64, so it gives the same summary for a compact frame, the other float columns
+    (the candles and the kept datapoints) are float32. The actions are a Categorical, its codes for
+    "h", "e" and "x" are the ACTION_* codes of run_analysis.
+    """
+    keep_columns = set(keep_columns or [])
+    df = df.drop(columns=[column for column in datapoint_columns if column not in keep_columns])
+    compacted = {
+        column: df[column].astype(np.float32)
+        for column in df.columns
+        if df[column].dtype == np.float64 and column not in SUMMARY_COLUMNS
+    }
+    if "action" in df.columns and not isinstance(df["action"].dtype, pd.CategoricalDtype):
+        # exit_on_end adds its row as strings
+        compacted["action"] = compact_actions(df["action"])
+    for column, values in compacted.items():
+        df[column] = values
+    # a new index without the lookup table the old one built along the way (a lot more than the dates)
+    df.index = pd.DatetimeIndex(df.index)
+    return df
 
+
+def simulate_actions(df: pd.DataFrame, backtest: dict, progress_callback=None):
+    """Runs the account simulation over a frame that already has its actions
+    Parameters
+    ----------
+        df, dataframe with all the calculated datapoints and the "action" column
+        backtest, backtest object
+
+    Returns
+    -------
+        df, dataframe with with the account values added
+    """
     df = apply_logic_to_df(
         df,
         backtest,
@@ -289,57 +386,46 @@ def process_logic_and_generate_actions(
     ---------
     In this function, like the name suggests, we process the logic and generate the actions.
     This optimized version uses vectorized operations where possible.
-    """
 
-    """we need to search though all the logics and find the highest confirmation number
-    so we know how many frames to pass in
+    Confirmation frames (the optional 4th element of a logic, ex. ["rsi", "<", 30, 3]) are
+    vectorized as a rolling AND over the condition, so they only fall back to the row loop
+    when the logic itself can't be vectorized.
     """
-    max_last = max_last_frames(backtest)
-    compiled_logic = compile_action_logic(backtest)
-
-    # If we need to look at previous frames, we can't fully vectorize
-    if max_last:
-        actions = []
-        last_frames = deque(maxlen=max_last)
-        total_rows = len(df)
-        update_every = max(1, total_rows // 200)
-        for idx, frame in enumerate(df.itertuples()):
-            last_frames.appendleft(frame)
-            actions.append(determine_action_compiled(frame, compiled_logic, last_frames))
-            if progress_callback and (idx % update_every == 0 or idx == total_rows - 1):
-                progress_callback({"percent": int((idx + 1) / total_rows * 100)})
-        df["action"] = actions
-    else:
-        try:
-            if can_vectorize_logic(df, backtest):
-                df["action"] = vectorized_actions(df, backtest)
-                if progress_callback:
-                    progress_callback({"percent": 100})
-            else:
-                actions = []
-                total_rows = len(df)
-                update_every = max(1, total_rows // 200)
-                for idx, frame in enumerate(df.itertuples()):
-                    actions.append(determine_action_compiled(frame, compiled_logic))
-                    if progress_callback and (idx % update_every == 0 or idx == total_rows - 1):
-                        progress_callback({"percent": int((idx + 1) / total_rows * 100)})
-                df["action"] = actions
-        except Exception:
-            # If vectorization fails for any reason, fall back to row-by-row processing
-            actions = []
-            total_rows = len(df)
-            update_every = max(1, total_rows // 200)
-            for idx, frame in enumerate(df.itertuples()):
-                actions.append(determine_action_compiled(frame, compiled_logic))
-                if progress_callback and (
-                    idx % update_every == 0 or idx == total_rows - 1
-                ):
-                    progress_callback({"percent": int((idx + 1) / total_rows * 100)})
-            df["action"] = actions
-
+    try:
+        if can_vectorize_logic(df, backtest):
+            df["action"] = vectorized_actions(df, backtest)
+            if progress_callback:
+                progress_callback({"percent": 100})
+            return df
+    except Exception:
+        # If vectorization fails for any reason, fall back to row-by-row processing
+        pass
+
+    # the highest confirmation number across all the logics is how many frames to keep around
+    df["action"] = _row_actions(
+        df,
+        compile_action_logic(backtest),
+        max_last_frames(backtest),
+        progress_callback=progress_callback,
+    )
     return df
 
 
+def _row_actions(df: pd.DataFrame, compiled_logic: dict, max_last: int, progress_callback=None):
+    """Determines the action of every row, one at a time. Used when the logic can't be vectorized."""
+    actions = []
+    last_frames = deque(maxlen=max_last) if max_last else None
+    total_rows = len(df)
+    update_every = max(1, total_rows // 200)
+    for idx, frame in enumerate(df.itertuples()):
+        if last_frames is not None:
+            last_frames.appendleft(frame)
+        actions.append(determine_action_compiled(frame, compiled_logic, last_frames))
+        if progress_callback and (idx % update_every == 0 or idx == total_rows - 1):
+            progress_callback({"percent": int((idx + 1) / total_rows * 100)})
+    return actions
+
+
 def _compile_field_accessor(field):
     if isinstance(field, str):
         if field.isnumeric():
@@ -589,41 +675,112 @@ def clean_field_type(field, row=None):
     return row
 
 
+# set once per worker process by _init_backtest_worker
+_WORKER_DF = None
+_WORKER_SEGMENT = None
+
+
+def _init_backtest_worker(meta=None, df=None):
+    """Pool initializer, attaches the shared dataframe (or keeps the one sent once per worker)."""
+    global _WORKER_DF, _WORKER_SEGMENT
+    if meta is not None:
+        _WORKER_DF, _WORKER_SEGMENT = attach_frame(meta)
+    else:
+        _WORKER_DF = df
+
+
+def _run_backtest_task(task, summary=True, compact=False, keep_columns=None):
+    position, backtest = task
+    df = _WORKER_DF if _WORKER_DF is not None else pd.DataFrame()
+    return position, run_backtest(backtest, df=df, summary=summary, compact=compact, keep_columns=keep_columns)
+
+
 def run_backtests_parallel(
-    backtests: list, df: pd.DataFrame = pd.DataFrame(), summary=True, n_processes=None
+    backtests: list,
+    df: pd.DataFrame = pd.DataFrame(),
+    summary=True,
+    n_processes=None,
+    chunksize=None,
+    progress_callback=None,
+    compact=False,
+    keep_columns=None,
 ):
     """
     Run multiple backtests in parallel
 
+    The dataframe is put in shared memory once and every worker attaches to it, instead of
+    pickling it for every backtest. Results stream back as they finish.
+
     Parameters
     ----------
     backtests: list of dict, required, list of backtest configurations to run
     df: pandas dataframe, optional, dataframe to use for all backtests
     summary: bool, optional, whether to generate summary statistics
     n_processes: int, optional, number of processes to use (defaults to CPU count)
+    chunksize: int, optional, number of backtests sent to a worker at a time
+    progress_callback: callable, optional, called with {"phase": "backtests", "percent": int}
+        every time a backtest finishes
+    compact: bool, optional, return compact dataframes (see run_backtest), a lot less to send back and hold
+    keep_columns: list of str, optional, the datapoint columns the compact dataframes keep
 
     Returns
     -------
-    list of dict, results from each backtest
+    list of dict, results from each backtest, in the same order as backtests
     """
+    if not backtests:
+        return []
+
     if n_processes is None:
         n_processes = mp.cpu_count()
+    n_processes = max(1, min(n_processes, len(backtests)))
+
+    if chunksize is None:
+        chunksize = max(1, len(backtests) // (n_processes * 4))
+
+    meta, segment, worker_df = None, None, None
+    if can_share_frame(df):
+        meta, segment = share_frame(df)
+    elif not df.empty:
+        # can't be rebuilt from shared memory, so at least only send it once per worker
+        worker_df = df
+
+    results = [None] * len(backtests)
+    try:
+        with mp.Pool(
+            processes=n_processes,
+            initializer=_init_backtest_worker,
+            initargs=(meta, worker_df),
+        ) as pool:
+            finished = pool.imap_unordered(
+                partial(_run_backtest_task, summary=summary, compact=compact, keep_columns=keep_columns),
+                enumerate(backtests),
+                chunksize=chunksize,
+            )
+            for completed, (position, result) in enumerate(finished, start=1):
+                results[position] = result
+                if progress_callback:
+                    progress_callback(
+                        {"phase": "backtests", "percent": int(completed / len(backtests) * 100)}
+                    )
+    finally:
+        release_frame(segment, unlink=True)
 
-    # Create a partial function with fixed df and summary parameters
-    run_backtest_partial = partial(run_backtest, df=df, summary=summary)
+    return results
 
-    # Run backtests in parallel
-    with mp.Pool(processes=n_processes) as pool:
-        results = pool.map(run_backtest_partial, backtests)
 
-    return results
+def _chunk_actions(task, backtest):
+    skip, chunk = task
+    chunk = process_logic_and_generate_actions(chunk.copy(), backtest)
+    return chunk["action"].to_numpy()[skip:]
 
 
 def run_backtest_chunked(
     backtest: dict, df: pd.DataFrame = pd.DataFrame(), summary=True, chunk_size=None
 ):
     """
-    Run a backtest by splitting the dataframe into chunks and processing them in parallel
+    Run a backtest by splitting the dataframe into chunks and generating their actions in parallel.
+    The account simulation then runs once over the whole frame so positions carry across chunks,
+    giving the same result as run_backtest.
 
     Parameters
     ----------
@@ -691,17 +848,24 @@ def run_backtest_chunked(
         # Default to a reasonable chunk size based on dataframe length
         chunk_size = max(1000, len(df) // mp.cpu_count())
 
-    # Split the dataframe into chunks
-    chunks = [df.iloc[i:i + chunk_size] for i in range(0, len(df), chunk_size)]
-
-    # Process each chunk in parallel
-    with mp.Pool(processes=mp.cpu_count()) as pool:
-        processed_chunks = pool.map(
-            partial(apply_backtest_to_df, backtest=new_backtest), chunks
-        )
+    # Phase 1: the actions only depend on the current row and the confirmation frames before it,
+    # so each chunk also gets that many rows of the previous chunk and drops them afterwards.
+    # The indicators were already calculated over the whole frame by prepare_df.
+    overlap = max_last_frames(new_backtest)
+    tasks = [
+        (min(i, overlap), df.iloc[max(0, i - overlap):i + chunk_size])
+        for i in range(0, len(df), chunk_size)
+    ]
+    if len(tasks) > 1:
+        with mp.Pool(processes=min(mp.cpu_count(), len(tasks))) as pool:
+            chunk_actions = pool.map(partial(_chunk_actions, backtest=new_backtest), tasks)
+    else:
+        chunk_actions = [_chunk_actions(task, new_backtest) for task in tasks]
 
-    # Combine the processed chunks
-    processed_df = pd.concat(processed_chunks)
+    # Phase 2: cash, aux and in_trade carry over from one chunk to the next, so the simulation
+    # is one sequential pass over the whole frame. It only visits the transitions, so it's cheap.
+    df["action"] = np.concatenate(chunk_actions)
+    processed_df = simulate_actions(df, new_backtest)
 
     # Validate the combined dataframe
     validate_backtest_with_df(new_backtest, processed_df)
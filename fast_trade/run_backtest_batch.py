@@ -0,0 +1,200 @@
+import numpy as np
+import pandas as pd
+
+from .build_data_frame import prepare_df
+from .build_summary import build_summary
+from .indicator_cache import IndicatorCache, indicator_cache
+from .logic_utils import action_code_matrix, can_vectorize_logic
+from .run_analysis import _encode_actions, _exit_on_end, _simulate_account_path
+from .run_backtest import (
+    BacktestKeyError,
+    MissingData,
+    extract_error_messages,
+    prepare_new_backtest,
+    process_logic_and_generate_actions,
+)
+from .validate_backtest import validate_backtest, validate_backtest_with_df
+
+# the columns of the table returned by run_backtest_batch, each one is the summary key of the
+# same name in build_summary (or of its nested metric group)
+BATCH_SUMMARY_KEYS = [
+    "return_perc",
+    "sharpe_ratio",
+    "buy_and_hold_perc",
+    "market_adjusted_return",
+    "num_trades",
+    "total_num_winning_trades",
+    "total_num_losing_trades",
+    "win_perc",
+    "loss_perc",
+    "equity_peak",
+    "equity_final",
+    "max_drawdown",
+    "max_drawdown_pct",
+    "total_fees",
+    "time_in_market_pct",
+    "total_tics",
+]
+# the summary metric of each of them, see build_summary
+BATCH_SUMMARY_METRICS = {
+    **{key: key for key in BATCH_SUMMARY_KEYS},
+    "max_drawdown_pct": "drawdown_metrics.max_drawdown_pct",
+    "time_in_market_pct": "market_exposure.time_in_market_pct",
+}
+
+
+def _check_backtest(new_backtest: dict) -> None:
+    """Raises the same BacktestKeyError run_backtest would for an invalid backtest."""
+    errors = validate_backtest(new_backtest)
+    if errors.get("has_error"):
+        error_keys = [key for key, value in errors.items() if value and key != "has_error"]
+        if any(ek not in ["any_enter", "any_exit"] for ek in error_keys):
+            raise BacktestKeyError(extract_error_messages(errors))
+
+
+def _group_backtests(backtests: list) -> list:
+    """Groups the backtests that can share one frame.
+
+    They need the same chart (freq, start, stop) and can't give one datapoint name two different
+    definitions. Each group gets the union of its datapoints, in the order they first show up.
+    """
+    groups = []
+    for position, backtest in enumerate(backtests):
+        chart = (
+            backtest.get("chart_period"),
+            backtest.get("freq"),
+            str(backtest.get("start") or ""),
+            str(backtest.get("stop") or ""),
+        )
+        datapoints = backtest.get("datapoints", [])
+        for group in groups:
+            if group["chart"] == chart and all(
+                group["datapoints"].get(dp.get("name"), dp) == dp for dp in datapoints
+            ):
+                break
+        else:
+            group = {"chart": chart, "datapoints": {}, "positions": []}
+            groups.append(group)
+        for dp in datapoints:
+            group["datapoints"].setdefault(dp.get("name"), dp)
+        group["positions"].append(position)
+    return groups
+
+
+def _summary_frame(sim: dict, close: np.ndarray) -> pd.DataFrame:
+    """The columns of the backtest frame build_summary reads, set from the simulated account the way
+    simulate_actions sets them."""
+    adj_account_value = pd.Series(sim["adj_account_value"])
+    if len(close) < len(adj_account_value):
+        # the exit_on_end row is a copy of the last one
+        close = np.append(close, close[-1])
+    return pd.DataFrame(
+        {
+            "close": close,
+            "in_trade": sim["in_trade"],
+            "account_value": sim["account_value"],
+            "fee": sim["fee"],
+            "adj_account_value": adj_account_value,
+            "adj_account_value_change_perc": adj_account_value.pct_change(),
+            "adj_account_value_change": adj_account_value.diff(),
+        },
+        # the arrays are used as they are, a copy into one block would cost more than the summary
+        copy=False,
+    )
+
+
+def _compact_summary(sim: dict, close: np.ndarray) -> dict:
+    """The BATCH_SUMMARY_KEYS of one simulated account, computed by build_summary."""
+    summary, _ = build_summary(_summary_frame(sim, close), None, metrics=list(BATCH_SUMMARY_METRICS.values()))
+    row = {}
+    for key, metric in BATCH_SUMMARY_METRICS.items():
+        group, _, sub_key = metric.partition(".")
+        row[key] = summary[group][sub_key] if sub_key else summary[group]
+    return row
+
+
+def run_backtest_batch(
+    base_df: pd.DataFrame,
+    strategies: list,
+    cache: IndicatorCache = indicator_cache,
+    block_size: int = 256,
+) -> pd.DataFrame:
+    """
+    Run many strategies over the same candles and return a compact table of their summaries.
+
+    Strategies that share a chart (freq, start, stop) share one frame: the union of their
+    datapoints is calculated once by apply_transformers_to_dataframe. The enter/exit logic of
+    every strategy is evaluated into one bars x strategies action matrix, with each distinct
+    condition evaluated once, and the account simulation then runs down every column. Only the
+    BATCH_SUMMARY_KEYS are calculated, by build_summary on the simulated account columns, no per
+    strategy frame with the candles and datapoints is built.
+
+    Parameters
+    ----------
+    base_df: pandas dataframe, required, the OHLCV candles indexed by date
+    strategies: list of dict, required, backtest configurations, as passed to run_backtest
+    cache: IndicatorCache, where the datapoints are looked up and stored, None to always recompute
+    block_size: int, optional, how many strategies are put in one action matrix at a time,
+        bounds the memory to block_size bytes per bar
+
+    Returns
+    -------
+    pandas dataframe, one row per strategy, in the same order, with the BATCH_SUMMARY_KEYS as columns
+    """
+    if base_df.empty:
+        raise MissingData("run_backtest_batch needs a dataframe with the candles")
+
+    new_backtests = [prepare_new_backtest(strategy) for strategy in strategies]
+    for new_backtest in new_backtests:
+        _check_backtest(new_backtest)
+
+    rows = [None] * len(new_backtests)
+    for group in _group_backtests(new_backtests):
+        first = new_backtests[group["positions"][0]]
+        df = prepare_df(
+            base_df,
+            {**first, "datapoints": list(group["datapoints"].values()), "trailing_stop_loss": 0},
+            cache=cache,
+        )
+        close = df["close"].to_numpy()
+
+        vectorized, looped = [], []
+        for position in group["positions"]:
+            validate_backtest_with_df(new_backtests[position], df)
+            if can_vectorize_logic(df, new_backtests[position]):
+                vectorized.append(position)
+            else:
+                looped.append(position)
+
+        columns = []
+        conditions = {}
+        for i in range(0, len(vectorized), block_size):
+            block = vectorized[i:i + block_size]
+            codes = action_code_matrix(df, [new_backtests[p] for p in block], conditions)
+            columns.extend((position, codes[:, col]) for col, position in enumerate(block))
+        for position in looped:
+            # the row by row loop, with the frame process_logic_and_generate_actions would get
+            backtest = new_backtests[position]
+            frame = df.copy()
+            if backtest.get("trailing_stop_loss"):
+                frame["trailing_stop_loss"] = frame["close"].cummax() * (1 - float(backtest["trailing_stop_loss"]))
+            actions = process_logic_and_generate_actions(frame, backtest)["action"].to_numpy()
+            columns.append((position, _encode_actions(actions)))
+
+        for position, action_codes in columns:
+            backtest = new_backtests[position]
+            sim = _simulate_account_path(
+                action_codes=action_codes,
+                close_prices=close,
+                base_balance=float(backtest["base_balance"]),
+                comission=float(backtest["comission"]),
+                lot_size=backtest["lot_size_perc"],
+                max_lot_size=backtest["max_lot_size"],
+            )
+            if backtest.get("exit_on_end") and sim["in_trade"][-1]:
+                sim = _exit_on_end(sim, close[-1], float(backtest["comission"]))
+            rows[position] = _compact_summary(sim, close)
+
+    table = pd.DataFrame(rows, columns=BATCH_SUMMARY_KEYS)
+    table.index.name = "strategy"
+    return table
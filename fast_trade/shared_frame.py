@@ -0,0 +1,84 @@
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def can_share_frame(df: pd.DataFrame) -> bool:
+    """Only date indexed frames of plain numeric columns can be rebuilt from a shared buffer."""
+    return (
+        not df.empty
+        and df.columns.is_unique
+        and isinstance(df.index, pd.DatetimeIndex)
+        and df.index.tz is None
+        and all(isinstance(dtype, np.dtype) and dtype.kind in "iuf" for dtype in df.dtypes)
+    )
+
+
+def share_frame(df: pd.DataFrame) -> Tuple[dict, shared_memory.SharedMemory]:
+    """Copies the frame into a single shared memory block so worker processes can attach to it.
+
+    The index and every column are laid out one after another, each
+    one contiguous and 8 byte aligned, keeping their original dtypes.
+
+    Returns
+    -------
+        meta, dict, small picklable description used by attach_frame
+        segment, the shared memory block, the caller owns it and must release_frame it
+    """
+    arrays = [("__index__", df.index.to_numpy())]
+    arrays.extend((column, df[column].to_numpy()) for column in df.columns)
+
+    layout = []
+    offset = 0
+    for name, values in arrays:
+        layout.append((name, values.dtype.str, offset))
+        offset += -(-values.nbytes // 8) * 8
+
+    segment = shared_memory.SharedMemory(create=True, size=max(1, offset))
+    for (_, dtype, start), (_, values) in zip(layout, arrays):
+        np.ndarray(len(df), dtype=dtype, buffer=segment.buf, offset=start)[:] = values
+
+    meta = {
+        "name": segment.name,
+        "rows": len(df),
+        "layout": layout,
+        "index_name": df.index.name,
+    }
+    return meta, segment
+
+
+def _attach_segment(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13 always registers the block, which would unlink it when this worker exits
+        segment = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(segment._name, "shared_memory")
+        return segment
+
+
+def attach_frame(meta: dict) -> Tuple[pd.DataFrame, shared_memory.SharedMemory]:
+    """Rebuilds a read-only dataframe on top of the block made by share_frame, without copying.
+
+    The segment has to be kept alive (and open) for as long as the dataframe is used.
+    """
+    segment = _attach_segment(meta["name"])
+    views = {}
+    for name, dtype, start in meta["layout"]:
+        values = np.ndarray(meta["rows"], dtype=dtype, buffer=segment.buf, offset=start)
+        values.flags.writeable = False
+        views[name] = values
+
+    index = pd.DatetimeIndex(views.pop("__index__"), name=meta["index_name"], copy=False)
+    df = pd.DataFrame(views, index=index, copy=False)
+    return df, segment
+
+
+def release_frame(segment: Optional[shared_memory.SharedMemory], unlink: bool = False) -> None:
+    if segment is None:
+        return
+    segment.close()
+    if unlink:
+        segment.unlink()
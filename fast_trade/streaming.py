@@ -0,0 +1,660 @@
+"""
+Incremental versions of the transformers, for loops that only ever see one new candle at a time
+(like the paper portfolio). Each one takes a candle (a dict of column: value) in O(1), returns the
+latest value of the matching TA function and keeps its whole state in plain values, so it can go
+through json and pick up where it left off.
+
+The updates are the ones pandas runs internally for rolling and ewm windows, so once warmed up on
+the same candles the values are the same as the batch TA functions, to the last digit.
+"""
+
+import math
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from .build_data_frame import apply_charting_to_df, datapoint_column
+
+NAN = float("nan")
+
+
+def _div(a: float, b: float) -> float:
+    """a / b the numpy way, inf or nan instead of ZeroDivisionError"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return float(np.float64(a) / b)
+
+
+class StreamingState:
+    """
+    Something with state that can go to json and back.
+
+    The state is every attribute named in _state, windows (deques) go out as lists and nested
+    StreamingStates as their own state.
+    """
+
+    _state = ()
+
+    def get_state(self) -> dict:
+        state = {}
+        for field in self._state:
+            value = getattr(self, field)
+            if isinstance(value, StreamingState):
+                value = value.get_state()
+            elif isinstance(value, deque):
+                value = [list(v) if isinstance(v, tuple) else v for v in value]
+            state[field] = value
+        return state
+
+    def set_state(self, state: dict):
+        for field in self._state:
+            current = getattr(self, field)
+            if isinstance(current, StreamingState):
+                current.set_state(state[field])
+            elif isinstance(current, deque):
+                current.clear()
+                current.extend(tuple(v) if isinstance(v, list) else v for v in state[field])
+            else:
+                setattr(self, field, state[field])
+        return self
+
+
+class EwmMean(StreamingState):
+    """One value at a time of Series.ewm(...).mean()"""
+
+    _state = ("started", "weighted", "old_wt", "nobs")
+
+    def __init__(self, alpha: float, adjust: bool = True, ignore_na: bool = False, min_periods: int = 0):
+        self.old_wt_factor = 1.0 - alpha
+        self.new_wt = 1.0 if adjust else alpha
+        self.adjust = adjust
+        self.ignore_na = ignore_na
+        self.min_periods = max(int(min_periods), 1)
+        self.started = False
+        self.weighted = NAN
+        self.old_wt = 1.0
+        self.nobs = 0
+
+    def update(self, value: float) -> float:
+        is_observation = value == value
+        if not self.started:
+            self.started = True
+            self.weighted = value
+            self.nobs = int(is_observation)
+        else:
+            self.nobs += is_observation
+            if self.weighted == self.weighted:
+                if is_observation or not self.ignore_na:
+                    self.old_wt *= self.old_wt_factor
+                    if is_observation:
+                        # avoid numerical errors on constant series
+                        if self.weighted != value:
+                            self.weighted = (self.old_wt * self.weighted + self.new_wt * value) / (
+                                self.old_wt + self.new_wt
+                            )
+                        self.old_wt = self.old_wt + self.new_wt if self.adjust else 1.0
+            elif is_observation:
+                self.weighted = value
+        return self.weighted if self.nobs >= self.min_periods else NAN
+
+
+class RollingMean(StreamingState):
+    """One value at a time of Series.rolling(period).mean(), a Kahan sum that adds the new value and drops the oldest"""
+
+    _state = ("window", "nobs", "sum_x", "neg_ct", "add_comp", "remove_comp", "same", "prev_value")
+
+    def __init__(self, period: int):
+        self.period = int(period)
+        self.window = deque(maxlen=self.period)
+        self.nobs = 0
+        self.sum_x = 0.0
+        self.neg_ct = 0
+        self.add_comp = 0.0
+        self.remove_comp = 0.0
+        # how many times in a row the last value came in, a window of one value is that value exactly
+        self.same = 0
+        self.prev_value = None
+
+    def update(self, value: float) -> float:
+        if self.prev_value is None:
+            self.prev_value = value
+        if len(self.window) == self.period:
+            dropped = self.window[0]
+            if dropped == dropped:
+                self.nobs -= 1
+                y = -dropped - self.remove_comp
+                t = self.sum_x + y
+                self.remove_comp = t - self.sum_x - y
+                self.sum_x = t
+                self.neg_ct -= math.copysign(1, dropped) < 0
+        self.window.append(value)
+        if value == value:
+            self.nobs += 1
+            y = value - self.add_comp
+            t = self.sum_x + y
+            self.add_comp = t - self.sum_x - y
+            self.sum_x = t
+            self.neg_ct += math.copysign(1, value) < 0
+            self.same = self.same + 1 if value == self.prev_value else 1
+            self.prev_value = value
+
+        if self.nobs < self.period:
+            return NAN
+        result = self.sum_x / self.nobs
+        if self.same >= self.nobs:
+            return self.prev_value
+        if self.neg_ct == 0 and result < 0 or self.neg_ct == self.nobs and result > 0:
+            return 0.0
+        return result
+
+
+class RollingStd(StreamingState):
+    """One value at a time of Series.rolling(period).std(), Welford's online variance with Kahan sums"""
+
+    _state = ("window", "nobs", "mean_x", "ssqdm_x", "add_comp", "remove_comp", "same", "prev_value")
+
+    def __init__(self, period: int, ddof: int = 1):
+        self.period = int(period)
+        self.ddof = ddof
+        self.window = deque(maxlen=self.period)
+        self.nobs = 0
+        self.mean_x = 0.0
+        self.ssqdm_x = 0.0
+        self.add_comp = 0.0
+        self.remove_comp = 0.0
+        self.same = 0
+        self.prev_value = None
+
+    def update(self, value: float) -> float:
+        if self.prev_value is None:
+            self.prev_value = value
+        if len(self.window) == self.period:
+            dropped = self.window[0]
+            if dropped == dropped:
+                self.nobs -= 1
+                if self.nobs:
+                    prev_mean = self.mean_x - self.remove_comp
+                    y = dropped - self.remove_comp
+                    t = y - self.mean_x
+                    self.remove_comp = t + self.mean_x - y
+                    self.mean_x = self.mean_x - t / self.nobs
+                    self.ssqdm_x = self.ssqdm_x - (dropped - prev_mean) * (dropped - self.mean_x)
+                else:
+                    self.mean_x = self.ssqdm_x = 0.0
+        self.window.append(value)
+        if value == value:
+            self.nobs += 1
+            self.same = self.same + 1 if value == self.prev_value else 1
+            self.prev_value = value
+            prev_mean = self.mean_x - self.add_comp
+            y = value - self.add_comp
+            t = y - self.mean_x
+            self.add_comp = t + self.mean_x - y
+            self.mean_x = self.mean_x + t / self.nobs
+            self.ssqdm_x = self.ssqdm_x + (value - prev_mean) * (value - self.mean_x)
+
+        if self.nobs < self.period or self.nobs <= self.ddof:
+            return NAN
+        if self.nobs == 1 or self.same >= self.nobs:
+            return 0.0
+        variance = self.ssqdm_x / (self.nobs - self.ddof)
+        return math.sqrt(variance) if variance > 0 else 0.0
+
+
+class RollingExtreme(StreamingState):
+    """One value at a time of Series.rolling(period).max() (or .min()), a monotonic queue of the candidates"""
+
+    _state = ("window", "nans", "candidates", "count")
+
+    def __init__(self, period: int, largest: bool = True):
+        self.period = int(period)
+        self.largest = largest
+        self.window = deque(maxlen=self.period)
+        self.nans = 0
+        # (position, value) of the values that can still be the extreme, the extreme first
+        self.candidates = deque()
+        self.count = 0
+
+    def update(self, value: float) -> float:
+        if len(self.window) == self.period and self.window[0] != self.window[0]:
+            self.nans -= 1
+        self.window.append(value)
+        if value == value:
+            while self.candidates and (
+                self.candidates[-1][1] <= value if self.largest else self.candidates[-1][1] >= value
+            ):
+                self.candidates.pop()
+            self.candidates.append((self.count, value))
+        else:
+            self.nans += 1
+        self.count += 1
+        while self.candidates and self.candidates[0][0] < self.count - self.period:
+            self.candidates.popleft()
+        # like pandas, a window with a nan in it has no extreme
+        if len(self.window) < self.period or self.nans:
+            return NAN
+        return self.candidates[0][1]
+
+
+class Lag(StreamingState):
+    """The value from period candles ago, nan until there is one"""
+
+    _state = ("window",)
+
+    def __init__(self, period: int):
+        self.window = deque(maxlen=int(period) + 1)
+
+    def update(self, value: float) -> float:
+        self.window.append(value)
+        return self.window[0] if len(self.window) == self.window.maxlen else NAN
+
+
+class StreamingIndicator(StreamingState, ABC):
+    """
+    An incremental transformer, made with the same args as its TA function (without the ohlc).
+
+    update takes the next candle and returns the latest value, a float, or a dict of floats named
+    like the columns of the TA function's dataframe when it returns several.
+    """
+
+    transformer = None
+
+    def __init__(self, *args):
+        self.args = list(args)
+
+    @abstractmethod
+    def update(self, candle: dict):
+        """Takes the next candle in and returns the latest value."""
+
+    def peek(self, candle: dict):
+        """The value update would return for the candle, without taking the candle in."""
+        state = self.get_state()
+        value = self.update(candle)
+        self.set_state(state)
+        return value
+
+    def to_dict(self) -> dict:
+        return {"transformer": self.transformer, "args": self.args, "state": self.get_state()}
+
+
+def _column(candle: dict, column: str) -> float:
+    value = candle.get(column)
+    return NAN if value is None else float(value)
+
+
+class SMA(StreamingIndicator):
+    transformer = "sma"
+    _state = ("mean",)
+
+    def __init__(self, period: int = 41, column: str = "close"):
+        super().__init__(period, column)
+        self.column = column
+        self.mean = RollingMean(period)
+
+    def update(self, candle: dict) -> float:
+        return self.mean.update(_column(candle, self.column))
+
+
+class EMA(StreamingIndicator):
+    transformer = "ema"
+    _state = ("ewm",)
+
+    def __init__(self, period: int = 9, column: str = "close", adjust: bool = True):
+        super().__init__(period, column, adjust)
+        self.column = column
+        self.ewm = EwmMean(2 / (period + 1), adjust=adjust)
+
+    def update(self, candle: dict) -> float:
+        return self.ewm.update(_column(candle, self.column))
+
+
+class SMMA(StreamingIndicator):
+    transformer = "smma"
+    _state = ("ewm",)
+
+    def __init__(self, period: int = 42, column: str = "close", adjust: bool = True):
+        super().__init__(period, column, adjust)
+        self.column = column
+        self.ewm = EwmMean(1 / period, adjust=adjust)
+
+    def update(self, candle: dict) -> float:
+        return self.ewm.update(_column(candle, self.column))
+
+
+class SSMA(SMMA):
+    transformer = "ssma"
+
+    def __init__(self, period: int = 9, column: str = "close", adjust: bool = True):
+        super().__init__(period, column, adjust)
+
+
+class DEMA(StreamingIndicator):
+    transformer = "dema"
+    _state = ("ema", "ema_ema")
+
+    def __init__(self, period: int = 9, column: str = "close", adjust: bool = True):
+        super().__init__(period, column, adjust)
+        # like TA.DEMA, the inner EMA is the default one (of close, adjusted)
+        self.ema = EwmMean(2 / (period + 1))
+        self.ema_ema = EwmMean(2 / (period + 1), adjust=adjust)
+
+    def update(self, candle: dict) -> float:
+        ema = self.ema.update(_column(candle, "close"))
+        return 2 * ema - self.ema_ema.update(ema)
+
+
+class TEMA(StreamingIndicator):
+    transformer = "tema"
+    _state = ("ema", "ema_ema", "ema_ema_ema")
+
+    def __init__(self, period: int = 9, adjust: bool = True):
+        super().__init__(period, adjust)
+        self.ema = EwmMean(2 / (period + 1))
+        self.ema_ema = EwmMean(2 / (period + 1), adjust=adjust)
+        self.ema_ema_ema = EwmMean(2 / (period + 1), adjust=adjust)
+
+    def update(self, candle: dict) -> float:
+        ema = self.ema.update(_column(candle, "close"))
+        ema_ema = self.ema_ema.update(ema)
+        return 3 * ema - 3 * ema_ema + self.ema_ema_ema.update(ema_ema)
+
+
+class MACD(StreamingIndicator):
+    transformer = "macd"
+    _state = ("fast", "slow", "signal")
+
+    def __init__(
+        self,
+        period_fast: int = 12,
+        period_slow: int = 26,
+        signal: int = 9,
+        column: str = "close",
+        adjust: bool = True,
+    ):
+        super().__init__(period_fast, period_slow, signal, column, adjust)
+        self.column = column
+        self.fast = EwmMean(2 / (period_fast + 1), adjust=adjust)
+        self.slow = EwmMean(2 / (period_slow + 1), adjust=adjust)
+        self.signal = EwmMean(2 / (signal + 1), adjust=adjust)
+
+    def update(self, candle: dict) -> dict:
+        price = _column(candle, self.column)
+        macd = self.fast.update(price) - self.slow.update(price)
+        return {"MACD": macd, "SIGNAL": self.signal.update(macd)}
+
+
+class MOM(StreamingIndicator):
+    transformer = "mom"
+    _state = ("lag",)
+
+    def __init__(self, period: int = 10, column: str = "close"):
+        super().__init__(period, column)
+        self.column = column
+        self.lag = Lag(period)
+
+    def update(self, candle: dict) -> float:
+        price = _column(candle, self.column)
+        return price - self.lag.update(price)
+
+
+class ROC(MOM):
+    transformer = "roc"
+
+    def __init__(self, period: int = 12, column: str = "close"):
+        super().__init__(period, column)
+
+    def update(self, candle: dict) -> float:
+        price = _column(candle, self.column)
+        past = self.lag.update(price)
+        return _div(price - past, past) * 100
+
+
+class RSI(StreamingIndicator):
+    transformer = "rsi"
+    _state = ("prev", "gain", "loss")
+
+    def __init__(self, period: int = 14, column: str = "close", adjust: bool = True):
+        super().__init__(period, column, adjust)
+        self.column = column
+        self.prev = NAN
+        self.gain = EwmMean(1.0 / period, adjust=adjust)
+        self.loss = EwmMean(1.0 / period, adjust=adjust)
+
+    def update(self, candle: dict) -> float:
+        price = _column(candle, self.column)
+        delta, self.prev = price - self.prev, price
+        gain = self.gain.update(0.0 if delta < 0 else delta)
+        loss = self.loss.update(abs(0.0 if delta > 0 else delta))
+        return 100 - _div(100, 1 + _div(gain, loss))
+
+
+def _true_range(candle: dict, prev_close: float) -> float:
+    high, low = _column(candle, "high"), _column(candle, "low")
+    ranges = [r for r in (abs(high - low), abs(high - prev_close), abs(prev_close - low)) if r == r]
+    return max(ranges) if ranges else NAN
+
+
+class TR(StreamingIndicator):
+    transformer = "tr"
+    _state = ("prev_close",)
+
+    def __init__(self):
+        super().__init__()
+        self.prev_close = NAN
+
+    def update(self, candle: dict) -> float:
+        true_range = _true_range(candle, self.prev_close)
+        self.prev_close = _column(candle, "close")
+        return true_range
+
+
+class ATR(StreamingIndicator):
+    transformer = "atr"
+    _state = ("prev_close", "mean")
+
+    def __init__(self, period: int = 14):
+        super().__init__(period)
+        self.prev_close = NAN
+        self.mean = RollingMean(period)
+
+    def update(self, candle: dict) -> float:
+        true_range = _true_range(candle, self.prev_close)
+        self.prev_close = _column(candle, "close")
+        return self.mean.update(true_range)
+
+
+class BBANDS(StreamingIndicator):
+    transformer = "bbands"
+    _state = ("middle", "std")
+
+    def __init__(self, period: int = 20, MA=None, column: str = "close", std_multiplier: float = 2):
+        if MA is not None:
+            raise ValueError("bbands can only be streamed around its own SMA")
+        super().__init__(period, MA, column, std_multiplier)
+        self.column = column
+        self.std_multiplier = std_multiplier
+        # like TA.BBANDS, the middle band is the SMA of close whatever the column
+        self.middle = RollingMean(period)
+        self.std = RollingStd(period)
+
+    def update(self, candle: dict) -> dict:
+        std = self.std.update(_column(candle, self.column))
+        middle = self.middle.update(_column(candle, "close"))
+        return {
+            "BB_UPPER": middle + (self.std_multiplier * std),
+            "BB_MIDDLE": middle,
+            "BB_LOWER": middle - (self.std_multiplier * std),
+        }
+
+
+class MSD(StreamingIndicator):
+    transformer = "msd"
+    _state = ("std",)
+
+    def __init__(self, period: int = 21, column: str = "close"):
+        super().__init__(period, column)
+        self.column = column
+        self.std = RollingStd(period)
+
+    def update(self, candle: dict) -> float:
+        return self.std.update(_column(candle, self.column))
+
+
+class OBV(StreamingIndicator):
+    transformer = "obv"
+    _state = ("prev_close", "prev_flow", "total")
+
+    def __init__(self, column: str = "close"):
+        super().__init__(column)
+        self.column = column
+        self.prev_close = NAN
+        # the signed volume of the previous candle, before flat candles copy it
+        self.prev_flow = NAN
+        self.total = 0.0
+
+    def update(self, candle: dict) -> float:
+        price, volume = _column(candle, self.column), _column(candle, "volume")
+        if price >= self.prev_close:
+            flow = volume
+        elif price < self.prev_close:
+            flow = -volume
+        else:
+            flow = NAN
+        # like TA.OBV, a flat candle takes the previous candle's volume
+        obv_flow = self.prev_flow if price == self.prev_close else flow
+        self.prev_close, self.prev_flow = price, flow
+        if obv_flow != obv_flow:
+            return NAN
+        self.total += obv_flow
+        return self.total
+
+
+class TP(StreamingIndicator):
+    transformer = "tp"
+
+    def update(self, candle: dict) -> float:
+        return (_column(candle, "high") + _column(candle, "low") + _column(candle, "close")) / 3
+
+
+class ROLLING_MAX(StreamingIndicator):
+    transformer = "rolling_max"
+    _state = ("extreme",)
+
+    def __init__(self, periods: int = 10, column: str = "close"):
+        super().__init__(periods, column)
+        self.column = column
+        self.extreme = RollingExtreme(periods, largest=self.transformer == "rolling_max")
+
+    def update(self, candle: dict) -> float:
+        return self.extreme.update(_column(candle, self.column))
+
+
+class ROLLING_MIN(ROLLING_MAX):
+    transformer = "rolling_min"
+
+
+streaming_map = {
+    indicator.transformer: indicator
+    for indicator in (
+        SMA, EMA, SMMA, SSMA, DEMA, TEMA, MACD, MOM, ROC, RSI, TR, ATR, BBANDS, MSD, OBV, TP, ROLLING_MAX, ROLLING_MIN
+    )
+}
+
+
+def load_indicator(state: dict) -> StreamingIndicator:
+    """A streaming indicator back from its to_dict"""
+    return streaming_map[state["transformer"]](*state.get("args", [])).set_state(state["state"])
+
+
+def can_stream(backtest: dict) -> bool:
+    """If every datapoint of the backtest has a streaming version (and there is at least one)."""
+    datapoints = backtest.get("datapoints") or []
+    if not datapoints or backtest.get("trailing_stop_loss"):
+        return False
+    for ind in datapoints:
+        if ind.get("freq") or ind.get("transformer") not in streaming_map:
+            return False
+        try:
+            streaming_map[ind["transformer"]](*ind.get("args", []))
+        except (TypeError, ValueError):
+            return False
+    return True
+
+
+class DatapointStream:
+    """
+    The datapoints of a backtest, kept up to date one candle at a time.
+
+    update takes the latest candles, resamples them to the backtest's freq and only feeds the
+    indicators the ones they haven't seen. The last candle can still be filling up, so it's only
+    peeked at: the next update feeds it once the one after it has started. Gaps in the candles are
+    forward filled. The last `rows` rows are kept to give the confirmation frames their history.
+    """
+
+    def __init__(self, backtest: dict, rows: int = 10):
+        self.datapoints = backtest.get("datapoints", [])
+        self.freq = backtest.get("chart_period") or backtest.get("freq", "1Min")
+        self.rows = rows
+        self.reset()
+
+    def reset(self):
+        self.indicators = [streaming_map[ind["transformer"]](*ind.get("args", [])) for ind in self.datapoints]
+        self.last_ts = None
+        self.recent = deque(maxlen=self.rows)
+
+    def _row(self, ts: pd.Timestamp, candle: dict, peek: bool = False) -> tuple:
+        row = {column: float(value) for column, value in candle.items()}
+        for ind, indicator in zip(self.datapoints, self.indicators):
+            value = indicator.peek(row) if peek else indicator.update(row)
+            if isinstance(value, dict):
+                row.update({datapoint_column(ind, key): v for key, v in value.items()})
+            else:
+                row[ind.get("name")] = value
+        return ts, row
+
+    def update(self, candles: pd.DataFrame) -> pd.DataFrame:
+        """
+        Feeds the new candles to the indicators.
+
+        Returns:
+            dataframe of the last rows (the candles and their datapoints), like the tail of prepare_df
+        """
+        candles = apply_charting_to_df(candles.select_dtypes("number"), self.freq, None, None).ffill()
+        if candles.empty:
+            return pd.DataFrame()
+        freq = pd.Timedelta(self.freq)
+        if self.last_ts is not None and candles.index[0] > self.last_ts + freq:
+            # candles went missing since the last update, start over on the ones there are
+            self.reset()
+        new = candles if self.last_ts is None else candles[candles.index > self.last_ts]
+        for ts, candle in zip(new.index[:-1], new.iloc[:-1].to_dict("records")):
+            self.recent.append(self._row(ts, candle))
+            self.last_ts = ts
+
+        rows = list(self.recent)
+        if len(new):
+            peeked = self._row(new.index[-1], new.iloc[-1].to_dict(), peek=True)
+            rows = rows[max(0, len(rows) + 1 - self.rows):] + [peeked]
+        return pd.DataFrame([row for _, row in rows], index=pd.DatetimeIndex([ts for ts, _ in rows]))
+
+    def to_dict(self) -> dict:
+        return {
+            "datapoints": self.datapoints,
+            "freq": self.freq,
+            "last_ts": self.last_ts.isoformat() if self.last_ts is not None else None,
+            "recent": [[ts.isoformat(), row] for ts, row in self.recent],
+            "indicators": [indicator.to_dict() for indicator in self.indicators],
+        }
+
+    @classmethod
+    def from_dict(cls, state: Optional[dict], backtest: dict, rows: int = 10) -> "DatapointStream":
+        """The stream saved by to_dict, or a new one when it was saved for other datapoints."""
+        stream = cls(backtest, rows=rows)
+        if not state or state.get("datapoints") != stream.datapoints or state.get("freq") != stream.freq:
+            return stream
+        stream.indicators = [load_indicator(indicator) for indicator in state["indicators"]]
+        stream.last_ts = pd.Timestamp(state["last_ts"]) if state.get("last_ts") else None
+        stream.recent.extend((pd.Timestamp(ts), row) for ts, row in state.get("recent", []))
+        return stream
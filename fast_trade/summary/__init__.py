@@ -13,6 +13,7 @@ from .metrics import (
 from .trades import (
     calculate_effective_trades,
     calculate_trade_quality,
+    create_round_trips,
     create_trade_log,
     summarize_time_held,
     summarize_trade_perc,
@@ -32,6 +33,7 @@ __all__ = [
     "calculate_time_analysis",
     "calculate_trade_quality",
     "calculate_trade_streaks",
+    "create_round_trips",
     "create_trade_log",
     "summarize_time_held",
     "summarize_trade_perc",
@@ -0,0 +1,178 @@
+import numpy as np
+
+# The summary metrics of build_summary, computed on the numpy arrays of the backtest columns instead
+# of the dataframe. Each function gives the same result as the calculate_* function of the same name
+# in metrics.py: NaNs are skipped the way pandas skips them and the values are rounded with the same
+# (numpy or python) round, so the summaries match to the last digit. The arrays are read as they are,
+# only the masks and the drawdown series are allocated. run_backtest_batch summarizes its simulated
+# accounts with build_summary too, so the account metrics of every summary come from here.
+
+
+def _skipna(values: np.ndarray) -> np.ndarray:
+    """values without the NaNs, no copy when there aren't any."""
+    mask = np.isnan(values)
+    return values[~mask] if mask.any() else values
+
+
+def _filled(values: np.ndarray):
+    """values with the NaNs as 0 (no copy when there aren't any) and how many aren't NaN."""
+    mask = np.isnan(values)
+    if not mask.any():
+        return values, mask, values.size
+    return np.where(mask, 0.0, values), mask, values.size - np.count_nonzero(mask)
+
+
+def nan_mean(values: np.ndarray):
+    """Same as pandas Series.mean"""
+    filled, _, count = _filled(values)
+    if not count:
+        return np.float64(np.nan)
+    return filled.sum(dtype=np.float64) / np.float64(count)
+
+
+def nan_std(values: np.ndarray):
+    """Same as pandas Series.std (ddof=1), which sums the squared deviations with the NaNs as 0"""
+    filled, mask, count = _filled(values)
+    if count <= 1:
+        return np.float64(np.nan)
+    avg = filled.sum(dtype=np.float64) / np.float64(count)
+    sqr = (avg - filled) ** 2
+    sqr[mask] = 0
+    return np.sqrt(sqr.sum(dtype=np.float64) / np.float64(count - 1))
+
+
+def nan_min(values: np.ndarray):
+    values = _skipna(values)
+    return values.min() if values.size else np.float64(np.nan)
+
+
+def nan_max(values: np.ndarray):
+    values = _skipna(values)
+    return values.max() if values.size else np.float64(np.nan)
+
+
+def nan_sum(values: np.ndarray):
+    return _filled(values)[0].sum(dtype=np.float64)
+
+
+def run_lengths(mask: np.ndarray) -> np.ndarray:
+    """The length of every run of True in mask."""
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], mask, [False])).view(np.int8)))
+    return edges[1::2] - edges[::2]
+
+
+def drawdowns(adj_account_value: np.ndarray) -> np.ndarray:
+    """adj_account_value / its running max - 1, the running max skips the NaNs like expanding().max()"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return adj_account_value / np.fmax.accumulate(adj_account_value) - 1.0
+
+
+def _clean(value) -> float:
+    return 0.0 if np.isnan(value) else value
+
+
+def calculate_return_perc(adj_account_value: np.ndarray) -> float:
+    if not adj_account_value.size or not adj_account_value[0]:
+        return 0.0
+    first_val, last_val = float(adj_account_value[0]), float(adj_account_value[-1])
+    if last_val == 0:
+        return 0.0
+    return_perc = 100 - (first_val / last_val) * 100
+    return 0.0 if np.isnan(return_perc) else float(round(return_perc, 3))
+
+
+def calculate_buy_and_hold_perc(close: np.ndarray) -> float:
+    if not close.size:
+        return 0.0
+    first_close, last_close = float(close[0]), float(close[-1])
+    if last_close == 0:
+        return 0.0
+    buy_and_hold_perc = (1 - (first_close / last_close)) * 100
+    return 0.0 if np.isnan(buy_and_hold_perc) else float(round(buy_and_hold_perc, 3))
+
+
+def calculate_shape_ratio(returns: np.ndarray) -> float:
+    mean_return, std_return = nan_mean(returns), nan_std(returns)
+    if np.isnan(mean_return) or np.isnan(std_return) or std_return == 0:
+        return 0.0
+    sharpe_ratio = (len(returns) ** 0.5) * (mean_return / std_return)
+    return 0.0 if np.isnan(sharpe_ratio) else float(round(sharpe_ratio, 3))
+
+
+def calculate_position_metrics(
+    aux: np.ndarray,
+    in_trade: np.ndarray,
+    fee: np.ndarray,
+    adj_account_value: np.ndarray,
+    in_trade_durations: np.ndarray,
+) -> dict:
+    position_sizes = aux[in_trade]
+    avg_pos_size = float(round(nan_mean(position_sizes), 3))
+    max_pos_size = float(round(nan_max(position_sizes), 3))
+    avg_pos_duration = float(round(in_trade_durations.mean(), 3)) if in_trade_durations.size else np.nan
+    with np.errstate(invalid="ignore", divide="ignore"):
+        commission_impact = float(round(nan_sum(fee) / adj_account_value[-1] * 100, 3))
+    return {
+        "avg_position_size": _clean(avg_pos_size),
+        "max_position_size": _clean(max_pos_size),
+        "avg_position_duration": _clean(avg_pos_duration),
+        "total_commission_impact": _clean(commission_impact),
+    }
+
+
+def calculate_market_exposure(in_trade: np.ndarray, in_trade_durations: np.ndarray) -> dict:
+    time_in_market = float(round(in_trade.sum() / len(in_trade) * 100, 3)) if len(in_trade) else 0.0
+    avg_duration = float(round(in_trade_durations.mean(), 3)) if in_trade_durations.size else 0
+    return {
+        "time_in_market_pct": _clean(time_in_market),
+        "avg_trade_duration": _clean(avg_duration),
+    }
+
+
+def calculate_drawdown_metrics(drawdowns: np.ndarray) -> dict:
+    if not drawdowns.size:
+        return {
+            "max_drawdown_pct": 0.0,
+            "avg_drawdown_pct": 0.0,
+            "max_drawdown_duration": 0.0,
+            "avg_drawdown_duration": 0.0,
+            "current_drawdown": 0.0,
+        }
+    max_drawdown = float(round(nan_min(drawdowns) * 100, 3))
+    avg_drawdown = float(round(nan_mean(drawdowns) * 100, 3))
+
+    with np.errstate(invalid="ignore"):
+        durations = run_lengths(drawdowns < 0)
+    max_duration = float(round(durations.max() if durations.size else 0, 3))
+    avg_duration = float(round(durations.mean() if durations.size else 0, 3))
+
+    return {
+        "max_drawdown_pct": _clean(max_drawdown),
+        "avg_drawdown_pct": _clean(avg_drawdown),
+        "max_drawdown_duration": _clean(max_duration),
+        "avg_drawdown_duration": _clean(avg_duration),
+        "current_drawdown": float(round(drawdowns[-1] * 100, 3)),
+    }
+
+
+def calculate_risk_metrics(returns: np.ndarray, drawdowns: np.ndarray) -> dict:
+    with np.errstate(invalid="ignore"):
+        negative_returns = returns[returns < 0]
+    downside_std = float(nan_std(negative_returns) if negative_returns.size else 0)
+    avg_return = float(nan_mean(returns))
+    sortino_ratio = float(round(avg_return / downside_std if downside_std != 0 else 0, 3))
+
+    max_drawdown = abs(float(nan_min(drawdowns)))
+    calmar_ratio = float(round(avg_return / max_drawdown if max_drawdown != 0 else 0, 3))
+
+    valid_returns = _skipna(returns)
+    var_95 = np.percentile(valid_returns, 5.0) if valid_returns.size else np.float64(np.nan)
+    var_95 = float(round(var_95, 3))
+
+    return {
+        "sortino_ratio": _clean(sortino_ratio),
+        "calmar_ratio": _clean(calmar_ratio),
+        "value_at_risk_95": _clean(var_95),
+        "annualized_volatility": float(round(nan_std(returns) * (252**0.5), 3)),
+        "downside_deviation": float(round(downside_std, 3)),
+    }
@@ -10,14 +10,19 @@ def calculate_market_adjusted_returns(df, return_perc, buy_and_hold_perc):
     return float(round(return_perc - buy_and_hold_perc, 3))
 
 
-def calculate_position_metrics(df):
-    """Calculate metrics that show how individual positions performed"""
-    in_trade_groups = df[df.in_trade].groupby((df.in_trade != df.in_trade.shift()).cumsum())
+def calculate_position_metrics(df, in_trade_durations=None):
+    """Calculate metrics that show how individual positions performed
+
+    in_trade_durations: the length of every in trade run, computed from df if not given
+    """
+    if in_trade_durations is None:
+        in_trade_durations = df[df.in_trade].groupby((df.in_trade != df.in_trade.shift()).cumsum()).size()
 
     try:
-        avg_pos_size = float(round(df[df.in_trade].aux.mean(), 3))
-        max_pos_size = float(round(df[df.in_trade].aux.max(), 3))
-        avg_pos_duration = float(round(in_trade_groups.size().mean(), 3))
+        position_sizes = df.aux[df.in_trade]
+        avg_pos_size = float(round(position_sizes.mean(), 3))
+        max_pos_size = float(round(position_sizes.max(), 3))
+        avg_pos_duration = float(round(in_trade_durations.mean(), 3))
         commission_impact = float(round(df.fee.sum() / df.iloc[-1].adj_account_value * 100, 3))
     except (ZeroDivisionError, ValueError):
         avg_pos_size = 0.0
@@ -33,10 +38,15 @@ def calculate_position_metrics(df):
     }
 
 
-def calculate_market_exposure(df):
-    """Calculate metrics about market exposure"""
+def calculate_market_exposure(df, in_trade_durations=None):
+    """Calculate metrics about market exposure
+
+    in_trade_durations: the length of every in trade run, computed from df if not given
+    """
     try:
-        in_trade_duration = df[df.in_trade].groupby((df.in_trade != df.in_trade.shift()).cumsum()).size()
+        if in_trade_durations is None:
+            in_trade_durations = df[df.in_trade].groupby((df.in_trade != df.in_trade.shift()).cumsum()).size()
+        in_trade_duration = in_trade_durations
         time_in_market = float(round((df.in_trade.sum() / len(df)) * 100, 3))
         avg_duration = float(round(in_trade_duration.mean(), 3)) if not in_trade_duration.empty else 0
     except (ZeroDivisionError, ValueError):
@@ -49,11 +59,15 @@ def calculate_market_exposure(df):
     }
 
 
-def calculate_drawdown_metrics(df):
-    """Calculate detailed drawdown metrics"""
+def calculate_drawdown_metrics(df, drawdowns=None):
+    """Calculate detailed drawdown metrics
+
+    drawdowns: adj_account_value / its running max - 1, computed from df if not given
+    """
     try:
-        rolling_max = df.adj_account_value.expanding().max()
-        drawdowns = df.adj_account_value / rolling_max - 1.0
+        if drawdowns is None:
+            rolling_max = df.adj_account_value.expanding().max()
+            drawdowns = df.adj_account_value / rolling_max - 1.0
 
         max_drawdown = float(round(drawdowns.min() * 100, 3))
         avg_drawdown = float(round(drawdowns.mean() * 100, 3))
@@ -82,8 +96,11 @@ def calculate_drawdown_metrics(df):
         }
 
 
-def calculate_risk_metrics(df):
-    """Calculate risk-adjusted return metrics"""
+def calculate_risk_metrics(df, drawdowns=None):
+    """Calculate risk-adjusted return metrics
+
+    drawdowns: adj_account_value / its running max - 1, computed from df if not given
+    """
     try:
         returns = df.adj_account_value_change_perc
 
@@ -92,8 +109,9 @@ def calculate_risk_metrics(df):
         avg_return = float(returns.mean())
         sortino_ratio = float(round(avg_return / downside_std if downside_std != 0 else 0, 3))
 
-        rolling_max = df.adj_account_value.expanding().max()
-        drawdowns = df.adj_account_value / rolling_max - 1.0
+        if drawdowns is None:
+            rolling_max = df.adj_account_value.expanding().max()
+            drawdowns = df.adj_account_value / rolling_max - 1.0
         max_drawdown = abs(float(drawdowns.min()))
         calmar_ratio = float(round(avg_return / max_drawdown if max_drawdown != 0 else 0, 3))
 
@@ -67,15 +67,46 @@ def calculate_effective_trades(df, trade_log_df):
     }
 
 
-def create_trade_log(df):
-    """Find all rows when a trade was entered or exited"""
-    trade_log_df = df.reset_index()
-    trade_log_df = trade_log_df.groupby(
-        (trade_log_df["in_trade"] != trade_log_df["in_trade"].shift()).cumsum()
-    ).first()
+def run_starts(in_trade) -> np.ndarray:
+    """
+    The position of the first row of every in_trade run: row 0, then every enter and exit,
+    the same transitions _simulate_account_path visits.
+    """
+    in_trade = np.asarray(in_trade)
+    if not len(in_trade):
+        return np.array([], dtype=np.intp)
+    return np.flatnonzero(np.concatenate(([True], in_trade[1:] != in_trade[:-1])))
+
 
-    if "date" in trade_log_df.columns:
-        trade_log_df = trade_log_df.set_index("date")
+def create_trade_log(df):
+    """
+    Find all rows when a trade was entered or exited
+
+    The rows are gathered at the run starts, nothing else of the frame is copied. Like a groupby
+    first over the runs, a column that is NaN on the first row of a run takes its first value
+    that isn't NaN in the run.
+    """
+    starts = run_starts(df["in_trade"].to_numpy())
+    trade_log_df = df.iloc[starts]
+
+    missing = trade_log_df.isna()
+    if missing.to_numpy().any():
+        trade_log_df = trade_log_df.copy()
+        ends = np.append(starts[1:], len(df.index))
+        for position, column in enumerate(trade_log_df.columns):
+            for run in np.flatnonzero(missing.iloc[:, position].to_numpy()):
+                values = df.iloc[starts[run]:ends[run], position]
+                first_valid = values.first_valid_index()
+                if first_valid is not None:
+                    trade_log_df.iloc[run, position] = values.loc[first_valid]
+
+    if df.index.name != "date":
+        # the runs are numbered and the index is kept as a column, like a groupby on the reset frame
+        trade_log_df = trade_log_df.reset_index()
+        trade_log_df.index = pd.Index(np.arange(1, len(starts) + 1), name="in_trade")
+    elif isinstance(trade_log_df.index, pd.DatetimeIndex):
+        # the trade dates aren't evenly spaced, even when some of them happen to be
+        trade_log_df = trade_log_df.set_axis(pd.DatetimeIndex(trade_log_df.index, freq=None))
 
     trade_log_df = trade_log_df.replace([np.inf, -np.inf], np.nan)
     trade_log_df = trade_log_df[trade_log_df.adj_account_value_change != 0]
@@ -83,6 +114,55 @@ def create_trade_log(df):
     return trade_log_df
 
 
+def create_round_trips(df) -> pd.DataFrame:
+    """
+    One row per closed trade, from its enter to its exit.
+
+    Returns
+    -------
+    dataframe with
+        entry_date, exit_date: the index of the enter and exit rows
+        entry_price, exit_price: the close of those rows
+        size: the aux bought
+        fee: the fees of both sides in base, the enter fee is taken from the aux
+        pnl, pnl_perc: the adj_account_value after the exit against the one before the enter
+        duration: exit_date - entry_date
+        bars: how many rows the trade was held
+    """
+    in_trade = df["in_trade"].to_numpy(dtype=bool)
+    starts = run_starts(in_trade)
+    entries = starts[in_trade[starts]]
+    # the exit is the start of the next run, a trade still open at the end has none
+    following = np.searchsorted(starts, entries, side="right")
+    closed = following < len(starts)
+    entries, exits = entries[closed], starts[following[closed]]
+
+    close = df["close"].to_numpy(dtype=float)
+    fee = df["fee"].to_numpy(dtype=float)
+    adj_account_value = df["adj_account_value"].to_numpy(dtype=float)
+    entry_fee = fee[entries] * close[entries]
+    before = adj_account_value[entries] + entry_fee
+    pnl = adj_account_value[exits] - before
+
+    index = df.index
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pnl_perc = pnl / before * 100
+    return pd.DataFrame(
+        {
+            "entry_date": index[entries],
+            "exit_date": index[exits],
+            "entry_price": close[entries],
+            "exit_price": close[exits],
+            "size": df["aux"].to_numpy(dtype=float)[entries],
+            "fee": entry_fee + fee[exits],
+            "pnl": pnl,
+            "pnl_perc": pnl_perc,
+            "duration": index[exits] - index[entries],
+            "bars": exits - entries,
+        }
+    )
+
+
 def summarize_time_held(trade_log_df):
     idx_series = pd.to_datetime(trade_log_df.index.to_series(), errors="coerce")
     deltas = idx_series.diff().dropna()
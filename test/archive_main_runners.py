@@ -10,24 +10,14 @@ from unittest import mock
 import pandas as pd
 
 
-def _chunk_df():
-    ts = int(datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc).timestamp())
-    return pd.DataFrame(
-        {"low": [90], "high": [110], "open": [100], "close": [105], "volume": [1]},
-        index=pd.to_datetime([ts], unit="s"),
-    )
-
-
 def run_coinbase_main() -> None:
     sys.modules.pop("fast_trade.archive.coinbase_api", None)
     fixed_now = datetime.datetime(2024, 2, 7, 0, 30, tzinfo=datetime.timezone.utc)
     real_datetime = datetime.datetime
     with mock.patch(
-        "fast_trade.archive.coinbase_api.get_single_candle", return_value=_chunk_df()
+        "fast_trade.archive.coinbase_api._request_candles", return_value=[]
     ), mock.patch("fast_trade.archive.coinbase_api.time.sleep"), mock.patch(
         "fast_trade.archive.coinbase_api.time.time", side_effect=lambda: 1.0
-    ), mock.patch(
-        "fast_trade.archive.coinbase_api.random.random", return_value=0.1
     ), mock.patch(
         "fast_trade.archive.coinbase_api.datetime.datetime"
     ) as dt_mock:
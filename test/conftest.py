@@ -2,11 +2,14 @@
 
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import pytest
 import yaml
 from typer.testing import CliRunner
 
+from fast_trade.archive import db_helpers
+
 
 @pytest.fixture
 def cli_runner():
@@ -133,3 +136,17 @@ def mock_backtest_result(sample_ohlcv):
             "strategy": {"name": "Test"},
         },
     }
+
+
+@pytest.fixture
+def kline_archive(tmp_path, monkeypatch):
+    """Three days of 1Min BTCUSDT candles on binanceus in a temporary kline archive."""
+    monkeypatch.setattr(db_helpers, "ARCHIVE_PATH", str(tmp_path))
+    index = pd.date_range("2024-01-01", periods=3 * 24 * 60, freq="1min")
+    close = 100 + np.sin(np.arange(len(index)) / 90.0) * 5
+    df = pd.DataFrame(
+        {"open": close, "high": close + 1, "low": close - 1, "close": close, "volume": 1.0},
+        index=index,
+    )
+    db_helpers.update_klines_to_db(df, "BTCUSDT", "binanceus")
+    return tmp_path
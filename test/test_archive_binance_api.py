@@ -1,10 +1,15 @@
 import datetime
+import http.server
+import json
+import threading
+import time
+import urllib.parse
 from unittest import mock
 
 import pandas as pd
 import pytest
 
-from fast_trade.archive import binance_api
+from fast_trade.archive import binance_api, rate_limit
 
 
 def _sample_kline(open_time_ms: int) -> list:
@@ -24,11 +29,12 @@ def _sample_kline(open_time_ms: int) -> list:
     ]
 
 
-def _mock_response(status_code=200, json_data=None, text="error"):
+def _mock_response(status_code=200, json_data=None, text="error", headers=None):
     resp = mock.Mock()
     resp.status_code = status_code
     resp.json.return_value = json_data if json_data is not None else []
     resp.text = text
+    resp.headers = headers or {}
     return resp
 
 
@@ -93,130 +99,204 @@ def test_binance_kline_to_df_drops_ignore_and_date():
     assert isinstance(df.index, pd.DatetimeIndex)
 
 
-def test_get_binance_klines_success_with_status_and_store():
+@pytest.fixture
+def session():
+    fake = mock.Mock()
+    with mock.patch("fast_trade.archive.binance_api.get_session", return_value=fake), mock.patch(
+        "fast_trade.archive.binance_api.get_rate_limiter", return_value=mock.Mock()
+    ):
+        yield fake
+
+
+def _window_klines(url, params, timeout):
+    # one candle per window, at its start time
+    return _mock_response(200, [_sample_kline(params["startTime"])])
+
+
+def test_get_binance_klines_success_with_status_and_store(session):
     start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
     end = datetime.datetime(2024, 1, 1, 1, 0, tzinfo=datetime.timezone.utc)
     kline = _sample_kline(int(start.timestamp() * 1000))
 
     status_updates = []
     store_calls = []
-
-    with mock.patch("fast_trade.archive.binance_api.requests.get") as get_mock, mock.patch(
-        "fast_trade.archive.binance_api.time.sleep"
-    ), mock.patch("fast_trade.archive.binance_api.random.random", return_value=0.5), mock.patch(
-        "fast_trade.archive.binance_api.random.randint", return_value=2
-    ), mock.patch(
-        "fast_trade.archive.binance_api.time.time", side_effect=[100.0, 101.0, 102.0, 103.0]
-    ):
-        get_mock.return_value = _mock_response(200, [kline])
-        df, status = binance_api.get_binance_klines(
-            "BTCUSDT",
-            start,
-            end,
-            tld="us",
-            status_update=status_updates.append,
-            store_func=lambda d, s, e: store_calls.append((s, e)),
-        )
-
-    url = get_mock.call_args[0][0]
-    assert "api.binance.us/api/v3/klines" in url
-    assert "symbol=BTCUSDT" in url
-    assert "interval=1m" in url
+    session.get.return_value = _mock_response(200, [kline])
+    df, status = binance_api.get_binance_klines(
+        "BTCUSDT",
+        start,
+        end,
+        tld="us",
+        status_update=status_updates.append,
+        store_func=lambda d, s, e: store_calls.append((s, e)),
+    )
+
+    url = session.get.call_args[0][0]
+    params = session.get.call_args[1]["params"]
+    assert url == "https://api.binance.us/api/v3/klines"
+    assert params["symbol"] == "BTCUSDT"
+    assert params["interval"] == "1m"
     assert not df.empty
     assert status["perc_complete"] == 100
-    assert len(status_updates) >= 1
+    assert [update["perc_complete"] for update in status_updates] == [100, 100]
 
 
-def test_get_binance_klines_caps_end_date_to_now():
+def test_get_binance_klines_caps_end_date_to_now(session):
     start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
     future_end = datetime.datetime(2099, 1, 1, tzinfo=datetime.timezone.utc)
     capped_now = datetime.datetime(2024, 1, 2, tzinfo=datetime.timezone.utc)
 
     real_datetime = datetime.datetime
-    with mock.patch("fast_trade.archive.binance_api.requests.get") as get_mock, mock.patch(
-        "fast_trade.archive.binance_api.time.sleep"
-    ), mock.patch("fast_trade.archive.binance_api.random.random", return_value=0.2), mock.patch(
-        "fast_trade.archive.binance_api.datetime.datetime"
-    ) as dt_mock:
+    with mock.patch("fast_trade.archive.binance_api.datetime.datetime") as dt_mock:
         dt_mock.now.return_value = capped_now
         dt_mock.side_effect = lambda *args, **kwargs: real_datetime(*args, **kwargs)
         dt_mock.timedelta = datetime.timedelta
         dt_mock.timezone = datetime.timezone
-        get_mock.return_value = _mock_response(200, [])
+        session.get.return_value = _mock_response(200, [])
         binance_api.get_binance_klines("BTCUSDT", start, future_end)
 
-    assert get_mock.called
-    assert get_mock.call_count <= 2
+    assert session.get.call_count == 2
 
 
-def test_get_binance_klines_handles_non_200_error():
+def test_get_binance_klines_retries_non_200_error(session):
     start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
     end = datetime.datetime(2024, 1, 1, 0, 30, tzinfo=datetime.timezone.utc)
+    kline = _sample_kline(int(start.timestamp() * 1000))
 
-    with mock.patch("fast_trade.archive.binance_api.requests.get") as get_mock, mock.patch(
-        "fast_trade.archive.binance_api.time.sleep"
-    ), mock.patch("fast_trade.archive.binance_api.random.random", return_value=0.2), mock.patch(
+    session.get.side_effect = [_mock_response(500, text="server error"), _mock_response(200, [kline])]
+    with mock.patch("fast_trade.archive.binance_api.time.sleep") as sleep_mock, mock.patch(
         "fast_trade.archive.binance_api.console.print"
     ):
-        get_mock.return_value = _mock_response(500, text="server error")
         df, _ = binance_api.get_binance_klines("BTCUSDT", start, end)
 
-    assert df.empty
+    # the failed window is retried instead of being skipped
+    assert len(df) == 1
+    sleep_mock.assert_called_once_with(1)
 
 
-def test_get_binance_klines_handles_429_rate_limit():
+def test_get_binance_klines_handles_429_rate_limit(session):
     start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
     end = datetime.datetime(2024, 1, 1, 2, 0, tzinfo=datetime.timezone.utc)
     kline = _sample_kline(int(start.timestamp() * 1000))
 
-    responses = [_mock_response(429, text="rate limit"), _mock_response(200, [kline])]
-
-    with mock.patch("fast_trade.archive.binance_api.requests.get", side_effect=responses), mock.patch(
-        "fast_trade.archive.binance_api.time.sleep"
-    ) as sleep_mock, mock.patch("fast_trade.archive.binance_api.random.random", return_value=0.2), mock.patch(
-        "fast_trade.archive.binance_api.console.print"
-    ):
+    session.get.side_effect = [
+        _mock_response(429, text="rate limit", headers={"Retry-After": "7"}),
+        _mock_response(418, text="banned"),
+        _mock_response(200, [kline]),
+    ]
+    limiter = binance_api.get_rate_limiter.return_value
+    with mock.patch("fast_trade.archive.binance_api.console.print"):
         df, status = binance_api.get_binance_klines("BTCUSDT", start, end)
 
-    assert sleep_mock.called
+    assert [c.args for c in limiter.pause.call_args_list] == [(7.0,), (10.0,)]
+    assert limiter.acquire.call_count == 3
     assert not df.empty
     assert status["perc_complete"] == 100
 
 
-def test_get_binance_klines_raises_after_four_consecutive_errors():
+def test_get_binance_klines_pauses_when_used_weight_is_high(session):
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2024, 1, 1, 1, 0, tzinfo=datetime.timezone.utc)
+
+    session.get.return_value = _mock_response(200, [], headers={"X-MBX-USED-WEIGHT-1M": "1100"})
+    limiter = binance_api.get_rate_limiter.return_value
+    with mock.patch("fast_trade.archive.binance_api.time.time", return_value=6015.0):
+        binance_api.get_binance_klines("BTCUSDT", start, end, tld="us")
+        limiter.pause.assert_called_once_with(45.0)
+
+        limiter.pause.reset_mock()
+        binance_api.get_binance_klines("BTCUSDT", start, end, tld="com")
+        assert not limiter.pause.called
+
+
+def test_get_binance_klines_raises_after_four_consecutive_errors(session):
     start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
-    end = datetime.datetime(2024, 1, 6, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2024, 1, 1, 12, tzinfo=datetime.timezone.utc)
 
-    with mock.patch("fast_trade.archive.binance_api.requests.get") as get_mock, mock.patch(
-        "fast_trade.archive.binance_api.time.sleep"
-    ), mock.patch("fast_trade.archive.binance_api.random.random", return_value=0.2), mock.patch(
+    with mock.patch("fast_trade.archive.binance_api.time.sleep"), mock.patch(
         "fast_trade.archive.binance_api.console.print"
     ):
-        get_mock.return_value = _mock_response(500, text="server error")
-        with pytest.raises(Exception, match="Download failed for BTCUSDT after 3 errors"):
+        session.get.return_value = _mock_response(500, text="server error")
+        with pytest.raises(Exception, match="Download failed for BTCUSDT after 4 errors"):
             binance_api.get_binance_klines("BTCUSDT", start, end)
 
-    assert get_mock.call_count == 4
+    assert session.get.call_count == 4
 
 
-def test_get_binance_klines_periodic_store_on_thirtieth_call():
+def test_get_binance_klines_reassembles_windows_in_order(session):
     start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
     end = datetime.datetime(2024, 1, 20, tzinfo=datetime.timezone.utc)
-    kline = _sample_kline(int(start.timestamp() * 1000))
     store_calls = []
 
-    with mock.patch("fast_trade.archive.binance_api.requests.get") as get_mock, mock.patch(
-        "fast_trade.archive.binance_api.time.sleep"
-    ), mock.patch("fast_trade.archive.binance_api.random.random", return_value=0.2), mock.patch(
-        "fast_trade.archive.binance_api.random.randint", return_value=1
-    ):
-        get_mock.return_value = _mock_response(200, [kline])
-        binance_api.get_binance_klines(
-            "BTCUSDT",
-            start,
-            end,
-            store_func=lambda d, s, e: store_calls.append((s, e)),
-        )
-
-    assert len(store_calls) >= 1
-    assert store_calls[0] == ("BTCUSDT", "binanceus")
+    def slow_first_window(url, params, timeout):
+        if params["startTime"] == int(start.timestamp()) * 1000:
+            time.sleep(0.05)
+        return _window_klines(url, params, timeout)
+
+    session.get.side_effect = slow_first_window
+    df, status = binance_api.get_binance_klines(
+        "BTCUSDT",
+        start,
+        end,
+        tld="com",
+        store_func=lambda d, s, e: store_calls.append((d, s, e)),
+    )
+
+    assert status["call_count"] == 31
+    assert len(df) == 31
+    assert df.index.is_monotonic_increasing
+    # the store only ever gets a contiguous run of windows, starting at the first one
+    assert len(store_calls) == 1
+    stored, symbol, exchange = store_calls[0]
+    assert (symbol, exchange) == ("BTCUSDT", "binancecom")
+    assert stored.index[0] == pd.Timestamp(start.replace(tzinfo=None))
+    pd.testing.assert_frame_equal(stored, df.iloc[: len(stored)])
+
+
+class _KlineHandler(http.server.BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_GET(self):
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        start_time = int(query["startTime"][0])
+        _KlineHandler.requests_seen.append(start_time)
+        if _KlineHandler.requests_seen.count(start_time) == 1 and len(_KlineHandler.requests_seen) == 2:
+            self._reply(429, [], {"Retry-After": "0"})
+            return
+        end_time = int(query["endTime"][0])
+        klines = [_sample_kline(t) for t in range(start_time, min(end_time, start_time + 3 * 60000), 60000)]
+        self._reply(200, klines, {"X-MBX-USED-WEIGHT-1M": "10"})
+
+    def _reply(self, status, body, headers):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_get_binance_klines_against_local_server(monkeypatch):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _KlineHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    _KlineHandler.requests_seen = []
+    monkeypatch.setattr(binance_api, "BINANCE_API_URL", f"http://127.0.0.1:{server.server_port}/{{tld}}/api/v3")
+    monkeypatch.setattr(binance_api, "_session", None)
+    monkeypatch.setattr(rate_limit, "_limiters", {})
+    try:
+        start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        with mock.patch("fast_trade.archive.binance_api.console.print"):
+            df, status = binance_api.get_binance_klines("BTCUSDT", start, start + datetime.timedelta(days=5))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert status["call_count"] == 8
+    assert len(_KlineHandler.requests_seen) == 9
+    assert len(df) == 24
+    assert df.index.is_monotonic_increasing
+    assert binance_api.get_session() is binance_api.get_session()
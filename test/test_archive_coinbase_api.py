@@ -1,5 +1,5 @@
 import datetime
-import inspect
+import time
 from unittest import mock
 
 import pandas as pd
@@ -18,11 +18,12 @@ def _candle(ts: int) -> list:
     return [ts, 90.0, 110.0, 100.0, 105.0, 1000.0]
 
 
-def _mock_response(status_code=200, json_data=None, text="error"):
+def _mock_response(status_code=200, json_data=None, text="error", headers=None):
     resp = mock.Mock()
     resp.status_code = status_code
     resp.json.return_value = json_data if json_data is not None else []
     resp.text = text
+    resp.headers = headers or {}
     return resp
 
 
@@ -66,243 +67,210 @@ def test_df_from_candles():
     assert len(df) == 1
 
 
-def test_get_single_candle_success():
-    ts = int(datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc).timestamp())
-    params = {"granularity": 60, "start": str(ts), "end": str(ts + 60)}
+@pytest.fixture
+def session():
+    fake = mock.Mock()
+    limiter = mock.Mock()
+    with mock.patch("fast_trade.archive.coinbase_api.get_session", return_value=fake), mock.patch(
+        "fast_trade.archive.coinbase_api.get_rate_limiter", return_value=limiter
+    ):
+        fake.limiter = limiter
+        yield fake
 
-    with mock.patch("fast_trade.archive.coinbase_api.requests.get") as get_mock, mock.patch(
-        "fast_trade.archive.coinbase_api.time.sleep"
-    ), mock.patch("fast_trade.archive.coinbase_api.random.random", return_value=0.1):
-        get_mock.return_value = _mock_response(200, [_candle(ts)])
-        df = coinbase_api.get_single_candle("BTC-USD", params)
 
-    get_mock.assert_called_once()
-    url = get_mock.call_args[0][0]
-    assert url == "https://api.exchange.coinbase.com/products/BTC-USD/candles"
-    assert get_mock.call_args[1]["params"] == params
-    assert not df.empty
+def _page(url, params=None, headers=None, timeout=None):
+    # one candle per page, at its start time
+    return _mock_response(200, [_candle(int(params["start"]))])
 
 
-def test_get_single_candle_api_error_status():
-    with mock.patch("fast_trade.archive.coinbase_api.requests.get") as get_mock, mock.patch(
-        "fast_trade.archive.coinbase_api.time.sleep"
-    ) as sleep_mock, mock.patch("fast_trade.archive.coinbase_api.console.print"):
-        get_mock.return_value = _mock_response(500, text="server error")
-        df = coinbase_api.get_single_candle("BTC-USD", {})
-
-    assert df.empty
-    sleep_mock.assert_any_call(1)
+def test_get_single_candle_success(session):
+    ts = int(datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc).timestamp())
+    params = {"granularity": 60, "start": str(ts), "end": str(ts + 60)}
+    session.get.return_value = _mock_response(200, [_candle(ts)])
 
+    df = coinbase_api.get_single_candle("BTC-USD", params)
 
-def test_get_single_candle_api_error_raises_after_bad_errors_gt_five():
-    filename = inspect.getfile(coinbase_api)
-    source = (
-        "\n" * 142
-        + "if bad_errors > 5:\n"
-        + "    raise Exception(f'Api Error: {res.status_code} {res.text}')\n"
-    )
-    namespace = {
-        "bad_errors": 6,
-        "Exception": Exception,
-        "res": _mock_response(500, text="server error"),
-    }
-    with pytest.raises(Exception, match="Api Error: 500 server error"):
-        exec(compile(source, filename, "exec"), namespace)
+    session.get.assert_called_once()
+    url = session.get.call_args[0][0]
+    assert url == "https://api.exchange.coinbase.com/products/BTC-USD/candles"
+    assert session.get.call_args[1]["params"] == params
+    assert not df.empty
+    session.limiter.recover.assert_called_once_with()
 
 
-def test_get_single_candle_empty_candles_raises_download_error():
-    with mock.patch("fast_trade.archive.coinbase_api.requests.get") as get_mock, mock.patch(
+def test_get_single_candle_retries_then_gives_up(session):
+    session.get.return_value = _mock_response(500, text="server error")
+    with mock.patch("fast_trade.archive.coinbase_api.time.sleep") as sleep_mock, mock.patch(
         "fast_trade.archive.coinbase_api.console.print"
     ) as print_mock:
-        get_mock.return_value = _mock_response(200, [])
         df = coinbase_api.get_single_candle("BTC-USD", {})
 
     assert df.empty
-    printed = " ".join(str(call) for call in print_mock.call_args_list)
-    assert "Error Downloading: for BTC-USD" in printed
-
+    assert session.get.call_count == 5
+    assert [c.args for c in sleep_mock.call_args_list] == [(1,), (2,), (3,), (4,)]
+    assert "Api Error: 500 server error" in str(print_mock.call_args)
 
-def test_get_single_candle_empty_fallback_return_dead_branch():
-    filename = inspect.getfile(coinbase_api)
-    source = "\n" * 149 + "import pandas as pd; pd.DataFrame()\n"
-    exec(compile(source, filename, "exec"), {"pd": pd})
 
-
-def test_get_single_candle_empty_response_returns_empty():
-    with mock.patch("fast_trade.archive.coinbase_api.requests.get") as get_mock, mock.patch(
+def test_get_single_candle_backs_off_only_on_429(session):
+    ts = int(datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc).timestamp())
+    session.get.side_effect = [
+        _mock_response(429, text="slow down", headers={"Retry-After": "3"}),
+        _mock_response(429, text="slow down"),
+        _mock_response(200, [_candle(ts)]),
+    ]
+    with mock.patch("fast_trade.archive.coinbase_api.time.sleep") as sleep_mock, mock.patch(
         "fast_trade.archive.coinbase_api.console.print"
     ):
-        get_mock.return_value = _mock_response(500, [])
         df = coinbase_api.get_single_candle("BTC-USD", {})
-    assert df.empty
 
+    assert len(df) == 1
+    assert [c.args for c in session.limiter.backoff.call_args_list] == [(3.0,), (1.0,)]
+    assert not sleep_mock.called
 
-def test_get_single_candle_exception_returns_empty():
-    with mock.patch(
-        "fast_trade.archive.coinbase_api.requests.get", side_effect=RuntimeError("boom")
-    ), mock.patch("fast_trade.archive.coinbase_api.console.print"):
+
+def test_get_single_candle_empty_candles_raises_download_error(session):
+    session.get.return_value = _mock_response(200, [])
+    with mock.patch("fast_trade.archive.coinbase_api.console.print") as print_mock:
         df = coinbase_api.get_single_candle("BTC-USD", {})
+
     assert df.empty
+    printed = " ".join(str(call) for call in print_mock.call_args_list)
+    assert "Error Downloading: for BTC-USD" in printed
 
 
-def test_get_oldest_day_binary_search():
-    base = datetime.datetime(2020, 1, 1)
+def test_get_oldest_day_binary_search(session):
+    base = datetime.datetime(2015, 7, 21)
+    listed = datetime.datetime(2017, 3, 14)
 
-    def side_effect(url, params=None):
+    def side_effect(url, params=None, headers=None, timeout=None):
         start_ts = int(params["start"])
-        if start_ts < int(datetime.datetime(2018, 1, 1).timestamp()):
+        assert params["granularity"] == 86400
+        if start_ts >= int(listed.timestamp()):
             return _mock_response(200, [_candle(start_ts)])
         return _mock_response(200, [])
 
-    with mock.patch("fast_trade.archive.coinbase_api.requests.get", side_effect=side_effect), mock.patch(
-        "fast_trade.archive.coinbase_api.time.sleep"
-    ), mock.patch("fast_trade.archive.coinbase_api.random.random", return_value=0.1):
-        result = coinbase_api.get_oldest_day("BTC-USD", start_date=base)
+    session.get.side_effect = side_effect
+    assert coinbase_api.get_oldest_day("BTC-USD", start_date=base) == listed
+    assert session.get.call_count <= 13
 
-    assert isinstance(result, datetime.datetime)
 
-
-def test_get_oldest_day_api_failure():
-    with mock.patch("fast_trade.archive.coinbase_api.requests.get") as get_mock, mock.patch(
-        "fast_trade.archive.coinbase_api.time.sleep"
-    ), mock.patch("fast_trade.archive.coinbase_api.random.random", return_value=0.1):
-        get_mock.return_value = _mock_response(500, text="fail")
-        with pytest.raises(Exception, match="API request failed"):
+def test_get_oldest_day_api_failure(session):
+    session.get.return_value = _mock_response(500, text="fail")
+    with mock.patch("fast_trade.archive.coinbase_api.time.sleep"), mock.patch(
+        "fast_trade.archive.coinbase_api.console.print"
+    ):
+        with pytest.raises(Exception, match="Api Error: 500 fail"):
             coinbase_api.get_oldest_day("BTC-USD")
 
 
-def test_get_product_candles_with_explicit_dates():
+def test_get_product_candles_with_explicit_dates(session):
     start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
-    end = datetime.datetime(2024, 1, 1, 3, 30, tzinfo=datetime.timezone.utc)
-    ts = int(start.timestamp())
+    end = datetime.datetime(2024, 1, 1, 7, 30, tzinfo=datetime.timezone.utc)
     status_updates = []
     store_calls = []
+    session.get.side_effect = _page
+
+    df, status = coinbase_api.get_product_candles(
+        "BTC-USD",
+        start=start,
+        end=end,
+        update_status=status_updates.append,
+        store_func=lambda d, s, e: store_calls.append((s, e)),
+    )
 
-    with mock.patch(
-        "fast_trade.archive.coinbase_api.get_single_candle",
-        side_effect=[
-            pd.DataFrame({"low": [90], "high": [110], "open": [100], "close": [105], "volume": [1]}, index=pd.to_datetime([ts], unit="s")),
-            pd.DataFrame({"low": [91], "high": [111], "open": [101], "close": [106], "volume": [2]}, index=pd.to_datetime([ts + 3600], unit="s")),
-        ],
-    ), mock.patch("fast_trade.archive.coinbase_api.time.sleep"), mock.patch(
-        "fast_trade.archive.coinbase_api.time.time", side_effect=[1.0, 2.0, 3.0, 4.0, 5.0]
-    ):
-        df, status = coinbase_api.get_product_candles(
-            "BTC-USD",
-            start=start,
-            end=end,
-            update_status=status_updates.append,
-            store_func=lambda d, s, e: store_calls.append((s, e)),
-        )
-
-    assert not df.empty
+    # two pages of 300 minutes, the last one cut at end
+    assert [int(c[1]["params"]["end"]) - int(c[1]["params"]["start"]) for c in session.get.call_args_list] == [
+        18000,
+        9000,
+    ]
+    assert len(df) == 2
+    assert df.index.is_monotonic_decreasing
     assert status["symbol"] == "BTC-USD"
-    assert len(status_updates) >= 1
+    assert status["perc_complete"] == 100
+    assert len(status_updates) == 2
+    assert not store_calls
 
 
-def test_get_product_candles_defaults_start_via_oldest_day():
+def test_get_product_candles_defaults_start_via_oldest_day(session):
     oldest = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
     end = datetime.datetime(2024, 1, 1, 1, 0, tzinfo=datetime.timezone.utc)
-    ts = int(oldest.timestamp())
-    empty_df = pd.DataFrame()
-    good_df = pd.DataFrame(
-        {"low": [90], "high": [110], "open": [100], "close": [105], "volume": [1]},
-        index=pd.to_datetime([ts], unit="s"),
-    )
+    session.get.side_effect = _page
 
-    with mock.patch(
-        "fast_trade.archive.coinbase_api.get_oldest_day", return_value=oldest
-    ), mock.patch(
-        "fast_trade.archive.coinbase_api.get_single_candle",
-        side_effect=[empty_df, empty_df, empty_df, empty_df, empty_df, good_df],
-    ), mock.patch("fast_trade.archive.coinbase_api.time.sleep"), mock.patch(
+    with mock.patch("fast_trade.archive.coinbase_api.get_oldest_day", return_value=oldest) as oldest_mock:
+        df, _ = coinbase_api.get_product_candles("BTC-USD", end=end)
+
+    oldest_mock.assert_called_once_with("BTC-USD")
+    assert df.index[0] == pd.Timestamp("2024-01-01")
+
+
+def test_get_product_candles_raises_when_a_page_keeps_failing(session):
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2024, 1, 3, tzinfo=datetime.timezone.utc)
+    session.get.return_value = _mock_response(500, text="server error")
+
+    with mock.patch("fast_trade.archive.coinbase_api.time.sleep"), mock.patch(
         "fast_trade.archive.coinbase_api.console.print"
-    ), mock.patch("fast_trade.archive.coinbase_api.time.time", side_effect=[0.0, 1.0]):
-        with pytest.raises(Exception, match="Error Downloading"):
-            coinbase_api.get_product_candles("BTC-USD", end=end)
+    ):
+        with pytest.raises(Exception, match="Api Error: 500"):
+            coinbase_api.get_product_candles("BTC-USD", start=start, end=end)
 
 
-def test_get_product_candles_periodic_store():
+def test_get_product_candles_streams_contiguous_pages_to_store(session):
     start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
-    end = datetime.datetime(2024, 1, 2, 12, 0, tzinfo=datetime.timezone.utc)
-    ts = int(start.timestamp())
-    chunk = pd.DataFrame(
-        {"low": [90], "high": [110], "open": [100], "close": [105], "volume": [1]},
-        index=pd.to_datetime([ts], unit="s"),
-    )
+    end = datetime.datetime(2024, 1, 5, 12, 0, tzinfo=datetime.timezone.utc)
     store_calls = []
 
-    with mock.patch(
-        "fast_trade.archive.coinbase_api.get_single_candle", return_value=chunk
-    ), mock.patch("fast_trade.archive.coinbase_api.time.sleep"), mock.patch(
-        "fast_trade.archive.coinbase_api.time.time", side_effect=lambda: 100.0
-    ):
-        coinbase_api.get_product_candles(
-            "BTC-USD",
-            start=start,
-            end=end,
-            store_func=lambda d, s, e: store_calls.append((s, e)),
-        )
+    def slow_first_page(url, params=None, headers=None, timeout=None):
+        if int(params["start"]) == int(start.timestamp()):
+            time.sleep(0.05)
+        return _page(url, params)
+
+    session.get.side_effect = slow_first_page
+    df, status = coinbase_api.get_product_candles(
+        "BTC-USD",
+        start=start,
+        end=end,
+        store_func=lambda d, s, e: store_calls.append((d, s, e)),
+    )
 
-    assert len(store_calls) >= 1
-    assert store_calls[0] == ("BTC-USD", "coinbase")
+    assert status["call_count"] == 22
+    assert len(df) == 22
+    # nothing can be stored before the slow first page is in, then the whole run goes at once
+    assert [(len(d), s, e) for d, s, e in store_calls] == [(22, "BTC-USD", "coinbase")]
+    stored = pd.concat([d for d, _, _ in store_calls])
+    assert stored.index.is_monotonic_increasing
+    pd.testing.assert_frame_equal(stored, df.sort_index().iloc[: len(stored)])
 
 
-def test_get_product_candles_caps_chunk_end_to_now():
+def test_get_product_candles_caps_chunk_end_to_now(session):
     fixed_now = datetime.datetime(2024, 1, 1, 1, 0, tzinfo=datetime.timezone.utc)
     start = datetime.datetime(2024, 1, 1, 0, 0, tzinfo=datetime.timezone.utc)
-    end = datetime.datetime(2024, 1, 1, 0, 59, tzinfo=datetime.timezone.utc)
-    ts = int(start.timestamp())
-    chunk = pd.DataFrame(
-        {"low": [90], "high": [110], "open": [100], "close": [105], "volume": [1]},
-        index=pd.to_datetime([ts], unit="s"),
-    )
-    captured = {}
-
-    def fake_single(product_id, params, df=pd.DataFrame()):
-        captured.setdefault("ends", []).append(params["end"])
-        return chunk
+    end = datetime.datetime(2024, 1, 1, 23, 59, tzinfo=datetime.timezone.utc)
+    session.get.side_effect = _page
 
     real_datetime = datetime.datetime
-    with mock.patch("fast_trade.archive.coinbase_api.get_single_candle", side_effect=fake_single), mock.patch(
-        "fast_trade.archive.coinbase_api.time.sleep"
-    ), mock.patch("fast_trade.archive.coinbase_api.time.time", side_effect=lambda: 1.0), mock.patch(
-        "fast_trade.archive.coinbase_api.datetime.datetime"
-    ) as dt_mock:
+    with mock.patch("fast_trade.archive.coinbase_api.datetime.datetime") as dt_mock:
         dt_mock.utcnow.return_value = fixed_now
         dt_mock.side_effect = lambda *args, **kwargs: real_datetime(*args, **kwargs)
         dt_mock.timedelta = datetime.timedelta
         dt_mock.timezone = datetime.timezone
-        coinbase_api.get_product_candles(
-            "BTC-USD",
-            start=start,
-            end=end,
-            store_func=lambda *args, **kwargs: None,
-        )
+        coinbase_api.get_product_candles("BTC-USD", start=start, end=end)
 
-    assert captured["ends"]
-    assert int(captured["ends"][0]) <= int(fixed_now.timestamp())
+    assert [int(c[1]["params"]["end"]) for c in session.get.call_args_list] == [int(fixed_now.timestamp())]
 
 
-def test_get_oldest_day_data_found_searches_earlier():
-    call_count = {"n": 0}
-
-    def side_effect(url, params=None):
-        call_count["n"] += 1
-        if call_count["n"] == 1:
-            return _mock_response(200, [_candle(int(params["start"]))])
-        return _mock_response(200, [])
+def test_get_product_candles_empty_range(session):
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    df, status = coinbase_api.get_product_candles("BTC-USD", start=start, end=start)
+    assert df.empty
+    assert list(df.columns) == ["low", "high", "open", "close", "volume"]
+    assert status == {}
+    assert not session.get.called
 
-    with mock.patch(
-        "fast_trade.archive.coinbase_api.requests.get", side_effect=side_effect
-    ), mock.patch("fast_trade.archive.coinbase_api.time.sleep"), mock.patch(
-        "fast_trade.archive.coinbase_api.random.random", return_value=0.1
-    ):
-        result = coinbase_api.get_oldest_day(
-            "BTC-USD", start_date=datetime.datetime(2017, 1, 1)
-        )
 
-    assert isinstance(result, datetime.datetime)
+def test_get_session_is_shared(monkeypatch):
+    monkeypatch.setattr(coinbase_api, "_session", None)
+    assert coinbase_api.get_session() is coinbase_api.get_session()
 
 
 def test_main_block_runs():
@@ -3,10 +3,13 @@ import os
 import sqlite3
 from unittest import mock
 
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 import pytest
 
 from test.archive_main_runners import run_db_helpers_main
+from fast_trade import run_backtest
 from fast_trade.archive import db_helpers
 
 
@@ -46,15 +49,15 @@ def test_archive_path_file_parent_resolution(tmp_path, monkeypatch):
 
 def test_atomic_write_parquet(tmp_path):
     path = str(tmp_path / "out.parquet")
-    db_helpers._atomic_write_parquet(_sample_df(), path)
+    db_helpers.atomic_write_parquet(_sample_df(), path)
     assert os.path.exists(path)
     assert not os.path.exists(path + ".tmp")
 
 
 def test_safe_read_parquet_success(tmp_path):
     path = str(tmp_path / "data.parquet")
-    db_helpers._atomic_write_parquet(_sample_df(), path)
-    df = db_helpers._safe_read_parquet(path)
+    db_helpers.atomic_write_parquet(_sample_df(), path)
+    df = db_helpers.safe_read_parquet(path)
     assert df is not None
     assert len(df) == 2
 
@@ -63,7 +66,7 @@ def test_safe_read_parquet_corrupt_removes_file(tmp_path):
     path = str(tmp_path / "bad.parquet")
     with open(path, "w") as f:
         f.write("not parquet")
-    result = db_helpers._safe_read_parquet(path)
+    result = db_helpers.safe_read_parquet(path)
     assert result is None
     assert not os.path.exists(path)
 
@@ -73,7 +76,7 @@ def test_safe_read_parquet_remove_oserror(tmp_path):
     with open(path, "w") as f:
         f.write("not parquet")
     with mock.patch("fast_trade.archive.db_helpers.os.remove", side_effect=OSError("denied")):
-        result = db_helpers._safe_read_parquet(path)
+        result = db_helpers.safe_read_parquet(path)
     assert result is None
 
 
@@ -85,11 +88,20 @@ def test_get_local_assets(archive_path):
     (binance / "BTCUSDT.parquet").write_text("")
     (binance / "_skip.parquet").write_text("")
     (coinbase / "BTC-USD.sqlite").write_text("")
+    eth_month = coinbase / "ETH-USD" / "year=2024" / "month=01"
+    eth_month.mkdir(parents=True)
+    (eth_month / f"{db_helpers.KLINE_PART_PREFIX}0.parquet").write_text("")
+    # an aborted download leaves the partition directories without any part file
+    (coinbase / "SOL-USD" / "year=2024" / "month=01").mkdir(parents=True)
+    (coinbase / "empty").mkdir()
     (archive_path / "notadir.txt").write_text("")
 
     assets = db_helpers.get_local_assets()
     assert ("binanceus", "BTCUSDT") in assets
     assert ("coinbase", "BTC-USD") in assets
+    assert ("coinbase", "ETH-USD") in assets
+    assert ("coinbase", "SOL-USD") not in assets
+    assert ("coinbase", "empty") not in assets
     assert all(not sym.startswith("_") for _, sym in assets)
 
 
@@ -112,7 +124,7 @@ def test_update_klines_to_db_merges_existing_indexed_parquet(archive_path):
         },
         index=pd.to_datetime(["2024-01-01"]),
     )
-    db_helpers._atomic_write_parquet(existing, str(exchange_dir / "BTCUSDT.parquet"))
+    db_helpers.atomic_write_parquet(existing, str(exchange_dir / "BTCUSDT.parquet"))
 
     new_df = pd.DataFrame(
         {
@@ -124,17 +136,35 @@ def test_update_klines_to_db_merges_existing_indexed_parquet(archive_path):
         },
         index=pd.to_datetime(["2024-01-02"]),
     )
-    path = db_helpers.update_klines_to_db(new_df, "BTCUSDT", "binanceus")
-    merged = pd.read_parquet(path)
+    db_helpers.update_klines_to_db(new_df, "BTCUSDT", "binanceus")
+    merged = db_helpers.read_kline_archive("BTCUSDT", "binanceus")
     assert len(merged) == 2
+    assert not (exchange_dir / "BTCUSDT.parquet").exists()
 
 
-def test_update_klines_to_db_creates_new_parquet(archive_path):
-    df = _sample_df()
+def test_update_klines_to_db_creates_month_partitions(archive_path):
+    df = _sample_df(pd.to_datetime(["2024-01-31 23:59", "2024-02-01 00:00"]))
     path = db_helpers.update_klines_to_db(df, "BTCUSDT", "binanceus")
-    assert path.endswith("binanceus/BTCUSDT.parquet")
-    loaded = pd.read_parquet(path)
-    assert len(loaded) == 2
+    assert path.endswith("binanceus/BTCUSDT")
+    parts = db_helpers._kline_parts(path)
+    assert [os.path.relpath(os.path.dirname(part), path) for part in parts] == [
+        os.path.join("year=2024", "month=01"),
+        os.path.join("year=2024", "month=02"),
+    ]
+    assert os.path.basename(parts[0]) == os.path.basename(parts[1])
+    assert len(db_helpers.read_kline_archive("BTCUSDT", "binanceus")) == 2
+
+
+def test_kline_archive_exists(archive_path):
+    assert not db_helpers.kline_archive_exists("BTCUSDT", "binanceus")
+    # an aborted download can leave the directories behind without any part file
+    os.makedirs(archive_path / "binanceus" / "BTCUSDT" / "year=2024" / "month=01")
+    assert not db_helpers.kline_archive_exists("BTCUSDT", "binanceus")
+    db_helpers.update_klines_to_db(_sample_df(), "BTCUSDT", "binanceus")
+    assert db_helpers.kline_archive_exists("BTCUSDT", "binanceus")
+    # the legacy single file archive
+    db_helpers.atomic_write_parquet(_sample_df(), str(archive_path / "binanceus" / "ETHUSDT.parquet"))
+    assert db_helpers.kline_archive_exists("ETHUSDT", "binanceus")
 
 
 def test_update_klines_to_db_merges_existing_with_date_column(archive_path):
@@ -162,9 +192,10 @@ def test_update_klines_to_db_merges_existing_with_date_column(archive_path):
         },
         index=pd.to_datetime(["2024-01-02"]),
     )
-    path = db_helpers.update_klines_to_db(new_df, "BTCUSDT", "binanceus")
-    merged = pd.read_parquet(path)
+    db_helpers.update_klines_to_db(new_df, "BTCUSDT", "binanceus")
+    merged = db_helpers.read_kline_archive("BTCUSDT", "binanceus")
     assert len(merged) == 2
+    assert not (exchange_dir / "BTCUSDT.parquet").exists()
 
 
 def test_update_klines_to_db_recover_from_corrupt_existing(archive_path):
@@ -174,9 +205,9 @@ def test_update_klines_to_db_recover_from_corrupt_existing(archive_path):
     corrupt.write_text("bad")
 
     path = db_helpers.update_klines_to_db(_sample_df(), "BTCUSDT", "binanceus")
-    loaded = pd.read_parquet(path)
-    assert len(loaded) == 2
-    assert path == str(corrupt)
+    assert len(db_helpers.read_kline_archive("BTCUSDT", "binanceus")) == 2
+    assert path == str(exchange_dir / "BTCUSDT")
+    assert not corrupt.exists()
 
 
 def test_connect_to_db_existing(archive_path):
@@ -239,7 +270,7 @@ def test_standardize_df_drops_extra_columns_and_dedupes():
 def test_get_kline_from_parquet(archive_path):
     exchange_dir = archive_path / "binanceus"
     exchange_dir.mkdir(parents=True)
-    db_helpers._atomic_write_parquet(_sample_df(), str(exchange_dir / "BTCUSDT.parquet"))
+    db_helpers.atomic_write_parquet(_sample_df(), str(exchange_dir / "BTCUSDT.parquet"))
 
     start = datetime.datetime(2024, 1, 1)
     end = datetime.datetime(2024, 1, 2)
@@ -250,7 +281,7 @@ def test_get_kline_from_parquet(archive_path):
 def test_get_kline_string_dates(archive_path):
     exchange_dir = archive_path / "binanceus"
     exchange_dir.mkdir(parents=True)
-    db_helpers._atomic_write_parquet(_sample_df(), str(exchange_dir / "BTCUSDT.parquet"))
+    db_helpers.atomic_write_parquet(_sample_df(), str(exchange_dir / "BTCUSDT.parquet"))
 
     df = db_helpers.get_kline(
         "BTCUSDT",
@@ -349,7 +380,7 @@ def test_get_kline_runtime_error_when_still_missing(archive_path):
 
     with mock.patch("fast_trade.archive.update_kline.update_kline"), mock.patch(
         "fast_trade.archive.db_helpers.os.path.exists", side_effect=exists
-    ), mock.patch("fast_trade.archive.db_helpers._safe_read_parquet", return_value=None):
+    ), mock.patch("fast_trade.archive.db_helpers.safe_read_parquet", return_value=None):
         with pytest.raises(RuntimeError, match="Failed to load parquet"):
             db_helpers.get_kline("BTCUSDT", "binanceus")
 
@@ -368,10 +399,183 @@ def test_get_kline_after_update_reads_date_column_parquet(archive_path):
 
     with mock.patch("fast_trade.archive.db_helpers.os.path.exists", side_effect=exists), mock.patch(
         "fast_trade.archive.update_kline.update_kline", side_effect=fake_update
-    ), mock.patch("fast_trade.archive.db_helpers._safe_read_parquet", side_effect=[None, stored]):
+    ), mock.patch("fast_trade.archive.db_helpers.safe_read_parquet", side_effect=[None, stored]):
         df = db_helpers.get_kline("BTCUSDT", "binanceus")
     assert not df.empty
 
 
+def _minute_df(start="2024-01-01", periods=3 * 1440):
+    index = pd.date_range(start, periods=periods, freq="min", name="date")
+    values = [float(i) for i in range(periods)]
+    return pd.DataFrame(
+        {"open": values, "high": values, "low": values, "close": values, "volume": values, "ignore": values},
+        index=index,
+    )
+
+
+def test_update_klines_to_db_writes_small_row_groups(archive_path, monkeypatch):
+    monkeypatch.setattr(db_helpers, "KLINE_ROW_GROUP_SIZE", 1000)
+    path = db_helpers.update_klines_to_db(_minute_df(), "BTCUSDT", "binanceus")
+    metadata = pq.read_metadata(db_helpers._kline_parts(path)[0])
+    assert metadata.num_row_groups == 5
+    assert metadata.schema.to_arrow_schema().names == ["open", "close", "high", "low", "volume", "date"]
+
+
+def test_get_kline_reads_only_requested_days(archive_path, monkeypatch):
+    monkeypatch.setattr(db_helpers, "KLINE_ROW_GROUP_SIZE", 1000)
+    db_helpers.update_klines_to_db(_minute_df(), "BTCUSDT", "binanceus")
+
+    with mock.patch("fast_trade.archive.db_helpers.safe_read_parquet") as full_read:
+        df = db_helpers.get_kline("BTCUSDT", "binanceus", "2024-01-02T12:00:00", "2024-01-02")
+    assert not full_read.called
+    assert df.index[0] == pd.Timestamp("2024-01-02")
+    assert df.index[-1] == pd.Timestamp("2024-01-02 23:59")
+    assert list(df.columns) == ["open", "high", "low", "close", "volume"]
+
+    only_end = db_helpers.get_kline("BTCUSDT", "binanceus", end_date=datetime.datetime(2024, 1, 1, 6))
+    assert only_end.index[-1] == pd.Timestamp("2024-01-01 23:59")
+
+
+def test_get_kline_epoch_bounds(archive_path):
+    db_helpers.update_klines_to_db(_minute_df(), "BTCUSDT", "binanceus")
+    expected = db_helpers.get_kline("BTCUSDT", "binanceus", "2024-01-02T00:00:00", "2024-01-02T00:00:00")
+    # epoch seconds and milliseconds, like apply_charting_to_df takes them
+    for start, stop in [(1704153600, 1704153600), (1704153600000, 1704153600000), (np.int64(1704153600), 1704153600.0)]:
+        df = db_helpers.get_kline("BTCUSDT", "binanceus", start, stop)
+        pd.testing.assert_frame_equal(df, expected)
+    # the stop day is read whole
+    assert db_helpers.get_kline("BTCUSDT", "binanceus", None, 1704153600).index[-1] == pd.Timestamp("2024-01-02 23:59")
+
+    strategy = {
+        "symbol": "BTCUSDT",
+        "exchange": "binanceus",
+        "freq": "1Min",
+        "start": datetime.datetime(2024, 1, 1),
+        "stop": 1704153600,
+        "datapoints": [{"name": "sma", "transformer": "sma", "args": [3]}],
+        "enter": [["close", ">", 10]],
+        "exit": [["close", "<", 5]],
+    }
+    assert len(run_backtest(strategy)["df"]) == 1441
+
+@pytest.mark.parametrize("freq", ["15Min", "1D", "7Min", "5h", "2D", "W", "MS"])
+def test_get_kline_filtered_matches_the_whole_archive(archive_path, freq):
+    # the archive starts in the middle of a day, a month and a week
+    db_helpers.update_klines_to_db(_minute_df("2024-01-10 07:00", 40 * 1440), "BTCUSDT", "binanceus")
+    whole = db_helpers.get_kline("BTCUSDT", "binanceus", freq=freq)
+    df = db_helpers.get_kline("BTCUSDT", "binanceus", "2024-01-20T13:00:00", "2024-02-03T00:00:00", freq=freq)
+    # the candles from start to stop are the same as the ones resampled from the whole archive
+    start, stop = pd.Timestamp("2024-01-20 13:00"), pd.Timestamp("2024-02-03")
+    pd.testing.assert_frame_equal(df[start:stop], whole[start:stop])
+    assert db_helpers._tiles_days(freq) == (freq in ["15Min", "1D"])
+    assert not db_helpers._tiles_days("nope")
+
+def test_read_kline_parquet_date_column_and_timezone(tmp_path):
+    path = str(tmp_path / "BTCUSDT.parquet")
+    stored = _minute_df().tz_localize("UTC").reset_index()
+    stored.to_parquet(path, index=False)
+
+    df = db_helpers._read_kline_parquet(path, datetime.datetime(2024, 1, 3))
+    assert len(df) == 1440
+    assert str(df.index.tz) == "UTC"
+
+
+def test_read_kline_parquet_falls_back_to_full_read(tmp_path):
+    path = str(tmp_path / "BTCUSDT.parquet")
+    _minute_df().reset_index(drop=True).set_index(_minute_df().index.rename(None)).to_parquet(path)
+
+    df = db_helpers._read_kline_parquet(path, "2024-01-03", "2024-01-03")
+    assert len(df) == 1440
+    assert "ignore" in df.columns
+
+    (tmp_path / "bad.parquet").write_text("bad")
+    assert db_helpers._read_kline_parquet(str(tmp_path / "bad.parquet")) is None
+
+
+def test_update_klines_to_db_appends_without_rewriting(archive_path):
+    path = db_helpers.update_klines_to_db(_minute_df(periods=60), "BTCUSDT", "binanceus")
+    first_part = db_helpers._kline_parts(path)[0]
+    first_mtime = os.stat(first_part).st_mtime_ns
+
+    changed = _minute_df(periods=90).iloc[59:]
+    changed.iloc[0, changed.columns.get_loc("close")] = -1.0
+    db_helpers.update_klines_to_db(changed, "BTCUSDT", "binanceus")
+
+    parts = db_helpers._kline_parts(path)
+    assert len(parts) == 2
+    assert parts[0] == first_part
+    assert os.stat(first_part).st_mtime_ns == first_mtime
+    # the unchanged candle is not written again, the corrected one is and wins
+    assert len(pd.read_parquet(parts[1])) == 31
+    df = db_helpers.read_kline_archive("BTCUSDT", "binanceus")
+    assert len(df) == 90
+    assert df["close"].iloc[59] == -1.0
+    assert df.index.is_monotonic_increasing
+
+    db_helpers.update_klines_to_db(_minute_df(periods=90).iloc[60:], "BTCUSDT", "binanceus")
+    assert len(db_helpers._kline_parts(path)) == 2
+
+
+def test_compact_klines_merges_parts_per_month(archive_path):
+    path = db_helpers.update_klines_to_db(_minute_df("2024-01-31", periods=1440), "BTCUSDT", "binanceus")
+    db_helpers.update_klines_to_db(_minute_df("2024-01-31 12:00", periods=2880).assign(close=7.0), "BTCUSDT", "binanceus")
+    parts = db_helpers._kline_parts(path)
+    assert len(parts) == 3
+    before = db_helpers.read_kline_archive("BTCUSDT", "binanceus")
+
+    assert db_helpers.compact_klines("BTCUSDT", "binanceus") == 1
+    compacted = db_helpers._kline_parts(path)
+    assert compacted == parts[1:]
+    pd.testing.assert_frame_equal(db_helpers.read_kline_archive("BTCUSDT", "binanceus"), before, check_freq=False)
+    assert (before["close"].loc["2024-01-31 12:00":] == 7.0).all()
+
+    assert db_helpers.compact_klines("BTCUSDT", "binanceus") == 0
+    assert db_helpers.compact_klines("ETHUSDT", "binanceus") == 0
+
+
+def test_compact_klines_skips_unreadable_months(archive_path):
+    month = archive_path / "binanceus" / "BTCUSDT" / "year=2024" / "month=01"
+    month.mkdir(parents=True)
+    (month / "part-1.parquet").write_text("bad")
+    (month / "part-2.parquet").write_text("bad")
+    assert db_helpers.compact_klines("BTCUSDT", "binanceus") == 0
+
+
+def test_partitioned_reads_skip_other_months(archive_path):
+    db_helpers.update_klines_to_db(_minute_df("2024-01-30", periods=3 * 1440), "BTCUSDT", "binanceus")
+    month = archive_path / "binanceus" / "BTCUSDT" / "year=2024"
+    (month / "month=03").mkdir()
+    (month / "month=03" / "part-1.parquet").write_text("bad")
+    (month / "month=03" / "notes.txt").write_text("")
+    (month / "notes.txt").write_text("")
+    (month.parent / "notes.txt").write_text("")
+
+    df = db_helpers.get_kline("BTCUSDT", "binanceus", "2024-01-30", "2024-01-30")
+    assert len(df) == 1440
+    assert (month / "month=03" / "part-1.parquet").exists()
+
+    feb = db_helpers.read_kline_archive(
+        "BTCUSDT", "binanceus", start_date=datetime.datetime(2024, 2, 1, tzinfo=datetime.timezone.utc)
+    )
+    assert feb.index[0] == pd.Timestamp("2024-02-01")
+    assert db_helpers.read_kline_archive("BTCUSDT", "binanceus", start_date="2024-05-01").empty
+    assert db_helpers.read_kline_archive("ETHUSDT", "binanceus") is None
+
+
+def test_latest_kline_date(archive_path):
+    assert db_helpers.latest_kline_date("BTCUSDT", "binanceus") is None
+
+    exchange_dir = archive_path / "binanceus"
+    exchange_dir.mkdir()
+    (exchange_dir / "BTCUSDT").mkdir()
+    assert db_helpers.latest_kline_date("BTCUSDT", "binanceus") is None
+
+    db_helpers.update_klines_to_db(_minute_df("2024-01-31", periods=1440 + 5), "BTCUSDT", "binanceus")
+    assert db_helpers.latest_kline_date("BTCUSDT", "binanceus") == pd.Timestamp("2024-02-01 00:04")
+
+    _minute_df(periods=10).to_parquet(exchange_dir / "ETHUSDT.parquet")
+    assert db_helpers.latest_kline_date("ETHUSDT", "binanceus") == pd.Timestamp("2024-01-01 00:09")
+
+
 def test_main_block_runs(archive_path):
     run_db_helpers_main(str(archive_path))
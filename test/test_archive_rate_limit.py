@@ -0,0 +1,79 @@
+from unittest import mock
+
+import pytest
+
+from fast_trade.archive import rate_limit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    fake = FakeClock()
+    with mock.patch("fast_trade.archive.rate_limit.time.monotonic", fake.monotonic), mock.patch(
+        "fast_trade.archive.rate_limit.time.sleep", fake.sleep
+    ):
+        yield fake
+
+
+def test_token_bucket_bursts_then_waits(clock):
+    bucket = rate_limit.TokenBucket(rate=10, capacity=4)
+    assert [bucket.acquire(2), bucket.acquire(2)] == [0.0, 0.0]
+    assert bucket.acquire(2) == pytest.approx(0.2)
+
+    clock.now += 10
+    # the refill is capped at the capacity
+    assert bucket.acquire(4) == 0.0
+    assert bucket.acquire(1) == pytest.approx(0.1)
+    assert clock.sleeps == [pytest.approx(0.2), pytest.approx(0.1)]
+
+
+def test_token_bucket_queues_concurrent_debt(clock):
+    bucket = rate_limit.TokenBucket(rate=2, capacity=1)
+    with mock.patch("fast_trade.archive.rate_limit.time.sleep"):
+        waits = [bucket.acquire() for _ in range(4)]
+    # nobody refills while the mocked sleeps return, every caller waits out its own place in line
+    assert waits == [0.0, pytest.approx(0.5), pytest.approx(1.0), pytest.approx(1.5)]
+
+
+def test_get_rate_limiter_is_shared_per_exchange(monkeypatch):
+    monkeypatch.setattr(rate_limit, "_limiters", {})
+    assert rate_limit.get_rate_limiter("binanceus") is rate_limit.get_rate_limiter("binanceus")
+    assert rate_limit.get_rate_limiter("binanceus") is not rate_limit.get_rate_limiter("coinbase")
+    assert rate_limit.get_rate_limiter("binanceus").rate == rate_limit.EXCHANGE_RATE_LIMITS["binanceus"][0]
+    assert rate_limit.get_rate_limiter("kraken").rate == 1.0
+
+
+def test_token_bucket_pause_holds_every_caller(clock):
+    bucket = rate_limit.TokenBucket(rate=10, capacity=10)
+    bucket.pause(3)
+    # a shorter pause doesn't cut the first one short
+    bucket.pause(1)
+    assert bucket.acquire() == pytest.approx(3.1)
+    assert bucket.acquire() == pytest.approx(0.1)
+
+
+def test_token_bucket_backoff_and_recover(clock):
+    bucket = rate_limit.TokenBucket(rate=10, capacity=10)
+    bucket.backoff(2)
+    assert bucket.rate == 5
+    assert bucket.acquire() == pytest.approx(2.2)
+    for _ in range(5):
+        bucket.backoff(0)
+    # never below a tenth of the configured rate
+    assert bucket.rate == 1
+
+    for _ in range(100):
+        bucket.recover()
+    assert bucket.rate == 10
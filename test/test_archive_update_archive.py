@@ -1,11 +1,13 @@
 import datetime
+import threading
+import time
 from unittest import mock
 
 import pandas as pd
 import pytest
 
 from test.archive_main_runners import run_update_archive_main
-from fast_trade.archive import update_archive
+from fast_trade.archive import db_helpers, update_archive
 
 
 def _sample_df():
@@ -79,7 +81,7 @@ def test_update_single_archive_read_exception(archive_path):
     (exchange_dir / "BTCUSDT.parquet").write_text("")
 
     with mock.patch(
-        "fast_trade.archive.update_archive._safe_read_parquet",
+        "fast_trade.archive.update_archive.latest_kline_date",
         side_effect=RuntimeError("read failed"),
     ), mock.patch("fast_trade.archive.update_archive.update_kline") as update_mock:
         update_archive.update_single_archive("BTCUSDT", "binanceus")
@@ -106,12 +108,27 @@ def test_update_single_archive_existing_parquet_with_date_column(archive_path):
         assert update_mock.call_args[1]["start_date"] == pd.to_datetime("2024-01-02")
 
 
+def test_update_single_archive_partitioned(archive_path, monkeypatch):
+    monkeypatch.setattr(db_helpers, "ARCHIVE_PATH", str(archive_path))
+    df = _sample_df()
+    df.index = pd.to_datetime(["2024-02-10 12:30"])
+    db_helpers.update_klines_to_db(df, "BTCUSDT", "binanceus")
+
+    with mock.patch("fast_trade.archive.update_archive.update_kline") as update_mock:
+        update_archive.update_single_archive("BTCUSDT", "binanceus")
+        assert update_mock.call_args[1]["start_date"] == pd.Timestamp("2024-02-10 12:30")
+
+
 def test_update_archive_processes_symbols(archive_path):
     for exchange, symbol in [("binanceus", "BTCUSDT"), ("coinbase", "BTC-USD")]:
         exchange_dir = archive_path / exchange
         exchange_dir.mkdir(parents=True)
         _sample_df().to_parquet(exchange_dir / f"{symbol}.parquet")
     (archive_path / "skip.txt").write_text("")
+    eth_month = archive_path / "coinbase" / "ETH-USD" / "year=2024" / "month=01"
+    eth_month.mkdir(parents=True)
+    _sample_df().to_parquet(eth_month / f"{db_helpers.KLINE_PART_PREFIX}0.parquet")
+    (archive_path / "coinbase" / "not_an_archive").mkdir()
 
     with mock.patch("fast_trade.archive.update_archive.update_kline"), mock.patch(
         "fast_trade.archive.update_archive.console.print"
@@ -119,7 +136,7 @@ def test_update_archive_processes_symbols(archive_path):
         update_archive.update_archive()
 
     print_mock.assert_called()
-    assert "Updated 2 symbols" in str(print_mock.call_args)
+    assert "Updated 3 symbols" in str(print_mock.call_args)
 
 
 def test_update_archive_skips_non_parquet_files(archive_path):
@@ -151,17 +168,56 @@ def test_update_archive_progress_callback_invalid_perc(archive_path):
         update_archive.update_archive()
 
 
-def test_update_archive_raises_on_failure(archive_path):
+def test_update_archive_isolates_failures(archive_path):
     exchange_dir = archive_path / "binanceus"
     exchange_dir.mkdir(parents=True)
-    _sample_df().to_parquet(exchange_dir / "BTCUSDT.parquet")
+    for symbol in ["BTCUSDT", "ETHUSDT", "SOLUSDT"]:
+        _sample_df().to_parquet(exchange_dir / f"{symbol}.parquet")
+
+    def fake_update(symbol, exchange, **kwargs):
+        if symbol == "ETHUSDT":
+            raise RuntimeError("update failed")
 
     with mock.patch(
-        "fast_trade.archive.update_archive.update_kline",
-        side_effect=RuntimeError("update failed"),
+        "fast_trade.archive.update_archive.update_kline", side_effect=fake_update
+    ), mock.patch("fast_trade.archive.update_archive.console.print") as print_mock:
+        result = update_archive.update_archive(max_workers=2)
+
+    assert sorted(result["updated"]) == [("binanceus", "BTCUSDT"), ("binanceus", "SOLUSDT")]
+    assert result["failed"] == {"binanceus:ETHUSDT": "update failed"}
+    assert "1 symbols failed: binanceus:ETHUSDT" in str(print_mock.call_args)
+
+
+def test_update_archive_runs_symbols_concurrently(archive_path):
+    exchange_dir = archive_path / "binanceus"
+    exchange_dir.mkdir(parents=True)
+    for i in range(4):
+        _sample_df().to_parquet(exchange_dir / f"SYM{i}.parquet")
+
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def fake_update(symbol, exchange, **kwargs):
+        with lock:
+            running.append(symbol)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(symbol)
+
+    with mock.patch(
+        "fast_trade.archive.update_archive.update_kline", side_effect=fake_update
     ), mock.patch("fast_trade.archive.update_archive.console.print"):
-        with pytest.raises(RuntimeError, match="update failed"):
-            update_archive.update_archive()
+        result = update_archive.update_archive(max_workers=2)
+
+    assert len(result["updated"]) == 4
+    assert max(peak) == 2
+
+
+def test_update_archive_empty(archive_path):
+    with mock.patch("fast_trade.archive.update_archive.console.print"):
+        assert update_archive.update_archive() == {"updated": [], "failed": {}}
 
 
 def test_main_block_runs(archive_path):
@@ -1,15 +1,24 @@
 import pytest
+import numpy as np
 import pandas as pd
 import datetime
+import os
+import shutil
+from unittest import mock
 
 from fast_trade.build_data_frame import (
     build_data_frame,
+    datapoint_column,
     detect_time_unit,
     load_basic_df_from_csv,
     apply_transformers_to_dataframe,
     apply_charting_to_df,
     prepare_df,
     process_res_df,
+    read_csv_sidecar,
+    resample_candles,
+    standardize_df,
+    _freq_span,
 )
 
 
@@ -223,6 +232,13 @@ def test_process_res_df():
     assert list(res.ind_1_sma_val_2.values) == val2
 
 
+def test_datapoint_column():
+    mock_ind = {"name": "ind_1", "transformer": "sma", "args": [3]}
+
+    assert datapoint_column(mock_ind, "Val 1") == "ind_1_sma_val_1"
+    assert datapoint_column(mock_ind, "BB.Upper") == "ind_1_sma_bbupper"
+
+
 def test_apply_transformers_to_dataframe():
     mock_df = pd.read_csv("./test/ohlcv_data.csv.txt", parse_dates=True)
     mock_df.index = pd.to_datetime(mock_df.date, unit="s")
@@ -286,3 +302,125 @@ def test_build_data_frame_no_data():
         build_data_frame(mock_backtest, mock_csv_path)
 
         assert "Dataframe is empty. Check the start and end dates" in str(exeinfo.value)
+
+
+def test_apply_transformers_to_dataframe_aligns_and_fills_once():
+    index = pd.date_range("2024-01-01", periods=120, freq="1min")
+    close = pd.Series(np.linspace(100, 130, 120), index=index)
+    df = pd.DataFrame({"open": close, "high": close + 1, "low": close - 1, "close": close, "volume": 1.0})
+    # two missing candles, the first transformer sees the gap and the rest see it forward filled
+    df = df.drop(index[[50, 51]])
+    transformers = [
+        {"transformer": "sma", "name": "fast", "args": [3]},
+        {"transformer": "sma", "name": "slow", "args": [5]},
+        {"transformer": "ema", "name": "hourly", "args": [2], "freq": "30Min"},
+        {"transformer": "sma", "name": "smooth", "args": [2, "fast"]},
+        {"transformer": "macd", "name": "macd", "args": [3, 6, 2]},
+        {"transformer": "hma", "name": "hull", "args": [4]},
+    ]
+
+    result = apply_transformers_to_dataframe(df.copy(), transformers, cache=None)
+
+    gappy = df.asfreq("1Min")
+    filled = gappy.ffill()
+    assert list(result.columns) == [
+        "open", "high", "low", "close", "volume", "fast", "slow", "hourly", "smooth",
+        "macd_macd_macd", "macd_macd_signal", "hull",
+    ]
+    assert result.index.freq == "1Min"
+    pd.testing.assert_frame_equal(result[filled.columns], filled)
+    fast = gappy["close"].rolling(3).mean().ffill()
+    pd.testing.assert_series_equal(result["fast"], fast, check_names=False)
+    pd.testing.assert_series_equal(result["slow"], filled["close"].rolling(5).mean(), check_names=False)
+    thirty = filled["close"].resample("30Min").last().ewm(span=2).mean()
+    pd.testing.assert_series_equal(result["hourly"], thirty.reindex(index).ffill(), check_names=False, check_freq=False)
+    pd.testing.assert_series_equal(result["smooth"], fast.rolling(2).mean(), check_names=False)
+
+
+def test_resample_candles_builds_on_the_finer_ones():
+    index = pd.date_range("2024-01-01 00:10", periods=300, freq="1min")
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({c: rng.random(300) for c in ["open", "high", "low", "close"]}, index=index)
+    df["volume"] = rng.integers(0, 100, 300).astype(float)
+    df.iloc[[3, 40, 41, 200]] = np.nan
+    # a quarter of an hour without candles, the views keep it empty and only the results are filled
+    df.iloc[50:65] = np.nan
+    agg = {"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"}
+
+    views = {}
+    for freq in ["15Min", "5Min", "1h", "2h", "7Min"]:
+        result = resample_candles(df, freq, views)
+        pd.testing.assert_frame_equal(result, df.resample(freq).agg(agg).ffill())
+    assert set(views) == {"15Min", "5Min", "1h", "2h", "7Min"}
+    assert np.isnan(views["15Min"].loc["2024-01-01 01:00", "close"])
+
+    # 1h is built from the coarsest of the views it divides into, the 15Min one
+    views = {"5Min": views["5Min"], "15Min": views["15Min"] * 2}
+    hourly = resample_candles(df, "1h", views)
+    pd.testing.assert_frame_equal(hourly, df.resample("1h").agg(agg).ffill() * 2)
+    assert resample_candles(df, "1h", views) is not hourly
+
+
+def test_freq_span():
+    index = pd.date_range("2024-01-01", periods=2, freq="1min")
+    assert _freq_span("15Min", index) == pd.Timedelta("15min")
+    assert _freq_span("2D", index) == pd.Timedelta("2D")
+    assert _freq_span("2D", index.tz_localize("UTC")) is None
+    assert _freq_span("1W", index) is None
+    assert _freq_span("ME", index) is None
+    assert _freq_span("not a freq", index) is None
+
+
+def test_load_basic_df_from_csv_types(tmp_path):
+    result_df = load_basic_df_from_csv("./test/ohlcv_data.csv.txt")
+    assert result_df.dtypes.tolist() == [np.float64] * 5
+    assert result_df.index.dtype == "datetime64[s]"
+
+    csv_path = tmp_path / "iso.csv"
+    csv_path.write_text(
+        "date,open,high,low,close,volume,ignore\n"
+        "2024-01-01 00:01:00,2,3,1,2.5,20,0\n"
+        "2024-01-01 00:00:00,1,2,0.5,1.5,10,0\n"
+        "2024-01-01 00:01:00,9,9,9,9,9,0\n"
+    )
+    result_df = load_basic_df_from_csv(str(csv_path))
+    # sorted, the first of the duplicates kept and the dates parsed the way pandas parses them
+    assert result_df.index.tolist() == list(pd.date_range("2024-01-01", periods=2, freq="1min"))
+    assert result_df.index.dtype == "datetime64[us]"
+    assert result_df["close"].tolist() == [1.5, 2.5]
+    assert "ignore" not in result_df.columns
+
+    # the columns that aren't numbers yet are converted, on a copy unless told otherwise
+    raw = pd.DataFrame({"date": [1704067200], "open": ["1"], "high": ["2"], "low": ["0.5"], "close": ["1.5"], "volume": [3]})
+    result_df = standardize_df(raw)
+    assert result_df.iloc[0].tolist() == [1.0, 2.0, 0.5, 1.5, 3]
+    assert raw["open"].tolist() == ["1"]
+
+
+def test_load_basic_df_from_csv_sidecar(tmp_path):
+    csv_path = str(tmp_path / "ohlcv.csv")
+    shutil.copy("./test/ohlcv_data.csv.txt", csv_path)
+    parsed = load_basic_df_from_csv(csv_path, sidecar=True)
+    assert os.path.exists(csv_path + ".arrow")
+    pd.testing.assert_frame_equal(parsed, load_basic_df_from_csv(csv_path))
+
+    # the csv isn't parsed again while it is unchanged
+    with mock.patch("fast_trade.build_data_frame.pa_csv.read_csv", side_effect=AssertionError("parsed")):
+        pd.testing.assert_frame_equal(load_basic_df_from_csv(csv_path, sidecar=True), parsed)
+
+    with open(csv_path, "a") as f:
+        f.write("\n1523938384,0.03,0.03,0.03,0.03,1\n")
+    assert read_csv_sidecar(csv_path) is None
+    assert len(load_basic_df_from_csv(csv_path, sidecar=True)) == len(parsed) + 1
+    assert len(read_csv_sidecar(csv_path)) == len(parsed) + 1
+
+    # a broken sidecar is replaced, one that can't be written is skipped
+    with open(csv_path + ".arrow", "wb") as f:
+        f.write(b"not arrow")
+    assert read_csv_sidecar(csv_path) is None
+    assert len(load_basic_df_from_csv(csv_path, sidecar=True)) == len(parsed) + 1
+    assert read_csv_sidecar(csv_path) is not None
+    os.remove(csv_path + ".arrow")
+    with mock.patch("fast_trade.build_data_frame.os.replace", side_effect=PermissionError("read only")):
+        assert len(load_basic_df_from_csv(csv_path, sidecar=True)) == len(parsed) + 1
+    assert read_csv_sidecar(csv_path) is None
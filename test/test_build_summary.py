@@ -1,7 +1,11 @@
 import datetime
+from unittest import mock
+
 import pandas as pd
 
+from fast_trade import build_summary as build_summary_module
 from fast_trade.build_summary import (
+    SUMMARY_METRICS,
     build_summary,
     calculate_buy_and_hold_perc,
     calculate_return_perc,
@@ -11,6 +15,7 @@ from fast_trade.build_summary import (
     summarize_trade_perc,
     summarize_trades,
 )
+from fast_trade.summary import kernel
 
 
 def create_mock_trade_log():
@@ -45,6 +50,30 @@ def test_create_trade_log_simple():
     assert list(trade_log_df.in_trade) == [True, False, True, False]
 
 
+def test_create_trade_log_takes_the_first_value_of_each_run():
+    mock_tl = create_mock_trade_log()
+    mock_tl["adj_account_value_change"] = [100, 110, 100, 115, 125, 125, 130, 125, 135]
+    # a datapoint still warming up on the first rows of the runs
+    mock_tl["slow"] = [None, None, 1.0, 2.0, None, 3.0, 4.0, 5.0, 6.0]
+    mock_tl["perc"] = [float("inf"), 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0]
+
+    trade_log_df = create_trade_log(mock_tl)
+    assert list(trade_log_df.index) == list(mock_tl.index[[0, 1, 4, 6]])
+    assert trade_log_df.index.freq is None
+    assert pd.isna(trade_log_df.slow.iloc[0])
+    assert list(trade_log_df.slow.iloc[1:]) == [1.0, 3.0, 4.0]
+    assert pd.isna(trade_log_df.perc.iloc[0])
+    # the frame itself isn't touched
+    assert mock_tl.slow.isna().sum() == 3
+
+    # without a date index the runs are numbered and the index becomes a column
+    unnamed = create_trade_log(mock_tl.rename_axis(None))
+    assert list(unnamed.index) == [1, 2, 3, 4]
+    assert unnamed.index.name == "in_trade"
+    assert list(unnamed["index"]) == list(mock_tl.index[[0, 1, 4, 6]])
+    assert create_trade_log(mock_tl.iloc[:0]).empty
+
+
 def test_summarize_time_held():
     trade_log_df = create_mock_trade_log()
 
@@ -257,3 +286,61 @@ def test_build_summary():
     assert type(res["test_duration"]) is float
     assert len(trade_df.index) == 3
     assert res["total_missing"] == 0
+
+
+def _mock_backtest_df():
+    mock_df = create_mock_trade_log()
+    mock_df.close = [10, 11, 11, 9, 9, 10, 11, 90, 11]
+    mock_df["action"] = ["e", "h", "h", "h", "x", "e", "h", "h", "x"]
+    mock_df["account_value"] = [90, 110, 110, 90, 90, 100, 110, 90, 100]
+    mock_df["adj_account_value"] = [90, 110, 110, 90, 90, 100, 110, 90, 100]
+    mock_df["adj_account_value_change"] = mock_df["adj_account_value"].diff()
+    mock_df["adj_account_value_change_perc"] = mock_df["account_value"].pct_change()
+    mock_df["aux"] = [1, 1, 1, 1, 1, 1, 1, 1, 1]
+    return mock_df
+
+
+def test_build_summary_selected_metrics():
+    mock_df = _mock_backtest_df()
+    start = datetime.datetime.utcnow()
+    full, trade_df = build_summary(mock_df, start)
+    assert list(full) == list(SUMMARY_METRICS)
+
+    metrics = ["sharpe_ratio", "return_perc", "drawdown_metrics.max_drawdown_pct", "nope", "risk_metrics"]
+    res, selected_trade_df = build_summary(mock_df, start, metrics=metrics)
+    # in the summary's own order, grouped metrics only keep the requested keys
+    assert list(res) == ["return_perc", "sharpe_ratio", "drawdown_metrics", "risk_metrics"]
+    assert res["return_perc"] == full["return_perc"]
+    assert res["sharpe_ratio"] == full["sharpe_ratio"]
+    assert res["drawdown_metrics"] == {"max_drawdown_pct": full["drawdown_metrics"]["max_drawdown_pct"]}
+    assert res["risk_metrics"] == full["risk_metrics"]
+    # none of them needed the trade log
+    assert selected_trade_df.empty
+
+    res, selected_trade_df = build_summary(
+        mock_df, start, metrics=["risk_metrics.sortino_ratio", "risk_metrics", "num_trades", "test_duration"]
+    )
+    assert res["risk_metrics"] == full["risk_metrics"]
+    assert res["num_trades"] == 3
+    assert type(res["test_duration"]) is float
+    assert selected_trade_df.equals(trade_df)
+    assert build_summary(mock_df, start, metrics=[])[0] == {}
+
+
+def test_build_summary_computes_shared_intermediates_once():
+    mock_df = _mock_backtest_df()
+    with mock.patch.object(
+        build_summary_module, "create_trade_log", wraps=create_trade_log
+    ) as trade_log, mock.patch.object(
+        kernel, "drawdowns", wraps=kernel.drawdowns
+    ) as drawdowns, mock.patch.object(
+        kernel, "run_lengths", wraps=kernel.run_lengths
+    ) as run_lengths:
+        summary, _ = build_summary(mock_df, datetime.datetime.utcnow())
+
+    assert trade_log.call_count == 1
+    assert drawdowns.call_count == 1
+    # the in trade runs once, the drawdown runs once
+    assert run_lengths.call_count == 2
+    assert summary["drawdown_metrics"] == build_summary_module.calculate_drawdown_metrics(mock_df)
+    assert summary["risk_metrics"] == build_summary_module.calculate_risk_metrics(mock_df)
@@ -109,6 +109,10 @@ def test_backtest_live_paths(cli_runner, strategy_file, mock_backtest_result, ar
     recent.to_parquet(parquet, index=False)
     _invoke(cli_runner, ["backtest", str(strategy_file), "--live"])
 
+    # unreadable archive falls back to the strategy start
+    monkeypatch.setattr(cli_mod, "latest_kline_date", mock.Mock(side_effect=ValueError("bad partition")))
+    assert _invoke(cli_runner, ["backtest", str(strategy_file), "--live"]).exit_code == 0
+
     # corrupt parquet start from strategy start string
     monkeypatch.setattr(cli_mod.pd, "read_parquet", mock.Mock(side_effect=OSError("bad")))
     strat_start = archive_env / "strategies" / "start.yml"
@@ -280,9 +284,14 @@ def test_logs_follow_interrupt(cli_runner, archive_env, monkeypatch):
 
 
 def test_update_archive(cli_runner, monkeypatch):
-    monkeypatch.setattr(cli_mod, "update_archive", mock.Mock())
-    result = _invoke(cli_runner, ["update_archive"])
+    update_mock = mock.Mock(return_value={"updated": [("binanceus", "BTCUSDT")], "failed": {}})
+    monkeypatch.setattr(cli_mod, "update_archive", update_mock)
+    result = _invoke(cli_runner, ["update_archive", "--workers", "2"])
     assert result.exit_code == 0
+    update_mock.assert_called_once_with(max_workers=2)
+
+    update_mock.return_value = {"updated": [], "failed": {"binanceus:BTCUSDT": "boom"}}
+    assert _invoke(cli_runner, ["update_archive"]).exit_code == 1
 
 
 def test_evolve_command(cli_runner, tmp_path, monkeypatch):
@@ -329,6 +338,114 @@ def test_evolve_command(cli_runner, tmp_path, monkeypatch):
         assert _invoke(cli_runner, ["evolve", str(p)]).exit_code != 0
 
 
+def test_evolve_command_parallel_processing_default(cli_runner, tmp_path, monkeypatch):
+    calls = []
+
+    def fake_optimize(**kwargs):
+        calls.append(kwargs)
+        kwargs["progress_callback"]({"cache": {"hits": 3, "disk_hits": 1, "misses": 4, "hit_rate": 0.5}})
+        return [], 1.0
+
+    monkeypatch.setattr(cli_mod, "optimize_strategy", fake_optimize)
+    monkeypatch.setattr(cli_mod.os, "cpu_count", lambda: 6)
+    monkeypatch.setenv("ARCHIVE_PATH", str(tmp_path))
+    path = tmp_path / "evo.json"
+    for settings in [{}, {"processes": 2, "fitness_cache": False}, {"threads": 3, "fitness_cache": "cache.sqlite"}]:
+        path.write_text(json.dumps({"strategy": {"symbol": "BTC"}, "genes": [["x", [1]]], "settings": settings}))
+        result = _invoke(cli_runner, ["evolve", str(path)])
+        assert result.exit_code == 0
+    assert [k["parallel_processing"] for k in calls] == [["process", 6], ["process", 2], ["thread", 3]]
+    assert calls[0]["fitness_cache"].path == str(tmp_path / "ml" / "fitness_cache.sqlite")
+    assert calls[1]["fitness_cache"] is None
+    assert calls[2]["fitness_cache"].path == "cache.sqlite"
+    assert "Cache Hits" in result.output
+
+
+def test_sweep_command(cli_runner, kline_archive, tmp_path, monkeypatch):
+    monkeypatch.setenv("ARCHIVE_PATH", str(tmp_path))
+    cfg = {
+        "strategy": {
+            "symbol": "BTCUSDT",
+            "exchange": "binanceus",
+            "freq": "15Min",
+            "start": "2024-01-01T12:00:00",
+            "stop": "2024-01-03T00:00:00",
+            "datapoints": [
+                {"name": "trend", "transformer": "sma", "args": ["#slow_period"]},
+                {"name": "fast", "transformer": "ema", "args": ["#fast_period"]},
+            ],
+            "enter": [["fast", ">", "trend"]],
+            "exit": [["fast", "<", "trend"]],
+        },
+        "genes": [{"name": "fast_period", "space": [2, 5, 8]}, ["slow_period", {"low": 10, "high": 30, "step": 10}]],
+        "constraints": [["drawdown_metrics.max_drawdown_pct", ">", -5]],
+        "settings": {"sampler": "lhs", "samples": 4, "processes": 1, "prune_fraction": 0.5},
+    }
+    path = tmp_path / "sma_sweep.json"
+    path.write_text(json.dumps(cfg))
+
+    result = _invoke(cli_runner, ["sweep", str(path)])
+    assert result.exit_code == 0, result.output
+    assert "Best Candidates" in result.output
+    results_path = tmp_path / "ml" / "sweeps" / "sma_sweep"
+    assert len(list(results_path.glob("part-*.parquet"))) == 1
+    assert (tmp_path / "ml" / "fitness_cache.sqlite").exists()
+
+    out = tmp_path / "out"
+    cfg["settings"] = {"sampler": "grid", "processes": 1, "fitness_cache": False}
+    path.write_text(json.dumps(cfg))
+    assert _invoke(cli_runner, ["sweep", str(path), "--out", str(out), "--top", "3"]).exit_code == 0
+    assert "9 candidates" in _invoke(cli_runner, ["sweep", str(path), "--out", str(out)]).output
+
+    cfg["settings"] = {"sampler": "grid", "samples": 0, "processes": 1}
+    path.write_text(json.dumps(cfg))
+    result = _invoke(cli_runner, ["sweep", str(path), "--out", str(tmp_path / "empty"), "--no-resume"])
+    assert "No candidates" in result.output
+
+    cfg["settings"] = {"sampler": "sobol"}
+    path.write_text(json.dumps(cfg))
+    assert _invoke(cli_runner, ["sweep", str(path)]).exit_code != 0
+
+
+def test_walk_forward_command(cli_runner, kline_archive, tmp_path, monkeypatch):
+    monkeypatch.setenv("ARCHIVE_PATH", str(tmp_path))
+    cfg = {
+        "strategy": {
+            "symbol": "BTCUSDT",
+            "exchange": "binanceus",
+            "freq": "15Min",
+            "start": "2024-01-01T12:00:00",
+            "stop": "2024-01-03T00:00:00",
+            "datapoints": [
+                {"name": "trend", "transformer": "sma", "args": ["#slow_period"]},
+                {"name": "fast", "transformer": "ema", "args": ["#fast_period"]},
+            ],
+            "enter": [["fast", ">", "trend"]],
+            "exit": [["fast", "<", "trend"]],
+        },
+        "genes": [{"name": "fast_period", "space": [2, 5, 8]}, ["slow_period", {"low": 10, "high": 30}]],
+        "walk_forward": {"train": "18h", "test": "9h"},
+        "settings": {"num_generations": 1, "sol_per_pop": 4, "num_parents_mating": 2, "processes": 1},
+    }
+    path = tmp_path / "wf.json"
+    path.write_text(json.dumps(cfg))
+
+    out = tmp_path / "wf_out"
+    result = _invoke(cli_runner, ["walk_forward", str(path), "--out", str(out)])
+    assert result.exit_code == 0, result.output
+    assert "Out of Sample" in result.output
+    assert len(pd.read_csv(out / "folds.csv")) == 2
+    assert len(pd.read_csv(out / "equity.csv")) == 72
+
+    result = _invoke(cli_runner, ["walk_forward", str(path), "--train", "1D", "--test", "6h", "--step", "12h", "--anchored"])
+    assert result.exit_code == 0, result.output
+    assert "2024-01-02 12:00 → 2024-01-02 18:00" in result.output
+
+    cfg.pop("walk_forward")
+    path.write_text(json.dumps(cfg))
+    assert _invoke(cli_runner, ["walk_forward", str(path)]).exit_code != 0
+
+
 def test_main_and_callback(monkeypatch):
     ctx = mock.Mock()
     ctx.ensure_object = mock.Mock()
@@ -240,7 +240,7 @@ def test_load_latest_ohlcv_rebuilds_corrupt_parquet(archive_env, sample_ohlcv, m
     path = archive_env / "coinbase" / "BTC-USD.parquet"
     path.write_text("not parquet")
     monkeypatch.setattr(
-        "fast_trade.archive.db_helpers._safe_read_parquet",
+        "fast_trade.archive.db_helpers.safe_read_parquet",
         lambda _path: None,
     )
     monkeypatch.setattr(
@@ -1,8 +1,10 @@
 """CLI tests for portfolio commands."""
 
+import json
 import os
 from unittest import mock
 
+import numpy as np
 import pandas as pd
 import pytest
 from typer.testing import CliRunner
@@ -131,3 +133,41 @@ def test_portfolio_stop(cli_runner, tmp_path, monkeypatch):
     pid_file2.write_text("bad")
     with mock.patch("fast_trade.cli._portfolio_paths", return_value={"pid": str(pid_file2)}):
         _invoke(cli_runner, ["portfolio", "stop", "mypf"])
+
+
+def test_portfolio_start_streams_the_datapoints(cli_runner, archive_env, monkeypatch):
+    strategy = archive_env / "strategies" / "ema_cross.json"
+    strategy.write_text(json.dumps({
+        "freq": "1Min",
+        "datapoints": [
+            {"name": "fast", "transformer": "ema", "args": [3]},
+            {"name": "slow", "transformer": "sma", "args": [8]},
+        ],
+        "enter": [["fast", ">", "slow"]],
+        "exit": [["fast", "<", "slow"]],
+    }))
+    close = 100 + np.sin(np.arange(300) / 5)
+    candles = pd.DataFrame(
+        {"open": close, "high": close + 1, "low": close - 1, "close": close, "volume": 1.0},
+        index=pd.date_range("2024-01-01", periods=300, freq="1min"),
+    )
+    prepare = mock.Mock(side_effect=AssertionError("the datapoints are streamed"))
+    monkeypatch.setattr(cli_mod, "prepare_df", prepare)
+    args = ["portfolio", "start", str(strategy), "--no-daemon", "--once", "--name", "streampf"]
+
+    monkeypatch.setattr(cli_mod, "_load_latest_ohlcv", lambda *a, **k: candles.iloc[:200])
+    assert _invoke(cli_runner, args).exit_code == 0
+    state_path = cli_mod._portfolio_paths("streampf")["state"]
+    with open(state_path) as fh:
+        stream = json.load(fh)["stream"]
+    assert stream["last_ts"] == candles.index[198].isoformat()
+    assert [ind["transformer"] for ind in stream["indicators"]] == ["ema", "sma"]
+
+    # the next cycle carries on from the saved state
+    monkeypatch.setattr(cli_mod, "_load_latest_ohlcv", lambda *a, **k: candles.iloc[100:260])
+    assert _invoke(cli_runner, args).exit_code == 0
+    with open(state_path) as fh:
+        state = json.load(fh)
+    assert state["stream"]["last_ts"] == candles.index[258].isoformat()
+    assert state["last_data_ts"] == str(candles.index[259])
+    prepare.assert_not_called()
@@ -2,6 +2,7 @@ import datetime as dt
 import json
 
 import numpy as np
+import pandas as pd
 import pytest
 
 from fast_trade.ml import evolver
@@ -272,6 +273,7 @@ def test_optimize_strategy_ga_path(tmp_path, monkeypatch):
         def __init__(self, **kwargs):
             self.kwargs = kwargs
             self.generations_completed = 0
+            self.last_generation_fitness = None
             self.on_generation = kwargs.get("on_generation")
 
         def run(self):
@@ -279,7 +281,7 @@ def test_optimize_strategy_ga_path(tmp_path, monkeypatch):
             if self.on_generation:
                 self.on_generation(self)
 
-        def best_solution(self):
+        def best_solution(self, pop_fitness=None):
             return [1, 0, 2, 1], 12.34, 0
 
     monkeypatch.setattr(evolver.pygad, "GA", FakeGA)
@@ -360,6 +362,7 @@ def test_optimize_strategy_ga_error_callback(capsys, tmp_path, monkeypatch):
         def __init__(self, **kwargs):
             self.kwargs = kwargs
             self.generations_completed = 0
+            self.last_generation_fitness = None
             self.on_generation = kwargs.get("on_generation")
 
         def run(self):
@@ -368,7 +371,7 @@ def test_optimize_strategy_ga_error_callback(capsys, tmp_path, monkeypatch):
             if self.on_generation:
                 self.on_generation(self)
 
-        def best_solution(self):
+        def best_solution(self, pop_fitness=None):
             return [1], -1e9, 0
 
     monkeypatch.setattr(evolver.pygad, "GA", FakeGA)
@@ -428,11 +431,12 @@ def test_optimize_strategy_default_gene_space_provider(tmp_path, monkeypatch):
     class FakeGA:
         def __init__(self, **kwargs):
             captured["gene_space"] = kwargs.get("gene_space")
+            self.last_generation_fitness = None
 
         def run(self):
             return None
 
-        def best_solution(self):
+        def best_solution(self, pop_fitness=None):
             return [1, 2, 3, 4], 1.0, 0
 
     monkeypatch.setattr(evolver.pygad, "GA", FakeGA)
@@ -449,3 +453,286 @@ def test_optimize_strategy_default_gene_space_provider(tmp_path, monkeypatch):
         sol_per_pop=1,
     )
     assert len(captured["gene_space"]) == 4
+
+
+def _archive_strategy():
+    return {
+        "symbol": "BTCUSDT",
+        "exchange": "binanceus",
+        "freq": "15Min",
+        "start": "2024-01-01T12:00:00",
+        "stop": "2024-01-03T00:00:00",
+        "datapoints": [
+            {"name": "trend", "transformer": "sma", "args": [40]},
+            {"name": "fast", "transformer": "ema", "args": ["#fast_period"]},
+        ],
+        "enter": [["fast", ">", "trend"]],
+        "exit": [["fast", "<", "trend"]],
+    }
+
+
+def test_fitness_data_loads_candles_once_and_memoizes_static_datapoints(kline_archive, monkeypatch):
+    loads = []
+    real_get_kline = evolver.get_kline
+    monkeypatch.setattr(evolver, "get_kline", lambda *a, **k: loads.append(a) or real_get_kline(*a, **k))
+
+    data = evolver.FitnessData()
+    shared = [
+        evolver.fitness_func([period], 0, _archive_strategy(), [("fast_period", None)], fitness_data=data)
+        for period in [5, 8, 13, 5]
+    ]
+    fresh = [
+        evolver.fitness_func([period], 0, _archive_strategy(), [("fast_period", None)])
+        for period in [5, 8, 13, 5]
+    ]
+
+    assert shared == fresh
+    assert len(loads) == 1
+    stats = data.stats()
+    assert stats["candle_loads"] == 1
+    # the sma is only computed for the first individual, the ema once per distinct period
+    assert stats["misses"] == 1 + 3
+    assert stats["hits"] == 3 + 1
+
+
+def test_fitness_data_computes_only_the_compact_metrics(kline_archive):
+    data = evolver.FitnessData()
+    strategy = evolver._solution_strategy([5], _archive_strategy(), [("fast_period", None)])
+    metrics = evolver.compact_metrics()
+    summary = data.run_backtest(strategy, metrics=metrics)["summary"]
+    assert "time_analysis" not in summary and "trade_streaks" not in summary
+
+    full = data.run_backtest(strategy)["summary"]
+    assert evolver.compact_summary(summary) == evolver.compact_summary(full)
+    assert evolver.score_summary(summary) == evolver.score_summary(full)
+
+
+def test_fitness_data_missing_candles(kline_archive, monkeypatch):
+    monkeypatch.setattr(evolver, "get_kline", lambda *a, **k: pd.DataFrame())
+    data = evolver.FitnessData()
+    errors = []
+    fitness = evolver.fitness_func(
+        [5], 0, _archive_strategy(), [("fast_period", None)], error_callback=errors.append, fitness_data=data
+    )
+    assert fitness == -1e9
+    assert "No data found for BTCUSDT on binanceus" in str(errors[0])
+
+
+def test_fitness_data_without_symbol_runs_plain_backtest(monkeypatch):
+    calls = []
+    monkeypatch.setattr(evolver, "run_backtest", lambda s: calls.append(s) or {"summary": {"return_perc": 1.0}})
+    evolver.fitness_func([1], 0, {"datapoints": [], "enter": [], "exit": []}, [("x", 1)], fitness_data=evolver.FitnessData())
+    assert len(calls) == 1
+
+
+def test_fitness_worker_uses_shared_candles(kline_archive):
+    from fast_trade.shared_frame import release_frame, share_frame
+
+    data = evolver.FitnessData()
+    strategy = _archive_strategy()
+    df = data.get_candles(evolver._solution_strategy([5], strategy, [("fast_period", None)]))
+    expected = evolver.evaluate_solution([5], strategy, [("fast_period", None)])
+
+    key = next(iter(data.candles))
+    meta, segment = share_frame(df)
+    try:
+        evolver._init_fitness_worker(strategy, [("fast_period", None)], None, [(key, meta, None)])
+        assert evolver._fitness_task([5]) == expected
+        # nothing left to load in the worker
+        assert evolver._WORKER_FITNESS[3].loads == 0
+    finally:
+        for attached in evolver._WORKER_FITNESS[4]:
+            release_frame(attached)
+        release_frame(segment, unlink=True)
+
+    evolver._init_fitness_worker(strategy, [("fast_period", None)], None, [(key, None, df)])
+    fitness, summary = evolver._fitness_task([5])
+    assert fitness == expected[0]
+    assert summary["num_trades"] == expected[1]["num_trades"]
+    assert set(summary) >= {"return_perc", "win_perc", "drawdown_metrics.max_drawdown_pct"}
+
+
+def test_optimize_strategy_process_pool(kline_archive, monkeypatch):
+    monkeypatch.setenv("ARCHIVE_PATH", str(kline_archive))
+    genes = [("fast_period", {"low": 2, "high": 30})]
+    progress = []
+    mapped, fitness = evolver.optimize_strategy(
+        _archive_strategy(),
+        genes,
+        num_generations=2,
+        sol_per_pop=4,
+        num_parents_mating=2,
+        parallel_processing=["process", 2],
+        progress_callback=progress.append,
+    )
+
+    assert mapped[0][0] == "fast_period"
+    assert fitness == evolver.fitness_func([mapped[0][1]], 0, _archive_strategy(), genes)
+    assert progress[-1]["best_summary"]["num_trades"] > 0
+
+    broken = _archive_strategy()
+    broken["exit"] = [["fast", "<", "missing_column"]]
+    printed = []
+    monkeypatch.setattr("builtins.print", lambda *a, **k: printed.append(" ".join(map(str, a))))
+    progress = []
+    _, fitness = evolver.optimize_strategy(
+        broken,
+        genes,
+        num_generations=1,
+        sol_per_pop=2,
+        num_parents_mating=2,
+        parallel_processing=["process", 2],
+        progress_callback=progress.append,
+    )
+    # the workers fail the backtests, the error makes it back to the parent
+    assert fitness == -1e9
+    assert any("Fitness error" in line for line in printed)
+    assert progress[-1]["best_summary"]["error"]
+
+
+def test_fitness_pool_preloads_population_candles(kline_archive, monkeypatch):
+    started = {}
+
+    class FakePool:
+        def __init__(self, processes, initializer, initargs):
+            started["processes"] = processes
+            started["frames"] = initargs[3]
+
+        def map(self, func, solutions, chunksize):
+            started["chunksize"] = chunksize
+            return [(1.0, {}) for _ in solutions]
+
+        def terminate(self):
+            started["terminated"] = True
+
+        def join(self):
+            pass
+
+    monkeypatch.setattr(evolver.mp, "Pool", FakePool)
+    strategy = _archive_strategy()
+    strategy["freq"] = "#freq"
+    genes = [("fast_period", None), ("freq", None)]
+    # two freqs, one of them twice, and one solution that can't be turned into a strategy
+    population = [[5, 1], [6, 1], [7, 2], [5, "bad"]]
+    with evolver.FitnessPool(strategy, genes, processes=3, population=population) as pool:
+        assert pool.evaluate([[5, 1]] * 30) == [(1.0, {})] * 30
+
+    assert started["processes"] == 3
+    assert started["chunksize"] == 2
+    assert sorted(key[2] for key, _, _ in started["frames"]) == ["15Min", "5Min"]
+    assert all(meta is not None and df is None for _, meta, df in started["frames"])
+    assert started["terminated"]
+
+
+def test_fitness_pool_sends_unshareable_candles(monkeypatch):
+    class FakePool:
+        def __init__(self, processes, initializer, initargs):
+            self.frames = initargs[3]
+
+        def terminate(self):
+            pass
+
+        def join(self):
+            pass
+
+    monkeypatch.setattr(evolver.mp, "Pool", FakePool)
+    data = evolver.FitnessData()
+    data.candles[("BTCUSDT", "binanceus", "1h", None, None)] = pd.DataFrame()
+    pool = evolver.FitnessPool({"datapoints": [], "enter": [], "exit": []}, [], fitness_data=data)
+    assert pool._pool.frames[0][1] is None
+    assert pool._pool.frames[0][2].empty
+    pool.close()
+
+
+def test_fitness_func_skips_strategies_already_evaluated(monkeypatch):
+    from fast_trade.ml.fitness_cache import FitnessCache
+
+    calls = []
+    monkeypatch.setattr(
+        evolver,
+        "run_backtest",
+        lambda s, **kwargs: calls.append(s) or {"summary": {"return_perc": 2.0, "num_trades": 10}},
+    )
+    strategy = {"datapoints": [{"name": "fast", "transformer": "ema", "args": ["#period"]}], "enter": [], "exit": []}
+    index = pd.date_range("2024-01-01", periods=5, freq="1min")
+    data = evolver.FitnessData(df=pd.DataFrame({"close": [1.0, 2.0, 3.0, 4.0, 5.0]}, index=index))
+    cache = FitnessCache()
+    # 13.8 and 14.2 are both rounded to 14 by modify_strategy
+    scores = [
+        evolver.fitness_func([period], 0, strategy, [("period", None)], fitness_data=data, fitness_cache=cache)
+        for period in [13.8, 14.2, 14, 20]
+    ]
+    assert len(set(scores)) == 1
+    assert [s["datapoints"][0]["args"] for s in calls] == [[14], [20]]
+    assert cache.stats()["hits"] == 2
+
+    # other candles (e.g. the archive got new ones) are another key
+    other = evolver.FitnessData(df=pd.DataFrame({"close": [1.0, 2.0, 3.0, 4.0, 6.0]}, index=index))
+    evolver.fitness_func([14], 0, strategy, [("period", None)], fitness_data=other, fitness_cache=cache)
+    assert len(calls) == 3
+    # and the cache isn't used when the candles aren't known
+    evolver.fitness_func([14], 0, strategy, [("period", None)], fitness_cache=cache)
+    assert len(calls) == 4
+    assert cache.stats()["entries"] == 3
+
+    # errors aren't cached, the next evaluation tries again
+    monkeypatch.setattr(evolver, "run_backtest", lambda s, **kwargs: (_ for _ in ()).throw(RuntimeError("boom")))
+    assert evolver.fitness_func([30], 0, strategy, [("period", None)], fitness_data=data, fitness_cache=cache) == -1e9
+    assert evolver.fitness_func([30], 0, strategy, [("period", None)], fitness_data=data, fitness_cache=cache) == -1e9
+    assert cache.stats()["entries"] == 3
+
+
+def test_optimize_strategy_process_mode_skips_cached_and_repeated(monkeypatch, tmp_path):
+    from fast_trade.ml.fitness_cache import FitnessCache
+
+    monkeypatch.setenv("ARCHIVE_PATH", str(tmp_path))
+    evaluated = []
+
+    class FakeFitnessPool:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def evaluate(self, solutions):
+            evaluated.append([int(s[0]) for s in solutions])
+            return [(float(s[0]), {"num_trades": 1}) if s[0] != 3 else (-1e9, {"error": "boom"}) for s in solutions]
+
+        def close(self):
+            pass
+
+    class FakeGA:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+            self.generations_completed = 0
+            self.last_generation_fitness = None
+
+        def run(self):
+            batch = np.array([[1.0], [1.2], [2.0], [3.0], [1.0]])
+            self.last_generation_fitness = self.kwargs["fitness_func"](self, batch, list(range(5)))
+            self.generations_completed = 1
+            self.kwargs["on_generation"](self)
+
+        def best_solution(self, pop_fitness=None):
+            return [2.0], max(pop_fitness), 2
+
+    monkeypatch.setattr(evolver, "FitnessPool", FakeFitnessPool)
+    monkeypatch.setattr(evolver.pygad, "GA", FakeGA)
+    strategy = {"datapoints": [{"name": "fast", "transformer": "ema", "args": ["#period"]}], "enter": [], "exit": []}
+    cache = FitnessCache(str(tmp_path / "fitness_cache.sqlite"))
+    progress = []
+    for _ in range(2):
+        evolver.optimize_strategy(
+            strategy,
+            [("period", {"low": 1, "high": 3})],
+            num_generations=1,
+            sol_per_pop=5,
+            parallel_processing=["process", 2],
+            progress_callback=progress.append,
+            fitness_cache=cache,
+        )
+        cache.close()
+
+    # 1.0 and 1.2 are the same strategy, the second run only retries the one that failed
+    assert evaluated == [[1, 2, 3], [3]]
+    assert progress[0]["cache"]["duplicates"] == 2
+    assert progress[1]["cache"]["hits"] == 2
+    assert progress[1]["best_summary"] == {"num_trades": 1}
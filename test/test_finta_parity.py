@@ -0,0 +1,234 @@
+"""The vectorized finta indicators against the row-by-row versions they replaced."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fast_trade.finta import TA
+
+
+# ---------------------------------------------------------------------------
+# The row-by-row versions, as they were before they were vectorized
+# ---------------------------------------------------------------------------
+
+def legacy_kama(ohlc, er=10, ema_fast=2, ema_slow=30, period=20):
+    er = TA.ER(ohlc, er)
+    fast_alpha, slow_alpha = 2 / (ema_fast + 1), 2 / (ema_slow + 1)
+    sc = pd.Series((er * (fast_alpha - slow_alpha) + slow_alpha) ** 2)
+    sma = ohlc["close"].rolling(period).mean()
+    kama = []
+    for s, ma, price in zip(sc.items(), sma.shift().items(), ohlc["close"].items()):
+        try:
+            kama.append(kama[-1] + s[1] * (price[1] - kama[-1]))
+        except (IndexError, TypeError):
+            kama.append(ma[1] + s[1] * (price[1] - ma[1]) if pd.notnull(ma[1]) else None)
+    return pd.Series(kama, index=ohlc.index, name="{0} period KAMA.".format(period))
+
+
+def legacy_wma(ohlc, period=9):
+    d = (period * (period + 1)) / 2
+    weights = np.arange(1, period + 1)
+    wma = ohlc["close"].rolling(period, min_periods=period).apply(lambda x: (weights * x).sum() / d, raw=True)
+    return pd.Series(wma, name="{0} period WMA.".format(period))
+
+
+def legacy_evwma(ohlcv, period=20):
+    vol_sum = ohlcv["volume"].rolling(window=period).sum()
+    x = (vol_sum - ohlcv["volume"]) / vol_sum
+    y = (ohlcv["volume"] * ohlcv["close"]) / vol_sum
+    evwma = [0]
+    for x, y in zip(x.fillna(0).items(), y.items()):
+        evwma.append(0 if x[1] == 0 or y[1] == 0 else evwma[-1] * x[1] + y[1])
+    return pd.Series(evwma[1:], index=ohlcv.index, name="{0} period EVWMA.".format(period))
+
+
+def legacy_sar(ohlc, af=0.02, amax=0.2):
+    high, low = ohlc.high.values, ohlc.low.values
+    sig0, xpt0, af0 = True, high[0], af
+    _sar = [low[0] - (ohlc.high - ohlc.low).std()]
+    for i in range(1, len(ohlc)):
+        sig1, xpt1, af1 = sig0, xpt0, af0
+        lmin = min(low[i - 1], low[i])
+        lmax = max(high[i - 1], high[i])
+        if sig1:
+            sig0 = low[i] > _sar[-1]
+            xpt0 = max(lmax, xpt1)
+        else:
+            sig0 = high[i] >= _sar[-1]
+            xpt0 = min(lmin, xpt1)
+        if sig0 == sig1:
+            sari = _sar[-1] + (xpt1 - _sar[-1]) * af1
+            af0 = min(amax, af1 + af)
+            if sig0:
+                af0 = af0 if xpt0 > xpt1 else af1
+                sari = min(sari, lmin)
+            else:
+                af0 = af0 if xpt0 < xpt1 else af1
+                sari = max(sari, lmax)
+        else:
+            af0 = af
+            sari = xpt0
+        _sar.append(sari)
+    return pd.Series(_sar, index=ohlc.index)
+
+
+def legacy_uo(ohlc):
+    k = [min(row.low, _row.close) for row, _row in zip(ohlc.itertuples(), ohlc.shift(1).itertuples())]
+    bp = pd.Series(ohlc["close"] - k, name="bp")
+    averages = [bp.rolling(window=w).sum() / TA.TR(ohlc).rolling(window=w).sum() for w in (7, 14, 28)]
+    return pd.Series((100 * ((4 * averages[0]) + (2 * averages[1]) + averages[2])) / (4 + 2 + 1))
+
+
+def legacy_dmi(ohlc, period=14, adjust=True):
+    ohlc = ohlc.copy()
+    ohlc["up_move"] = ohlc["high"].diff()
+    ohlc["down_move"] = -ohlc["low"].diff()
+    ohlc["plus"] = ohlc.apply(
+        lambda row: row["up_move"] if row["up_move"] > row["down_move"] and row["up_move"] > 0 else 0, axis=1
+    )
+    ohlc["minus"] = ohlc.apply(
+        lambda row: row["down_move"] if row["down_move"] > row["up_move"] and row["down_move"] > 0 else 0, axis=1
+    )
+    diplus = pd.Series(
+        100 * (ohlc["plus"] / TA.ATR(ohlc, period)).ewm(alpha=1 / period, adjust=adjust).mean(), name="DI_PLUS"
+    )
+    diminus = pd.Series(
+        100 * (ohlc["minus"] / TA.ATR(ohlc, period)).ewm(alpha=1 / period, adjust=adjust).mean(), name="DI_MINUS"
+    )
+    return pd.concat([diplus, diminus], axis=1)
+
+
+def legacy_mfi(ohlc, period=14):
+    tp = TA.TP(ohlc)
+    _mf = pd.concat([tp, pd.Series(tp * ohlc["volume"], name="rmf")], axis=1)
+    _mf["delta"] = _mf["TP"].diff()
+    _mf["neg"] = _mf.apply(lambda row: row["rmf"] if row["delta"] < 0 else 0, axis=1)
+    _mf["pos"] = _mf.apply(lambda row: row["rmf"] if row["delta"] > 0 else 0, axis=1)
+    mfratio = pd.Series(_mf["pos"].rolling(window=period).sum() / _mf["neg"].rolling(window=period).sum())
+    return pd.Series(100 - (100 / (1 + mfratio)), name="{0} period MFI".format(period))
+
+
+def legacy_cci(ohlc, period=20, constant=0.015):
+    tp = TA.TP(ohlc)
+    tp_rolling = tp.rolling(window=period, min_periods=0)
+    mad = tp_rolling.apply(lambda s: abs(s - s.mean()).mean(), raw=True)
+    return pd.Series((tp - tp_rolling.mean()) / (constant * mad), name="{0} period CCI".format(period))
+
+
+def legacy_sqzmi(ohlc, period=20):
+    bb = TA.BBANDS(ohlc, period=period, MA=pd.Series(TA.SMA(ohlc, period)))
+    kc = TA.KC(ohlc, period=period, kc_mult=1.5)
+    comb = pd.concat([bb, kc], axis=1)
+    comb["SQZ"] = comb.apply(
+        lambda row: bool(row["BB_LOWER"] > row["KC_LOWER"] and row["BB_UPPER"] < row["KC_UPPER"]), axis=1
+    )
+    return pd.Series(comb["SQZ"], name="{0} period SQZMI".format(period))
+
+
+def legacy_fve(ohlc, period=22, factor=0.3):
+    hl2 = (ohlc["high"] + ohlc["low"]) / 2
+    smav = ohlc["volume"].rolling(window=period).mean()
+    mf = pd.Series((ohlc["close"] - hl2 + TA.TP(ohlc).diff()), name="mf")
+    _mf = pd.concat([ohlc["close"], ohlc["volume"], mf], axis=1)
+
+    def vol_shift(row):
+        if row["mf"] > factor * row["close"] / 100:
+            return row["volume"]
+        elif row["mf"] < -factor * row["close"] / 100:
+            return -row["volume"]
+        return 0
+
+    _sum = _mf.apply(vol_shift, axis=1).rolling(window=period).sum()
+    return pd.Series((_sum / smav) / period * 100)
+
+
+def legacy_vfi(ohlc, period=130, smoothing_factor=3, factor=0.2, vfactor=2.5, adjust=True):
+    typical = TA.TP(ohlc)
+    vinter = typical.apply(np.log).diff().rolling(window=30).std()
+    cutoff = pd.Series(factor * vinter * ohlc["close"], name="cutoff")
+    price_change = pd.Series(typical.diff(), name="pc")
+    mav = pd.Series(ohlc["volume"].rolling(center=False, window=period).mean(), name="mav")
+    _va = pd.concat([ohlc["volume"], mav.shift()], axis=1)
+    _mp = pd.concat([price_change, cutoff], axis=1).fillna(value=0)
+    added_vol = _va.apply(lambda row: vfactor * row["mav"] if row["volume"] > vfactor * row["mav"] else row["volume"], axis=1)
+
+    def _multiplier(row):
+        if row["pc"] > row["cutoff"]:
+            return 1
+        elif row["pc"] < 0 - row["cutoff"]:
+            return -1
+        return 0
+
+    raw_sum = (_mp.apply(_multiplier, axis=1) * added_vol).rolling(window=period).sum()
+    raw_value = raw_sum / mav.shift()
+    return pd.Series(
+        raw_value.ewm(ignore_na=False, min_periods=smoothing_factor - 1, span=smoothing_factor, adjust=adjust).mean(),
+        name="VFI",
+    )
+
+
+# ---------------------------------------------------------------------------
+# Parity
+# ---------------------------------------------------------------------------
+
+def _ohlcv(rows, seed):
+    """Random walk candles with zero volume bars and a few rows of NaNs."""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, rows)))
+    volume = rng.integers(0, 1000, rows).astype(float)
+    volume[rng.random(rows) < 0.2] = 0
+    df = pd.DataFrame(
+        {
+            "open": close * (1 + rng.normal(0, 0.003, rows)),
+            "high": close * (1 + np.abs(rng.normal(0, 0.005, rows))),
+            "low": close * (1 - np.abs(rng.normal(0, 0.005, rows))),
+            "close": close,
+            "volume": volume,
+        },
+        index=pd.date_range("2024-01-01", periods=rows, freq="1min"),
+    )
+    if seed % 2:
+        df.iloc[rng.integers(0, rows, 3)] = np.nan
+    return df
+
+
+CASES = [
+    ("KAMA", legacy_kama, {}),
+    ("KAMA", legacy_kama, {"er": 3, "period": 5}),
+    ("WMA", legacy_wma, {}),
+    ("WMA", legacy_wma, {"period": 2}),
+    ("EVWMA", legacy_evwma, {}),
+    ("SAR", legacy_sar, {}),
+    ("UO", legacy_uo, {}),
+    ("DMI", legacy_dmi, {}),
+    ("DMI", legacy_dmi, {"period": 5, "adjust": False}),
+    ("MFI", legacy_mfi, {}),
+    ("CCI", legacy_cci, {}),
+    ("CCI", legacy_cci, {"period": 3}),
+    ("SQZMI", legacy_sqzmi, {}),
+    ("FVE", legacy_fve, {}),
+    ("VFI", legacy_vfi, {}),
+    ("VFI", legacy_vfi, {"period": 20, "adjust": False}),
+]
+
+
+@pytest.mark.parametrize("rows", [1, 4, 30, 400])
+@pytest.mark.parametrize("seed", [0, 1, 2, 3])
+@pytest.mark.parametrize("name,legacy,kwargs", CASES)
+def test_vectorized_matches_legacy(name, legacy, kwargs, rows, seed):
+    df = _ohlcv(rows, seed)
+    expected = legacy(df.copy(), **kwargs)
+    result = getattr(TA, name)(df, **kwargs)
+    if isinstance(expected, pd.DataFrame):
+        pd.testing.assert_frame_equal(result, expected, check_exact=True)
+    else:
+        pd.testing.assert_series_equal(result, expected, check_exact=True)
+
+
+def test_vectorized_indicators_leave_the_frame_alone():
+    df = _ohlcv(50, 1)
+    before = df.copy()
+    for name, _, kwargs in CASES:
+        getattr(TA, name)(df, **kwargs)
+    pd.testing.assert_frame_equal(df, before)
+
@@ -0,0 +1,67 @@
+import datetime
+
+import numpy as np
+
+from fast_trade.ml.fitness_cache import FitnessCache, default_cache_path, strategy_hash
+
+
+def _strategy(period):
+    return {
+        "freq": "5Min",
+        "datapoints": [{"name": "fast", "transformer": "ema", "args": [period]}],
+        "enter": [["close", ">", "fast"]],
+        "exit": [["close", "<", "fast"]],
+        "completed_at": datetime.datetime.now().isoformat(),
+    }
+
+
+def test_strategy_hash_is_canonical():
+    key = strategy_hash(_strategy(14))
+    assert strategy_hash(_strategy(14.0)) == key
+    assert strategy_hash(_strategy(np.int64(14))) == key
+    # completed_at changes on every run and doesn't change the backtest
+    assert strategy_hash({**_strategy(14), "completed_at": "later"}) == key
+
+    assert strategy_hash(_strategy(15)) != key
+    assert strategy_hash(_strategy(14.5)) != key
+    assert strategy_hash(_strategy(14), {"preset": "conservative"}) != key
+    # the candles are part of it
+    assert strategy_hash(_strategy(14), data="abc") != key
+    assert strategy_hash(_strategy(14), data="abc") != strategy_hash(_strategy(14), data="abd")
+    assert strategy_hash({**_strategy(14), "start": datetime.datetime(2024, 1, 1)}) == strategy_hash(
+        {**_strategy(14), "start": "2024-01-01T00:00:00"}
+    )
+
+
+def test_fitness_cache_in_memory():
+    cache = FitnessCache()
+    assert cache.get("a") is None
+    cache.put("a", 1.5, {"num_trades": 3})
+    assert cache.get("a") == (1.5, {"num_trades": 3})
+    assert cache.stats() == {"hits": 1, "disk_hits": 0, "misses": 1, "entries": 1, "hit_rate": 0.5}
+    assert FitnessCache().stats()["hit_rate"] == 0.0
+    cache.close()
+
+
+def test_fitness_cache_persists_across_runs(tmp_path):
+    path = tmp_path / "ml" / "fitness_cache.sqlite"
+    first = FitnessCache(str(path))
+    assert not path.exists()
+    first.put("a", 2.0, {"return_perc": np.float64(4.0), "sharpe_ratio": 0.25})
+    first.close()
+    first.close()
+
+    resumed = FitnessCache(str(path))
+    assert resumed.get("a") == (2.0, {"return_perc": 4, "sharpe_ratio": 0.25})
+    assert resumed.get("a") == (2.0, {"return_perc": 4, "sharpe_ratio": 0.25})
+    assert resumed.get("b") is None
+    assert resumed.stats()["disk_hits"] == 1
+    assert resumed.stats()["hits"] == 1
+    resumed.close()
+
+
+def test_default_cache_path(monkeypatch, tmp_path):
+    monkeypatch.setenv("ARCHIVE_PATH", str(tmp_path))
+    assert default_cache_path() == str(tmp_path / "ml" / "fitness_cache.sqlite")
+    monkeypatch.setenv("ARCHIVE_PATH", str(tmp_path / "ml"))
+    assert default_cache_path() == str(tmp_path / "ml" / "fitness_cache.sqlite")
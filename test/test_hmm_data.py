@@ -7,6 +7,7 @@ import numpy as np
 import pandas as pd
 import pytest
 
+from fast_trade.archive.db_helpers import KLINE_PART_PREFIX
 from fast_trade.ml import hmm_data
 
 
@@ -57,7 +58,7 @@ def test_load_archive_candles(tmp_path, monkeypatch):
     with pytest.raises(FileNotFoundError):
         hmm_data.load_archive_candles("MISSING", exchange)
 
-    monkeypatch.setattr(hmm_data, "_safe_read_parquet", lambda _path: None)
+    monkeypatch.setattr(hmm_data, "read_kline_archive", lambda *a, **k: None)
     with pytest.raises(RuntimeError, match="unreadable"):
         hmm_data.load_archive_candles(symbol, exchange)
 
@@ -190,8 +191,12 @@ def test_local_archive_symbols(tmp_path, monkeypatch):
     (exchange_dir / "BTC-USD.parquet").write_text("x", encoding="utf-8")
     (exchange_dir / "ETH-USD.sqlite").write_text("x", encoding="utf-8")
     (exchange_dir / "_meta.json").write_text("x", encoding="utf-8")
+    sol_month = exchange_dir / "SOL-USD" / "year=2024" / "month=01"
+    sol_month.mkdir(parents=True)
+    (sol_month / f"{KLINE_PART_PREFIX}0.parquet").write_text("x", encoding="utf-8")
+    (exchange_dir / "XRP-USD" / "year=2024").mkdir(parents=True)
     monkeypatch.setattr(hmm_data, "ARCHIVE_PATH", str(tmp_path))
-    assert hmm_data._local_archive_symbols("coinbase") == ["BTC-USD", "ETH-USD"]
+    assert hmm_data._local_archive_symbols("coinbase") == ["BTC-USD", "ETH-USD", "SOL-USD"]
     assert hmm_data._local_archive_symbols("missing") == []
 
 
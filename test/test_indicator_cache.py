@@ -0,0 +1,212 @@
+from unittest import mock
+
+import pandas as pd
+
+from fast_trade.build_data_frame import apply_transformers_to_dataframe
+from fast_trade.indicator_cache import IndicatorCache, data_fingerprint
+from fast_trade.transformers_map import transformers_map
+
+
+def _ohlcv():
+    df = pd.read_csv("./test/ohlcv_data.csv.txt").set_index("date")
+    df.index = pd.to_datetime(df.index, unit="s")
+    return df
+
+
+def test_data_fingerprint_ignores_indicator_columns():
+    df = _ohlcv()
+    with_indicator = df.assign(rsi=1.0)
+    assert data_fingerprint(df) == data_fingerprint(with_indicator)
+
+    changed = df.copy()
+    changed.iloc[3, changed.columns.get_loc("close")] += 1
+    assert data_fingerprint(df) != data_fingerprint(changed)
+
+    as_strings = df.astype({"volume": str})
+    assert data_fingerprint(as_strings) != data_fingerprint(df)
+    assert data_fingerprint(df[["close"]]) != data_fingerprint(df)
+
+
+def test_is_cacheable_rejects_computed_column_args():
+    df = _ohlcv().assign(rsi=1.0)
+    assert IndicatorCache.is_cacheable(df, [14, "close"])
+    assert not IndicatorCache.is_cacheable(df, [14, "rsi"])
+
+
+def test_make_key_depends_on_every_part():
+    key = IndicatorCache.make_key("abc", "sma", transformers_map["sma"], [20], None)
+    assert key == IndicatorCache.make_key("abc", "sma", transformers_map["sma"], [20], None)
+    assert key != IndicatorCache.make_key("abd", "sma", transformers_map["sma"], [20], None)
+    assert key != IndicatorCache.make_key("abc", "sma", transformers_map["sma"], [21], None)
+    assert key != IndicatorCache.make_key("abc", "sma", transformers_map["sma"], [20], "1h")
+    assert key != IndicatorCache.make_key("abc", "sma", transformers_map["ema"], [20], None)
+    # a new cache version misses the parquet files written by the old code
+    resampled = IndicatorCache.resample_key("abc", "1h")
+    with mock.patch("fast_trade.indicator_cache.CACHE_VERSION", 2):
+        assert key != IndicatorCache.make_key("abc", "sma", transformers_map["sma"], [20], None)
+        assert resampled != IndicatorCache.resample_key("abc", "1h")
+
+
+def test_lru_eviction_and_counters():
+    value = pd.Series(range(10), dtype=float)
+    size = int(value.memory_usage(index=True))
+    cache = IndicatorCache(max_bytes=size * 2)
+
+    cache.put("a", value)
+    cache.put("b", value)
+    assert cache.get("a") is not None  # "b" is now the least recently used
+    cache.put("c", value)
+
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+    cache.put("c", value)
+    assert cache.stats() == {
+        "hits": 2,
+        "disk_hits": 0,
+        "misses": 1,
+        "evictions": 1,
+        "entries": 2,
+        "bytes": size * 2,
+        "max_bytes": size * 2,
+    }
+
+    cache.put("too_big", pd.Series(range(1000), dtype=float))
+    assert cache.get("too_big") is None
+
+    cache.clear()
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["hits"] == 0
+
+
+def test_disk_cache_round_trips_series_and_frames(tmp_path):
+    series = pd.Series([1.0, 2.0], index=pd.date_range("2024-01-01", periods=2, freq="h"), name="SMA")
+    frame = pd.DataFrame({"MACD": [1.0, 2.0], "SIGNAL": [0.5, 1.5]}, index=series.index)
+    IndicatorCache(path=str(tmp_path)).put("s", series)
+    IndicatorCache(path=str(tmp_path)).put("f", frame)
+
+    cache = IndicatorCache(path=str(tmp_path))
+    cached_series = cache.get("s")
+    cached_frame = cache.get("f")
+
+    assert isinstance(cached_series, pd.Series)
+    assert list(cached_series) == [1.0, 2.0]
+    pd.testing.assert_frame_equal(cached_frame, frame, check_freq=False)
+    assert cache.get("s") is not cached_series
+    assert cache.stats()["disk_hits"] == 2
+    assert cache.stats()["hits"] == 1
+
+
+def test_get_returns_copies(tmp_path):
+    IndicatorCache(path=str(tmp_path)).put("s", pd.Series([1.0, 2.0]))
+    cache = IndicatorCache(path=str(tmp_path))
+
+    from_disk = cache.get("s")
+    from_disk.iloc[0] = 10.0
+    from_memory = cache.get("s")
+    from_memory.iloc[1] = 20.0
+
+    assert list(cache.get("s")) == [1.0, 2.0]
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.stats()["hits"] == 2
+
+
+def test_disk_write_failure_keeps_memory_entry(tmp_path):
+    cache = IndicatorCache(path=str(tmp_path))
+    with mock.patch(
+        "fast_trade.indicator_cache.atomic_write_parquet", side_effect=ValueError("bad")
+    ):
+        cache.put("s", pd.Series([1.0]))
+    assert cache.get("s") is not None
+    assert not list(tmp_path.iterdir())
+
+
+def test_apply_transformers_reuses_cached_results():
+    df = _ohlcv()
+    cache = IndicatorCache()
+    datapoints = [
+        {"transformer": "sma", "name": "sma_3", "args": [3]},
+        {"transformer": "macd", "name": "macd", "args": [2, 3, 2]},
+        {"transformer": "sma", "name": "sma_on_sma", "args": [2, "sma_3"]},
+    ]
+
+    first = apply_transformers_to_dataframe(df.copy(), datapoints, cache=cache)
+    sma = mock.Mock(wraps=transformers_map["sma"])
+    with mock.patch.dict(transformers_map, {"sma": sma}):
+        second = apply_transformers_to_dataframe(df.copy(), datapoints, cache=cache)
+
+    pd.testing.assert_frame_equal(first, second)
+    # the mock is a different function so sma_3 is recomputed, and sma_on_sma never caches
+    assert sma.call_count == 2
+    assert cache.stats()["hits"] == 1
+
+    uncached = apply_transformers_to_dataframe(df.copy(), datapoints, cache=None)
+    pd.testing.assert_frame_equal(first, uncached)
+
+
+def test_resampled_candles_by_fingerprint():
+    df = _ohlcv()
+    hourly = df.resample("1h").last()
+    cache = IndicatorCache(max_bytes=int(hourly.memory_usage(index=True).sum()) * 2 + 1)
+    assert cache.get_resampled("abc", "1h") is None
+
+    cache.put_resampled("abc", "1h", hourly)
+    cache.put_resampled("abc", "2h", hourly)
+    pd.testing.assert_frame_equal(cache.get_resampled("abc", "1h"), hourly)
+    assert set(cache.resampled("abc")) == {"1h", "2h"}
+    assert cache.resampled("abd") == {}
+
+    # the evicted ones are dropped, from the index too
+    cache.put_resampled("abd", "1h", hourly)
+    assert set(cache.resampled("abc")) == {"1h"}
+    assert len(cache._resampled) == 2
+    for fingerprint in ["f1", "f2", "f3"]:
+        cache.put_resampled(fingerprint, "1h", hourly)
+    assert sorted(owner for owner, _ in cache._resampled.values()) == ["f2", "f3"]
+    # one that doesn't fit isn't indexed
+    cache.put_resampled("big", "1h", pd.concat([hourly] * 3))
+    assert cache.resampled("big") == {}
+    cache.clear()
+    assert cache.resampled("abd") == {}
+
+
+def _candles():
+    """An hour of one minute candles without gaps."""
+    close = pd.Series(range(100, 160), index=pd.date_range("2024-01-01", periods=60, freq="1min"), dtype=float)
+    return pd.DataFrame({"open": close, "high": close + 1, "low": close - 1, "close": close, "volume": 1.0})
+
+
+def test_apply_transformers_reuses_the_resampled_candles():
+    df = _candles()
+    cache = IndicatorCache()
+    datapoints = [
+        {"transformer": "sma", "name": "sma_3", "args": [3], "freq": "2Min"},
+        {"transformer": "ema", "name": "ema_3", "args": [3], "freq": "4Min"},
+        {"transformer": "rsi", "name": "rsi_3", "args": [3], "freq": "4Min"},
+        {"transformer": "sma", "name": "sma_4", "args": [4], "freq": "4Min"},
+    ]
+    resample = pd.DataFrame.resample
+    with mock.patch.object(pd.DataFrame, "resample", autospec=True, side_effect=resample) as spy:
+        first = apply_transformers_to_dataframe(df.copy(), datapoints, cache=cache)
+        # the candles go to 2Min once and 4Min is built from that
+        assert [(len(call.args[0]), call.args[1]) for call in spy.call_args_list] == [(60, "2Min"), (30, "4Min")]
+
+        spy.reset_mock()
+        other = [{**dp, "args": [5]} for dp in datapoints]
+        second = apply_transformers_to_dataframe(df.copy(), other, cache=cache)
+        assert spy.call_count == 0
+
+    pd.testing.assert_frame_equal(first, apply_transformers_to_dataframe(df.copy(), datapoints, cache=None))
+    pd.testing.assert_frame_equal(second, apply_transformers_to_dataframe(df.copy(), other, cache=None))
+
+
+def test_apply_transformers_fingerprints_a_replaced_candle_column():
+    df = _candles()
+    datapoints = [
+        {"transformer": "sma", "name": "sma_3", "args": [3]},
+        {"transformer": "sma", "name": "close", "args": [2]},
+        {"transformer": "sma", "name": "smooth", "args": [3]},
+        {"transformer": "sma", "name": "hourly", "args": [3], "freq": "2Min"},
+    ]
+    cached = apply_transformers_to_dataframe(df.copy(), datapoints, cache=IndicatorCache())
+    pd.testing.assert_frame_equal(cached, apply_transformers_to_dataframe(df.copy(), datapoints, cache=None))
+    assert not cached["smooth"].equals(cached["sma_3"])
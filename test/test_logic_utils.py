@@ -3,6 +3,7 @@ import pandas as pd
 from fast_trade.logic_utils import (
     build_mask,
     can_vectorize_logic,
+    confirm_frames,
     max_last_frames,
     vectorized_actions,
 )
@@ -90,3 +91,19 @@ def test_vectorized_actions_priority_and_any_enter():
     }
     actions = vectorized_actions(df, backtest)
     assert list(actions) == ["h", "ae", "ae"]
+
+
+def test_confirm_frames_requires_consecutive_rows():
+    condition = pd.Series([True, True, False, True, True, True, True])
+    assert list(confirm_frames(condition, 3)) == [False, False, False, False, False, True, True]
+    assert confirm_frames(condition, 1) is condition
+    assert not confirm_frames(condition.head(2), 3).any()
+
+
+def test_build_mask_applies_confirmation_frames():
+    df = _sample_df()
+    mask = build_mask(df, [["close", ">", 1, 2]], combine_any=False)
+    assert list(mask) == [False, True, True]
+
+    any_mask = build_mask(df, [["close", ">", 100], ["signal", ">", 0, 2]], combine_any=True)
+    assert list(any_mask) == [False, False, True]
@@ -120,6 +120,14 @@ def test_assets_uses_cli(monkeypatch):
         ("validate", ("strategy.yml",), ["validate", "strategy.yml"]),
         ("update_archive", (), ["update_archive"]),
         ("evolve", ("evolver.yml",), ["evolve", "evolver.yml"]),
+        ("sweep", ("sweep.yml",), ["sweep", "sweep.yml"]),
+        ("sweep", ("sweep.yml", "out", False), ["sweep", "sweep.yml", "--out", "out", "--no-resume"]),
+        ("walk_forward", ("wf.yml",), ["walk_forward", "wf.yml"]),
+        (
+            "walk_forward",
+            ("wf.yml", "30D", "7D", "out"),
+            ["walk_forward", "wf.yml", "--train", "30D", "--test", "7D", "--out", "out"],
+        ),
         (
             "screen_hmm",
             (),
@@ -7,8 +7,12 @@ import pandas as pd
 import pytest
 
 from fast_trade.run_analysis import (
+    ACTION_ENTER,
+    ACTION_EXIT,
+    ACTION_HOLD,
     _encode_actions,
     _simulate_account_path,
+    _transition_indices,
     apply_logic_to_df,
 )
 
@@ -74,3 +78,78 @@ def test_apply_logic_fallback_exit_on_end_and_progress():
     assert len(out) == 4
     assert out.iloc[-1]["in_trade"] == False
     assert progress[-1]["percent"] == 100
+
+
+def _row_by_row_simulation(action_codes, close_prices, base_balance, comission, lot_size, max_lot_size):
+    """The per-row loop the event driven simulator replaced, kept as the parity reference."""
+    n = len(action_codes)
+    out = {key: np.zeros(n, dtype=float) for key in ["account_value", "aux", "fee"]}
+    out["in_trade"] = np.zeros(n, dtype=bool)
+    fee_rate = comission / 100 if comission else 0.0
+    in_trade = False
+    cash_value = base_balance
+    aux_value = 0.0
+    for i in range(n):
+        close = close_prices[i]
+        fee = 0.0
+        if action_codes[i] == ACTION_ENTER and not in_trade:
+            base_transaction_amount = cash_value * lot_size
+            if max_lot_size and base_transaction_amount > max_lot_size:
+                base_transaction_amount = max_lot_size
+            aux_value = round(base_transaction_amount / close, 8) if base_transaction_amount else 0.0
+            fee = round(aux_value * fee_rate, 8) if fee_rate and aux_value else 0.0
+            aux_value = aux_value - fee
+            cash_value = round(cash_value - base_transaction_amount, 8)
+            in_trade = True
+        elif action_codes[i] == ACTION_EXIT and in_trade:
+            base_value = round(aux_value * close, 8) if aux_value else 0.0
+            fee = round(base_value * fee_rate, 8) if fee_rate and base_value else 0.0
+            cash_value = round(cash_value + base_value - fee, 8)
+            aux_value = 0.0
+            in_trade = False
+        out["account_value"][i] = cash_value
+        out["aux"][i] = aux_value
+        out["in_trade"][i] = in_trade
+        out["fee"][i] = fee
+    out["adj_account_value"] = out["account_value"] + np.round(out["aux"] * close_prices, 8)
+    return out
+
+
+def test_transition_indices_skip_repeated_actions():
+    codes = _encode_actions(np.array(["x", "h", "e", "ae", "h", "x", "tsl", "e", "h"]))
+    assert list(_transition_indices(codes)) == [2, 5, 7]
+    assert len(_transition_indices(_encode_actions(np.array([], dtype=object)))) == 0
+
+
+@pytest.mark.parametrize("comission,lot_size,max_lot_size", [(0.0, 1.0, 0), (0.1, 0.333, 0), (1.0, 0.5, 100.0)])
+def test_simulate_account_path_matches_row_by_row_bit_for_bit(comission, lot_size, max_lot_size):
+    rng = np.random.default_rng(11)
+    codes = rng.choice([ACTION_HOLD] * 3 + [ACTION_ENTER, ACTION_EXIT], 2000).astype(np.int8)
+    closes = rng.uniform(0.01, 50000.0, 2000)
+    closes[100] = np.nan
+    kwargs = {
+        "base_balance": 1234.5678,
+        "comission": comission,
+        "lot_size": lot_size,
+        "max_lot_size": max_lot_size,
+    }
+
+    sim = _simulate_account_path(codes, closes, **kwargs)
+    expected = _row_by_row_simulation(codes, closes, **kwargs)
+
+    for key, values in expected.items():
+        assert sim[key].dtype == values.dtype
+        assert sim[key].tobytes() == values.tobytes(), key
+
+
+def test_simulate_account_path_without_trades():
+    sim = _simulate_account_path(
+        action_codes=_encode_actions(np.array(["h", "x", "h"])),
+        close_prices=np.array([10.0, 11.0, 12.0]),
+        base_balance=1000.0,
+        comission=0.0,
+        lot_size=1.0,
+        max_lot_size=0,
+    )
+    assert list(sim["account_value"]) == [1000.0, 1000.0, 1000.0]
+    assert not sim["in_trade"].any()
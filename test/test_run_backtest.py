@@ -9,9 +9,12 @@ from fast_trade.run_backtest import (
     determine_action,
     determine_action_compiled,
     apply_backtest_to_df,
+    _row_actions,
 )
+from fast_trade.logic_utils import max_last_frames
 
 from collections import namedtuple
+import numpy as np
 import pandas as pd
 
 
@@ -899,3 +902,48 @@ def test_determine_action_compiled_matches_runtime_logic():
         compiled,
         last_frames=last_frames,
     )
+
+
+def test_proccess_logic_and_actions_confirmations_match_row_loop():
+    rng = np.random.default_rng(7)
+    mock_df = pd.DataFrame(
+        {
+            "close": rng.normal(100, 5, 500),
+            "ind_1": rng.integers(0, 10, 500),
+            "ind_2": rng.normal(100, 5, 500),
+        },
+        index=pd.date_range("2024-01-01", periods=500, freq="min"),
+    )
+    mock_df.loc[mock_df.index[::17], "ind_2"] = np.nan
+    mock_df["trailing_stop_loss"] = mock_df["close"].cummax() * 0.9
+    mock_backtest = {
+        "trailing_stop_loss": 0.1,
+        "enter": [["ind_1", "<", 6, 3], ["close", ">", "ind_2"]],
+        "any_enter": [["ind_1", "=", 0, 2], ["close", "<", 95, 4]],
+        "exit": [["ind_1", ">=", 4, 2], ["close", "<", "ind_2", 2]],
+        "any_exit": [["ind_1", "!=", 5, 5], ["close", "<=", 90]],
+    }
+
+    res = process_logic_and_generate_actions(mock_df.copy(), mock_backtest)
+    row_actions = _row_actions(mock_df, compile_action_logic(mock_backtest), max_last_frames(mock_backtest))
+
+    assert set(res.action) > {"h"}
+    assert list(res.action.values) == row_actions
+
+
+def test_proccess_logic_and_actions_confirmations_non_vectorized():
+    mock_df = pd.read_csv("./test/ohlcv_data.csv.txt", parse_dates=True).set_index(
+        "date"
+    )
+    mock_df["ind_1"] = [5, 5, 5, 2, 6, 7, 9, 9, 1]
+    # a numeric string can't be vectorized, so this takes the row loop
+    mock_backtest = {
+        "enter": [["ind_1", "=", "5", 2]],
+        "any_enter": [],
+        "exit": [["ind_1", ">", "6", 3]],
+        "any_exit": [],
+    }
+
+    res = process_logic_and_generate_actions(mock_df, mock_backtest)
+
+    assert list(res.action.values) == ["h", "e", "e", "h", "h", "h", "h", "x", "h"]
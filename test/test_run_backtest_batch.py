@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fast_trade import run_backtest, run_backtest_batch
+from fast_trade.indicator_cache import IndicatorCache
+from fast_trade.logic_utils import action_code_matrix, build_mask, build_mask_matrix
+from fast_trade.run_analysis import ACTION_ENTER, ACTION_EXIT, _encode_actions
+from fast_trade.run_backtest import BacktestKeyError, MissingData, vectorized_actions
+from fast_trade.run_backtest_batch import BATCH_SUMMARY_KEYS, _group_backtests
+
+
+def _candles(rows=3000, seed=7):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.003, rows)))
+    index = pd.date_range("2024-01-01", periods=rows, freq="1min")
+    return pd.DataFrame(
+        {
+            "open": close * (1 + rng.normal(0, 0.001, rows)),
+            "high": close * 1.002,
+            "low": close * 0.998,
+            "close": close,
+            "volume": rng.integers(100, 10000, rows).astype(float),
+        },
+        index=index,
+    )
+
+
+def _strategy(fast=10, slow=30, **overrides):
+    strategy = {
+        "freq": "5Min",
+        "start": "",
+        "stop": "",
+        "datapoints": [
+            {"name": "fast", "transformer": "ema", "args": [fast]},
+            {"name": "slow", "transformer": "sma", "args": [slow]},
+            {"name": "rsi", "transformer": "rsi", "args": [14]},
+        ],
+        "enter": [["fast", ">", "slow"]],
+        "exit": [["fast", "<", "slow"]],
+    }
+    strategy.update(overrides)
+    return strategy
+
+
+STRATEGIES = [
+    _strategy(),
+    _strategy(5, 20, comission=0.1),
+    _strategy(enter=[["rsi", "<", 35, 2]], exit=[["rsi", ">", 60]], exit_on_end=True),
+    _strategy(any_enter=[["rsi", "<", 30], ["fast", ">", "slow"]], any_exit=[["rsi", ">", 70]]),
+    _strategy(trailing_stop_loss=0.01, lot_size=0.5, comission=0.2, exit_on_end=True),
+    _strategy(max_lot_size=400, exit=[["rsi", ">", 90]], any_exit=[["rsi", ">", 75]]),
+    # a name used with other args lands in a second frame
+    _strategy(datapoints=[{"name": "fast", "transformer": "ema", "args": [3]},
+                          {"name": "slow", "transformer": "sma", "args": [30]}]),
+    # a numeric string isn't vectorized, it goes through the row loop
+    _strategy(enter=[["rsi", "<", "40"]], exit=[["rsi", ">", "65"]], trailing_stop_loss=0.02),
+    _strategy(freq="15Min", enter=[["close", ">", "fast"]], exit=[["close", "<", "fast"]]),
+]
+
+
+def test_run_backtest_batch_matches_run_backtest():
+    df = _candles()
+    table = run_backtest_batch(df, STRATEGIES, cache=IndicatorCache())
+
+    assert list(table.columns) == BATCH_SUMMARY_KEYS
+    assert len(table) == len(STRATEGIES)
+    assert table["num_trades"].sum() > 0
+    for position, strategy in enumerate(STRATEGIES):
+        summary = run_backtest(strategy, df=df.copy(), cache=None)["summary"]
+        expected = {
+            **summary,
+            "max_drawdown_pct": summary["drawdown_metrics"]["max_drawdown_pct"],
+            "time_in_market_pct": summary["market_exposure"]["time_in_market_pct"],
+        }
+        row = table.loc[position].to_dict()
+        for key in BATCH_SUMMARY_KEYS:
+            # build_summary computes both, so they're the same to the last digit
+            assert row[key] == expected[key], (position, key)
+
+
+def test_run_backtest_batch_computes_shared_datapoints_once():
+    df = _candles()
+    cache = IndicatorCache()
+    sweep = [
+        _strategy(enter=[["rsi", "<", level]], exit=[["rsi", ">", 100 - level]])
+        for level in range(20, 45)
+    ]
+    table = run_backtest_batch(df, sweep, cache=cache, block_size=4)
+
+    # fast, slow and rsi, once for the whole sweep
+    assert cache.stats()["misses"] == 3
+    assert len(table) == len(sweep)
+    assert table["num_trades"].iloc[0] <= table["num_trades"].iloc[-1]
+
+
+def test_run_backtest_batch_errors():
+    with pytest.raises(MissingData):
+        run_backtest_batch(pd.DataFrame(), [_strategy()])
+    with pytest.raises(BacktestKeyError):
+        run_backtest_batch(_candles(), [_strategy(), {"freq": "5Min", "datapoints": []}])
+    # a datapoint the logic needs and nobody calculates
+    with pytest.raises(Exception):
+        run_backtest_batch(_candles(), [_strategy(enter=[["missing", ">", 1]])])
+    assert run_backtest_batch(_candles(), []).empty
+
+
+def test_group_backtests():
+    groups = _group_backtests([_strategy(), _strategy(10, 50), _strategy(freq="1Min"), _strategy()])
+    assert [g["positions"] for g in groups] == [[0, 3], [1], [2]]
+    assert list(groups[0]["datapoints"]) == ["fast", "slow", "rsi"]
+
+
+def test_build_mask_matrix_matches_build_mask():
+    df = _candles(500).assign(fast=lambda d: d.close.ewm(span=5).mean())
+    logic_lists = [
+        [["close", ">", "fast"]],
+        [["close", ">", "fast"], ["volume", ">", 5000, 2]],
+        [],
+        [["close", "<", "fast"], ["volume", "~", 1], ["volume", "<", "nope"]],
+    ]
+    conditions = {}
+    for combine_any in [False, True]:
+        matrix = build_mask_matrix(df, logic_lists, combine_any, conditions)
+        for col, logic_list in enumerate(logic_lists):
+            np.testing.assert_array_equal(matrix[:, col], build_mask(df, logic_list, combine_any).to_numpy())
+    assert len(conditions) == 5
+
+
+def test_action_code_matrix_matches_vectorized_actions():
+    df = _candles(500).assign(fast=lambda d: d.close.ewm(span=5).mean())
+    backtests = [
+        {"enter": [["close", ">", "fast"]], "exit": [["close", "<", "fast"]]},
+        {"any_enter": [["volume", ">", 9000]], "any_exit": [["volume", "<", 500]], "trailing_stop_loss": 0.01},
+    ]
+    codes = action_code_matrix(df, backtests)
+    assert codes.dtype == np.int8
+    assert set(np.unique(codes)) <= {0, ACTION_ENTER, ACTION_EXIT}
+    for col, backtest in enumerate(backtests):
+        frame = df.assign(trailing_stop_loss=df.close.cummax() * (1 - backtest.get("trailing_stop_loss", 0)))
+        expected = _encode_actions(vectorized_actions(frame, backtest).to_numpy())
+        np.testing.assert_array_equal(codes[:, col], expected)
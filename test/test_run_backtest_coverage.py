@@ -1,8 +1,10 @@
 """Additional coverage tests for run_backtest.py entry points and edge branches."""
 
+import importlib
 from collections import namedtuple
 from unittest import mock
 
+import numpy as np
 import pandas as pd
 import pytest
 
@@ -10,10 +12,13 @@ from fast_trade.run_backtest import (
     BacktestKeyError,
     MissingData,
     _compile_field_accessor,
+    _init_backtest_worker,
     _resolve_compiled_field,
+    _run_backtest_task,
     _take_action_compiled,
     apply_backtest_to_df,
     clean_field_type,
+    compact_df,
     compile_action_logic,
     extract_error_messages,
     prepare_new_backtest,
@@ -25,6 +30,8 @@ from fast_trade.run_backtest import (
     run_backtests_parallel,
     take_action,
 )
+from fast_trade.run_analysis import ACTION_ENTER, ACTION_EXIT, ACTION_HOLD, ACTION_LABELS, _encode_actions
+from fast_trade.shared_frame import release_frame, share_frame
 
 
 def _ohlcv():
@@ -227,6 +234,139 @@ def test_run_backtests_parallel_and_chunked():
     assert len(chunked["df"]) == len(df)
 
 
+def test_run_backtest_chunked_matches_run_backtest_across_boundaries():
+    rng = np.random.default_rng(3)
+    close = 100 + rng.normal(0, 1, 3000).cumsum()
+    df = pd.DataFrame(
+        {"open": close, "high": close + 1, "low": close - 1, "close": close, "volume": rng.uniform(1, 10, 3000)},
+        index=pd.date_range("2024-01-01", periods=3000, freq="min"),
+    )
+    bt = _valid_backtest(
+        comission=0.1,
+        exit_on_end=True,
+        datapoints=[
+            {"name": "sma", "transformer": "sma", "args": [30]},
+            {"name": "rsi", "transformer": "rsi", "args": [14]},
+        ],
+        enter=[["close", ">", "sma", 3]],
+        exit=[["rsi", ">", 70, 2]],
+        any_exit=[["close", "<", "90"]],
+    )
+
+    expected = run_backtest(bt, df=df.copy())
+    chunked = run_backtest_chunked(bt, df=df.copy(), chunk_size=251)
+
+    pd.testing.assert_frame_equal(chunked["df"], expected["df"])
+    pd.testing.assert_frame_equal(chunked["trade_df"], expected["trade_df"])
+    expected["summary"].pop("test_duration")
+    chunked["summary"].pop("test_duration")
+    np.testing.assert_equal(chunked["summary"], expected["summary"])
+
+
+def test_run_backtests_parallel_matches_serial_and_keeps_order():
+    df = _ohlcv()
+    backtests = [
+        _valid_backtest(enter=[["volume", ">", threshold]]) for threshold in [10000, 50000, 90000, 130000]
+    ]
+    progress = []
+
+    results = run_backtests_parallel(
+        backtests, df=df.copy(), n_processes=2, chunksize=1, progress_callback=progress.append
+    )
+
+    for backtest, result in zip(backtests, results):
+        expected = run_backtest(backtest, df=df.copy())
+        pd.testing.assert_frame_equal(result["df"], expected["df"])
+        assert result["summary"]["return_perc"] == expected["summary"]["return_perc"]
+    assert [p["percent"] for p in progress] == [25, 50, 75, 100]
+    assert run_backtests_parallel([], df=df) == []
+
+
+def test_run_backtest_compact():
+    df = _ohlcv()
+    bt = _valid_backtest(
+        comission=0.1,
+        exit_on_end=True,
+        datapoints=[
+            {"name": "sma", "transformer": "sma", "args": [5]},
+            {"name": "bands", "transformer": "bbands", "args": [5]},
+        ],
+        enter=[["close", ">", "sma"]],
+        exit=[["close", "<", "bands_bbands_bb_lower"]],
+    )
+    full = run_backtest(bt, df=df.copy())
+    compact = run_backtest(bt, df=df.copy(), compact=True, keep_columns=["sma"])
+
+    result = compact["df"]
+    assert "sma" in result.columns and "bands_bbands_bb_upper" not in result.columns
+    assert result["sma"].dtype == np.float32 and result["open"].dtype == np.float32
+    assert result["adj_account_value"].dtype == np.float64
+    assert result["action"].cat.categories.tolist() == ACTION_LABELS
+    assert result["action"].astype(str).tolist() == full["df"]["action"].tolist()
+    np.testing.assert_allclose(result["sma"], full["df"]["sma"], rtol=1e-6)
+    assert result.memory_usage(deep=True).sum() < full["df"].memory_usage(deep=True).sum()
+
+    pd.testing.assert_frame_equal(compact["trade_df"], full["trade_df"], check_dtype=False)
+    compact["summary"].pop("test_duration")
+    full["summary"].pop("test_duration")
+    np.testing.assert_equal(compact["summary"], full["summary"])
+
+
+def test_compact_df_leaves_other_columns():
+    df = pd.DataFrame(
+        {"close": [1.0, 2.0], "label": ["a", "b"], "count": [1, 2], "rsi": [0.5, 0.6]},
+        index=pd.date_range("2024-01-01", periods=2, freq="1min"),
+    )
+    result = compact_df(df, ["rsi"])
+    assert list(result.columns) == ["close", "label", "count"]
+    assert result["close"].dtype == np.float64 and result["count"].dtype == np.int64
+    assert result.index.freq == df.index.freq
+
+
+def test_encode_actions_categorical():
+    actions = pd.Categorical(["h", "e", "x", "ae", "ax", "tsl", None], categories=ACTION_LABELS)
+    expected = [ACTION_HOLD, ACTION_ENTER, ACTION_EXIT, ACTION_ENTER, ACTION_EXIT, ACTION_EXIT, ACTION_HOLD]
+    assert _encode_actions(actions).tolist() == expected
+    assert _encode_actions(np.asarray(actions.astype(object))).tolist() == expected
+
+
+def test_run_backtests_parallel_compact():
+    df = _ohlcv()
+    results = run_backtests_parallel([_valid_backtest()], df=df, n_processes=1, compact=True)
+    assert isinstance(results[0]["df"]["action"].dtype, pd.CategoricalDtype)
+
+
+def test_run_backtests_parallel_sends_unshareable_frames_once():
+    df = _ohlcv().assign(label="x")
+    results = run_backtests_parallel([_valid_backtest()], df=df, n_processes=1)
+    assert results[0]["df"]["label"].eq("x").all()
+
+
+def test_backtest_worker_attaches_shared_frame(monkeypatch):
+    # fast_trade re-exports the run_backtest function under the module's name
+    run_backtest_module = importlib.import_module("fast_trade.run_backtest")
+    df = _ohlcv()
+    meta, segment = share_frame(df)
+    monkeypatch.setattr(run_backtest_module, "_WORKER_DF", None)
+    monkeypatch.setattr(run_backtest_module, "_WORKER_SEGMENT", None)
+    try:
+        _init_backtest_worker(meta)
+        position, result = _run_backtest_task((3, _valid_backtest()), summary=False)
+        assert position == 3
+        assert len(result["df"]) == len(df)
+    finally:
+        monkeypatch.setattr(run_backtest_module, "_WORKER_DF", None)
+        release_frame(run_backtest_module._WORKER_SEGMENT)
+        release_frame(segment, unlink=True)
+
+    _init_backtest_worker(None, df)
+    assert run_backtest_module._WORKER_DF is df
+    monkeypatch.setattr(run_backtest_module, "_WORKER_DF", None)
+    with mock.patch("fast_trade.run_backtest.run_backtest") as run:
+        _run_backtest_task((0, {}))
+    assert run.call_args.kwargs["df"].empty
+
+
 def test_run_backtest_chunked_empty_archive_raises():
     bt = _valid_backtest(
         symbol="X",
@@ -27,7 +27,7 @@ from fast_trade.summary.metrics import (
     calculate_return_perc,
     calculate_shape_ratio,
 )
-from fast_trade.summary.trades import calculate_trade_quality
+from fast_trade.summary.trades import calculate_trade_quality, create_round_trips
 
 
 def _ohlcv_df():
@@ -114,6 +114,34 @@ def test_apply_logic_to_df_with_commission_exact_equity():
     assert out["fee"].sum() == pytest.approx(1000.0 + exit_fee)
 
 
+def test_create_round_trips_with_commission():
+    df = _ohlcv_df()
+    df["action"] = ["e", "h", "x", "h", "h", "e", "h", "h", "h"]
+    backtest = {
+        "base_balance": 1000.0,
+        "exit_on_end": False,
+        "comission": 1.0,
+        "lot_size_perc": 1.0,
+        "max_lot_size": 0,
+    }
+    out = apply_logic_to_df(df.copy(), backtest)
+    trips = create_round_trips(out)
+
+    # the trade still open on the last row isn't closed
+    assert len(trips) == 1
+    trip = trips.iloc[0]
+    assert trip["entry_date"] == out.index[0] and trip["exit_date"] == out.index[2]
+    assert trip["entry_price"] == out["close"].iloc[0] and trip["exit_price"] == out["close"].iloc[2]
+    assert trip["size"] == pytest.approx(99000.0)
+    exit_fee = round(99000.0 * 0.02296 * 0.01, 8)
+    # the enter fee is paid in aux, 1000 aux at 0.01
+    assert trip["fee"] == pytest.approx(10.0 + exit_fee)
+    assert trip["pnl"] == pytest.approx(out["account_value"].iloc[2] - 1000.0)
+    assert trip["pnl_perc"] == pytest.approx(trip["pnl"] / 10)
+    assert trip["duration"] == out.index[2] - out.index[0]
+    assert trip["bars"] == 2
+
+
 def test_simulate_account_path_matches_apply_logic_for_same_actions():
     df = _ohlcv_df()
     actions = np.array(["e", "h", "x", "h", "e", "h", "x", "h", "h"])
@@ -306,6 +334,28 @@ def test_build_summary_top_level_max_drawdown_is_min_equity():
     assert summary["max_drawdown"] == pytest.approx(90.0)
 
 
+def test_run_backtest_selected_metrics_and_rule_metrics():
+    df = _ohlcv_df()
+    rules = [["market_exposure.time_in_market_pct", ">", "trade_quality.profit_factor"]]
+    full = run_backtest(_simple_strategy(rules=rules), df=df.copy())
+    result = run_backtest(
+        _simple_strategy(rules=rules), df=df.copy(), metrics=["num_trades", "drawdown_metrics.max_drawdown_pct"]
+    )
+
+    summary = result["summary"]
+    # the metrics the rules compare are computed too
+    assert set(summary) == {"num_trades", "drawdown_metrics", "market_exposure", "trade_quality", "rules", "strategy"}
+    assert summary["num_trades"] == full["summary"]["num_trades"]
+    assert summary["drawdown_metrics"] == {
+        "max_drawdown_pct": full["summary"]["drawdown_metrics"]["max_drawdown_pct"]
+    }
+    assert summary["market_exposure"] == {
+        "time_in_market_pct": full["summary"]["market_exposure"]["time_in_market_pct"]
+    }
+    assert summary["rules"] == full["summary"]["rules"]
+    assert result["trade_df"].equals(full["trade_df"])
+
+
 def test_portfolio_apply_action_has_no_commission_unlike_backtest():
     """Documented divergence: portfolio path ignores commission."""
     from fast_trade.portfolio import apply_action
@@ -0,0 +1,61 @@
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fast_trade.shared_frame import (
+    _attach_segment,
+    attach_frame,
+    can_share_frame,
+    release_frame,
+    share_frame,
+)
+
+
+def _ohlcv():
+    df = pd.read_csv("./test/ohlcv_data.csv.txt").set_index("date")
+    df.index = pd.to_datetime(df.index, unit="s")
+    return df
+
+
+def test_can_share_frame():
+    df = _ohlcv()
+    assert can_share_frame(df)
+    assert not can_share_frame(pd.DataFrame())
+    assert not can_share_frame(df.reset_index())
+    assert not can_share_frame(df.tz_localize("UTC"))
+    assert not can_share_frame(df.assign(action="h"))
+    assert not can_share_frame(df.assign(flag=True))
+    assert not can_share_frame(pd.concat([df["close"], df["close"]], axis=1))
+
+
+def test_share_and_attach_round_trip_without_copying():
+    df = _ohlcv()
+    df.index.name = "date"
+    meta, segment = share_frame(df)
+    try:
+        attached, attached_segment = attach_frame(meta)
+        pd.testing.assert_frame_equal(attached, df)
+
+        buffer = np.ndarray(segment.size, dtype=np.uint8, buffer=attached_segment.buf)
+        assert np.shares_memory(attached["close"].to_numpy(), buffer)
+        assert np.shares_memory(attached.index.asi8, buffer)
+        with pytest.raises(ValueError):
+            attached["close"].to_numpy()[0] = 1.0
+
+        del attached, buffer
+        release_frame(attached_segment)
+    finally:
+        release_frame(segment, unlink=True)
+    release_frame(None)
+
+
+def test_attach_segment_without_track_argument():
+    created = mock.Mock(_name="/psm_test")
+    with mock.patch(
+        "fast_trade.shared_frame.shared_memory.SharedMemory",
+        side_effect=[TypeError("track"), created],
+    ), mock.patch("fast_trade.shared_frame.resource_tracker.unregister") as unregister:
+        assert _attach_segment("psm_test") is created
+    unregister.assert_called_once_with("/psm_test", "shared_memory")
@@ -0,0 +1,164 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fast_trade import streaming
+from fast_trade.build_data_frame import prepare_df
+from fast_trade.streaming import DatapointStream, can_stream, load_indicator, streaming_map
+from fast_trade.transformers_map import transformers_map
+
+
+def _candles(rows=300, seed=0, nans=False):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, rows)))
+    df = pd.DataFrame(
+        {
+            "open": close * (1 + rng.normal(0, 0.003, rows)),
+            "high": close * (1 + np.abs(rng.normal(0, 0.005, rows))),
+            "low": close * (1 - np.abs(rng.normal(0, 0.005, rows))),
+            "close": close,
+            "volume": rng.integers(0, 1000, rows).astype(float),
+        },
+        index=pd.date_range("2024-01-01", periods=rows, freq="1min"),
+    )
+    # flat closes, for the same value shortcuts of the rolling windows and OBV
+    df.iloc[10:14, 3] = df.iloc[9, 3]
+    if nans:
+        df.iloc[rng.integers(0, rows, 4)] = np.nan
+    return df
+
+
+CASES = [
+    ("sma", [20]),
+    ("sma", [3]),
+    ("ema", [9]),
+    ("ema", [5, "close", False]),
+    ("smma", []),
+    ("ssma", [4]),
+    ("dema", [9]),
+    ("dema", [5, "close", False]),
+    ("tema", [9]),
+    ("tema", [4, False]),
+    ("macd", []),
+    ("mom", []),
+    ("roc", []),
+    ("rsi", []),
+    ("rsi", [5, "close", False]),
+    ("tr", []),
+    ("atr", []),
+    ("bbands", []),
+    ("bbands", [5, None, "open", 1.5]),
+    ("msd", []),
+    ("obv", []),
+    ("tp", []),
+    ("rolling_max", []),
+    ("rolling_min", [5, "low"]),
+]
+
+
+@pytest.mark.parametrize("nans", [False, True])
+@pytest.mark.parametrize("transformer,args", CASES)
+def test_streaming_matches_the_batch_transformer(transformer, args, nans):
+    df = _candles(seed=len(args), nans=nans)
+    expected = transformers_map[transformer](df.copy(), *args)
+
+    indicator = streaming_map[transformer](*args)
+    values = []
+    for position, candle in enumerate(df.to_dict("records")):
+        if position == len(df) // 2:
+            # half way through, the indicator goes through json and carries on
+            indicator = load_indicator(json.loads(json.dumps(indicator.to_dict())))
+        values.append(indicator.update(candle))
+
+    if isinstance(expected, pd.DataFrame):
+        result = pd.DataFrame(values, index=df.index)[expected.columns]
+        np.testing.assert_array_equal(result.to_numpy(), expected.to_numpy())
+    else:
+        np.testing.assert_array_equal(np.array(values, dtype=float), expected.to_numpy(dtype=float))
+
+
+def test_peek_leaves_the_state_alone():
+    indicator = streaming_map["bbands"](5)
+    candles = _candles(20).to_dict("records")
+    for candle in candles[:10]:
+        indicator.update(candle)
+    before = indicator.to_dict()
+    peeked = indicator.peek(candles[10])
+    assert indicator.to_dict() == before
+    assert indicator.update(candles[10]) == peeked
+
+
+def test_rolling_windows_like_pandas():
+    series = pd.Series([2.0, 2.0, 2.0, np.nan, np.nan, 1.0, 5.0, 5.0])
+    for period, ddof in [(1, 0), (2, 1), (3, 1)]:
+        std = streaming.RollingStd(period, ddof=ddof)
+        np.testing.assert_array_equal([std.update(v) for v in series], series.rolling(period).std(ddof=ddof))
+
+    # the kahan sums can leave a hair of the wrong sign, an all positive (or negative) window is clamped at 0
+    mean = streaming.RollingMean(2)
+    mean.update(1.0)
+    mean.sum_x = -3.0
+    assert mean.update(2.0) == 0.0
+    mean = streaming.RollingMean(2)
+    mean.update(-1.0)
+    mean.sum_x = 5.0
+    assert mean.update(-2.0) == 0.0
+
+    # update is abstract, a subclass without it can't be made
+    with pytest.raises(TypeError):
+        streaming.StreamingIndicator()
+
+
+def test_can_stream():
+    sma = {"name": "sma", "transformer": "sma", "args": [5]}
+    assert can_stream({"datapoints": [sma]})
+    assert not can_stream({"datapoints": []})
+    assert not can_stream({"datapoints": [sma], "trailing_stop_loss": 0.05})
+    assert not can_stream({"datapoints": [{**sma, "freq": "5Min"}]})
+    assert not can_stream({"datapoints": [{"name": "k", "transformer": "kama"}]})
+    assert not can_stream({"datapoints": [{"name": "s", "transformer": "sma", "args": [5, "close", 1, 2]}]})
+    assert not can_stream({"datapoints": [{"name": "b", "transformer": "bbands", "args": [5, [1.0]]}]})
+
+
+BACKTEST = {
+    "freq": "5Min",
+    "datapoints": [
+        {"name": "fast", "transformer": "ema", "args": [3]},
+        {"name": "slow", "transformer": "sma", "args": [6]},
+        {"name": "bands", "transformer": "bbands", "args": [4]},
+        {"name": "trend", "transformer": "ema", "args": [3, "slow"]},
+    ],
+}
+
+
+def test_datapoint_stream_matches_prepare_df():
+    df = _candles(600)
+    expected = prepare_df(df.copy(), BACKTEST, cache=None)
+
+    stream = DatapointStream(BACKTEST)
+    # the candles come in a few at a time, the last (still filling up) candle is only peeked at
+    for stop in [200, 203, 207, 207, 400, 600]:
+        result = stream.update(df.iloc[:stop])
+        stream = DatapointStream.from_dict(json.loads(json.dumps(stream.to_dict())), BACKTEST)
+
+    assert len(result) == 10
+    assert stream.last_ts == expected.index[-2]
+    pd.testing.assert_frame_equal(result, expected.tail(10)[result.columns], check_freq=False)
+    assert {"bands_bbands_bb_upper", "trend"} <= set(result.columns)
+
+
+def test_datapoint_stream_starts_over():
+    df = _candles(200)
+    stream = DatapointStream(BACKTEST)
+    stream.update(df.iloc[:100])
+    # the candles after the last update went missing
+    result = stream.update(df.iloc[150:])
+    expected = prepare_df(df.iloc[150:].copy(), BACKTEST, cache=None)
+    pd.testing.assert_frame_equal(result, expected.tail(10)[result.columns], check_freq=False)
+
+    assert stream.update(df.iloc[:0]).empty
+    other = {**BACKTEST, "datapoints": BACKTEST["datapoints"][:1]}
+    assert DatapointStream.from_dict(stream.to_dict(), other).last_ts is None
+    assert DatapointStream.from_dict(None, BACKTEST).last_ts is None
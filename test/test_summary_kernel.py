@@ -0,0 +1,105 @@
+import math
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fast_trade.summary import kernel, metrics
+
+
+def _same(a, b):
+    """Equal to the last digit and of the same type, NaN equals NaN."""
+    if isinstance(a, dict):
+        return list(a) == list(b) and all(_same(a[key], b[key]) for key in a)
+    if isinstance(a, float) and math.isnan(a):
+        return isinstance(b, float) and math.isnan(b)
+    return a == b and type(a) is type(b)
+
+
+def _account(rows, seed):
+    rng = np.random.default_rng(seed)
+    adj = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, rows)))
+    if seed % 3 == 0:
+        adj[rng.random(rows) < 0.2] = np.nan
+    if seed % 7 == 0:
+        adj[-1] = 0.0
+    returns = pd.Series(adj).pct_change().to_numpy().copy()
+    if seed % 5 == 0:
+        returns = np.round(returns, 2)
+    return pd.DataFrame(
+        {
+            "adj_account_value": adj,
+            "adj_account_value_change_perc": returns,
+            "in_trade": rng.random(rows) < rng.random(),
+            "aux": np.round(rng.uniform(0, 2, rows), seed % 4),
+            "fee": np.round(rng.uniform(0, 1, rows), 4) * (seed % 2),
+            "close": rng.uniform(1, 10, rows),
+        }
+    )
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_kernel_matches_the_pandas_metrics(seed):
+    df = _account(1 + seed * 7, seed)
+    adj = df.adj_account_value.to_numpy()
+    returns = df.adj_account_value_change_perc.to_numpy()
+    in_trade = df.in_trade.to_numpy()
+    drawdowns = kernel.drawdowns(adj)
+    runs = kernel.run_lengths(in_trade)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        pairs = [
+            (metrics.calculate_drawdown_metrics(df), kernel.calculate_drawdown_metrics(drawdowns)),
+            (metrics.calculate_risk_metrics(df), kernel.calculate_risk_metrics(returns, drawdowns)),
+            (
+                metrics.calculate_position_metrics(df),
+                kernel.calculate_position_metrics(df.aux.to_numpy(), in_trade, df.fee.to_numpy(), adj, runs),
+            ),
+            (metrics.calculate_market_exposure(df), kernel.calculate_market_exposure(in_trade, runs)),
+            (metrics.calculate_return_perc(df), kernel.calculate_return_perc(adj)),
+            (metrics.calculate_buy_and_hold_perc(df), kernel.calculate_buy_and_hold_perc(df.close.to_numpy())),
+            (metrics.calculate_shape_ratio(df), kernel.calculate_shape_ratio(returns)),
+        ]
+    for expected, result in pairs:
+        assert _same(expected, result), (expected, result)
+
+
+def test_reductions_skip_nans_like_pandas():
+    values = np.array([np.nan, 1.5, -2.0, np.nan, 4.25])
+    series = pd.Series(values)
+    assert kernel.nan_mean(values) == series.mean()
+    assert kernel.nan_std(values) == series.std()
+    assert kernel.nan_min(values) == series.min()
+    assert kernel.nan_max(values) == series.max()
+    assert kernel.nan_sum(values) == series.sum()
+
+    empty = np.array([np.nan])
+    assert np.isnan(kernel.nan_mean(empty)) and np.isnan(kernel.nan_std(empty))
+    assert np.isnan(kernel.nan_min(empty)) and np.isnan(kernel.nan_max(empty))
+    assert kernel.nan_sum(empty) == 0.0
+
+
+def test_run_lengths_and_drawdowns():
+    mask = np.array([True, True, False, True, False, False, True, True, True])
+    assert kernel.run_lengths(mask).tolist() == [2, 1, 3]
+    assert kernel.run_lengths(np.zeros(3, dtype=bool)).tolist() == []
+    assert kernel.run_lengths(np.array([], dtype=bool)).tolist() == []
+
+    adj = np.array([np.nan, 100.0, 90.0, np.nan, 120.0, 60.0])
+    expected = pd.Series(adj) / pd.Series(adj).expanding().max() - 1.0
+    np.testing.assert_array_equal(kernel.drawdowns(adj), expected.to_numpy())
+
+
+def test_kernel_edge_cases():
+    assert kernel.calculate_drawdown_metrics(np.array([]))["max_drawdown_pct"] == 0.0
+    assert kernel.calculate_return_perc(np.array([])) == 0.0
+    assert kernel.calculate_return_perc(np.array([100.0, 0.0])) == 0.0
+    assert kernel.calculate_buy_and_hold_perc(np.array([])) == 0.0
+    assert kernel.calculate_buy_and_hold_perc(np.array([1.0, 0.0])) == 0.0
+    assert kernel.calculate_shape_ratio(np.array([0.0, 0.0, 0.0])) == 0.0
+    assert kernel.calculate_market_exposure(np.array([], dtype=bool), np.array([])) == {
+        "time_in_market_pct": 0.0,
+        "avg_trade_duration": 0,
+    }
@@ -56,7 +56,7 @@ def test_save_state_error_swallowed(tmp_path):
 def test_append_trades_corrupt_existing(tmp_path):
     path = tmp_path / "trades.parquet"
     path.write_text("not parquet", encoding="utf-8")
-    with mock.patch("fast_trade.portfolio._safe_read_parquet", return_value=None):
+    with mock.patch("fast_trade.portfolio.safe_read_parquet", return_value=None):
         append_trades(str(path), [{"side": "BUY", "qty": 1.0}])
     df = pd.read_parquet(path)
     assert len(df) == 1
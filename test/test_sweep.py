@@ -0,0 +1,187 @@
+import math
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fast_trade.ml import evolver, sweep
+from fast_trade.ml.fitness_cache import FitnessCache
+
+
+def _sweep_strategy():
+    return {
+        "symbol": "BTCUSDT",
+        "exchange": "binanceus",
+        "freq": "15Min",
+        "start": "2024-01-01T12:00:00",
+        "stop": "2024-01-03T00:00:00",
+        "datapoints": [
+            {"name": "trend", "transformer": "sma", "args": ["#slow_period"]},
+            {"name": "fast", "transformer": "ema", "args": ["#fast_period"]},
+        ],
+        "enter": [["fast", ">", "trend"]],
+        "exit": [["fast", "<", "trend"]],
+    }
+
+
+GENES = [("fast_period", [2, 3, 5, 8]), ("slow_period", {"low": 10, "high": 40, "step": 10})]
+DRAWDOWN = ["drawdown_metrics.max_drawdown_pct", ">", -5]
+
+
+def test_gene_values():
+    assert sweep.gene_values(["sma", "ema"]) == ["sma", "ema"]
+    assert sweep.gene_values({"low": 2, "high": 5}) == [2, 3, 4, 5]
+    assert sweep.gene_values({"low": 10, "high": 45, "step": 10}) == [10, 20, 30, 40]
+    assert sweep.gene_values({"low": 0.1, "high": 0.3, "step": 0.1}) == [0.1, 0.2, 0.3]
+    assert sweep.gene_values({"low": 0.0, "high": 1}) is None
+    with pytest.raises(ValueError):
+        sweep.gene_values({"low": 1})
+
+
+def test_samplers():
+    spaces = [[1, 2], {"low": 0, "high": 2}]
+    assert list(sweep.grid_candidates(spaces)) == [[1, 0], [1, 1], [1, 2], [2, 0], [2, 1], [2, 2]]
+    with pytest.raises(ValueError):
+        list(sweep.grid_candidates([{"low": 0.0, "high": 1.0}]))
+
+    continuous = [{"low": 0.0, "high": 10.0}, list(range(8))]
+    drawn = list(sweep.random_candidates(continuous, 8, seed=1))
+    assert drawn == list(sweep.random_candidates(continuous, 8, seed=1))
+    assert all(0 <= a < 10 and b in range(8) for a, b in drawn)
+
+    # a latin hypercube uses every stratum of every gene exactly once
+    lhs = list(sweep.lhs_candidates(continuous, 8, seed=1))
+    assert sorted(int(a // 1.25) for a, _ in lhs) == list(range(8))
+    assert sorted(b for _, b in lhs) == list(range(8))
+
+    candidates, total = sweep.sweep_candidates(spaces, "grid", samples=4)
+    assert (len(list(candidates)), total) == (4, 4)
+    assert sweep.sweep_candidates(spaces, "grid")[1] == 6
+    assert sweep.sweep_candidates(spaces, "lhs", samples=3)[1] == 3
+    with pytest.raises(ValueError):
+        sweep.sweep_candidates(spaces, "sobol", samples=3)
+    with pytest.raises(ValueError):
+        sweep.sweep_candidates(spaces, "random")
+
+
+def test_check_constraints():
+    summary = {"num_trades": 12, "drawdown_metrics.max_drawdown_pct": -4.0}
+    assert sweep.check_constraints(summary, [["num_trades", ">=", 10], DRAWDOWN])
+    assert not sweep.check_constraints(summary, [["num_trades", ">", 12]])
+    assert not sweep.check_constraints(summary, [["missing", ">", 1]])
+    assert sweep.check_constraints(summary, [])
+
+
+def test_run_sweep_prunes_only_what_would_fail(kline_archive):
+    progress = []
+    results = sweep.run_sweep(
+        _sweep_strategy(),
+        GENES,
+        constraints=[DRAWDOWN, ["num_trades", ">=", 1]],
+        prune_fraction=0.5,
+        processes=1,
+        batch_size=5,
+        progress_callback=progress.append,
+    )
+    assert len(results) == 16
+    assert list(results["candidate"]) == list(range(16))
+    assert "drawdown_metrics.max_drawdown_pct" in results.columns
+    pruned = results[results.status == "pruned"]
+    assert len(pruned) > 0
+    assert pruned["message"].str.contains("failed on the first 50% of the candles").all()
+    assert pruned["fitness"].isna().all()
+
+    full = sweep.run_sweep(_sweep_strategy(), GENES, processes=1)
+    merged = results.merge(full, on="key", suffixes=("", "_full"))
+    # every pruned candidate fails the constraint on the whole backtest too
+    assert (merged[merged.status == "pruned"]["drawdown_metrics.max_drawdown_pct_full"] <= -5).all()
+    ok = merged[merged.status == "ok"]
+    assert ok["fitness"].tolist() == ok["fitness_full"].tolist()
+    assert ok["passed"].tolist() == (ok["drawdown_metrics.max_drawdown_pct"] > -5).tolist()
+
+    assert [p["done"] for p in progress] == [5, 10, 15, 16]
+    assert progress[-1]["pruned"] == len(pruned)
+    best = results[results.passed].sort_values("fitness").iloc[-1]
+    assert progress[-1]["best_fitness"] == best["fitness"]
+    assert progress[-1]["best_genes"] == [("fast_period", best["gene.fast_period"]), ("slow_period", best["gene.slow_period"])]
+
+
+def test_run_sweep_resumes_from_parquet(kline_archive, tmp_path):
+    path = str(tmp_path / "sweeps" / "sma")
+    first = sweep.run_sweep(_sweep_strategy(), GENES, sampler="grid", samples=6, processes=1, results_path=path, batch_size=4)
+    assert len(first) == 6
+    assert len(os.listdir(path)) == 2
+
+    progress = []
+    resumed = sweep.run_sweep(_sweep_strategy(), GENES, processes=1, results_path=path, progress_callback=progress.append)
+    assert len(resumed) == 16
+    assert progress[-1]["resumed"] == 6
+    assert progress[-1]["evaluated"] == 10
+    assert resumed["key"].is_unique
+    pd.testing.assert_frame_equal(resumed.iloc[:6], first)
+
+    fresh = sweep.run_sweep(_sweep_strategy(), GENES, samples=2, processes=1, results_path=path, resume=False)
+    assert len(fresh) == 2
+    assert sweep.load_sweep_results(str(tmp_path / "nothing")).empty
+
+
+def test_run_sweep_random_duplicates_errors_and_cache(kline_archive):
+    cache = FitnessCache()
+    progress = []
+    genes = [("fast_period", [5, 8]), ("slow_period", [20])]
+    results = sweep.run_sweep(
+        _sweep_strategy(), genes, sampler="random", samples=12, processes=1, fitness_cache=cache,
+        progress_callback=progress.append,
+    )
+    assert len(results) == 2
+    assert progress[-1]["duplicates"] == 10
+    assert cache.stats()["entries"] == 2
+
+    again = sweep.run_sweep(
+        _sweep_strategy(), genes, sampler="lhs", samples=2, processes=1, fitness_cache=cache,
+        progress_callback=progress.append,
+    )
+    assert progress[-1]["cached"] == 2
+    assert sorted(again["fitness"]) == sorted(results["fitness"])
+
+    broken = {**_sweep_strategy(), "symbol": "NOPE"}
+    errors = sweep.run_sweep(broken, genes, processes=1, constraints=[DRAWDOWN])
+    assert (errors.status == "error").all()
+    assert (errors["message"] != "").all()
+    assert not errors["passed"].any()
+    assert errors["num_trades"].isna().all()
+
+
+def test_prune_candidate_needs_archived_candles():
+    strategy = evolver.modify_strategy(_sweep_strategy(), [("fast_period", 5), ("slow_period", 20)])
+    data = evolver.FitnessData()
+    no_symbol = {k: v for k, v in strategy.items() if k != "symbol"}
+    assert sweep.prune_candidate(no_symbol, [DRAWDOWN], 0.5, data) == ""
+    assert sweep.prune_candidate(strategy, [["return_perc", ">", 1]], 0.5, data) == ""
+    assert sweep.prune_candidate(strategy, [DRAWDOWN], 0, data) == ""
+
+
+def test_sweep_task_and_pool(kline_archive):
+    solution = [5, 20]
+    gene_names = [("fast_period", None), ("slow_period", None)]
+    expected = sweep.evaluate_candidate(solution, _sweep_strategy(), gene_names, constraints=[DRAWDOWN])
+
+    evolver._init_fitness_worker(_sweep_strategy(), gene_names, None, [])
+    try:
+        assert sweep._sweep_task(solution, constraints=[DRAWDOWN]) == expected
+    finally:
+        evolver._WORKER_FITNESS = None
+
+    in_process = sweep.run_sweep(_sweep_strategy(), GENES, samples=6, processes=1, constraints=[DRAWDOWN])
+    pooled = sweep.run_sweep(_sweep_strategy(), GENES, samples=6, processes=2, constraints=[DRAWDOWN])
+    pd.testing.assert_frame_equal(in_process, pooled)
+    assert not math.isnan(pooled["fitness"].max())
+
+
+def test_default_results_path(monkeypatch, tmp_path):
+    monkeypatch.setenv("ARCHIVE_PATH", str(tmp_path))
+    assert sweep.default_results_path("sma") == str(tmp_path / "ml" / "sweeps" / "sma")
+    monkeypatch.setenv("ARCHIVE_PATH", str(tmp_path / "ml"))
+    assert sweep.default_results_path("sma") == str(tmp_path / "ml" / "sweeps" / "sma")
+    assert np.isclose(sweep.gene_values({"low": 0, "high": 0.5, "step": 0.25})[-1], 0.5)
@@ -0,0 +1,166 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fast_trade import run_backtest
+from fast_trade.ml.evolver import FitnessData
+from fast_trade.ml import walk_forward
+from fast_trade.ml.walk_forward import run_fold, run_walk_forward, stitch_equity, walk_forward_folds, warm_up_period
+from fast_trade.run_backtest import MissingData
+from fast_trade.shared_frame import release_frame, share_frame
+
+SETTINGS = {"num_generations": 2, "sol_per_pop": 4, "num_parents_mating": 2, "parallel_processing": None}
+GENES = [("fast_period", {"low": 2, "high": 10}), ("slow_period", {"low": 12, "high": 30})]
+
+
+def _candles(days=3, seed=3):
+    rows = days * 24 * 60
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, rows)))
+    return pd.DataFrame(
+        {"open": close, "high": close * 1.001, "low": close * 0.999, "close": close, "volume": 1.0},
+        index=pd.date_range("2024-01-01", periods=rows, freq="1min"),
+    )
+
+
+def _strategy(**overrides):
+    return {
+        "symbol": "BTCUSDT",
+        "exchange": "binanceus",
+        "freq": "15Min",
+        "datapoints": [
+            {"name": "fast", "transformer": "ema", "args": ["#fast_period"]},
+            {"name": "slow", "transformer": "sma", "args": ["#slow_period"]},
+        ],
+        "enter": [["fast", ">", "slow"]],
+        "exit": [["fast", "<", "slow"]],
+        **overrides,
+    }
+
+
+def test_walk_forward_folds():
+    index = pd.date_range("2024-01-01", periods=3 * 24 * 60, freq="1min")
+    folds = walk_forward_folds(index, "1D", "12h")
+    assert len(folds) == 4
+    assert folds[1] == {
+        "fold": 1,
+        "train_start": pd.Timestamp("2024-01-01 12:00"),
+        "test_start": pd.Timestamp("2024-01-02 12:00"),
+        "test_stop": pd.Timestamp("2024-01-03"),
+    }
+    # the test windows tile the candles up to the last one
+    assert folds[-1]["test_stop"] == index[-1] + pd.Timedelta("1min")
+    assert all(a["test_stop"] == b["test_start"] for a, b in zip(folds, folds[1:]))
+
+    anchored = walk_forward_folds(index, "1D", "12h", step="6h", anchored=True)
+    assert len(anchored) == 7
+    assert {f["train_start"] for f in anchored} == {index[0]}
+    assert anchored[1]["test_start"] == pd.Timestamp("2024-01-02 06:00")
+
+    assert walk_forward_folds(index, "3D", "1D") == []
+    assert walk_forward_folds(index[:1], "1h", "1h") == []
+    with pytest.raises(ValueError):
+        walk_forward_folds(index, "1D", "0h")
+
+
+def test_warm_up_period():
+    assert warm_up_period(_strategy(), GENES) == pd.Timedelta("15Min") * 30
+    winner = _strategy(datapoints=[{"name": "fast", "transformer": "ema", "args": [np.int64(7)]}])
+    assert warm_up_period(winner) == pd.Timedelta("15Min") * 7
+    spaces = [("fast_period", [3, 9.6]), ("freq", {"low": 0, "high": 4})]
+    assert warm_up_period(_strategy(), spaces) == pd.Timedelta("1h") * 10
+    assert warm_up_period(_strategy(), [("freq", ["5Min", "1h"]), ("slow_period", None)]) == pd.Timedelta("0")
+    assert warm_up_period(_strategy(), [("freq", None), ("fast_period", ["x", 1])]) == pd.Timedelta("0")
+    assert warm_up_period(_strategy(), [("freq", [1, 2]), ("fast_period", lambda: 5)]) == pd.Timedelta("0")
+
+
+def test_run_backtest_warm_up():
+    df = _candles(days=1)
+    strategy = {**_strategy(), "datapoints": [{"name": "slow", "transformer": "sma", "args": [20]}],
+                "enter": [["close", ">", "slow"]], "exit": [["close", "<", "slow"]], "start": "2024-01-01T12:00:00"}
+    cold = run_backtest(strategy, df=df, cache=None)["df"]
+    warm = run_backtest(strategy, df=df, cache=None, warm_up=True)["df"]
+    assert cold.index[0] == warm.index[0] == pd.Timestamp("2024-01-01 12:00")
+    assert cold["slow"].iloc[:19].isna().all()
+    assert not warm["slow"].isna().any()
+    assert warm["slow"].iloc[0] == pytest.approx(df["close"].resample("15Min").first().loc[:"2024-01-01 12:00"].tail(20).mean())
+
+    data = FitnessData(df=df)
+    assert data.get_candles({}) is df
+    assert data.run_backtest(strategy)["df"]["slow"].equals(warm["slow"])
+
+
+def test_run_walk_forward_stitches_the_test_windows(tmp_path, monkeypatch):
+    monkeypatch.setenv("ARCHIVE_PATH", str(tmp_path))
+    df = _candles()
+    progress = []
+    result = run_walk_forward(
+        _strategy(base_balance=500), GENES, "1D", "12h", df=df, optimizer_settings=SETTINGS, processes=1,
+        progress_callback=progress.append,
+    )
+    folds = result["folds"]
+    assert list(folds.index) == [0, 1, 2, 3]
+    assert {"gene.fast_period", "gene.slow_period", "train_fitness", "test_fitness", "num_trades"} <= set(folds.columns)
+    assert progress[-1] == {"phase": "folds", "done": 4, "total": 4}
+
+    equity = result["equity"]
+    assert equity.index.is_unique and equity.index.is_monotonic_increasing
+    assert equity.index[0] == pd.Timestamp("2024-01-02") and equity.index[-1] == pd.Timestamp("2024-01-03 23:45")
+    assert equity.iloc[0] == pytest.approx(500)
+    assert result["summary"]["num_folds"] == 4
+    assert result["summary"]["num_trades"] == folds["num_trades"].sum()
+    assert result["summary"]["return_perc"] == pytest.approx(100 - 500 / equity.iloc[-1] * 100, abs=1e-3)
+
+    # every test window is the winner's own backtest, warmed up on the candles before it
+    for fold, strategy in enumerate(result["strategies"]):
+        assert strategy["start"] == folds.loc[fold, "test_start"].isoformat()
+        alone = run_backtest(strategy, df=df, cache=None, warm_up=True)
+        assert alone["summary"]["return_perc"] == folds.loc[fold, "return_perc"]
+
+    # the candles go to the workers through shared memory, or once per worker when they can't
+    for candles in [df, df.assign(note="x")]:
+        pooled = run_walk_forward(
+            _strategy(base_balance=500), GENES, "1D", "12h", df=candles, optimizer_settings=SETTINGS, processes=2
+        )
+        pd.testing.assert_frame_equal(pooled["folds"], folds)
+        pd.testing.assert_series_equal(pooled["equity"], equity)
+
+
+def test_fold_worker(tmp_path, monkeypatch):
+    monkeypatch.setenv("ARCHIVE_PATH", str(tmp_path))
+    df = _candles(days=2)
+    fold = walk_forward_folds(df.index, "1D", "12h")[1]
+    expected = run_fold(df, fold, _strategy(), GENES, optimizer_settings=SETTINGS)
+    meta, segment = share_frame(df)
+    try:
+        walk_forward._init_fold_worker(meta, None, _strategy(), GENES, None, SETTINGS, 0)
+        position, (row, equity, _) = walk_forward._fold_task(fold)
+    finally:
+        release_frame(walk_forward._WORKER_FOLDS[1])
+        monkeypatch.setattr(walk_forward, "_WORKER_FOLDS", None)
+        release_frame(segment, unlink=True)
+    assert position == 1
+    assert row == expected[0]
+    pd.testing.assert_series_equal(equity, expected[1])
+
+
+def test_run_walk_forward_loads_the_archive(kline_archive, monkeypatch):
+    monkeypatch.setenv("ARCHIVE_PATH", str(kline_archive))
+    strategy = _strategy(start="2024-01-01T12:00:00", stop="2024-01-03T00:00:00")
+    result = run_walk_forward(strategy, GENES, "18h", "6h", optimizer_settings=SETTINGS)
+    # the folds only cover start to stop, the candles before start warm up the first one
+    assert len(result["folds"]) == 3
+    assert result["folds"]["test_start"].tolist() == list(pd.date_range("2024-01-02 06:00", periods=3, freq="6h"))
+    assert result["strategies"][-1]["stop"] == "2024-01-02T23:45:00"
+
+    with pytest.raises(ValueError):
+        run_walk_forward(strategy, GENES, "3D", "1D", optimizer_settings=SETTINGS, processes=1)
+    with pytest.raises(MissingData):
+        run_walk_forward(strategy, GENES, "1D", "1D", df=pd.DataFrame())
+
+
+def test_stitch_equity():
+    first = pd.Series([100.0, 110.0], index=pd.date_range("2024-01-01", periods=2, freq="1D"))
+    second = pd.Series([100.0, 90.0], index=pd.date_range("2024-01-03", periods=2, freq="1D"))
+    assert stitch_equity([first, second], 100.0).tolist() == pytest.approx([100.0, 110.0, 110.0, 99.0])
+    assert stitch_equity([], 100.0).empty